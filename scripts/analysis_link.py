@@ -0,0 +1,192 @@
+"""
+The browser capture link's analysis stream: what resolution and rate it runs
+at, and how its frames are packed.
+
+``p0_web_capture`` used to take a raw 640x360 grayscale frame for every
+camera frame, about 7 MB/s, at one resolution fixed for the whole session.
+On a ChromeOS port forward that is more than the link carries. The socket
+backs up, and the detector, the HUD and the recording upload all fall
+seconds behind.
+
+Two things bring the stream down to what the link carries:
+
+* **Levels.** ``link_levels`` is a ladder of analysis (height, fps) pairs,
+  from the configured resolution at the full timeline rate down to a third
+  of the height at a third of the rate. ``LinkAdapter`` reads the stats
+  report the page sends every two seconds. When messages arrive late (``lag_s``), or the
+  recording queued in the browser keeps growing (``chunk_q``), it steps down
+  a level. After a long clear stretch it steps back up. Each change waits
+  out a cooldown, so the backlog a step leaves behind can drain before it is
+  judged. Every change is kept in ``history`` for metadata.json.
+
+* **Delta frames.** A book under a camera is mostly still, so most of each
+  frame repeats the last one. A delta frame (``MSG_DELTA``) carries only the
+  8x8 blocks whose mean absolute difference from the page's reference
+  exceeds ``DELTA_TOLERANCE``, plus a bitmask of which blocks those are.
+  ``DeltaDecoder`` applies them to the same reference on this side. Both
+  sides update the reference with exactly the blocks sent, so they can't
+  drift apart. A raw frame resets the reference, and the page sends one
+  whenever the size changes. ``encode_delta`` is the page's encoder in
+  numpy, for the tests.
+
+The detector's thresholds were tuned on the configured analysis size, so
+the server scales every frame back to that size before the detector sees it
+(see ``WebSession._measure``). A lower level averages more sensor noise
+away, so a still page reads stiller, while a page turn moves whole blocks
+and reads the same. Blocks held back by the tolerance make a still page read
+stiller still. Neither change can make a still page look like a turn.
+"""
+
+import math
+
+import numpy as np
+
+BLOCK = 8
+# Mean |difference| per block at or below which the page keeps its reference
+# block. Well under the settle threshold (2.0), so held-back blocks only
+# ever remove sensor noise from the motion signal.
+DELTA_TOLERANCE = 1.0
+
+# Congestion: browser messages this late, or a recording backlog past this
+# size that is still growing.
+LAG_HIGH = 0.75
+QUEUE_HIGH = 32e6
+# Clear: messages on time and the backlog all but gone, for CLEAR_REPORTS
+# reports in a row (~20 s at the page's 2 s cadence) before stepping up.
+LAG_LOW = 0.2
+QUEUE_LOW = 4e6
+CLEAR_REPORTS = 10
+# Seconds after a change before the next report is judged.
+COOLDOWN_SEC = 4.0
+
+
+def link_levels(analysis_height, fps):
+    """The ladder of analysis levels, best first: dicts of height and fps."""
+    steps = [(1, 1), (3 / 4, 1), (1 / 2, 1), (1 / 2, 2), (1 / 3, 2), (1 / 3, 3)]
+    levels = []
+    for scale, div in steps:
+        level = {"height": max(48, int(analysis_height * scale) // 2 * 2),
+                 "fps": round(fps / div, 3)}
+        if level not in levels:
+            levels.append(level)
+    return levels
+
+
+def _grid(w, h):
+    return math.ceil(w / BLOCK), math.ceil(h / BLOCK)
+
+
+def _blocks(ref):
+    """(rows, cols, BLOCK, BLOCK) view of a padded reference frame."""
+    ph, pw = ref.shape
+    return ref.reshape(ph // BLOCK, BLOCK, pw // BLOCK, BLOCK).swapaxes(1, 2)
+
+
+def reference_frame(gray):
+    """``gray`` as a delta reference: zero-padded to whole blocks."""
+    h, w = gray.shape
+    bw, bh = _grid(w, h)
+    ref = np.zeros((bh * BLOCK, bw * BLOCK), np.uint8)
+    ref[:h, :w] = gray
+    return ref
+
+
+def encode_delta(ref, gray, tolerance=DELTA_TOLERANCE):
+    """The page's delta encoder: (payload, updated reference).
+
+    ``ref`` is the padded reference (from a previous call, or
+    ``reference_frame`` of the last raw frame); it is updated in place.
+    """
+    h, w = gray.shape
+    bw, bh = _grid(w, h)
+    cur = reference_frame(gray)
+    diff = np.abs(cur.astype(np.int16) - ref.astype(np.int16))
+    sums = _blocks(diff).sum(axis=(2, 3))
+    valid = _blocks(reference_frame(np.ones_like(gray))).sum(axis=(2, 3))
+    changed = sums > tolerance * valid
+    blocks = _blocks(ref)
+    blocks[changed] = _blocks(cur)[changed]
+    mask = np.packbits(changed.ravel())
+    return mask.tobytes() + _blocks(cur)[changed].tobytes(), ref
+
+
+class DeltaDecoder:
+    """The server's copy of the page's reference frame."""
+
+    def __init__(self):
+        self.ref = None
+        self.size = None            # (w, h) of the frames the reference is for
+
+    def reset(self, gray):
+        """A raw frame arrived: it is the new reference."""
+        h, w = gray.shape
+        self.ref = reference_frame(gray)
+        self.size = (w, h)
+
+    def decode(self, w, h, payload):
+        """The frame a delta payload describes, or None if it doesn't apply
+        to the reference held (a size change whose raw frame never came)."""
+        if self.ref is None or self.size != (w, h):
+            return None
+        bw, bh = _grid(w, h)
+        n_blocks = bw * bh
+        mask_len = (n_blocks + 7) // 8
+        if len(payload) < mask_len:
+            return None
+        changed = np.unpackbits(np.frombuffer(payload, np.uint8, count=mask_len),
+                                count=n_blocks).astype(bool)
+        n = int(changed.sum())
+        if len(payload) < mask_len + n * BLOCK * BLOCK:
+            return None
+        values = np.frombuffer(payload, np.uint8, count=n * BLOCK * BLOCK,
+                               offset=mask_len).reshape(n, BLOCK, BLOCK)
+        _blocks(self.ref)[changed.reshape(bh, bw)] = values
+        return self.ref[:h, :w].copy()
+
+
+class LinkAdapter:
+    """Choose the analysis level from the page's stats reports."""
+
+    def __init__(self, levels, adaptive=True):
+        self.levels = levels
+        self.adaptive = adaptive
+        self.level = 0
+        self.history = []
+        self._clear = 0
+        self._last_change = None
+        self._last_queue = 0
+
+    def observe(self, now, lag_s, chunk_q, frame_index=None):
+        """One stats report at monotonic ``now``; the new level's index if
+        this report changes it, else None."""
+        growing = chunk_q > self._last_queue
+        self._last_queue = chunk_q
+        if not self.adaptive:
+            return None
+        if self._last_change is not None and now - self._last_change < COOLDOWN_SEC:
+            return None
+        if lag_s > LAG_HIGH or (chunk_q > QUEUE_HIGH and growing):
+            self._clear = 0
+            if self.level + 1 < len(self.levels):
+                reason = "lag" if lag_s > LAG_HIGH else "queue"
+                return self._change(now, self.level + 1, reason, lag_s, chunk_q,
+                                    frame_index)
+            return None
+        if lag_s < LAG_LOW and chunk_q < QUEUE_LOW:
+            self._clear += 1
+            if self._clear >= CLEAR_REPORTS and self.level > 0:
+                return self._change(now, self.level - 1, "clear", lag_s, chunk_q,
+                                    frame_index)
+        else:
+            self._clear = 0
+        return None
+
+    def _change(self, now, level, reason, lag_s, chunk_q, frame_index):
+        self.history.append({"frame_index": frame_index, "from": self.level,
+                             "to": level, **self.levels[level], "reason": reason,
+                             "lag_s": round(lag_s, 2),
+                             "chunk_q_mb": round(chunk_q / 1e6, 1)})
+        self.level = level
+        self._clear = 0
+        self._last_change = now
+        return level
@@ -0,0 +1,213 @@
+"""
+Archival recording: a continuous low-resolution proxy, plus full resolution
+only where the book was still.
+
+A 4K book recording runs to 10+ GB, and nearly all of it is page turns that
+no later phase looks at closely. P3 and P4's insert need full-resolution
+pixels only near the frames where a page sat still. With ``--archive``, P0
+writes two streams:
+
+  recordings/<name>.mp4        the proxy: every frame, at --proxy-height
+  recordings/<name>.full.mp4   full resolution, only the frames within
+                               --archive-margin of a still frame, back to back
+
+``ArchiveRecorder`` makes that split in the capture loop. Each full-resolution
+slot is held for the margin (the pool reference the encoder would otherwise
+take), and when a slot ages out of the margin it goes to the full-resolution
+encoder if a still frame, or a capture, fell within the margin on either side
+of it. Otherwise it is dropped. The proxy is the camera frame scaled down in
+the same loop and encoded by its own encoder.
+
+  data/archive_index.npz   full_pos: per timeline frame, its position in the
+                           full-resolution stream, or -1 if only the proxy
+                           has it; plus that stream's packet index (as in
+                           frame_index.npz), the full frame size, and the
+                           size and mtime of both files
+
+``open_reader`` is how consumers get at a recording. For an archival session
+it returns an ``ArchiveReader``. Its ``read(i)`` serves frame i from the
+full-resolution stream when it is held there, and otherwise from the proxy,
+scaled up to full size. ``full_res(i)`` says which one it will be. For any
+other recording it returns a plain ``FrameReader``, so P3's winners and
+P4's insert (Tk and web) work the same either way.
+"""
+
+from collections import deque
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from frame_index import (FrameReader, ensure_index, file_stamp, load_index,
+                         scan_index, sync_points)
+from utils import log
+
+ARCHIVE_FILE = "archive_index.npz"
+
+
+def full_res_path(video_path):
+    """Where the full-resolution stream of ``video_path``'s archive lives."""
+    p = Path(video_path)
+    return p.with_name(f"{p.stem}.full{p.suffix}")
+
+
+class ArchiveRecorder:
+    """Route live frames to the proxy and, within settle windows, to the
+    full-resolution encoder.
+
+    ``put`` every frame as it is read (the caller keeps its own reference to
+    the slot), then ``advance`` once the detector has seen it. ``keep``
+    marks a frame, such as a forced capture, as worth full resolution even
+    when it wasn't still.
+    """
+
+    def __init__(self, pool, encoder, proxy_pool, proxy_encoder, margin_frames):
+        self.pool, self.encoder = pool, encoder
+        self.proxy_pool, self.proxy_encoder = proxy_pool, proxy_encoder
+        self.margin = margin_frames
+        self._held = deque()            # (frame_index, slot, t_read)
+        self._last_still = -(margin_frames + 1)
+        self.full_pos = []
+        self.full_frames = 0
+
+    def put(self, idx, slot, t, proxy):
+        """Frame ``idx`` was read into ``slot`` at ``t``; ``proxy`` is it at
+        proxy size."""
+        pslot = self.proxy_pool.acquire()
+        np.copyto(self.proxy_pool.view(pslot), proxy)
+        self.proxy_encoder.put(pslot, t)
+        self.pool.retain(slot)
+        self._held.append((idx, slot, t))
+        self.full_pos.append(-1)
+
+    def keep(self, idx):
+        self._last_still = max(self._last_still, idx)
+
+    def advance(self, idx, still):
+        """Frame ``idx`` has been analysed; hand on what left the margin."""
+        if still:
+            self._last_still = idx
+        while self._held and self._held[0][0] <= idx - self.margin:
+            self._emit(*self._held.popleft())
+
+    def _emit(self, idx, slot, t):
+        # Every still frame up to idx + margin is known by now, so the latest
+        # one is within the margin of idx exactly when some still frame is.
+        if self._last_still >= idx - self.margin:
+            self.full_pos[idx] = self.full_frames
+            self.full_frames += 1
+            self.encoder.put(slot, t)       # the encoder releases it
+        else:
+            self.pool.release(slot)
+
+    def finish(self):
+        """Flush the margin; the per-frame positions in the full stream."""
+        while self._held:
+            self._emit(*self._held.popleft())
+        return np.asarray(self.full_pos, dtype="<i4")
+
+
+def build_archive_index(data_dir, video_path, full_pos, size):
+    """Index the full-resolution stream and write ``data_dir/ARCHIVE_FILE``.
+    ``size`` is the full-resolution (w, h) the proxy scales back up to."""
+    full_path = full_res_path(video_path)
+    scanned = scan_index(full_path) if full_pos.max(initial=-1) >= 0 else None
+    pts, key = scanned if scanned is not None else (np.zeros(0), np.zeros(0, bool))
+    np.savez(str(data_dir / ARCHIVE_FILE), full_pos=full_pos, pts=pts,
+             key=key.astype(np.uint8), sync=sync_points(key),
+             size=np.asarray(size, dtype="<i4"),
+             stamp=file_stamp(video_path),
+             full_stamp=file_stamp(full_path) if full_path.exists() else np.zeros(2, "<i8"))
+    return {"full_pos": full_pos, "pts": pts, "key": key, "sync": sync_points(key),
+            "size": np.asarray(size)}
+
+
+def load_archive(data_dir, video_path):
+    """The archive index for ``video_path``, or None if it isn't archival.
+
+    An index whose proxy or full-resolution file has changed since it was
+    written is ignored, with a warning: the positions would be wrong.
+    """
+    path = data_dir / ARCHIVE_FILE
+    if not path.exists():
+        return None
+    full_path = full_res_path(video_path)
+    try:
+        with np.load(str(path)) as z:
+            archive = {k: z[k] for k in ("full_pos", "pts", "key", "sync", "size")}
+            stale = not np.array_equal(z["stamp"], file_stamp(video_path)) or (
+                len(archive["pts"]) and not (
+                    full_path.exists()
+                    and np.array_equal(z["full_stamp"], file_stamp(full_path))))
+    except (OSError, KeyError, ValueError):
+        return None
+    if stale:
+        log(f"  WARNING: {path} no longer matches {video_path} / {full_path.name}; "
+            "reading the recording as it is")
+        return None
+    return archive
+
+
+class ArchiveReader:
+    """FrameReader's interface over an archive: full resolution where the
+    archive holds it, the proxy scaled up everywhere else."""
+
+    def __init__(self, video_path, archive, proxy_index=None):
+        self.archive = archive
+        self.proxy = FrameReader(video_path, proxy_index)
+        self.full = FrameReader(full_res_path(video_path), archive) \
+            if len(archive["pts"]) else None
+        self.size = tuple(int(v) for v in archive["size"])     # full (w, h)
+
+    def isOpened(self):
+        return self.proxy.isOpened()
+
+    def __len__(self):
+        return len(self.archive["full_pos"])
+
+    @property
+    def seeks(self):
+        return self.proxy.seeks + (self.full.seeks if self.full else 0)
+
+    @property
+    def grabs(self):
+        return self.proxy.grabs + (self.full.grabs if self.full else 0)
+
+    def full_res(self, i):
+        pos = self.archive["full_pos"]
+        return self.full is not None and 0 <= i < len(pos) and pos[i] >= 0
+
+    def read(self, i):
+        """The BGR frame at timeline index ``i``, or None."""
+        if self.full_res(i):
+            frame = self.full.read(int(self.archive["full_pos"][i]))
+            if frame is not None:
+                return frame
+        frame = self.proxy.read(i)
+        if frame is None:
+            return None
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_CUBIC)
+
+    def release(self):
+        self.proxy.release()
+        if self.full is not None:
+            self.full.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def open_reader(data_dir, video_path, build=True):
+    """A frame-exact reader for the session's recording, archival or not.
+
+    With ``build=False`` a missing frame index is not built here: the reader
+    seeks by position until ``index_in_background`` has written it."""
+    archive = load_archive(data_dir, video_path)
+    index = (ensure_index(data_dir, video_path) if build
+             else load_index(data_dir, video_path))
+    if archive is None:
+        return FrameReader(video_path, index)
+    return ArchiveReader(video_path, archive, index)
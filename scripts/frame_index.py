@@ -0,0 +1,245 @@
+"""
+Frame index sidecar — frame-exact random access into a recording.
+
+Every consumer that jumps to a frame (P3's winners, the Tk scrubber, the web
+review's insert) used to ``cap.set(CAP_PROP_POS_FRAMES, i)`` and trust the
+result. That asks the demuxer to seek by timestamp and then decode from
+wherever it lands, and the cost and accuracy of that depend on where the
+keyframes are — which nobody knew. The index records it once:
+
+  data/frame_index.npz   per frame, in presentation order:
+                           pts   the stream timestamp (CAP_PROP_PTS units)
+                           key   1 if the frame is a keyframe (sync point)
+                           sync  index of the nearest keyframe at or before it
+
+It is built from a packet scan, not a decode: OpenCV's raw-stream mode
+(``CAP_PROP_FORMAT=-1``) hands back each compressed packet with its pts and
+keyframe flag, so indexing a 4K hour costs a read of the file. Packets arrive
+in decode order — with B-frames, pts 0, 3, 1, 2, ... — and are sorted into
+presentation order. P0 writes the index when it closes the recording, so a
+live book never pays for it; for anything else ``ensure_index`` builds it on
+first use — except in the reviews, which start ``index_in_background`` when
+they open and insert through the plain seek until it lands, so an insert
+never waits on a scan of a 10 GB recording. Size and mtime of the recording
+are stored with it, so a re-recorded or re-normalized file is re-indexed
+rather than misread.
+
+``FrameReader.read(i)`` then knows what reaching frame i costs: if the
+decoder is already between frame i's sync point and frame i, it decodes
+forward; otherwise it seeks to the sync point and decodes forward exactly
+``i - sync`` frames. The frame it lands on is checked against the index pts,
+so a container whose timestamps fool the seek is caught and walked to the
+right frame instead of returning a neighbour; a seek that overshoots is
+retried from earlier sync points, one GOP further back each time.
+
+Without an index (an OpenCV build whose backend has no raw mode, an
+unreadable file) the reader falls back to the plain POS_FRAMES seek.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils import log
+
+INDEX_FILE = "frame_index.npz"
+
+
+def scan_index(video_path):
+    """(pts, key) arrays in presentation order from a packet scan, or None."""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        return None
+    if not cap.set(cv2.CAP_PROP_FORMAT, -1):
+        cap.release()
+        return None
+    pts, key = [], []
+    while cap.grab():
+        pts.append(cap.get(cv2.CAP_PROP_PTS))
+        key.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME))
+    cap.release()
+    if not pts:
+        return None
+    pts = np.asarray(pts, dtype="<f8")
+    key = np.asarray(key, dtype=np.uint8) != 0
+    if np.all(pts >= 0) and len(np.unique(pts)) == len(pts):
+        order = np.argsort(pts, kind="stable")
+        pts, key = pts[order], key[order]
+    key[0] = True       # decoding always starts somewhere: treat frame 0 as one
+    return pts, key
+
+
+def sync_points(key):
+    """For each frame, the index of the last keyframe at or before it."""
+    idx = np.where(key, np.arange(len(key)), 0)
+    return np.maximum.accumulate(idx).astype("<i4")
+
+
+def file_stamp(video_path):
+    """(size, mtime_ns) of a file: what a sidecar checks to see it's still current."""
+    st = Path(video_path).stat()
+    return np.array([st.st_size, st.st_mtime_ns], dtype="<i8")
+
+
+def build_index(data_dir, video_path):
+    """Scan ``video_path`` and write ``data_dir/INDEX_FILE``; the index or None."""
+    scanned = scan_index(video_path)
+    if scanned is None:
+        return None
+    pts, key = scanned
+    index = {"pts": pts, "key": key.astype(np.uint8), "sync": sync_points(key)}
+    # Written aside and renamed: a review may load the index mid-build.
+    tmp = data_dir / f"{INDEX_FILE}.{os.getpid()}.{threading.get_ident()}.tmp.npz"
+    np.savez(str(tmp), stamp=file_stamp(video_path), **index)
+    os.replace(tmp, data_dir / INDEX_FILE)
+    return index
+
+
+def load_index(data_dir, video_path):
+    """The saved index for ``video_path``, or None if absent or stale."""
+    path = data_dir / INDEX_FILE
+    if not path.exists():
+        return None
+    try:
+        with np.load(str(path)) as z:
+            if not np.array_equal(z["stamp"], file_stamp(video_path)):
+                return None
+            return {k: z[k] for k in ("pts", "key", "sync")}
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def ensure_index(data_dir, video_path):
+    """The index for ``video_path``, building it on first use; None if the
+    recording can't be indexed."""
+    index = load_index(data_dir, video_path)
+    if index is None:
+        index = build_index(data_dir, video_path)
+        if index is not None:
+            log(f"  Indexed {len(index['pts'])} frames, "
+                f"{int(index['key'].sum())} keyframes -> {data_dir / INDEX_FILE}")
+    return index
+
+
+_building = {}                  # str(video_path) -> Thread
+_building_lock = threading.Lock()
+
+
+def index_in_background(data_dir, video_path):
+    """Build the index on a daemon thread unless it is already current (or
+    being built); returns the thread, or None when there is nothing to do."""
+    key = str(video_path)
+    with _building_lock:
+        t = _building.get(key)
+        if t is not None and t.is_alive():
+            return t
+        if load_index(data_dir, video_path) is not None:
+            return None
+        t = threading.Thread(target=ensure_index, args=(data_dir, video_path),
+                             daemon=True, name="frame-index")
+        _building[key] = t
+        t.start()
+        return t
+
+
+class FrameReader:
+    """Frame-exact reads by index: seek to the sync point, decode forward."""
+
+    def __init__(self, video_path, index=None):
+        self.cap = cv2.VideoCapture(str(video_path))
+        self.index = index
+        self._frame_of = ({float(p): i for i, p in enumerate(index["pts"])}
+                          if index is not None else None)
+        self._next = 0          # frame the next grab() decodes; None if unknown
+        self.seeks = 0
+        self.grabs = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def __len__(self):
+        if self.index is not None:
+            return len(self.index["pts"])
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def full_res(self, i):
+        """Whether frame ``i`` comes back at the recording's full resolution
+        (always, here; see archive.ArchiveReader)."""
+        return True
+
+    def read(self, i):
+        """The BGR frame at index ``i``, or None."""
+        if self.index is None:
+            return self._read_unindexed(i)
+        if not 0 <= i < len(self.index["pts"]):
+            return None
+        sync = int(self.index["sync"][i])
+        if self._next is None or not sync <= self._next <= i:
+            self._seek(sync)
+        frame = self._decode_to(i)
+        if frame is None:
+            return None
+        landed = self._landed(i)
+        if landed == i:
+            return frame
+        # The seek landed off-target. Decoding forward is always exact, so
+        # walk there from where we are once that's behind. Past the target,
+        # seek to the sync point before, and the one before that while it
+        # still overshoots: a few GOPs of decoding, not a walk from frame 0.
+        # (A pts the index doesn't know means the decoder reports timestamps
+        # differently from the packet scan; there is nothing to check against.)
+        back = sync
+        while landed > i and back > 0:
+            back = int(self.index["sync"][back - 1])
+            self._seek(back)
+            frame = self._decode_to(back)
+            if frame is None:
+                return None
+            landed = self._landed(back)
+        if landed == i:
+            self._next = i + 1
+            return frame
+        if landed > i:
+            self._next = None
+            return None
+        self._next = landed + 1
+        return self._decode_to(i)
+
+    def _landed(self, default):
+        """The frame the decoder just returned, by its pts."""
+        return self._frame_of.get(self.cap.get(cv2.CAP_PROP_PTS), default)
+
+    def _seek(self, fi):
+        self.cap.set(cv2.CAP_PROP_POS_FRAMES, fi)
+        self.seeks += 1
+        self._next = fi
+
+    def _decode_to(self, i):
+        while self._next < i:
+            if not self.cap.grab():
+                self._next = None
+                return None
+            self.grabs += 1
+            self._next += 1
+        ok, frame = self.cap.read()
+        self._next = i + 1 if ok else None
+        return frame if ok else None
+
+    def _read_unindexed(self, i):
+        if self._next != i:
+            self._seek(i)
+        ok, frame = self.cap.read()
+        self._next = i + 1 if ok else None
+        return frame if ok else None
+
+    def release(self):
+        self.cap.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
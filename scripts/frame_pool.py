@@ -0,0 +1,133 @@
+"""
+Preallocated full-resolution frame buffers for live capture.
+
+P0 used to hand the encoder thread fresh 4K arrays through a 64-deep queue
+and keep more of them in the settle window: up to ~1.6 GB allocated on
+demand, and exactly when the encoder hiccups — the moment the laptop can
+least afford it — the queue fills and the machine swaps.
+
+``FramePool`` allocates one slab up front, sized by a byte budget, and hands
+out its slots by index. The camera reads straight into a slot
+(``cap.read(pool.view(slot))`` — no per-frame allocation), and every holder
+of a frame takes a reference: the capture loop while it works on the frame,
+the encoder until it has written it, the settle window until the frame ages
+out. The last ``release`` returns the slot to the free list. When every slot
+is taken the capture loop waits in ``acquire`` — the same backpressure the
+bounded queue gave, but bounded in bytes — and the wait is counted, so a
+slow encoder shows up in the stats rather than in swap.
+
+``SharedFramePool`` puts the slab in named shared memory, so an encoder in
+another process can map the same slots: the frame the camera wrote is the
+one the encoder reads, with no copy and no pickling of 4K arrays. Slot
+indices are the only thing that crosses the process boundary.
+"""
+
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class FramePool:
+    """A fixed slab of equally shaped frame buffers, recycled by refcount."""
+
+    def __init__(self, shape, budget_bytes, dtype=np.uint8, min_slots=2):
+        self.shape = tuple(shape)
+        self.frame_bytes = int(np.prod(self.shape)) * np.dtype(dtype).itemsize
+        self.slots = max(min_slots, budget_bytes // self.frame_bytes)
+        self.slab = self._allocate((self.slots,) + self.shape, np.dtype(dtype))
+        self._refs = [0] * self.slots
+        self._free = list(range(self.slots - 1, -1, -1))
+        self._cond = threading.Condition()
+        self.acquired = 0
+        self.peak_in_use = 0
+        self.stalls = 0
+        self.stall_sec = 0.0
+
+    def _allocate(self, shape, dtype):
+        return np.empty(shape, dtype=dtype)
+
+    @property
+    def nbytes(self):
+        return self.slab.nbytes
+
+    def view(self, slot):
+        return self.slab[slot]
+
+    def acquire(self):
+        """A free slot with one reference, waiting if none is free."""
+        with self._cond:
+            if not self._free:
+                self.stalls += 1
+                t0 = time.perf_counter()
+                while not self._free:
+                    self._cond.wait()
+                self.stall_sec += time.perf_counter() - t0
+            slot = self._free.pop()
+            self._refs[slot] = 1
+            self.acquired += 1
+            self.peak_in_use = max(self.peak_in_use, self.slots - len(self._free))
+            return slot
+
+    def retain(self, slot):
+        with self._cond:
+            self._refs[slot] += 1
+
+    def release(self, slot):
+        with self._cond:
+            self._refs[slot] -= 1
+            if self._refs[slot] == 0:
+                self._free.append(slot)
+                self._cond.notify()
+
+    def close(self):
+        pass
+
+    def in_use(self):
+        with self._cond:
+            return self.slots - len(self._free)
+
+    def stats(self):
+        """Occupancy and stall counters, JSON-ready (for metadata.json)."""
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "budget_mb": round(self.nbytes / 2**20, 1),
+                "frames": self.acquired,
+                "in_use": self.slots - len(self._free),
+                "peak_in_use": self.peak_in_use,
+                "stalls": self.stalls,
+                "stall_sec": round(self.stall_sec, 3),
+            }
+
+
+class SharedFramePool(FramePool):
+    """A FramePool whose slab lives in named shared memory.
+
+    ``attach(name, shape, slots)`` maps it from another process. The
+    creating process owns the segment: ``close()`` there unlinks it.
+    """
+
+    def _allocate(self, shape, dtype):
+        size = int(np.prod(shape)) * dtype.itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @staticmethod
+    def attach(name, shape, slots, dtype=np.uint8):
+        """(SharedMemory, slab) for a pool created in another process."""
+        shm = shared_memory.SharedMemory(name=name)
+        return shm, np.ndarray((slots,) + tuple(shape), dtype=dtype, buffer=shm.buf)
+
+    def close(self):
+        self.slab = None
+        try:
+            self.shm.close()
+        except BufferError:         # a caller still holds a view; unmapped at exit
+            pass
+        self.shm.unlink()
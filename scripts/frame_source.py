@@ -0,0 +1,202 @@
+"""
+Analysis-resolution grayscale frames from a recording — P1's decode path.
+
+P1 only ever looks at a ~360p grayscale copy of each frame, yet the OpenCV
+path decodes every frame to a full 4K BGR array first and then shrinks and
+converts it in Python: three full-frame passes per frame, at the pace of the
+interpreter. ffmpeg can do the whole chain inside the decoder process —
+decode, area-scale, drop chroma — and hand over nothing but the small luma
+plane through a pipe, which P1 reads straight into a reusable numpy buffer.
+
+Both backends fill the same fixed-size ``uint8`` buffer, so callers never
+branch on which one ran. ffmpeg is optional, exactly as it is for the
+live-web normalize: when it isn't on PATH the OpenCV path runs instead.
+
+The two backends agree to within ``FFMPEG_TOLERANCE`` per frame pair on the
+mean absolute difference P1 records. ffmpeg takes luma straight from the
+decoder's YUV and scales it with its own area kernel, while OpenCV goes
+YUV -> BGR -> area resize -> BT.601 gray; the rounding differs, the scale
+does not (gray8 output is full range, like OpenCV's). Measured on a 720p
+mp4v test clip: max |diff| 0.16 on values up to 50, median ratio 0.9996 —
+two orders of magnitude below the gap between P2's peak height and the
+settle level.
+
+P1 also keeps two numbers per analysis frame in ``data/frame_features.npy``
+— sharpness (live capture's measure) and mean brightness — so keyframe
+selection can be re-ranked from the table without decoding the recording.
+"""
+
+import shutil
+import subprocess
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+# Per-frame-pair agreement between the ffmpeg and OpenCV backends on
+# motion_signal.npy, in mean gray levels (see the module docstring).
+FFMPEG_TOLERANCE = 0.25
+
+DECODERS = ("auto", "ffmpeg", "opencv")
+
+# One row per decoded frame, indexed like the recording; read back memory-
+# mapped, so a re-run of P3 touches only the rows its candidates need.
+FEATURES_FILE = "frame_features.npy"
+FEATURES_DTYPE = np.dtype([("sharpness", "<f8"), ("brightness", "<f8")])
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+@dataclass(frozen=True)
+class VideoInfo:
+    """What P1 needs to know about a recording before decoding it."""
+    width: int
+    height: int
+    fps: float
+    total_frames: int
+
+
+def probe_video(video_path) -> "VideoInfo | None":
+    """Dimensions, fps and frame count from the container, or None."""
+    cap = cv2.VideoCapture(str(video_path))
+    if not cap.isOpened():
+        return None
+    info = VideoInfo(width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                     fps=cap.get(cv2.CAP_PROP_FPS),
+                     total_frames=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    cap.release()
+    return info
+
+
+def features_table(sharpness, brightness):
+    """Structured FEATURES_DTYPE array from per-frame sequences."""
+    table = np.empty(len(sharpness), FEATURES_DTYPE)
+    table["sharpness"] = sharpness
+    table["brightness"] = brightness
+    return table
+
+
+def load_features(data_dir):
+    """The feature table, memory-mapped read-only, or None if P1 didn't write one."""
+    path = data_dir / FEATURES_FILE
+    if not path.exists():
+        return None
+    return np.load(str(path), mmap_mode="r")
+
+
+def analysis_size(width, height, analysis_height):
+    """(w, h) of the analysis frame — P1's rounding, so both backends agree."""
+    return int(width * analysis_height / height), analysis_height
+
+
+class GrayFrames:
+    """Sequential analysis-size grayscale frames, read into caller buffers.
+
+    ``read_into(buf)`` fills ``buf`` (``uint8``, shape ``(h, w)``) with the
+    next frame and returns True, or returns False at the end of the stream.
+    ``backend`` is which decoder actually runs: ``"ffmpeg"`` or ``"opencv"``.
+
+    ``start``/``count`` restrict the stream to frames ``start .. start+count-1``
+    (``count=None`` reads to the end) — the sharded P1 pass. Both backends
+    seek frame-exactly on CFR recordings: OpenCV by index, ffmpeg by time,
+    which is why a non-zero ``start`` needs ``fps``.
+    """
+
+    def __init__(self, video_path, size, decoder="auto", start=0, count=None,
+                 fps=None):
+        if decoder not in DECODERS:
+            raise ValueError(f"decoder must be one of {DECODERS}, not {decoder!r}")
+        self.video_path = str(video_path)
+        self.size = size
+        self.start = start
+        self._left = count          # frames still to hand out; None = to EOF
+        if start and not fps:
+            raise ValueError("seeking to a start frame needs the recording's fps")
+        self._fps = fps
+        self.backend = ("ffmpeg" if decoder == "ffmpeg"
+                        or (decoder == "auto" and ffmpeg_available())
+                        else "opencv")
+        self._proc = None
+        self._cap = None
+        self._frame = None          # OpenCV path: decoded full-res BGR
+        self._small = None          # OpenCV path: resized BGR
+        if self.backend == "ffmpeg":
+            self._open_ffmpeg()
+        else:
+            self._open_opencv()
+
+    def _open_ffmpeg(self):
+        w, h = self.size
+        # passthrough keeps ffmpeg from duplicating or dropping frames to hit
+        # a nominal rate: P1's timeline is the container's frame sequence,
+        # exactly what OpenCV's read() loop walks.
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+        if self.start:
+            # Input-side -ss decodes from the preceding keyframe and discards
+            # frames before the timestamp; aiming half a frame early keeps
+            # float rounding from dropping the start frame itself.
+            cmd += ["-ss", f"{(self.start - 0.5) / self._fps:.6f}"]
+        cmd += ["-i", self.video_path, "-an", "-vsync", "passthrough",
+                "-vf", f"scale={w}:{h}:flags=area,format=gray"]
+        if self._left is not None:
+            cmd += ["-frames:v", str(self._left)]
+        cmd += ["-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL,
+                                      bufsize=w * h * 4)
+
+    def _open_opencv(self):
+        self._cap = cv2.VideoCapture(self.video_path)
+        if not self._cap.isOpened():
+            raise OSError(f"Cannot open video: {self.video_path}")
+        if self.start:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, self.start)
+        w, h = self.size
+        self._small = np.empty((h, w, 3), np.uint8)
+
+    def read_into(self, buf) -> bool:
+        if self._left is not None:
+            if self._left <= 0:
+                return False
+            self._left -= 1
+        if self._proc is not None:
+            view = memoryview(buf).cast("B")
+            got = 0
+            while got < len(view):
+                n = self._proc.stdout.readinto(view[got:])
+                if not n:
+                    return False        # EOF (a torn last frame is dropped)
+                got += n
+            return True
+        ok, self._frame = self._cap.read(self._frame)
+        if not ok:
+            return False
+        cv2.resize(self._frame, self.size, dst=self._small,
+                   interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=buf)
+        return True
+
+    def close(self) -> "int | None":
+        """Release the decoder; returns ffmpeg's exit code (None for OpenCV)."""
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+            return None
+        if self._proc is None:
+            return None
+        proc, self._proc = self._proc, None
+        proc.stdout.close()
+        try:
+            return proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            return proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
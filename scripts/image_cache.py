@@ -0,0 +1,190 @@
+"""
+Decoded keyframes, shared by everything in the process that reads them.
+
+One P4 session decodes the same 4K JPEG many times over: the frame's
+preview geometry, the editor seed, the watchdog (as an anchor and again as
+a tracked frame, on every rescan after an edit) and the consensus vote. Most
+of those decodes are shrunk to ``TRACK_WORK_WIDTH`` straight away.
+
+``ImageCache`` keeps both kinds, each once:
+
+- ``full(path)`` — the image as ``cv2.imread`` returns it;
+- ``work(path, width)`` — the image at ``width`` px wide, exactly the size
+  ``cv2.resize(full, None, fx=s, fy=s)`` would give. It is decoded by
+  libjpeg at 1/2, 1/4 or 1/8 scale (``IMREAD_REDUCED_COLOR_*``), which scales
+  in the DCT domain and skips most of the decode, then area-resized the
+  rest of the way.
+
+Entries are keyed by path, size and mtime, so a file rewritten in place (P5
+crop, an insert) is a new entry and the old one ages out. Least recently
+used entries are evicted past the memory budget. Returned arrays are
+read-only because they are shared: a caller that drew on one would corrupt
+it for every later reader.
+
+``shared()`` is the process's cache, which the Tk and web P4 reviews and
+``consensus_geometry`` all use. Its budget is ``IMAGE_CACHE_MB``, or
+``configure(budget_mb)``.
+"""
+
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+from PIL import Image
+
+from utils import TRACK_WORK_WIDTH
+
+IMAGE_CACHE_MB = 512        # ~20 decoded 4K frames, or ~120 at work size
+_REDUCED = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+            (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+class ImageCache:
+    """Full and work-size decodes of image files, LRU within a byte budget."""
+
+    def __init__(self, budget_mb=IMAGE_CACHE_MB):
+        self.budget = int(budget_mb * 1e6)
+        self._items = OrderedDict()      # key -> (value, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "misses": 0, "reduced": 0, "evicted": 0}
+
+    def full(self, path):
+        """The image at full resolution (BGR), or None if unreadable."""
+        key = self._key(path, "full")
+        if key is None:
+            return None
+        found, img = self._lookup(key)
+        if not found:
+            img = _readonly(cv2.imread(str(path)))
+            self._store(key, img, 0 if img is None else img.nbytes)
+        return img
+
+    def work(self, path, width=TRACK_WORK_WIDTH):
+        """``(small, scale, (w, h))``: the image scaled by ``scale`` =
+        min(1, width / w) and its full size, or ``(None, 1.0, None)`` if
+        unreadable."""
+        key = self._key(path, f"work{width}")
+        if key is None:
+            return None, 1.0, None
+        found, value = self._lookup(key)
+        if not found:
+            value = self._decode_work(path, width)
+            self._store(key, value, 0 if value[0] is None else value[0].nbytes)
+        return value
+
+    def stats(self):
+        with self._lock:
+            looked = self.counts["hits"] + self.counts["misses"]
+            return {**self.counts, "entries": len(self._items),
+                    "mb": round(self._bytes / 1e6, 1),
+                    "budget_mb": round(self.budget / 1e6),
+                    "hit_rate": round(self.counts["hits"] / looked, 3) if looked else None}
+
+    def summary(self):
+        """One line for the session log."""
+        st = self.stats()
+        rate = "" if st["hit_rate"] is None else f" ({st['hit_rate']:.0%} hit)"
+        return (f"Image cache: {st['hits']} hits, {st['misses']} decodes{rate}, "
+                f"{st['reduced']} at reduced scale, {st['evicted']} evicted, "
+                f"{st['mb']:g} of {st['budget_mb']} MB")
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    # ── Internals ────────────────────────────────────────────
+
+    @staticmethod
+    def _key(path, kind):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return str(path), st.st_size, st.st_mtime_ns, kind
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.counts["hits"] += 1
+                return True, self._items[key][0]
+            self.counts["misses"] += 1
+            return False, None
+
+    def _store(self, key, value, nbytes):
+        if nbytes > self.budget:
+            return                       # bigger than the whole budget
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (value, nbytes)
+            self._bytes += nbytes
+            self._trim()
+
+    def _trim(self):
+        while self._bytes > self.budget:
+            _, (_, n) = self._items.popitem(last=False)
+            self._bytes -= n
+            self.counts["evicted"] += 1
+
+    def _decode_work(self, path, width):
+        try:
+            with Image.open(path) as im:
+                w, h = im.size               # the header only
+        except OSError:
+            return None, 1.0, None
+        s = min(1.0, width / w)
+        if s >= 1.0:
+            return self.full(path), 1.0, (w, h)
+        tw, th = round(w * s), round(h * s)  # what cv2.resize(fx=s) makes
+        small = None
+        for factor, flag in _REDUCED:
+            if math.ceil(w / factor) >= tw and math.ceil(h / factor) >= th:
+                small = cv2.imread(str(path), flag)
+                if small is not None and small.shape[:2] != (math.ceil(h / factor),
+                                                              math.ceil(w / factor)):
+                    small = None             # rotated by EXIF, or not a JPEG
+                if small is not None:
+                    with self._lock:
+                        self.counts["reduced"] += 1
+                break
+        if small is None:
+            small = cv2.imread(str(path))
+            if small is None:
+                return None, 1.0, None
+        if small.shape[1] != tw or small.shape[0] != th:
+            small = cv2.resize(small, (tw, th), interpolation=cv2.INTER_AREA)
+        return _readonly(small), s, (w, h)
+
+
+def _readonly(img):
+    if img is not None:
+        img.flags.writeable = False
+    return img
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared():
+    """The process-wide cache, created on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ImageCache()
+        return _shared
+
+
+def configure(budget_mb):
+    """Set the shared cache's budget (0 turns caching off); returns it."""
+    cache = shared()
+    with cache._lock:
+        cache.budget = int(budget_mb * 1e6)
+        cache._trim()
+    return cache
@@ -0,0 +1,160 @@
+"""
+Keyframe commits off the capture hot path — shared by both live front ends.
+
+Writing a capture used to happen inline. ``p0_live_capture`` JPEG-encoded
+and wrote a 4K frame inside its capture loop, and ``p0_web_capture`` wrote
+the browser's JPEG inside its socket handler. Each capture stalled preview
+and detection for tens of milliseconds, and the motion signal registered
+that stall as dropped frames. ``KeyframeWriter`` hands the work to a small
+thread pool. ``cv2.imencode`` and file writes both release the GIL, so the
+capture loop carries on while a keyframe is saved.
+
+A job owns its data until it is done. A full-resolution frame from the
+capture pool comes with a ``release`` callback, and the writer calls it once
+the JPEG is encoded, so the pool slot can't be recycled under the encoder.
+Files are written to a temporary name and renamed into place.
+
+Undo is safe at any point. ``discard`` on a job still in flight marks it
+cancelled. The worker checks the flag under the same lock it renames under,
+so a cancelled capture never appears in images/, and a finished one is
+deleted. ``on_done`` reports each completion (for the HUD's "saving"
+count), and ``close`` waits for the backlog before keyframes.json is
+written.
+"""
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from utils import log
+
+
+class _Job:
+    __slots__ = ("filename", "cancelled", "done")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.cancelled = False
+        self.done = False
+
+
+class KeyframeWriter:
+    """Encode and write keyframe images on worker threads."""
+
+    def __init__(self, directory, jpeg_quality=95, workers=2, on_done=None):
+        self.directory = directory
+        self.jpeg_quality = jpeg_quality
+        self.on_done = on_done
+        self._pool = ThreadPoolExecutor(max_workers=workers,
+                                        thread_name_prefix="keyframe-writer")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._jobs = {}                 # filename -> latest _Job for it
+        self._ids = itertools.count()
+        self._pending = 0
+        self.written = 0
+        self.discarded = 0
+        self.failed = 0
+        self.max_ms = 0.0
+        self._total_ms = 0.0
+
+    def submit(self, filename, image, release=None):
+        """Queue ``image`` for ``directory/filename``.
+
+        ``image`` is a BGR array (JPEG-encoded here) or the encoded bytes
+        themselves. ``release``, if given, runs as soon as the writer no
+        longer needs ``image``.
+        """
+        job = _Job(filename)
+        with self._lock:
+            self._jobs[filename] = job
+            self._pending += 1
+        self._pool.submit(self._run, job, image, release, next(self._ids))
+
+    def discard(self, filename):
+        """Undo a commit: cancel it if still in flight, else delete the file."""
+        with self._lock:
+            job = self._jobs.get(filename)
+            if job is not None and not job.done:
+                job.cancelled = True
+                return
+        (self.directory / filename).unlink(missing_ok=True)
+
+    def flush(self):
+        """Block until every write submitted so far has finished."""
+        with self._idle:
+            while self._pending:
+                self._idle.wait()
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    def _run(self, job, image, release, job_id):
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            if job.cancelled:
+                return
+            if isinstance(image, np.ndarray):
+                ok, buf = cv2.imencode(".jpg", image,
+                                       [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                if release is not None:
+                    release()
+                    release = None
+                data = buf.tobytes() if ok else b""
+            else:
+                data, ok = image, True
+            if not ok:
+                return
+            final = self.directory / job.filename
+            tmp = self.directory / f".{job.filename}.{job_id}.tmp"
+            tmp.write_bytes(data)
+            with self._lock:
+                if job.cancelled:
+                    tmp.unlink(missing_ok=True)
+                else:
+                    os.replace(tmp, final)
+                job.done = True
+        except OSError as e:
+            ok = False
+            log(f"  WARNING: could not write {job.filename}: {e}")
+        finally:
+            if release is not None:
+                release()
+            ms = (time.perf_counter() - t0) * 1000
+            with self._lock:
+                job.done = True
+                self._pending -= 1
+                if job.cancelled:
+                    self.discarded += 1
+                elif ok:
+                    self.written += 1
+                    self._total_ms += ms
+                    self.max_ms = max(self.max_ms, ms)
+                else:
+                    self.failed += 1
+                if self._jobs.get(job.filename) is job:
+                    del self._jobs[job.filename]
+                pending = self._pending
+                if not pending:
+                    self._idle.notify_all()
+            if self.on_done is not None:
+                self.on_done(job.filename, ok and not job.cancelled, pending)
+
+    def close(self):
+        """Wait for every queued write; the writer's stats."""
+        self._pool.shutdown(wait=True)
+        return self.stats()
+
+    def stats(self):
+        with self._lock:
+            return {"written": self.written, "discarded": self.discarded,
+                    "failed": self.failed, "pending": self._pending,
+                    "write_ms_mean": round(self._total_ms / max(self.written, 1), 1),
+                    "write_ms_max": round(self.max_ms, 1)}
@@ -0,0 +1,220 @@
+"""
+Recording encoders for live capture, and frame-delivery accounting.
+
+P0's capture read, 4K resize, detector, preview and the encoder thread all
+shared one interpreter, so whenever the software encode held the GIL the
+capture loop stalled, and that jitter went straight into the motion signal.
+``ProcessEncoder`` moves the encode into its own process. The capture loop
+reads each frame into a slot of a ``SharedFramePool``, and the encoder
+process maps the same shared memory and writes the slot out. Only the slot
+index and a timestamp cross the process boundary; the 4K array is never
+copied or pickled. When the encoder is done with a slot it reports back on a
+second queue, and a reaper thread in the capture process drops the
+encoder's reference to that slot.
+
+``ThreadEncoder`` is the in-process version (``--encoder thread``), with the
+same interface, for machines where shared memory is not available.
+
+``FrameTiming`` counts what the camera delivered late or not at all. The
+delivery gap is measured after each read. A frame arriving more than 1.5
+periods after the previous one is *late*. Every whole period missing from a
+gap is a *dropped* frame: the driver had no buffer for it because the loop
+was busy. Both counts go into metadata.json with the encoder's
+capture-to-disk latency.
+"""
+
+import multiprocessing as mp
+import queue
+import threading
+import time
+
+from frame_pool import SharedFramePool
+from utils import open_video_writer
+
+ENCODERS = ("process", "thread")
+
+# A frame is late once its gap exceeds this many frame periods.
+LATE_PERIODS = 1.5
+
+
+class FrameTiming:
+    """Late/dropped frame counts from the times frames were delivered."""
+
+    def __init__(self, fps):
+        self.period = 1.0 / fps
+        self.last = None
+        self.late = 0
+        self.dropped = 0
+        self.max_gap = 0.0
+
+    def tick(self, t):
+        if self.last is not None:
+            gap = t - self.last
+            self.max_gap = max(self.max_gap, gap)
+            if gap > LATE_PERIODS * self.period:
+                self.late += 1
+                self.dropped += max(0, int(round(gap / self.period)) - 1)
+        self.last = t
+
+    def stats(self):
+        return {"late_frames": self.late, "dropped_frames": self.dropped,
+                "max_gap_ms": round(self.max_gap * 1000, 1)}
+
+
+class _Latency:
+    def __init__(self):
+        self.n, self.total, self.max = 0, 0.0, 0.0
+
+    def add(self, sec):
+        self.n += 1
+        self.total += sec
+        self.max = max(self.max, sec)
+
+    def stats(self):
+        return {"frames_encoded": self.n,
+                "encode_latency_ms_mean": round(1000 * self.total / max(self.n, 1), 1),
+                "encode_latency_ms_max": round(1000 * self.max, 1)}
+
+
+class ThreadEncoder:
+    """Encode pool slots on a background thread of this process."""
+
+    kind = "thread"
+    dead = False
+
+    def __init__(self, pool, video_out, fps, size, codec, **writer_opts):
+        self.pool = pool
+        self.writer, self.codec = open_video_writer(video_out, fps, size, codec,
+                                                    **writer_opts)
+        self._jobs: "queue.Queue" = queue.Queue()
+        self._latency = _Latency()
+        if self.codec:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            slot, t = job
+            self.writer.write(self.pool.view(slot))
+            self._latency.add(time.monotonic() - t)
+            self.pool.release(slot)
+
+    def put(self, slot, t):
+        """Queue ``slot`` (captured at monotonic time ``t``); the encoder
+        releases the reference the caller retained for it."""
+        self._jobs.put((slot, t))
+
+    def close(self):
+        """Drain the backlog, finish the file; the encoder's stats."""
+        self._jobs.put(None)
+        self._thread.join()
+        error = self.writer.release() or ""
+        return {"encoder": self.kind, "codec": self.codec, "writer_error": error,
+                **self._latency.stats()}
+
+
+def _encode_process(shm_name, shape, slots, video_out, fps, size, codec, writer_opts,
+                    jobs, done):
+    """Encoder process body: write the slots named on ``jobs`` in order."""
+    shm, slab = SharedFramePool.attach(shm_name, shape, slots)
+    writer, used = open_video_writer(video_out, fps, size, codec, **writer_opts)
+    done.put(("ready", used))
+    error = ""
+    if writer is not None:
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            slot, t = job
+            writer.write(slab[slot])
+            done.put(("done", slot, time.monotonic() - t))
+        error = writer.release() or ""
+    del slab
+    shm.close()
+    done.put(("closed", error))
+
+
+class ProcessEncoder:
+    """Encode slots of a SharedFramePool in a separate process."""
+
+    kind = "process"
+
+    def __init__(self, pool, video_out, fps, size, codec, start_timeout=30.0,
+                 **writer_opts):
+        self.pool = pool
+        self.writer_error = ""
+        # spawn, not fork: the capture process has camera handles, GUI state
+        # and threads that a forked child must not inherit.
+        ctx = mp.get_context("spawn")
+        self._jobs, self._done = ctx.Queue(), ctx.Queue()
+        self._latency = _Latency()
+        self._proc = ctx.Process(
+            target=_encode_process, daemon=True,
+            args=(pool.name, pool.shape, pool.slots, str(video_out), fps,
+                  tuple(size), codec, writer_opts, self._jobs, self._done))
+        self._proc.start()
+        try:
+            _, self.codec = self._done.get(timeout=start_timeout)
+        except queue.Empty:
+            self.codec = ""
+        if not self.codec:
+            self._proc.join(timeout=5)
+            return
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self.dead = False
+        self._reaper = threading.Thread(target=self._reap, daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while True:
+            try:
+                msg = self._done.get(timeout=1.0)
+            except queue.Empty:
+                if self._proc.is_alive():
+                    continue
+                self._encoder_died()
+                break
+            if msg[0] == "closed":
+                self.writer_error = msg[1]
+                break
+            _, slot, latency = msg
+            self._latency.add(latency)
+            with self._lock:
+                self._inflight.discard(slot)
+            self.pool.release(slot)
+
+    def _encoder_died(self):
+        # Hand back every slot the dead encoder held, or capture would wait
+        # on them forever; from here on frames are released unwritten.
+        with self._lock:
+            self.dead = True
+            stranded, self._inflight = self._inflight, set()
+        for slot in stranded:
+            self.pool.release(slot)
+
+    def put(self, slot, t):
+        with self._lock:
+            if not self.dead:
+                self._inflight.add(slot)
+                self._jobs.put((slot, t))
+                return
+        self.pool.release(slot)
+
+    def close(self):
+        self._jobs.put(None)
+        self._reaper.join()
+        self._proc.join()
+        return {"encoder": self.kind, "codec": self.codec, "encoder_died": self.dead,
+                "writer_error": self.writer_error, **self._latency.stats()}
+
+
+def open_encoder(kind, pool, video_out, fps, size, codec, **writer_opts):
+    """The encoder ``kind`` names, over ``pool``; ``encoder.codec`` is the
+    fourcc that opened, "" if none did. ``writer_opts`` (x264 preset, gop)
+    go to open_video_writer."""
+    cls = ProcessEncoder if kind == "process" else ThreadEncoder
+    return cls(pool, video_out, fps, size, codec, **writer_opts)
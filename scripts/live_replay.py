@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Offline replay of the live detector, for tuning its thresholds per rig.
+
+Live capture's thresholds (``SETTLE``, ``TURN``, ``SETTLE_TIME`` and the
+smoothing window) depend on the camera, the lighting and the book. Until now,
+the only way to try a setting was to scan a book with it. Every live session
+already saves what the detector saw: ``data/motion_signal.npy``,
+``data/frame_features.npy`` (per-frame sharpness) and, once P4 has been
+through it, the operator-approved ``json/keyframes.json``. This replays those
+signals under a grid of settings and scores each setting against what the
+operator kept.
+
+``replay`` reproduces ``LiveDetector.update`` without a per-frame Python
+loop. The trailing mean comes from one ``np.cumsum``. That is the same
+running sum the detector keeps, added in the same order, so the smoothed
+values are bit-identical. Stillness runs come from a cumulative max over the
+non-still positions. The state machine then only visits events: each step
+is a ``searchsorted`` for the next settled frame or the next turn, so a
+session costs a few array passes plus one step per page. A capture names the
+sharpest frame in the trailing settle window, the first on ties, exactly as
+live capture does.
+
+Early capture (``--early``) is replayed by running the detector's state
+machine itself (``LiveDetector.advance``) over the saved signal. That is a
+Python step per frame, since its decay fit looks back along the signal, but
+it still needs no decoding. Every setting reports how long each page waited
+from coming to rest to being captured, so both modes can be compared on the
+same sessions.
+
+Replay assumes auto-capture ran unpaused the whole session, because pauses
+aren't recorded. Sessions without a feature table (recorded before it was
+saved) replay with flat sharpness, so a capture names the first frame of its
+window, and the agreement tolerance has to absorb that.
+
+``tune`` spreads a grid over a process pool. Every worker maps the sessions'
+arrays once and evaluates its share of the settings. Each result carries the
+capture indices, turn frames and agreement per session, plus totals.
+
+Usage:
+  python scripts/live_replay.py output/book1 output/book2
+  python scripts/live_replay.py output/book* --settle 1.5 2 2.5 --turn 4 5 6 \\
+      --settle-time 0.3 0.4 0.5 --smoothing 9 15 --json tuning.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+
+from frame_source import load_features
+from live_state import LiveDetector, latency_stats
+from utils import ProjectPaths, log
+
+# A capture within this many seconds of a reviewed keyframe agrees with it.
+DEFAULT_TOLERANCE_SEC = 0.5
+
+
+@dataclass(frozen=True)
+class Setting:
+    """One point of the grid: LiveDetector's tunable arguments."""
+    settle_threshold: float
+    turn_threshold: float
+    settle_time: float
+    smoothing_window: int
+    early_capture: bool = False
+
+
+def grid(settle, turn, settle_time, smoothing, early=(False,)):
+    """Every combination of the given values, as Settings."""
+    return [Setting(float(s), float(t), float(st), int(w), bool(e))
+            for s, t, st, w, e in itertools.product(settle, turn, settle_time,
+                                                    smoothing, early)]
+
+
+@dataclass
+class Session:
+    """What one live session saved: the signals to replay and the answer key."""
+    name: str
+    fps: float
+    motion: np.ndarray
+    sharpness: "np.ndarray | None"
+    reviewed: np.ndarray            # frame indices of the approved keyframes
+
+
+def load_session(output_dir) -> Session:
+    """A session's arrays (memory-mapped) and reviewed keyframe indices."""
+    paths = ProjectPaths(output_dir)
+    motion = np.load(str(paths.data / "motion_signal.npy"), mmap_mode="r")
+    meta = json.loads((paths.json / "metadata.json").read_text())
+    features = load_features(paths.data)
+    sharpness = None
+    if features is not None and len(features) == len(motion):
+        sharpness = features["sharpness"]
+    kf_path = paths.json / "keyframes.json"
+    reviewed = []
+    if kf_path.exists():
+        reviewed = sorted(int(k["frame_index"]) for k in json.loads(kf_path.read_text()))
+    return Session(name=paths.base.name, fps=float(meta["fps"]), motion=motion,
+                   sharpness=sharpness, reviewed=np.array(reviewed, dtype=np.int64))
+
+
+def trailing_mean(motion, window):
+    """LiveDetector's smoothed value at every slot, bit for bit."""
+    n = len(motion)
+    csum = np.zeros(n + 1)
+    np.cumsum(motion, out=csum[1:])
+    i = np.arange(1, n + 1)
+    win = np.minimum(window, i)
+    return (csum[i] - csum[i - win]) / win
+
+
+def replay(motion, sharpness, fps, setting):
+    """(capture frame indices, turn frames, latencies) LiveDetector makes
+    on ``motion``. Latencies are in frames, one per capture after a turn.
+
+    ``sharpness`` is the per-frame focus measure the capture choice ranks by,
+    or None to treat every frame as equally sharp.
+    """
+    if setting.early_capture:
+        return replay_early(motion, sharpness, fps, setting)
+    motion = np.asarray(motion, dtype=np.float64)
+    n = len(motion)
+    if n == 0:
+        return [], [], []
+    settle_frames = max(1, int(setting.settle_time * fps))
+    smooth = trailing_mean(motion, setting.smoothing_window)
+    still = smooth < setting.settle_threshold
+    pos = np.arange(n)
+    # Length of the still run ending at each slot: the distance back to the
+    # last slot that wasn't still.
+    last_break = np.maximum.accumulate(np.where(still, -1, pos))
+    settled = np.flatnonzero(pos - last_break >= settle_frames)
+    turning = np.flatnonzero(smooth > setting.turn_threshold)
+    # Same again for the raw signal: where the page came to rest.
+    raw_break = np.maximum.accumulate(np.where(motion < setting.settle_threshold, -1, pos))
+
+    captures, turns, latencies = [], [], []
+    at, waiting_for = 0, settled          # WAITING: the first settle captures
+    while True:
+        k = np.searchsorted(waiting_for, at)
+        if k == len(waiting_for):
+            break
+        idx = int(waiting_for[k])
+        if waiting_for is settled:
+            lo = max(0, idx - settle_frames + 1)
+            best = lo if sharpness is None else lo + int(np.argmax(sharpness[lo:idx + 1]))
+            captures.append(best)
+            if turns:
+                latencies.append(max(0, idx - int(raw_break[idx]) - 1))
+            waiting_for = turning         # SETTLED: wait for a turn
+        else:
+            turns.append(idx)
+            waiting_for = settled         # TURNING: wait for the next settle
+        at = idx + 1
+    return captures, turns, latencies
+
+
+def replay_early(motion, sharpness, fps, setting):
+    """``replay`` for early capture, by running the detector's state machine
+    frame by frame. An upgrade replaces the capture it supersedes."""
+    det = LiveDetector(fps=fps, settle_threshold=setting.settle_threshold,
+                       turn_threshold=setting.turn_threshold,
+                       settle_time=setting.settle_time,
+                       smoothing_window=setting.smoothing_window, early_capture=True)
+    motion = np.asarray(motion, dtype=np.float64).tolist()
+    sharp = [0.0] * len(motion) if sharpness is None else np.asarray(sharpness).tolist()
+    captures = []
+    for i, (m, sh) in enumerate(zip(motion, sharp)):
+        capture, _ = det.advance(i, m, sh)
+        if capture is None:
+            continue
+        if capture.replaces is not None and captures and captures[-1] == capture.replaces:
+            captures[-1] = capture.frame_index
+        else:
+            captures.append(capture.frame_index)
+    return captures, list(det.turn_frames), det.latencies
+
+
+def agreement(captures, reviewed, tolerance):
+    """Match captures to reviewed keyframes one-to-one within ``tolerance``
+    frames, nearest first. Counts plus precision/recall/F1."""
+    reviewed = np.asarray(reviewed)
+    order = np.argsort(reviewed, kind="stable")
+    ranked = reviewed[order]
+    pairs = []
+    for i, c in enumerate(captures):
+        lo = np.searchsorted(ranked, c - tolerance, side="left")
+        hi = np.searchsorted(ranked, c + tolerance, side="right")
+        pairs += [(abs(c - int(ranked[k])), i, int(order[k])) for k in range(lo, hi)]
+    pairs.sort()
+    used_c, used_r, offsets = set(), set(), []
+    for d, i, j in pairs:
+        if i not in used_c and j not in used_r:
+            used_c.add(i)
+            used_r.add(j)
+            offsets.append(d)
+    matched = len(offsets)
+    precision = matched / len(captures) if len(captures) else 0.0
+    recall = matched / len(reviewed) if len(reviewed) else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if matched else 0.0
+    return {"matched": matched, "missed": len(reviewed) - matched,
+            "extra": len(captures) - matched, "precision": round(precision, 4),
+            "recall": round(recall, 4), "f1": round(f1, 4),
+            "mean_offset_frames": round(float(np.mean(offsets)), 2) if offsets else None}
+
+
+def evaluate(sessions, setting, tolerance_sec=DEFAULT_TOLERANCE_SEC):
+    """One setting over every session: per-session results and totals."""
+    per_session, matched, missed, extra, waits = {}, 0, 0, 0, []
+    for s in sessions:
+        captures, turns, latencies = replay(s.motion, s.sharpness, s.fps, setting)
+        agree = agreement(captures, s.reviewed.tolist(), tolerance_sec * s.fps)
+        per_session[s.name] = {"captures": captures, "turn_frames": turns, **agree,
+                               "capture_latency": latency_stats(latencies, s.fps)}
+        matched += agree["matched"]
+        missed += agree["missed"]
+        extra += agree["extra"]
+        waits += [lat / s.fps for lat in latencies]
+    f1 = 2 * matched / (2 * matched + missed + extra) if matched else 0.0
+    return {"setting": asdict(setting), "matched": matched, "missed": missed,
+            "extra": extra, "f1": round(f1, 4),
+            "capture_latency": latency_stats(waits, 1.0), "sessions": per_session}
+
+
+_worker_sessions = None
+
+
+def _init_worker(dirs):
+    global _worker_sessions
+    _worker_sessions = [load_session(d) for d in dirs]
+
+
+def _evaluate_chunk(settings, tolerance_sec):
+    return [evaluate(_worker_sessions, s, tolerance_sec) for s in settings]
+
+
+def tune(dirs, settings, workers=0, tolerance_sec=DEFAULT_TOLERANCE_SEC):
+    """Evaluate ``settings`` over the sessions in ``dirs``, best first.
+
+    ``workers`` processes share the grid (0 = one per core, 1 = in this
+    process). Ranked by total F1 against the reviewed keyframes, then by
+    fewest extra captures.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(settings) == 1:
+        sessions = [load_session(d) for d in dirs]
+        results = [evaluate(sessions, s, tolerance_sec) for s in settings]
+    else:
+        chunks = [settings[k::workers] for k in range(workers) if settings[k::workers]]
+        with ProcessPoolExecutor(max_workers=len(chunks), initializer=_init_worker,
+                                 initargs=([str(d) for d in dirs],)) as executor:
+            futures = [executor.submit(_evaluate_chunk, c, tolerance_sec) for c in chunks]
+            results = [None] * len(settings)
+            for k, f in enumerate(futures):     # back into grid order, so ties
+                results[k::workers] = f.result()    # rank the same either way
+    return sorted(results, key=lambda r: (-r["f1"], r["extra"], r["missed"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay live sessions under a grid of detector settings")
+    parser.add_argument("sessions", nargs="+",
+                        help="Output directories of reviewed live sessions")
+    parser.add_argument("--settle", type=float, nargs="+", default=[1.5, 2.0, 2.5])
+    parser.add_argument("--turn", type=float, nargs="+", default=[4.0, 5.0, 6.0])
+    parser.add_argument("--settle-time", type=float, nargs="+", default=[0.3, 0.4, 0.5])
+    parser.add_argument("--smoothing", type=int, nargs="+", default=[9, 15])
+    parser.add_argument("--early", action="store_true",
+                        help="Also replay every setting with early capture, to "
+                             "compare pages captured and latency per page")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE_SEC,
+                        help="Seconds a capture may be from a reviewed keyframe "
+                             "and still agree with it")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processes to spread the grid over (0 = one per core)")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--json", type=str, default=None,
+                        help="Write every setting's full results here")
+    args = parser.parse_args()
+
+    dirs = []
+    for d in map(Path, args.sessions):
+        if (d / "data" / "motion_signal.npy").exists() and (d / "json" / "metadata.json").exists():
+            dirs.append(d)
+        else:
+            log(f"  Skipping {d}: no motion signal or metadata")
+    if not dirs:
+        log("ERROR: no sessions to replay")
+        sys.exit(1)
+    settings = grid(args.settle, args.turn, args.settle_time, args.smoothing,
+                    early=(False, True) if args.early else (False,))
+    log(f"Replaying {len(dirs)} session(s) under {len(settings)} settings")
+    t0 = time.time()
+    results = tune(dirs, settings, args.workers, args.tolerance)
+    log(f"  done in {time.time() - t0:.1f}s")
+
+    log(f"{'settle':>7} {'turn':>6} {'time':>5} {'win':>4} {'mode':>8}  "
+        f"{'F1':>6} {'match':>6} {'miss':>5} {'extra':>6} {'wait ms':>8}")
+    for r in results[:args.top]:
+        s = r["setting"]
+        wait = r["capture_latency"].get("latency_ms_mean")
+        log(f"{s['settle_threshold']:7.2f} {s['turn_threshold']:6.2f} "
+            f"{s['settle_time']:5.2f} {s['smoothing_window']:4d} "
+            f"{'early' if s['early_capture'] else 'standard':>8}  {r['f1']:6.3f} "
+            f"{r['matched']:6d} {r['missed']:5d} {r['extra']:6d} "
+            f"{'-' if wait is None else f'{wait:.0f}':>8}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+        log(f"  Results -> {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,8 +27,19 @@ A capture always names the *sharpest* frame in the trailing settle window, not
 the frame that happened to trip the threshold: the operator's hand leaves the
 frame gradually and the camera needs a moment to refocus, so the last frame of
 a settle is rarely the best one in it.
+
+Early capture (``early_capture=True``) trades that wait for a prediction.
+The detector commits a *provisional* capture straight away once two things
+hold: the raw motion has been under the settle threshold for a few frames,
+and the smoothed signal is decaying fast enough to cross the threshold
+within one smoothing window. The decay is an exponential fitted (log-linear
+least squares) to the signal's current decline. Until
+the ordinary settle condition confirms the page, a still frame that is
+clearly sharper replaces it (``reason="upgrade"``, ``replaces`` naming the
+frame it supersedes), and the caller overwrites that keyframe in place.
 """
 
+import math
 from collections import deque
 from dataclasses import dataclass
 
@@ -36,11 +47,17 @@ import cv2
 import numpy as np
 from scipy.ndimage import uniform_filter1d
 
+from frame_source import features_table
+
 
 WAITING = "WAITING"
 SETTLED = "SETTLED"
 TURNING = "TURNING"
 
+# Early capture: an upgrade must beat the provisional frame's sharpness by
+# this factor, so sensor noise doesn't rewrite a 4K keyframe every frame.
+UPGRADE_GAIN = 1.05
+
 
 def laplacian_sharpness(gray):
     """Focus measure: variance of the Laplacian over the frame's centre 80%.
@@ -90,6 +107,47 @@ def keyframe_record(capture, fps, spread_start, filename, source="live"):
     }
 
 
+class Series:
+    """Append-only float64 samples in a preallocated array, grown by doubling.
+
+    The detector appends a value per timeline slot for the whole session; a
+    Python list of floats costs ~32 bytes a sample and has to be copied out
+    again for every artifact, where this holds 8 and hands out views.
+    """
+
+    def __init__(self, capacity=4096):
+        self._buf = np.empty(capacity, dtype=np.float64)
+        self._n = 0
+
+    def append(self, value):
+        if self._n == len(self._buf):
+            self._buf = np.concatenate([self._buf, np.empty_like(self._buf)])
+        self._buf[self._n] = value
+        self._n += 1
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        return float(self._buf[:self._n][i])
+
+    def array(self):
+        """A copy of the samples so far."""
+        return self._buf[:self._n].copy()
+
+
+def latency_stats(latencies, fps, **extra):
+    """Summary of per-page capture latencies (frames), in milliseconds."""
+    ms = np.asarray(latencies, dtype=np.float64) * 1000.0 / fps
+    stats = {"captures": int(ms.size)}
+    if ms.size:
+        stats.update(latency_ms_mean=round(float(ms.mean()), 1),
+                     latency_ms_median=round(float(np.median(ms)), 1),
+                     latency_ms_p90=round(float(np.percentile(ms, 90)), 1),
+                     latency_ms_max=round(float(ms.max()), 1))
+    return {**extra, **stats}
+
+
 @dataclass(frozen=True)
 class Capture:
     """The detector's choice of which frame to keep, for the caller to resolve.
@@ -102,6 +160,7 @@ class Capture:
     sharpness: float
     motion: float
     reason: str
+    replaces: "int | None" = None   # early capture: the provisional frame superseded
 
 
 @dataclass(frozen=True)
@@ -134,7 +193,7 @@ class LiveDetector:
     """
 
     def __init__(self, fps=30.0, settle_threshold=2.0, turn_threshold=5.0,
-                 settle_time=0.4, smoothing_window=15):
+                 settle_time=0.4, smoothing_window=15, early_capture=False):
         self.fps = fps
         self.settle_threshold = settle_threshold
         self.turn_threshold = turn_threshold
@@ -142,16 +201,37 @@ class LiveDetector:
         # Stillness is counted in frames, so the wall-clock settle time has to
         # be resolved against fps once, here, rather than per frame.
         self.settle_frames = max(1, int(settle_time * fps))
+        self.early_capture = early_capture
+        # Raw frames under the settle threshold before a provisional capture.
+        self.early_frames = max(2, self.settle_frames // 3)
 
         self.state = WAITING
         self.paused = False
-        self.motion = []            # one value per frame -> motion_signal.npy
+        self.motion = Series()      # one value per frame -> motion_signal.npy
         self.turn_frames = []       # frame index of each page turn -> peaks.npy
+        # Per-frame sharpness and brightness -> frame_features.npy, so a session
+        # can be replayed offline (live_replay.py) with the captures it made.
+        self.sharpness = Series()
+        self.brightness = Series()
+        # Running sums of motion, csum[k] = sum(motion[:k]): the trailing mean
+        # is one subtraction per frame instead of a mean over the window.
+        # live_replay.py computes the same sums with np.cumsum, which adds in
+        # the same order, so offline replay reproduces these bits exactly.
+        self._csum = Series()
+        self._csum.append(0.0)
 
         self._window = deque(maxlen=self.settle_frames)   # (frame_index, sharpness)
         self._prev = None
         self._still_run = 0         # consecutive low-motion frames
+        self._raw_still = 0         # ... by raw, unsmoothed motion
         self._saw_turn = False
+        self._decay = []            # smoothed motion since the turn began
+        self._provisional = None    # early capture awaiting confirmation
+
+        # Frames from the page coming to rest to its capture, per settle.
+        self.latencies = []
+        self.provisional = 0
+        self.upgrades = 0
 
     # ── Driving ──────────────────────────────────────────────
 
@@ -177,18 +257,32 @@ class LiveDetector:
                   if self._prev is not None else 0.0)
         self._prev = gray
         sharpness = laplacian_sharpness(gray)
+        brightness = float(np.mean(gray))
+        capture, smooth = self.advance(frame_index, motion, sharpness, brightness, span)
+        return Tick(frame_index=frame_index, motion=motion, smooth=smooth,
+                    brightness=brightness, sharpness=sharpness,
+                    state=self.state, capture=capture)
 
+    def advance(self, frame_index, motion, sharpness, brightness=0.0, span=1):
+        """The state machine alone, on measurements already taken: what
+        :meth:`update` runs after measuring ``gray``, and what an offline
+        replay feeds from a saved signal. Returns (capture or None, smooth)."""
         capture, smooth = None, 0.0
         for idx in range(frame_index - span + 1, frame_index + 1):
             self.motion.append(motion)
+            self.sharpness.append(sharpness)
+            self.brightness.append(brightness)
+            n = len(self.motion)
+            self._csum.append(self._csum[n - 1] + motion)
 
             # Trailing mean over the smoothing window — the online counterpart
             # of P1's uniform filter. Thresholding the raw per-frame difference
             # would chatter between states on sensor noise alone.
-            win_n = min(self.smoothing_window, len(self.motion))
-            smooth = float(np.mean(self.motion[-win_n:]))
+            win_n = min(self.smoothing_window, n)
+            smooth = (self._csum[n] - self._csum[n - win_n]) / win_n
 
             self._window.append((idx, sharpness))
+            self._raw_still = self._raw_still + 1 if motion < self.settle_threshold else 0
 
             if not self.paused:
                 still = smooth < self.settle_threshold
@@ -204,15 +298,68 @@ class LiveDetector:
                         self.state = TURNING
                         self._saw_turn = True
                         self.turn_frames.append(idx)
+                        self._decay = []
                 elif self.state == TURNING:
                     if settled and self._saw_turn:
-                        capture = self._take("settle") or capture
+                        if self._provisional is None:
+                            capture = self._take("settle") or capture
+                            self._settle_latency(idx)
+                        self._provisional = None
                         self.state = SETTLED
                         self._saw_turn = False
+                    elif self.early_capture:
+                        capture = self._early(idx, motion, sharpness, smooth) or capture
+        return capture, smooth
+
+    def _early(self, idx, motion, sharpness, smooth) -> "Capture | None":
+        """Early capture's step while TURNING: commit or upgrade a provisional."""
+        if self._provisional is not None:
+            if (motion < self.settle_threshold
+                    and sharpness > self._provisional.sharpness * UPGRADE_GAIN):
+                self._provisional = Capture(frame_index=idx, sharpness=sharpness,
+                                            motion=motion, reason="upgrade",
+                                            replaces=self._provisional.frame_index)
+                self.upgrades += 1
+                return self._provisional
+            return None
+        self._decay.append(smooth)
+        if self._raw_still < self.early_frames or not self._settling_soon():
+            return None
+        capture = self._take("early", since=idx - self._raw_still + 1)
+        if capture is not None:
+            self._provisional = capture
+            self.provisional += 1
+            self._settle_latency(idx)
+        return capture
 
-        return Tick(frame_index=frame_index, motion=motion, smooth=smooth,
-                    brightness=float(np.mean(gray)), sharpness=sharpness,
-                    state=self.state, capture=capture)
+    def _settling_soon(self):
+        """Whether the smoothed motion is under the settle threshold already,
+        or its current decay, fitted as an exponential, crosses it within
+        one smoothing window."""
+        if self._decay[-1] < self.settle_threshold:
+            return True
+        k = len(self._decay) - 1
+        while k > 0 and self._decay[k - 1] >= self._decay[k]:
+            k -= 1
+        y = np.log(self._decay[k:])
+        if len(y) < 3:
+            return False
+        x = np.arange(len(y), dtype=np.float64)
+        slope = float(np.polyfit(x, y, 1)[0])
+        if slope >= 0:
+            return False
+        ahead = (math.log(self.settle_threshold) - y[-1]) / slope
+        return ahead <= self.smoothing_window
+
+    def _settle_latency(self, idx):
+        self.latencies.append(self._raw_still - 1 if self._raw_still else 0)
+
+    def rebase(self, gray):
+        """Measure the next frame's motion against ``gray`` instead of the
+        last frame seen — for a source that changed how it renders frames
+        (the browser link changing resolution), so the switch itself isn't
+        read as motion."""
+        self._prev = gray
 
     def force_capture(self, reason="manual") -> "Capture | None":
         """Capture now (the operator's override), and treat the book as settled.
@@ -225,6 +372,7 @@ class LiveDetector:
         if capture is not None:
             self.state = SETTLED
             self._saw_turn = False
+            self._provisional = None
         return capture
 
     def set_paused(self, paused: bool):
@@ -237,18 +385,31 @@ class LiveDetector:
         self.paused = bool(paused)
         self._still_run = 0
 
-    def _take(self, reason) -> "Capture | None":
-        if not self._window:
+    def _take(self, reason, since=None) -> "Capture | None":
+        window = [w for w in self._window if since is None or w[0] >= since]
+        if not window:
             return None
-        frame_index, sharpness = max(self._window, key=lambda w: w[1])
+        frame_index, sharpness = max(window, key=lambda w: w[1])
         return Capture(frame_index=frame_index, sharpness=sharpness,
                        motion=self.motion[frame_index], reason=reason)
 
     # ── Artifacts ────────────────────────────────────────────
 
+    def capture_latency(self):
+        """Page-at-rest to capture, over the session's settle captures (for
+        metadata.json): what early capture saves, per page."""
+        return latency_stats(self.latencies, self.fps,
+                             mode="early" if self.early_capture else "standard",
+                             provisional=self.provisional, upgrades=self.upgrades)
+
     def motion_signal(self):
         """The raw per-frame motion signal, as P1 would have written it."""
-        return np.array(self.motion, dtype=np.float64)
+        return self.motion.array()
+
+    def features(self):
+        """Per-frame sharpness and brightness, in the table P1 writes to
+        frame_features.npy (the same sharpness measure, at analysis size)."""
+        return features_table(self.sharpness.array(), self.brightness.array())
 
     def smoothed_signal(self):
         """The offline smoothing of that signal — P1's, not the online trailing mean.
@@ -0,0 +1,723 @@
+#!/usr/bin/env python3
+"""
+Load test for the browser capture server: simulated stations, no camera.
+
+Sizing a machine for web capture used to mean pointing real cameras at real
+books, and a throughput regression on the capture path only showed up as a
+laggy session. This plays the browser's side of ``p0_web_capture`` from
+Python instead, for any number of stations at once, against the real server
+running as its own process. Each simulated station speaks the page's whole
+protocol over a real socket:
+
+* the analysis stream, as delta frames (or raw, with the server's
+  ``--analysis-encoding raw``) at the level the server asks for, following
+  its ``link`` messages up and down;
+* a recorder chunk every ``timeslice_ms``;
+* a JPEG reply to every capture request, at the camera's full resolution;
+* a stats report every two seconds, stamped with the wall clock, so the
+  server's link adapter judges this link as it would a browser's.
+
+Frames go out at the camera's rate times ``--speed`` (0 = as fast as the
+server takes them). A station that falls behind its schedule skips frames,
+as a browser tab does, and the server sees a gap.
+
+The session is either synthetic (printed pages held still for
+``--page-sec``, with a page turn sliding the next one in) or a recording
+(``--recording``), decoded once at the analysis height and shared by every
+station. A synthetic recording is filler bytes at ``--recording-mbps``, so
+the server's normalize fails on it at Finish; replay a real recording to
+load the normalize too. A minute of 360p frames held for replay is about
+400 MB.
+
+Every station is a project under ``--out``: one ``p0_web_capture`` process
+per station, or one ``stations.py`` serving them all (``--server
+stations``). The report has, per station, what was sent and what the server
+made of it (received, gap-filled, duplicate and undecodable frames,
+captures, the final link level), the server's own handling time per message
+kind (``web.handling`` in metadata.json), the round trip from a frame
+leaving to its tick coming back, and each server process's CPU time and
+memory: after every station connected, at its peak, and once the streams
+ended. ``--json`` writes it all out, for comparing runs.
+
+Usage:
+  python scripts/load_web_capture.py
+  python scripts/load_web_capture.py --stations 4 --seconds 120
+  python scripts/load_web_capture.py --recording recordings/mybook.mp4 --speed 2
+  python scripts/load_web_capture.py --stations 3 --server stations --json load.json
+
+Options this script doesn't know (--fps, --early-capture, --ws-deflate, ...)
+go to the server, as p0_web_capture would take them.
+"""
+
+import argparse
+import json
+import os
+import queue
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from analysis_link import encode_delta, reference_frame
+from miniws import CLOSE, TEXT, WebSocket, accept_key
+from p0_web_capture import MSG_CHUNK, MSG_DELTA, MSG_FRAME, MSG_JPEG
+from utils import log
+
+SCRIPTS = Path(__file__).resolve().parent
+STATS_SEC = 2.0              # the page's stats cadence
+KEY = "dGhlIHNhbXBsZSBub25jZQ=="
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(
+        description="Load test for the browser capture server, no camera needed")
+    p.add_argument("--stations", type=int, default=1,
+                   help="Simulated stations capturing at once")
+    p.add_argument("--server", choices=("capture", "stations"), default="capture",
+                   help="One p0_web_capture process per station, or one "
+                        "stations.py for all of them")
+    p.add_argument("--seconds", type=float, default=60.0,
+                   help="Session length (a recording caps it at its own)")
+    p.add_argument("--speed", type=float, default=1.0,
+                   help="Playback rate: 1 = real time, 2 = twice as fast, "
+                        "0 = as fast as the server takes frames")
+    p.add_argument("--recording", help="Replay this video instead of a synthetic book")
+    p.add_argument("--camera", default="3840x2160",
+                   help="WxH of the simulated camera (synthetic sessions)")
+    p.add_argument("--camera-fps", type=float, default=30.0,
+                   help="Frame rate of the simulated camera (synthetic sessions)")
+    p.add_argument("--page-sec", type=float, default=3.0,
+                   help="Seconds each synthetic page lies still")
+    p.add_argument("--turn-sec", type=float, default=0.6,
+                   help="Seconds each synthetic page turn takes")
+    p.add_argument("--recording-mbps", type=float, default=12.0,
+                   help="Bitrate of the synthetic recording, in Mbit/s")
+    p.add_argument("--out", help="Directory for the stations' projects "
+                                 "(default: a temporary one, removed after)")
+    p.add_argument("--json", help="Also write the report here")
+    args, server_argv = p.parse_known_args(argv)
+    args.server_argv = server_argv
+    return args
+
+
+# ── What the stations play ───────────────────────────────────
+
+
+class SyntheticBook:
+    """Printed pages under a still camera, turned every ``page_sec``."""
+
+    def __init__(self, camera, fps, seconds, page_sec, turn_sec, mbps):
+        self.camera = camera                 # (w, h)
+        self.fps = fps
+        self.frames = int(seconds * fps)
+        self.mime = "video/webm"
+        self._period = int(round((page_sec + turn_sec) * fps))
+        self._turn = max(1, int(round(turn_sec * fps)))
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._filler = np.random.default_rng(1).integers(
+            0, 256, 1 << 20, np.uint8).tobytes()
+        self._chunk_bytes = mbps * 1e6 / 8
+
+    def _page(self, n, h):
+        """Page ``n`` at height ``h``: blocks of dark 'text' on paper."""
+        with self._lock:
+            key = (n, h)
+            if key not in self._pages:
+                w = h * self.camera[0] // self.camera[1]
+                rng = np.random.default_rng(n)
+                ink = rng.random((max(1, h // 6), max(1, w // 4))) < 0.3
+                page = np.where(ink, 40, 215).astype(np.uint8)
+                self._pages[key] = cv2.resize(page, (w, h),
+                                              interpolation=cv2.INTER_NEAREST)
+                while len(self._pages) > 8:
+                    del self._pages[next(iter(self._pages))]
+            return self._pages[key]
+
+    def frame(self, i, h):
+        """Gray frame ``i`` at height ``h``."""
+        n, t = divmod(i, self._period)
+        still = self._period - self._turn
+        page = self._page(n, h)
+        if t < still:
+            return page
+        # The turn slides the next page in from the right.
+        shift = page.shape[1] * (t - still + 1) // (self._turn + 1)
+        return np.hstack([page[:, shift:], self._page(n + 1, h)[:, :shift]])
+
+    def jpeg(self, i):
+        gray = self.frame(i, self.camera[1])
+        ok, buf = cv2.imencode(".jpg", cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR),
+                               [cv2.IMWRITE_JPEG_QUALITY, 90])
+        return buf.tobytes()
+
+    def chunk(self, seq, seconds):
+        """Recorder chunk ``seq``, ``seconds`` of recording long."""
+        n = int(self._chunk_bytes * seconds)
+        reps = -(-n // len(self._filler))
+        return (self._filler * reps)[:n]
+
+
+class RecordedBook:
+    """A recording, decoded once at the analysis height."""
+
+    def __init__(self, path, seconds, analysis_height):
+        cap = cv2.VideoCapture(str(path))
+        if not cap.isOpened():
+            raise OSError(f"cannot open {path}")
+        self.path = Path(path)
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.camera = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                       int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.mime = "video/mp4" if self.path.suffix.lower() == ".mp4" else "video/webm"
+        w = self.camera[0] * analysis_height // self.camera[1]
+        self._frames = []
+        while len(self._frames) < seconds * self.fps:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            self._frames.append(cv2.resize(gray, (w, analysis_height),
+                                           interpolation=cv2.INTER_AREA))
+        cap.release()
+        if not self._frames:
+            raise OSError(f"no frames in {path}")
+        self.frames = len(self._frames)
+        self._data = self.path.read_bytes()
+        # The file's bytes, spread evenly over the part being replayed.
+        total = cv2.VideoCapture(str(path)).get(cv2.CAP_PROP_FRAME_COUNT) or self.frames
+        self._bytes_per_sec = len(self._data) / (total / self.fps)
+        self._sent = 0
+        self._jpeg_lock = threading.Lock()
+        self._cap = None
+
+    def frame(self, i, h):
+        gray = self._frames[i]
+        if gray.shape[0] == h:
+            return gray
+        w = gray.shape[1] * h // gray.shape[0]
+        return cv2.resize(gray, (w, h), interpolation=cv2.INTER_AREA)
+
+    def jpeg(self, i):
+        with self._jpeg_lock:
+            if self._cap is None:
+                self._cap = cv2.VideoCapture(str(self.path))
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, i)
+            ok, frame = self._cap.read()
+        if not ok:
+            return b""
+        return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+
+    def chunk(self, seq, seconds):
+        start = int(seq * self._bytes_per_sec * seconds)
+        end = int((seq + 1) * self._bytes_per_sec * seconds)
+        return self._data[start:end]
+
+    def tail(self, seq, seconds):
+        """Everything after chunk ``seq - 1``: the recorder's last chunk."""
+        return self._data[int(seq * self._bytes_per_sec * seconds):]
+
+
+# ── A simulated browser ──────────────────────────────────────
+
+
+def ws_connect(host, port, path):
+    sock = socket.create_connection((host, port), timeout=10)
+    sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n"
+                  "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {KEY}\r\n"
+                  "Sec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = b""
+    while b"\r\n\r\n" not in head:
+        byte = sock.recv(1)
+        if not byte:
+            raise ConnectionError("server closed the connection during the upgrade")
+        head += byte
+    status = head.split(b"\r\n", 1)[0]
+    if b" 101 " not in status or accept_key(KEY).encode() not in head:
+        raise ConnectionError(f"no websocket upgrade: {status!r}")
+    sock.settimeout(None)
+    return WebSocket(sock, client=True), sock
+
+
+class Station:
+    """One browser tab's side of a capture session."""
+
+    def __init__(self, name, book, speed):
+        self.name = name
+        self.book = book
+        self.speed = speed
+        self.ws = None
+        self.sock = None
+        self.config = None
+        self.level = None             # {"height", "fps"} the server asked for
+        self.encoding = "delta"
+        self.timeslice = 1.0
+        self.sent = {"frame": 0, "delta": 0, "jpeg": 0, "chunk": 0}
+        self.sent_bytes = 0
+        self.skipped = 0              # frames the schedule had already passed
+        self.captures = 0
+        self.link_changes = 0
+        self.finished = None
+        self.error = None
+        self.rtt_ms = []              # frame sent -> its tick back
+        self._sent_at = {}
+        self._configured = threading.Event()
+        self.done = threading.Event()
+        self._jpegs = queue.Queue()
+
+    def connect(self, host, port, path):
+        self.ws, self.sock = ws_connect(host, port, path)
+        threading.Thread(target=self._receive, name=f"{self.name}-recv",
+                         daemon=True).start()
+        threading.Thread(target=self._reply, name=f"{self.name}-jpeg",
+                         daemon=True).start()
+        if not self._configured.wait(30):
+            raise ConnectionError(f"{self.name}: no config from the server")
+        if self.error:
+            raise ConnectionError(f"{self.name}: {self.error}")
+
+    # Inbound, on the receive thread.
+
+    def _receive(self):
+        try:
+            while True:
+                op, payload = self.ws.recv()
+                if op == CLOSE:
+                    break
+                if op != TEXT:
+                    continue
+                m = json.loads(bytes(payload).decode())
+                for msg in m["messages"] if m["type"] == "batch" else [m]:
+                    self._on_message(msg)
+        except (ConnectionError, OSError) as e:
+            if not self.done.is_set() and self.finished is None:
+                self.error = self.error or f"connection lost: {e}"
+        self._configured.set()
+        self.done.set()
+
+    def _on_message(self, m):
+        t = m["type"]
+        if t == "tick":
+            sent_at = self._sent_at.pop(m["frame_index"], None)
+            if sent_at is not None:
+                self.rtt_ms.append((time.perf_counter() - sent_at) * 1000)
+        elif t == "config":
+            self.config = m
+            link = m.get("link", {})
+            self.encoding = link.get("encoding", "raw")
+            levels = link.get("levels") or [{"height": m["analysis_height"],
+                                              "fps": m["fps"]}]
+            self.level = levels[link.get("level", 0)]
+            self.timeslice = m.get("timeslice_ms", 1000) / 1000.0
+            self._configured.set()
+        elif t == "link":
+            self.level = {"height": m["height"], "fps": m["fps"]}
+            self.link_changes += 1
+        elif t == "capture":
+            self.captures += 1
+            self._jpegs.put((m["frame_index"], m["ts_us"]))
+        elif t == "finished":
+            self.finished = m
+            self.done.set()
+        elif t == "error":
+            self.error = m.get("message")
+            self.done.set()
+
+    def _reply(self):
+        """JPEGs for capture requests, off the receive thread: encoding a
+        full-resolution frame must not hold up the ticks behind it."""
+        while True:
+            request = self._jpegs.get()
+            if request is None:
+                return
+            fi, ts_us = request
+            jpeg = self.book.jpeg(int(round(ts_us * self.book.fps / 1e6)))
+            try:
+                self._send(struct.pack("<BI", MSG_JPEG, fi) + jpeg, "jpeg")
+            except ConnectionError:
+                return
+
+    # Outbound, on the station's own thread.
+
+    def _send(self, data, kind):
+        try:
+            self.ws.send_binary(data)
+        except OSError as e:
+            self.error = self.error or f"send failed: {e}"
+            raise ConnectionError(self.error) from e
+        self.sent[kind] += 1
+        self.sent_bytes += len(data)
+
+    def run(self):
+        """Play the whole session, then Finish and wait for the server."""
+        try:
+            self._play()
+            self._jpegs.put(None)
+            self.ws.send_text('{"type": "finish"}')
+        except (ConnectionError, OSError) as e:
+            self.error = self.error or str(e)
+            self.done.set()
+
+    def _play(self):
+        book, fps = self.book, self.book.fps
+        w, h = book.camera
+        self.ws.send_text(json.dumps({"type": "hello", "width": w, "height": h,
+                                      "frame_rate": fps, "mime": book.mime}))
+        interval = 1.0 / (fps * self.speed) if self.speed > 0 else 0.0
+        per_chunk = max(1, int(round(self.timeslice * fps)))
+        timeline_fps = self.config["fps"]
+        t0 = time.perf_counter()
+        ref, ref_h, next_stats, seq = None, None, 0.0, 0
+        for i in range(book.frames):
+            if self.done.is_set():
+                return
+            if interval:
+                due = t0 + i * interval
+                lag = time.perf_counter() - due
+                if lag < 0:
+                    time.sleep(-lag)
+                elif lag > interval:
+                    self.skipped += 1       # the tab would have dropped it
+                    continue
+            if i and i % per_chunk == 0:
+                self._send(struct.pack("<BI", MSG_CHUNK, seq)
+                           + book.chunk(seq, self.timeslice), "chunk")
+                seq += 1
+            if i / fps >= next_stats:
+                next_stats += STATS_SEC
+                self.ws.send_text(json.dumps({
+                    "type": "stats", "epoch_ms": time.time() * 1000, "chunk_q": 0,
+                    "buffered": 0, "cam_fps": fps, "skipped": self.skipped}))
+            level = self.level
+            if i % max(1, int(round(fps / level["fps"]))):
+                continue                    # the page thins frames to the level's rate
+            gray = book.frame(i, level["height"])
+            ts_us = i * 1e6 / fps
+            header = struct.pack("<dHH", ts_us, gray.shape[1], gray.shape[0])
+            if self.encoding == "delta" and ref is not None and ref_h == gray.shape[0]:
+                payload, ref = encode_delta(ref, gray)
+                data, kind = bytes([MSG_DELTA]) + header + payload, "delta"
+            else:
+                ref, ref_h = reference_frame(gray), gray.shape[0]
+                data, kind = bytes([MSG_FRAME]) + header + gray.tobytes(), "frame"
+            # The server's timeline index for this frame, which its tick names.
+            self._sent_at[int(round(ts_us * timeline_fps / 1e6))] = time.perf_counter()
+            self._send(data, kind)
+        tail = getattr(book, "tail", None)
+        last = tail(seq, self.timeslice) if tail else book.chunk(seq, self.timeslice)
+        if last:
+            self._send(struct.pack("<BI", MSG_CHUNK, seq) + last, "chunk")
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+
+
+# ── The server under test ────────────────────────────────────
+
+
+def free_port(host):
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """A server under test, with its CPU time and memory as it runs."""
+
+    def __init__(self, cmd, log_path, host):
+        self.host = host
+        self.port = int(cmd[cmd.index("--port") + 1])
+        self._log = open(log_path, "w")
+        self.proc = subprocess.Popen(cmd, stdout=self._log, stderr=subprocess.STDOUT,
+                                     cwd=SCRIPTS.parent)
+        self.cpu_s = None             # user + system, once it has exited
+        self.maxrss_mb = None
+        self.marks = {}               # name -> (cpu_s, rss_mb)
+        self.rss_peak_mb = 0.0
+        self._tick = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def wait_ready(self, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise OSError(f"server exited ({self.proc.returncode}); "
+                              f"see {self._log.name}")
+            try:
+                socket.create_connection((self.host, self.port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise OSError(f"server not listening on {self.port} after {timeout}s")
+
+    def sample(self):
+        """(cpu seconds, RSS in MB) so far, from /proc; None elsewhere."""
+        try:
+            stat = Path(f"/proc/{self.proc.pid}/stat").read_text()
+            status = Path(f"/proc/{self.proc.pid}/status").read_text()
+        except OSError:
+            return None
+        fields = stat.rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / self._tick
+        rss = next((int(line.split()[1]) / 1024 for line in status.splitlines()
+                    if line.startswith("VmRSS:")), 0.0)
+        self.rss_peak_mb = max(self.rss_peak_mb, rss)
+        return cpu, rss
+
+    def mark(self, name):
+        sample = self.sample()
+        if sample is not None:
+            self.marks[name] = sample
+
+    def stop(self, timeout):
+        """Wait for the server to exit (interrupting it after ``timeout``)
+        and take its resource usage. Reaped here rather than by Popen, whose
+        wait drops the child's rusage."""
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                pid, status, usage = os.wait4(self.proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                if time.monotonic() >= deadline:
+                    self.proc.send_signal(signal.SIGINT)
+                    pid, status, usage = os.wait4(self.proc.pid, 0)
+                    break
+                self.sample()
+                time.sleep(0.1)
+            self._reaped(status, usage)
+        except ChildProcessError:
+            self.proc.wait()
+        self._log.close()
+
+    def _reaped(self, status, usage):
+        self.proc.returncode = os.waitstatus_to_exitcode(status)
+        self.cpu_s = usage.ru_utime + usage.ru_stime
+        # ru_maxrss is KB on Linux, bytes on macOS.
+        self.maxrss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def start_servers(args, out):
+    """The server processes, and each station's (server, websocket path)."""
+    host = "127.0.0.1"
+    py = [sys.executable, "-u"]
+    extra = list(args.server_argv)
+    if not args.recording and "--normalize-after" not in extra:
+        extra.append("--normalize-after")   # filler bytes: don't stream them into ffmpeg
+    names = [f"station{n + 1}" for n in range(args.stations)]
+    if args.server == "stations":
+        port = free_port(host)
+        server = ServerProcess(
+            py + [str(SCRIPTS / "stations.py"), "--root", str(out / "output"),
+                  "--recordings", str(out / "recordings"), "--host", host,
+                  "--port", str(port), *extra],
+            out / "stations.log", host)
+        servers = [server]
+        routes = [(server, f"/{name}/capture/ws") for name in names]
+    else:
+        servers, routes = [], []
+        for name in names:
+            port = free_port(host)
+            server = ServerProcess(
+                py + [str(SCRIPTS / "p0_web_capture.py"), str(out / "output" / name),
+                      str(out / "recordings" / f"{name}.mp4"), "--host", host,
+                      "--port", str(port), *extra],
+                out / f"{name}.log", host)
+            servers.append(server)
+            routes.append((server, "/ws"))
+    for server in servers:
+        server.wait_ready()
+    return names, servers, routes
+
+
+# ── The run ──────────────────────────────────────────────────
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(len(v) * q))], 1)
+
+
+def run(args, out):
+    if args.recording:
+        log(f"Decoding {args.recording} at the analysis height ...")
+        height = 360
+        if "--analysis-height" in args.server_argv:
+            height = int(args.server_argv[args.server_argv.index("--analysis-height") + 1])
+        book = RecordedBook(args.recording, args.seconds, height)
+    else:
+        w, h = (int(v) for v in args.camera.split("x"))
+        book = SyntheticBook((w, h), args.camera_fps, args.seconds,
+                             args.page_sec, args.turn_sec, args.recording_mbps)
+    names, servers, routes = start_servers(args, out)
+    stations = [Station(name, book, args.speed) for name in names]
+    try:
+        for station, (server, path) in zip(stations, routes):
+            station.connect(server.host, server.port, path)
+        for server in servers:
+            server.mark("connected")
+        t0 = time.perf_counter()
+        players = [threading.Thread(target=s.run, name=s.name, daemon=True)
+                   for s in stations]
+        for p in players:
+            p.start()
+        while any(p.is_alive() for p in players):
+            for server in servers:
+                server.sample()
+            time.sleep(0.25)
+        stream_s = time.perf_counter() - t0
+        for server in servers:
+            server.mark("streamed")
+        for s in stations:
+            s.done.wait(600)
+        wall_s = time.perf_counter() - t0
+    finally:
+        for s in stations:
+            s.close()
+        for server in servers:
+            server.stop(timeout=60 if args.server == "capture" else 2)
+    return report(args, book, stations, servers, out, stream_s, wall_s)
+
+
+def report(args, book, stations, servers, out, stream_s, wall_s):
+    per_station = []
+    for s in stations:
+        meta_path = out / "output" / s.name / "json" / "metadata.json"
+        web = json.loads(meta_path.read_text())["web"] if meta_path.exists() else {}
+        link = web.get("analysis_link", {})
+        levels = link.get("levels") or []
+        final = link.get("final_level")
+        frames_sent = s.sent["frame"] + s.sent["delta"]
+        per_station.append({
+            "station": s.name,
+            "frames_sent": frames_sent,
+            "frames_skipped": s.skipped,
+            "sent_mb": round(s.sent_bytes / 1e6, 1),
+            "frames_received": web.get("frames_received"),
+            "gap_filled": web.get("gap_filled"),
+            "duplicates_dropped": web.get("duplicates_dropped"),
+            "delta_dropped": link.get("delta_dropped"),
+            "captures_requested": s.captures,
+            "jpegs_sent": s.sent["jpeg"],
+            "chunks_sent": s.sent["chunk"],
+            "link_changes": s.link_changes,
+            "final_level": levels[final] if final is not None and levels else None,
+            "tick_rtt_ms": {"p50": _pct(s.rtt_ms, 0.5), "p95": _pct(s.rtt_ms, 0.95),
+                            "p99": _pct(s.rtt_ms, 0.99), "max": _pct(s.rtt_ms, 1.0)},
+            "handling": web.get("handling"),
+            "recording_sink": web.get("recording_sink"),
+            "normalize": web.get("normalize"),
+            "error": s.error,
+        })
+    procs = []
+    for server in servers:
+        connected, streamed = server.marks.get("connected"), server.marks.get("streamed")
+        procs.append({
+            "cpu_s": round(server.cpu_s, 2) if server.cpu_s is not None else None,
+            "stream_cpu_s": (round(streamed[0] - connected[0], 2)
+                             if connected and streamed else None),
+            "rss_connected_mb": round(connected[1], 1) if connected else None,
+            "rss_streamed_mb": round(streamed[1], 1) if streamed else None,
+            "rss_peak_mb": round(max(server.rss_peak_mb, server.maxrss_mb or 0), 1),
+            "exit_code": server.proc.returncode,
+        })
+    frames = sum(st["frames_received"] or 0 for st in per_station)
+    stream_cpu = [p["stream_cpu_s"] for p in procs if p["stream_cpu_s"] is not None]
+    return {
+        "stations": args.stations,
+        "server": args.server,
+        "source": args.recording or "synthetic",
+        "seconds": round(book.frames / book.fps, 1),
+        "speed": args.speed,
+        "stream_wall_s": round(stream_s, 1),
+        "wall_s": round(wall_s, 1),
+        "server_args": args.server_argv,
+        "per_station": per_station,
+        "processes": procs,
+        "frames_per_cpu_s": (round(frames / sum(stream_cpu), 1)
+                             if stream_cpu and sum(stream_cpu) > 0 else None),
+    }
+
+
+def print_report(r):
+    speed = f"at {r['speed']:g}x" if r["speed"] > 0 else "flat out"
+    log(f"{r['stations']} station(s), {r['seconds']:g}s of {r['source']} {speed} "
+        f"against {r['server']}: streams took {r['stream_wall_s']}s, "
+        f"{r['wall_s']}s with Finish")
+    log("")
+    log(f"  {'station':10s} {'sent':>6s} {'skip':>5s} {'recv':>6s} {'gaps':>5s} "
+        f"{'dup':>4s} {'undec':>5s} {'capt':>5s} {'jpeg':>5s} {'level':>10s} "
+        "tick p50/p99 ms")
+    for st in r["per_station"]:
+        level = st["final_level"]
+        level = f"{level['height']}p@{level['fps']:g}" if level else "-"
+        rtt = st["tick_rtt_ms"]
+        log(f"  {st['station']:10s} {st['frames_sent']:6d} {st['frames_skipped']:5d} "
+            f"{_cell(st['frames_received'], 6)} {_cell(st['gap_filled'], 5)} "
+            f"{_cell(st['duplicates_dropped'], 4)} {_cell(st['delta_dropped'], 5)} "
+            f"{st['captures_requested']:5d} {st['jpegs_sent']:5d} {level:>10s} "
+            f"{_cell(rtt['p50'], 0)}/{_cell(rtt['p99'], 0):<8s}".rstrip())
+        if st["error"]:
+            log(f"    error: {st['error']}")
+    log("")
+    log("  Server handling per message, ms (p50 / p99 / max, count):")
+    for st in r["per_station"]:
+        handling = st["handling"] or {}
+        cells = [f"{kind} {h['p50_ms']}/{h['p99_ms']}/{h['max_ms']} ({h['count']})"
+                 for kind, h in handling.items()]
+        log(f"    {st['station']:10s} " + ("  ".join(cells) if cells else "-"))
+    log("")
+    for n, p in enumerate(r["processes"]):
+        label = "stations.py" if r["server"] == "stations" else r["per_station"][n]["station"]
+        growth = (p["rss_streamed_mb"] - p["rss_connected_mb"]
+                  if p["rss_streamed_mb"] is not None and p["rss_connected_mb"] is not None
+                  else None)
+        log(f"  {label}: CPU {_cell(p['stream_cpu_s'], 0)}s streaming, "
+            f"{_cell(p['cpu_s'], 0)}s in all · RSS {_cell(p['rss_connected_mb'], 0)} MB "
+            f"connected -> {_cell(p['rss_streamed_mb'], 0)} MB streamed "
+            f"({'+' if (growth or 0) >= 0 else ''}{_cell(growth and round(growth, 1), 0)}), "
+            f"peak {p['rss_peak_mb']} MB")
+    if r["frames_per_cpu_s"]:
+        log(f"  Throughput: {r['frames_per_cpu_s']} analysis frames per server CPU-second")
+
+
+def _cell(v, width):
+    return f"{'-' if v is None else v:>{width}}"
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.stations < 1:
+        log("ERROR: --stations must be at least 1")
+        sys.exit(2)
+    out = Path(args.out) if args.out else Path(tempfile.mkdtemp(prefix="scanstudio-load-"))
+    out.mkdir(parents=True, exist_ok=True)
+    try:
+        r = run(args, out)
+    except OSError as e:
+        log(f"ERROR: {e}")
+        sys.exit(1)
+    finally:
+        if not args.out:
+            shutil.rmtree(out, ignore_errors=True)
+    print_report(r)
+    if args.json:
+        Path(args.json).write_text(json.dumps(r, indent=2))
+        log(f"  Report -> {args.json}")
+    return r
+
+
+if __name__ == "__main__":
+    main()
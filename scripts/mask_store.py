@@ -0,0 +1,211 @@
+"""
+Page masks, computed once per image and kept on disk.
+
+``page_mask_robust`` — an HSV threshold, 25x25 morphology and, on the frames
+where that fails, a ~0.5 s U^2-Net pass — runs on the same images again and
+again: the consensus vote, the watchdog (every rescan), the P4 auto crop,
+P5's crop and P6's gutter, and all of it over again when a review is
+reopened or a phase re-run. The mask depends only on the image's bytes and
+the mask parameters, so ``MaskStore`` keeps each one in ``data/masks/``:
+
+- masks are computed at ``TRACK_WORK_WIDTH`` from ``ImageCache.work``, the
+  scale page_mask's morphology is tuned for, and scaled up nearest-neighbour
+  for a caller working at full resolution;
+- a mask's file is named by a BLAKE2 hash of ``MASK_PARAMS``, whether rembg
+  is installed (U^2-Net replaces the HSV mask where that fails) and the
+  image file's bytes, so a frame P3 re-extracts unchanged keeps its mask and
+  one P5 rewrites in place gets a new one;
+- the file is a 16-byte header and the mask packed 8 pixels to the byte
+  (~180 KB for a 1600x900 frame), read back through ``np.memmap``.
+
+A mask computed while rembg was installed but failed to load is returned
+but not kept: it isn't the mask its key promises. P5 rewrites images/ in
+place, so the masks of the frames it cropped go unread until those frames
+are extracted again; they are kept, not deleted, and P5 and P6 ``trim`` the
+store to ``MASK_STORE_MB`` once they finish, least recently read first (a
+hit touches the file's mtime).
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import struct
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from utils import TRACK_WORK_WIDTH, _mask_plausible, _u2net, page_mask_robust
+
+# Everything a stored mask depends on besides the image. Bump the version
+# when page_mask or page_mask_robust changes what it returns: the old files
+# are then simply never looked up again.
+MASK_VERSION = 1
+MASK_PARAMS = {"version": MASK_VERSION, "sat_max": 70, "val_min": 150,
+               "kernel": 25, "width": TRACK_WORK_WIDTH}
+_HEADER = struct.Struct("<4sIII")          # magic, format, height, width
+_MAGIC = b"SSPM"
+MASK_STORE_MB = 256                        # ~1400 frames' masks at 1600x900
+
+
+class MaskStore:
+    """``page_mask_robust`` of image files, kept under ``root``."""
+
+    def __init__(self, root, images=None, params=MASK_PARAMS, u2net=None):
+        self.root = Path(root)
+        self.images = images             # an ImageCache; the shared one by default
+        if u2net is None:
+            u2net = importlib.util.find_spec("rembg") is not None
+        self.u2net = u2net
+        self._params = json.dumps({**params, "u2net": u2net}, sort_keys=True).encode()
+        self._digests = {}               # (path, size, mtime_ns) -> key
+        self._lock = threading.Lock()
+        self.counts = {"hits": 0, "computed": 0, "unsettled": 0, "evicted": 0}
+
+    def get(self, path, small=None, size=None):
+        """The page mask (uint8 0/255) of the image at ``path``, at the work
+        size or resized to ``size`` = (w, h); None if unreadable. ``small``
+        is the image as ``ImageCache.work`` returns it, when the caller
+        already has it."""
+        key = self.key(path)
+        if key is None:
+            return None
+        mask = self._read(key)
+        if mask is not None:
+            self._count("hits")
+            self._touch(key)
+        else:
+            if small is None:
+                if self.images is None:
+                    from image_cache import shared
+                    self.images = shared()
+                small = self.images.work(path)[0]
+                if small is None:
+                    return None
+            mask = page_mask_robust(small)
+            if _mask_plausible(mask) or (_u2net["state"] == "ready") == self.u2net:
+                self._write(key, mask)
+                self._count("computed")
+            else:
+                self._count("unsettled")
+        if size is not None and (mask.shape[1], mask.shape[0]) != tuple(size):
+            mask = cv2.resize(mask, tuple(size), interpolation=cv2.INTER_NEAREST)
+        return mask
+
+    def key(self, path):
+        """The hex key of ``path``'s current contents, or None if unreadable.
+        Hashed once per file version: the stat is remembered."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        ident = (str(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            key = self._digests.get(ident)
+        if key is None:
+            h = hashlib.blake2b(self._params, digest_size=20)
+            try:
+                with open(path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        h.update(block)
+            except OSError:
+                return None
+            key = h.hexdigest()
+            with self._lock:
+                self._digests[ident] = key
+        return key
+
+    def trim(self, budget_mb=MASK_STORE_MB):
+        """Remove the least recently read masks until the store fits in
+        ``budget_mb``, and any temp files a killed run left. Returns how many
+        masks went."""
+        try:
+            entries = list(self.root.iterdir())
+        except OSError:
+            return 0
+        stored = []
+        for path in entries:
+            try:
+                if path.name.endswith(".tmp"):
+                    path.unlink()
+                elif path.suffix == ".mask":
+                    st = path.stat()
+                    stored.append((st.st_mtime_ns, st.st_size, path))
+            except OSError:
+                pass
+        total = sum(size for _, size, _ in stored)
+        gone = 0
+        for _, size, path in sorted(stored):
+            if total <= budget_mb * 1024 * 1024:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            gone += 1
+        with self._lock:
+            self.counts["evicted"] += gone
+        return gone
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "files": len(list(self.root.glob("*.mask")))
+                    if self.root.is_dir() else 0}
+
+    def summary(self):
+        """One line for the session log."""
+        st = self.stats()
+        kept = f", {st['unsettled']} not kept" if st["unsettled"] else ""
+        evicted = f", {st['evicted']} evicted" if st["evicted"] else ""
+        return (f"Page masks: {st['hits']} from {self.root.name}/, "
+                f"{st['computed']} computed{kept}, {st['files']} stored{evicted}")
+
+    # ── Internals ────────────────────────────────────────────
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _file(self, key):
+        return self.root / f"{key}.mask"
+
+    def _touch(self, key):
+        # The mtime is when the mask was last read: what trim() goes by.
+        try:
+            os.utime(self._file(key))
+        except OSError:
+            pass
+
+    def _read(self, key):
+        try:
+            mm = np.memmap(self._file(key), dtype=np.uint8, mode="r")
+        except (OSError, ValueError):      # missing, or empty
+            return None
+        try:
+            if mm.size < _HEADER.size:
+                return None
+            magic, _, h, w = _HEADER.unpack(mm[:_HEADER.size].tobytes())
+            row = (w + 7) // 8
+            if magic != _MAGIC or mm.size != _HEADER.size + h * row:
+                return None                # torn or foreign: compute afresh
+            packed = mm[_HEADER.size:].reshape(h, row)
+            mask = np.unpackbits(packed, axis=1, count=w)
+        finally:
+            del mm
+        mask *= 255
+        return mask
+
+    def _write(self, key, mask):
+        h, w = mask.shape[:2]
+        path = self._file(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, 1, h, w))
+                f.write(np.packbits(mask > 0, axis=1).tobytes())
+            os.replace(tmp, path)
+        except OSError:
+            # Read-only project, full disk: the mask is still good, just
+            # not kept for next time.
+            tmp.unlink(missing_ok=True)
@@ -4,20 +4,48 @@ Minimal WebSocket framing (RFC 6455) over an already-connected socket.
 The browser front end (p0_web_capture) talks to Chrome over one WebSocket:
 JSON control messages one way, analysis frames / JPEGs / recorder chunks the
 other. That needs exactly the server half of RFC 6455 — handshake key,
-frame parsing with masking, fragment reassembly, ping/pong, close — and
-nothing else: no wss, no extensions, no subprotocols, no async. Hand-rolling
-those ~150 lines keeps requirements.txt untouched, which matters most on the
-ChromeOS/Crostini setups this exists for, where every extra dependency is one
-more thing to install inside the container.
+frame parsing with masking, fragment reassembly, ping/pong, close — plus
+one extension, and nothing else: no wss, no subprotocols.
+Hand-rolling those few hundred lines keeps requirements.txt untouched, which
+matters most on the ChromeOS/Crostini setups this exists for, where every
+extra dependency is one more thing to install inside the container.
+
+The extension is permessage-deflate (RFC 7692), for the JSON. The servers
+send a message per capture frame or per review action, and the same keys
+over and over, which deflate with a shared context (the default "context
+takeover") shrinks to a few bytes each. ``negotiate_deflate`` answers the
+browser's offer; the socket then compresses outgoing TEXT messages and
+inflates whatever the peer compressed. Binary messages go out as they are:
+they are JPEGs, video and pixels, which deflate only spends CPU on.
+``MessageBatcher`` cuts the other per-message cost, a frame and a syscall
+each, by coalescing what is sent within a few tens of milliseconds into one
+``{"type": "batch", "messages": [...]}`` text message the pages unpack.
+
+Receiving makes no payload-sized allocations: payloads are read with
+``recv_into`` straight into one reusable buffer and unmasked there in place,
+and a binary message comes back as a view of that buffer
+(``tests/bench_miniws.py`` measures the difference).
+
+The blocking ``recv`` suits the one-station servers, a thread per
+connection. ``arecv`` is the same receive path on an asyncio stream, for
+the multi-station server (stations.py), where one event loop reads every
+connection and the sessions' work goes to a thread pool.
 
 Client mode (outgoing frames masked, as the RFC requires of clients) exists so
 the tests can drive a real server socket without a browser.
 """
 
+import asyncio
 import base64
 import hashlib
+import json
 import os
 import struct
+import threading
+import time
+import zlib
+
+import numpy as np
 
 # Handshake GUID fixed by RFC 6455 §1.3.
 _GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
@@ -26,6 +54,10 @@ _GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
 TEXT, BINARY, CLOSE, PING, PONG = 0x1, 0x2, 0x8, 0x9, 0xA
 _CONT = 0x0
 
+# RFC 7692 §7.2.1: a compressed message is a raw deflate stream, sync-flushed,
+# with the flush's empty stored block (these four bytes) taken off the end.
+_DEFLATE_TAIL = b"\x00\x00\xff\xff"
+
 
 def accept_key(client_key: str) -> str:
     """Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key."""
@@ -33,27 +65,99 @@ def accept_key(client_key: str) -> str:
     return base64.b64encode(digest).decode()
 
 
+def negotiate_deflate(offer):
+    """Accept a permessage-deflate offer (RFC 7692 §7.1).
+
+    ``offer`` is the client's Sec-WebSocket-Extensions header (or None).
+    Returns ``(response, settings)``: the header value to send back and the
+    ``deflate`` settings for ``WebSocket``, or ``(None, None)`` if no offer
+    is one this side can honour. Offers are tried in the client's order.
+    """
+    for ext in (offer or "").split(","):
+        name, *params = (p.strip() for p in ext.split(";"))
+        if name.lower() != "permessage-deflate":
+            continue
+        settings = {"server_no_context_takeover": False,
+                    "client_no_context_takeover": False,
+                    "server_max_window_bits": 15}
+        for param in params:
+            key, _, value = (v.strip().strip('"') for v in param.partition("="))
+            key = key.lower()
+            if key in ("server_no_context_takeover", "client_no_context_takeover"):
+                if value:
+                    break
+                settings[key] = True
+            elif key == "server_max_window_bits":
+                # zlib can't write a raw stream with a 256-byte window.
+                if not value.isdigit() or not 9 <= int(value) <= 15:
+                    break
+                settings[key] = int(value)
+            elif key == "client_max_window_bits":
+                # Only a hint that the client can limit its window; we inflate
+                # with the full 32 KB either way, so don't ask it to.
+                if value and not (value.isdigit() and 8 <= int(value) <= 15):
+                    break
+            else:
+                break
+        else:
+            response = ["permessage-deflate"]
+            response += [k for k in ("server_no_context_takeover",
+                                     "client_no_context_takeover") if settings[k]]
+            if settings["server_max_window_bits"] < 15:
+                response.append(f"server_max_window_bits={settings['server_max_window_bits']}")
+            return "; ".join(response), settings
+    return None, None
+
+
 class WebSocket:
     """Framed messages over a connected socket.
 
-    ``recv()`` returns the next complete *message* as ``(opcode, bytes)`` —
+    ``recv()`` returns the next complete *message* as ``(opcode, payload)`` —
     ping, pong and continuation frames are handled internally, and a peer
-    close is answered and surfaced as ``(CLOSE, b"")``. Sends write whole
-    unfragmented messages. All calls block; use one thread per connection.
+    close is answered and surfaced as ``(CLOSE, b"")``. A TEXT payload is
+    ``bytes``. A BINARY payload is a ``memoryview`` into the connection's
+    receive buffer, valid until the next ``recv()``: wrap it (``np.frombuffer``)
+    or slice it freely, but copy anything that must outlive the call (a
+    message the peer compressed is inflated into a buffer of its own). Sends
+    write whole unfragmented messages, and may come from several threads.
+    All calls block; use one receiving thread per connection.
+
+    ``deflate`` is the settings ``negotiate_deflate`` agreed to, or None for
+    an uncompressed connection.
     """
 
-    def __init__(self, sock, client=False, max_message=64 * 1024 * 1024):
+    def __init__(self, sock, client=False, max_message=64 * 1024 * 1024,
+                 buffer_size=1 << 20, deflate=None):
         self.sock = sock
         self.client = client        # clients mask outgoing frames (RFC §5.3)
         self.max_message = max_message
+        # Every message is received into this one buffer, in place: recv_into
+        # writes the payload, the mask is XORed over it, fragments land back
+        # to back. It grows to the largest message seen and is then reused.
+        self._buf = bytearray(buffer_size)
+        # A compressed message's frames must reach the wire in the order the
+        # shared deflate context produced them, so compressing and sending
+        # happen under one lock.
+        self._send_lock = threading.RLock()
+        self.deflate = deflate
+        self._deflater = self._inflater = None
+        if deflate:
+            own, peer = ("client", "server") if client else ("server", "client")
+            self._own_reset = deflate.get(f"{own}_no_context_takeover", False)
+            self._peer_reset = deflate.get(f"{peer}_no_context_takeover", False)
+            self._window = deflate.get(f"{own}_max_window_bits", 15)
+            self._deflater = self._new_deflater()
+            self._inflater = zlib.decompressobj(-15)
+        self.text_bytes = 0         # TEXT sent, before compression ...
+        self.text_wire_bytes = 0    # ... and as framed payloads
 
     # ── Receiving ────────────────────────────────────────────
 
     def recv(self):
         """Next complete message: ``(TEXT|BINARY, payload)`` or ``(CLOSE, b"")``."""
-        opcode, parts, total = None, [], 0
+        opcode, total, compressed = None, 0, False
         while True:
-            fin, op, payload = self._read_frame()
+            fin, rsv1, op, payload = self._read_frame(total)
             if op == PING:
                 self._send_frame(PONG, payload)
                 continue
@@ -68,48 +172,161 @@ class WebSocket:
             if op in (TEXT, BINARY):
                 if opcode is not None:
                     raise ConnectionError("new message inside a fragmented one")
-                opcode = op
+                opcode, compressed = op, rsv1
             elif op == _CONT:
                 if opcode is None:
                     raise ConnectionError("continuation frame with no start")
             else:
                 raise ConnectionError(f"unsupported opcode {op:#x}")
-            parts.append(payload)
             total += len(payload)
-            if total > self.max_message:
-                raise ConnectionError(f"message exceeds {self.max_message} bytes")
             if fin:
-                return opcode, b"".join(parts)
+                message = memoryview(self._buf)[:total]
+                if compressed:
+                    message = memoryview(self._inflate(message))
+                return opcode, bytes(message) if opcode == TEXT else message
 
-    def _read_frame(self):
+    def _read_frame(self, offset=0):
+        """One frame: ``(fin, rsv1, opcode, payload)``. A data frame's payload
+        is received into the buffer at ``offset`` (after the fragments before
+        it) and returned as a view of it; a control frame's is ``bytes``.
+        ``rsv1`` marks the first frame of a compressed message."""
         b0, b1 = self._read_exact(2)
-        fin, opcode = bool(b0 & 0x80), b0 & 0x0F
+        fin, rsv1, opcode = self._frame_bits(b0)
         masked, length = bool(b1 & 0x80), b1 & 0x7F
         if length == 126:
             (length,) = struct.unpack(">H", self._read_exact(2))
         elif length == 127:
             (length,) = struct.unpack(">Q", self._read_exact(8))
-        if length > self.max_message:
-            raise ConnectionError(f"frame exceeds {self.max_message} bytes")
         mask = self._read_exact(4) if masked else None
-        payload = self._read_exact(length) if length else b""
+        if opcode & 0x8:
+            # Control frames (<= 125 bytes) can arrive between fragments,
+            # so they never touch the message buffer.
+            payload = bytearray(self._read_exact(length)) if length else bytearray()
+            if mask:
+                _xor_mask(payload, mask)
+            return fin, False, opcode, bytes(payload)
+        if offset + length > self.max_message:
+            raise ConnectionError(f"message exceeds {self.max_message} bytes")
+        if offset + length > len(self._buf):
+            # Replace rather than resize: a view handed out earlier may still
+            # be alive, and keeps the old buffer to itself.
+            grown = bytearray(max(offset + length, 2 * len(self._buf)))
+            grown[:offset] = memoryview(self._buf)[:offset]
+            self._buf = grown
+        payload = memoryview(self._buf)[offset:offset + length]
+        self._recv_into(payload)
         if mask:
-            payload = _mask(payload, mask)
-        return fin, opcode, payload
+            _xor_mask(payload, mask)
+        return fin, rsv1, opcode, payload
 
-    def _read_exact(self, n):
-        buf = bytearray()
-        while len(buf) < n:
-            chunk = self.sock.recv(min(n - len(buf), 1 << 20))
-            if not chunk:
+    def _frame_bits(self, b0):
+        """``(fin, rsv1, opcode)`` of a frame's first byte."""
+        fin, rsv1, opcode = bool(b0 & 0x80), bool(b0 & 0x40), b0 & 0x0F
+        # RSV1 is permessage-deflate's, and only on a message's first frame.
+        if b0 & 0x30 or (rsv1 and (self._inflater is None or opcode in (_CONT, CLOSE,
+                                                                        PING, PONG))):
+            raise ConnectionError(f"unexpected reserved bits in {b0:#04x}")
+        return fin, rsv1, opcode
+
+    async def arecv(self, reader):
+        """``recv`` for a connection served by asyncio.
+
+        Frames come from the ``asyncio.StreamReader`` ``reader`` instead of
+        ``sock``, which then only needs a ``sendall``, callable from any
+        thread. Payloads are ``bytes``: the in-place buffer belongs to
+        the blocking path, where one thread owns the connection.
+        """
+        loop = asyncio.get_running_loop()
+        opcode, parts, total, compressed = None, [], 0, False
+        try:
+            while True:
+                b0, b1 = await reader.readexactly(2)
+                fin, rsv1, op = self._frame_bits(b0)
+                masked, length = bool(b1 & 0x80), b1 & 0x7F
+                if length == 126:
+                    (length,) = struct.unpack(">H", await reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack(">Q", await reader.readexactly(8))
+                mask = await reader.readexactly(4) if masked else None
+                if not op & 0x8 and total + length > self.max_message:
+                    raise ConnectionError(f"message exceeds {self.max_message} bytes")
+                payload = bytearray(await reader.readexactly(length))
+                if mask:
+                    _xor_mask(payload, mask)
+                # Replies go out from a worker thread: a session thread may
+                # hold the send lock while it waits on this loop to drain.
+                if op == PING:
+                    await loop.run_in_executor(None, self._send_frame, PONG,
+                                               bytes(payload))
+                    continue
+                if op == PONG:
+                    continue
+                if op == CLOSE:
+                    try:
+                        await loop.run_in_executor(None, self._send_frame, CLOSE,
+                                                   bytes(payload[:2]))
+                    except OSError:
+                        pass
+                    return CLOSE, b""
+                if op in (TEXT, BINARY):
+                    if opcode is not None:
+                        raise ConnectionError("new message inside a fragmented one")
+                    opcode, compressed = op, rsv1
+                elif op == _CONT:
+                    if opcode is None:
+                        raise ConnectionError("continuation frame with no start")
+                else:
+                    raise ConnectionError(f"unsupported opcode {op:#x}")
+                parts.append(payload)
+                total += length
+                if fin:
+                    message = parts[0] if len(parts) == 1 else b"".join(parts)
+                    if compressed:
+                        message = self._inflate(message)
+                    return opcode, bytes(message)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("socket closed mid-frame") from None
+
+    def _inflate(self, data):
+        """A compressed message's payload, inflated (RFC 7692 §7.2.2)."""
+        limit = self.max_message + 1
+        out = self._inflater.decompress(data, limit)
+        if len(out) < limit and not self._inflater.unconsumed_tail:
+            out += self._inflater.decompress(_DEFLATE_TAIL, limit - len(out))
+        if len(out) > self.max_message or self._inflater.unconsumed_tail:
+            raise ConnectionError(f"message exceeds {self.max_message} bytes")
+        if self._peer_reset:
+            self._inflater = zlib.decompressobj(-15)
+        return out
+
+    def _recv_into(self, view):
+        while len(view):
+            n = self.sock.recv_into(view)
+            if not n:
                 raise ConnectionError("socket closed mid-frame")
-            buf += chunk
+            view = view[n:]
+
+    def _read_exact(self, n):
+        buf = bytearray(n)
+        self._recv_into(memoryview(buf))
         return bytes(buf)
 
     # ── Sending ──────────────────────────────────────────────
 
     def send_text(self, s: str):
-        self._send_frame(TEXT, s.encode())
+        payload = s.encode()
+        with self._send_lock:
+            self.text_bytes += len(payload)
+            if self._deflater is None:
+                self.text_wire_bytes += len(payload)
+                self._send_frame(TEXT, payload)
+                return
+            body = self._deflater.compress(payload) + self._deflater.flush(zlib.Z_SYNC_FLUSH)
+            if self._own_reset:
+                self._deflater = self._new_deflater()
+            body = body[:-len(_DEFLATE_TAIL)]
+            self.text_wire_bytes += len(body)
+            self._send_frame(TEXT, body, rsv1=True)
 
     def send_binary(self, b: bytes):
         self._send_frame(BINARY, b)
@@ -120,8 +337,12 @@ class WebSocket:
         except OSError:
             pass
 
-    def _send_frame(self, opcode, payload):
-        header = bytearray([0x80 | opcode])       # FIN always set: no fragmenting
+    def _new_deflater(self):
+        return zlib.compressobj(6, zlib.DEFLATED, -self._window)
+
+    def _send_frame(self, opcode, payload, rsv1=False):
+        # FIN always set: no fragmenting.
+        header = bytearray([0x80 | (0x40 if rsv1 else 0) | opcode])
         mask_bit = 0x80 if self.client else 0
         n = len(payload)
         if n < 126:
@@ -135,19 +356,106 @@ class WebSocket:
         if self.client:
             mask = os.urandom(4)
             header += mask
-            payload = _mask(payload, mask)
-        self.sock.sendall(bytes(header) + payload)
+            payload = bytearray(payload)
+            _xor_mask(payload, mask)
+        with self._send_lock:
+            self.sock.sendall(bytes(header) + payload)
+
+
+class MessageBatcher:
+    """Coalesce outbound JSON messages into fewer text frames.
+
+    ``send(msg)`` serializes the message at once (so later changes to the
+    dict can't leak in) and queues it. A flush thread waits ``window``
+    seconds from the first queued message, then sends everything queued as
+    one ``{"type": "batch", "messages": [...]}`` message, or a lone message
+    as itself. A message whose type is in ``urgent`` goes out at once, with
+    whatever queued ahead of it, in order. ``close()`` flushes what is left.
+    A dead socket drops messages silently, like the servers' own ``send``.
+    """
+
+    def __init__(self, ws, window=0.025, urgent=()):
+        self.ws = ws
+        self.window = window
+        self.urgent = frozenset(urgent)
+        self.messages = 0
+        self.frames = 0
+        self._pending = []
+        self._flush_now = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def send(self, msg):
+        text = json.dumps(msg)
+        with self._cond:
+            if self._closed:
+                return
+            self._pending.append(text)
+            if msg.get("type") in self.urgent:
+                self._flush_now = True
+                self._cond.notify()
+            elif len(self._pending) == 1:
+                self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self):
+        """Counts for metadata: messages, the frames they went out in, and
+        the JSON's size before and after compression."""
+        return {"messages": self.messages, "frames": self.frames,
+                "json_kb": round(self.ws.text_bytes / 1e3, 1),
+                "wire_kb": round(self.ws.text_wire_bytes / 1e3, 1),
+                "deflate": bool(self.ws.deflate)}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.window
+                while not (self._closed or self._flush_now):
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch, self._pending, self._flush_now = self._pending, [], False
+                done = self._closed
+            if batch:
+                self._write(batch)
+            if done:
+                return
+
+    def _write(self, batch):
+        if len(batch) == 1:
+            text = batch[0]
+        else:
+            text = '{"type": "batch", "messages": [' + ", ".join(batch) + "]}"
+        self.messages += len(batch)
+        self.frames += 1
+        try:
+            self.ws.send_text(text)
+        except (OSError, ConnectionError):
+            pass
 
 
-def _mask(payload: bytes, mask: bytes) -> bytes:
-    """XOR ``payload`` with the repeating 4-byte mask (its own inverse).
+def _xor_mask(buf, mask: bytes):
+    """XOR the writable ``buf`` in place with the repeating 4-byte mask (its
+    own inverse).
 
-    Done as one big-int XOR: CPython evaluates that in C, which keeps even the
-    ~230 KB analysis frames at 30 fps far from mattering.
+    Four bytes at a time through a uint32 view: no copy of the payload, and
+    at numpy speed even for the ~230 KB analysis frames at 30 fps.
     """
-    n = len(payload)
-    if n == 0:
-        return payload
-    full = mask * (n // 4) + mask[:n % 4]
-    return (int.from_bytes(payload, "little")
-            ^ int.from_bytes(full, "little")).to_bytes(n, "little")
+    n = len(buf)
+    words = n // 4
+    if words:
+        np.bitwise_xor(np.frombuffer(buf, "<u4", count=words),
+                       np.frombuffer(mask, "<u4")[0],
+                       out=np.frombuffer(buf, "<u4", count=words))
+    for i in range(words * 4, n):
+        buf[i] ^= mask[i % 4]
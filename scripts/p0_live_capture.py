@@ -12,6 +12,14 @@ offline front half produces, so P4-P9 work unchanged:
   output/<name>/json/keyframes.json
   output/<name>/json/metadata.json
   output/<name>/data/{motion_signal,smoothed_signal}.npy
+  output/<name>/data/frame_features.npy   per-frame sharpness, for live_replay.py
+  output/<name>/data/frame_index.npz   keyframe map for frame-exact seeks
+
+With --archive the recording is a low-resolution proxy, and full resolution
+is kept only around still frames (see archive.py):
+
+  recordings/<name>.full.mp4           full-res frames of the settle windows
+  output/<name>/data/archive_index.npz timeline frame -> stream holding it
 
 Usage:
   python scripts/p0_live_capture.py output/mybook recordings/mybook.mp4
@@ -27,23 +35,30 @@ Keys (in the live window):
 
 import argparse
 import json
-import queue
 import sys
-import threading
 import time
 from collections import deque
+from pathlib import Path
 
 import cv2
 import numpy as np
 
+from archive import ARCHIVE_FILE, ArchiveRecorder, build_archive_index, full_res_path
+from frame_index import INDEX_FILE, build_index
+from frame_pool import FramePool, SharedFramePool
+from frame_source import FEATURES_FILE
+from keyframe_writer import KeyframeWriter
+from live_encoder import ENCODERS, FrameTiming, open_encoder
 from live_state import LiveDetector, keyframe_record
 from utils import (
     log,
     ProjectPaths,
+    X264_GOP_SEC,
+    X264_PRESET,
+    X264_PRESETS,
     CAMERA_SCAN_RANGE,
     camera_backend,
     camera_label,
-    open_video_writer,
     prepare_capture,
     sound_player,
 )
@@ -60,7 +75,7 @@ def resolution_label(w, h):
 
 def draw_overlay(preview, state, motion, smooth, settle_thr, turn_thr,
                  count, paused, flash_text, flash_until, header_h,
-                 muted=False, res_text="", brightness=0.0):
+                 muted=False, res_text="", brightness=0.0, saving=0):
     """Compose the display: the full downsampled frame with a HUD band stacked
     *above* it, so the HUD never covers the page.
 
@@ -85,7 +100,8 @@ def draw_overlay(preview, state, motion, smooth, settle_thr, turn_thr,
                    "TURNING": (0, 140, 255)}.get(state, (200, 200, 200))
     cv2.putText(canvas, f"{state}", (sc(12), sc(34)),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.7 * fs, state_color, th)
-    cv2.putText(canvas, f"captured: {count}", (sc(12), sc(64)),
+    count_text = f"captured: {count}" + (f" ({saving} saving)" if saving else "")
+    cv2.putText(canvas, count_text, (sc(12), sc(64)),
                 cv2.FONT_HERSHEY_SIMPLEX, 0.5 * fs, (230, 230, 230), thin)
     if paused:
         cv2.putText(canvas, "PAUSED", (pw - sc(120), sc(34)),
@@ -199,12 +215,20 @@ def main():
     p.add_argument("--capture-height", type=int, default=2160,
                    help="Requested capture height (default 2160 = 4K UHD)")
     p.add_argument("--fps", type=float, default=30.0, help="Recording / timing fps")
-    p.add_argument("--codec", default="mp4v", choices=["mp4v", "h264", "auto"],
-                   help="Recording codec. The default mp4v is ~2x faster to "
-                        "encode at 4K, which a real-time capture needs; the "
-                        "browser review transcodes a scrub proxy for it once. "
-                        "h264 records browser-playable video straight away, at "
-                        "half the encoder throughput — fine below 4K")
+    p.add_argument("--codec", default="x264", choices=["x264", "mp4v", "h264", "auto"],
+                   help="Recording codec. The default x264 pipes frames into a "
+                        "multi-threaded ffmpeg libx264 encode: browser-playable "
+                        "H.264 at 4K in real time, so the web review needs no "
+                        "scrub proxy (falls back to mp4v without ffmpeg). mp4v "
+                        "is OpenCV's fast MPEG-4 Part 2, which the browser "
+                        "review transcodes a proxy for once; h264 is OpenCV's "
+                        "H.264, at half mp4v's throughput — fine below 4K")
+    p.add_argument("--x264-preset", default=X264_PRESET, choices=X264_PRESETS,
+                   help="libx264 preset for --codec x264. Slower presets make "
+                        "smaller files if the CPU keeps up at the capture rate")
+    p.add_argument("--gop-sec", type=float, default=X264_GOP_SEC,
+                   help="Seconds between keyframes for --codec x264; a short "
+                        "GOP keeps every seek into the recording short")
     p.add_argument("--analysis-height", type=int, default=360)
     p.add_argument("--preview-height", type=int, default=720,
                    help="Height of the on-screen preview. The full-res frame is "
@@ -217,8 +241,30 @@ def main():
                    help="Motion above this counts as a page turn")
     p.add_argument("--settle-time", type=float, default=0.4,
                    help="Seconds of stillness required before capturing")
+    p.add_argument("--early-capture", action="store_true",
+                   help="Capture as soon as the motion decay predicts the page "
+                        "has settled, then upgrade it in place if a sharper "
+                        "frame arrives before the settle time is up")
     p.add_argument("--jpeg-quality", type=int, default=95,
                    help="JPEG quality for captured keyframes (one near-lossless generation)")
+    p.add_argument("--encoder", choices=ENCODERS, default="process",
+                   help="Where the recording is encoded: a separate process "
+                        "reading frames from shared memory (keeps the encode "
+                        "off the capture loop's GIL), or a thread of this one")
+    p.add_argument("--buffer-mb", type=int, default=768,
+                   help="Memory for full-resolution frames in flight (settle window "
+                        "plus the encoder's backlog), allocated once at start. "
+                        "768 MB holds ~30 4K frames; when it is full, capture waits "
+                        "for the encoder instead of growing")
+    p.add_argument("--archive", action="store_true",
+                   help="Record every frame as a low-resolution proxy, and full "
+                        "resolution only around still frames — an order of "
+                        "magnitude less disk for a book")
+    p.add_argument("--proxy-height", type=int, default=720,
+                   help="Height of the --archive proxy stream")
+    p.add_argument("--archive-margin", type=float, default=0.5,
+                   help="Seconds of full resolution kept either side of every "
+                        "still frame with --archive")
     args = p.parse_args()
 
     log("=" * 60)
@@ -250,50 +296,86 @@ def main():
     log(f"Thresholds: settle<{args.settle_threshold} turn>{args.turn_threshold}, "
         f"settle_time={args.settle_time}s")
 
-    writer, codec = open_video_writer(args.video_out, args.fps,
-                                      (orig_w, orig_h), args.codec)
-    if writer is None:
+    det = LiveDetector(fps=args.fps,
+                       settle_threshold=args.settle_threshold,
+                       turn_threshold=args.turn_threshold,
+                       settle_time=args.settle_time,
+                       smoothing_window=args.smoothing_window,
+                       early_capture=args.early_capture)
+
+    # Every full-res frame lives in one preallocated pool, bounded in bytes:
+    # the camera reads straight into a slot, and the settle window and the
+    # encoder each hold a reference until they are done with it. When the
+    # encoder falls behind, acquire() waits (backpressure) instead of memory
+    # growing — and the wait is counted in the pool's stats.
+    # --archive holds each frame for the margin too, until it is known
+    # whether a still frame falls within it.
+    margin_frames = (max(det.settle_frames, int(round(args.archive_margin * args.fps)))
+                     if args.archive else 0)
+    pool_cls = SharedFramePool if args.encoder == "process" else FramePool
+    pool = pool_cls((orig_h, orig_w, 3), args.buffer_mb * 2**20,
+                    min_slots=max(det.settle_frames, margin_frames) + 2)
+    log(f"Frame pool: {pool.slots} frames, {pool.nbytes / 2**20:.0f} MB")
+
+    # The 4K software encode runs beside the capture loop, never in it: in
+    # its own process by default, mapping the pool's shared memory (see
+    # live_encoder.py). It gets slot indices, read-only — the overlay draws
+    # on a separate preview image, so the encoder can write a frame while
+    # the main loop still holds it in its settle window.
+    full_out = str(full_res_path(args.video_out)) if args.archive else args.video_out
+    encoder = open_encoder(args.encoder, pool, full_out, args.fps,
+                           (orig_w, orig_h), args.codec, preset=args.x264_preset,
+                           gop=max(1, int(round(args.fps * args.gop_sec))))
+    codec = encoder.codec
+    if not codec:
         log(f"ERROR: Cannot open VideoWriter for {args.video_out}")
+        pool.close()
         sys.exit(1)
-    if codec != "avc1" and args.codec != "mp4v":
+    if args.codec == "x264":
+        if codec == "x264":
+            log(f"Encoding with ffmpeg libx264 ({args.x264_preset}, "
+                f"keyframe every {args.gop_sec:g}s)")
+        else:
+            log(f"WARNING: ffmpeg not found, recording {codec} — `make review-web` "
+                "will transcode a scrub proxy for its insert scrubber. "
+                "`make ffmpeg` installs it.")
+    elif codec != "avc1" and args.codec != "mp4v":
         log(f"WARNING: asked for H.264 but this OpenCV build wrote {codec} — "
             "`make review-web` will transcode a scrub proxy for its insert "
             "scrubber. `make review` is unaffected.")
-
-    # Encode on a background thread so the 4K software encode never stalls the
-    # capture/preview loop. Frames are queued read-only: cap.read() hands back a
-    # fresh array each call and the overlay draws on a separate preview image, so
-    # the worker can encode a frame while the main loop still holds the same
-    # buffer in its sharpness window. The queue is bounded — if the encoder falls
-    # behind, put() blocks (backpressure) instead of growing memory unbounded.
-    frame_queue: "queue.Queue" = queue.Queue(maxsize=64)
-    WRITER_STOP = object()
-
-    def writer_worker():
-        while True:
-            item = frame_queue.get()
-            if item is WRITER_STOP:
-                frame_queue.task_done()
-                break
-            writer.write(item)
-            frame_queue.task_done()
-
-    writer_thread = threading.Thread(target=writer_worker, daemon=True)
-    writer_thread.start()
-
-    det = LiveDetector(fps=args.fps,
-                       settle_threshold=args.settle_threshold,
-                       turn_threshold=args.turn_threshold,
-                       settle_time=args.settle_time,
-                       smoothing_window=args.smoothing_window)
+    timing = FrameTiming(args.fps)
+
+    # --archive: the encoder above gets only the settle windows, and every
+    # frame goes to a proxy, scaled down in this loop and encoded by its own
+    # small encoder (see archive.py).
+    recorder = proxy_encoder = None
+    if args.archive:
+        xh = min(args.proxy_height, orig_h) // 2 * 2
+        xw = int(orig_w * xh / orig_h) // 2 * 2
+        proxy_pool = pool_cls((xh, xw, 3), 64 * 2**20, min_slots=4)
+        proxy_encoder = open_encoder(args.encoder, proxy_pool, args.video_out, args.fps,
+                                     (xw, xh), args.codec, preset=args.x264_preset,
+                                     gop=max(1, int(round(args.fps * args.gop_sec))))
+        if not proxy_encoder.codec:
+            log(f"ERROR: Cannot open VideoWriter for {args.video_out}")
+            encoder.close()
+            proxy_pool.close()
+            pool.close()
+            sys.exit(1)
+        recorder = ArchiveRecorder(pool, encoder, proxy_pool, proxy_encoder, margin_frames)
+        log(f"Archive: proxy {xw}x{xh} -> {args.video_out}, full resolution within "
+            f"{margin_frames / args.fps:.2f}s of a still frame -> {full_out}")
 
     # The detector chooses a frame *index*; resolving it to pixels is the
     # caller's job, and is the one thing a remote front end would do
     # differently (asking the browser for that frame instead of a local
     # buffer). Sized to the detector's window so anything it can name is
     # still here — the linear scan is over ~10 entries.
-    frames = deque(maxlen=det.settle_frames)    # (frame_index, frame_bgr)
+    frames = deque()                            # (frame_index, pool slot)
 
+    # Captures are encoded and written on worker threads, never in this loop;
+    # the HUD shows how many are still being saved.
+    kf_writer = KeyframeWriter(paths.images, jpeg_quality=args.jpeg_quality)
     keyframes = []
     frame_idx = -1
     muted = False
@@ -310,14 +392,30 @@ def main():
         if capture is None:
             return
         fi = capture.frame_index
-        best_frame = next((f for i, f in frames if i == fi), None)
-        if best_frame is None:
+        slot = next((s for i, s in frames if i == fi), None)
+        if slot is None:
             return
+        if recorder is not None:
+            recorder.keep(fi)
+        upgrade = capture.replaces is not None
+        if upgrade:
+            # Early capture found a sharper frame of the same page: it takes
+            # the provisional keyframe's place, unless that was undone.
+            if not keyframes or keyframes[-1]["frame_index"] != capture.replaces:
+                return
+            kf_writer.discard(keyframes.pop()["filename"])
         spread_start = keyframes[-1]["frame_index"] if keyframes else 0
         filename = f"frame{fi:06d}.jpg"
-        cv2.imwrite(str(paths.images / filename), best_frame,
-                    [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality])
+        # The writer holds its own reference to the slot until the JPEG is
+        # encoded, so the frame can age out of the window meanwhile.
+        pool.retain(slot)
+        kf_writer.submit(filename, pool.view(slot),
+                         release=lambda: pool.release(slot))
         keyframes.append(keyframe_record(capture, args.fps, spread_start, filename))
+        if upgrade:
+            log(f"  Upgraded #{len(keyframes)}: frame {capture.replaces} -> {fi} "
+                f"(sharp={capture.sharpness:.0f})")
+            return
         flash_text = f"CAPTURED #{len(keyframes)} ({capture.reason})"
         flash_until = time.time() + 0.8
         log(f"  Captured #{len(keyframes)}: frame {fi} "
@@ -329,7 +427,7 @@ def main():
         if not keyframes:
             return
         kf = keyframes.pop()
-        (paths.images / kf["filename"]).unlink(missing_ok=True)
+        kf_writer.discard(kf["filename"])     # safe while its write is in flight
         flash_text = f"UNDO #{len(keyframes) + 1}"
         flash_until = time.time() + 0.8
         log(f"  Undid capture {kf['filename']}")
@@ -344,13 +442,26 @@ def main():
     t0 = time.time()
 
     while True:
-        ret, frame = cap.read()
+        slot = pool.acquire()
+        frame = pool.view(slot)
+        ret, got = cap.read(frame)
+        t_read = time.monotonic()
         if not ret:
+            pool.release(slot)
             log("Camera stream ended.")
             break
+        if got is not frame:        # the backend allocated after all
+            frame[...] = got
+        timing.tick(t_read)
 
-        frame_queue.put(frame)      # background thread does the 4K encode
         frame_idx += 1
+        if recorder is None:
+            pool.retain(slot)
+            encoder.put(slot, t_read)   # the encoder releases it once written
+        if encoder.dead or (proxy_encoder is not None and proxy_encoder.dead):
+            log("ERROR: the encoder process died — stopping; the recording ends here.")
+            pool.release(slot)
+            break
 
         # One expensive 4K downscale feeds both the preview and the analysis
         # frame; the analysis frame is then derived from the preview (a cheap
@@ -361,19 +472,28 @@ def main():
         else:
             small = cv2.resize(frame, (aw, args.analysis_height), interpolation=cv2.INTER_AREA)
         gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
-
-        # cap.read() returns a fresh array each call, so the rolling window can
-        # hold the frame directly — no per-frame full-res copy.
-        frames.append((frame_idx, frame))
+        if recorder is not None:
+            proxy = preview if (pw, ph) == (xw, xh) else \
+                cv2.resize(frame, (xw, xh), interpolation=cv2.INTER_AREA)
+            recorder.put(frame_idx, slot, t_read, proxy)
+
+        # The window takes over the loop's reference to the slot; the frame
+        # aging out of it gives its slot back (once the encoder is done too).
+        if len(frames) == det.settle_frames:
+            pool.release(frames.popleft()[1])
+        frames.append((frame_idx, slot))
         tick = det.update(frame_idx, gray)
         commit_capture(tick.capture)
+        if recorder is not None:
+            recorder.advance(frame_idx, tick.smooth < args.settle_threshold)
 
         # Draw the HUD straight onto the downscaled preview (a fresh array each
         # frame), so there's no full-res copy and imshow blits a small image.
         disp = draw_overlay(preview, tick.state, tick.motion, tick.smooth,
                             args.settle_threshold, args.turn_threshold,
                             len(keyframes), det.paused, flash_text, flash_until,
-                            header_h, muted, res_text, tick.brightness)
+                            header_h, muted, res_text, tick.brightness,
+                            kf_writer.pending())
         cv2.imshow(win, disp)
 
         key = cv2.waitKey(1) & 0xFF
@@ -390,18 +510,71 @@ def main():
             log(f"  Sound {'muted' if muted else 'unmuted'}")
 
     cap.release()
-    frame_queue.put(WRITER_STOP)    # drain remaining frames, then stop the worker
-    writer_thread.join()
-    writer.release()
+    write_stats = kf_writer.close()     # every capture on disk before keyframes.json
+    if write_stats["failed"]:
+        log(f"WARNING: {write_stats['failed']} keyframe image(s) could not be written")
+    if recorder is not None:
+        full_pos = recorder.finish()    # the last margin, before the encoder closes
+        proxy_stats = proxy_encoder.close()
+        proxy_pool.close()
+        if proxy_stats["writer_error"]:
+            log(f"WARNING: the proxy may be incomplete: {proxy_stats['writer_error']}")
+    encoder_stats = encoder.close()     # drains the backlog, finishes the file
+    if encoder_stats["writer_error"]:
+        log(f"WARNING: the recording may be incomplete: {encoder_stats['writer_error']}")
     cv2.destroyAllWindows()
+    while frames:
+        pool.release(frames.popleft()[1])
+
+    # Index the recording while its packets are still in the page cache, so
+    # P4's insert scrubber and P3 seek by keyframe from the first use on.
+    index = build_index(paths.data, args.video_out)
+    if index is not None:
+        log(f"  Frame index: {int(index['key'].sum())} keyframes "
+            f"-> {paths.data / INDEX_FILE}")
+    archive_meta = None
+    if recorder is not None:
+        build_archive_index(paths.data, args.video_out, full_pos, (orig_w, orig_h))
+        full_mb = Path(full_out).stat().st_size / 2**20 if Path(full_out).exists() else 0.0
+        proxy_mb = Path(args.video_out).stat().st_size / 2**20
+        archive_meta = {
+            "proxy_height": xh,
+            "margin_sec": round(margin_frames / args.fps, 3),
+            "full_res_path": full_out,
+            "frames_full": recorder.full_frames,
+            "frames_total": len(full_pos),
+            "proxy_mb": round(proxy_mb, 1),
+            "full_mb": round(full_mb, 1),
+        }
+        log(f"  Archive: {recorder.full_frames}/{len(full_pos)} frames at full "
+            f"resolution ({full_mb:.0f} MB) + proxy ({proxy_mb:.0f} MB) "
+            f"-> {paths.data / ARCHIVE_FILE}")
+    else:
+        # A re-recording over an archival session is a plain one now.
+        (paths.data / ARCHIVE_FILE).unlink(missing_ok=True)
 
     total_frames = frame_idx + 1
     elapsed = time.time() - t0
     log(f"Recorded {total_frames} frames in {elapsed:.1f}s "
         f"({total_frames / max(elapsed, 1e-3):.0f} fps), {len(keyframes)} keyframes")
+    pool_stats = pool.stats()
+    pool.close()
+    log(f"Frame pool: peak {pool_stats['peak_in_use']}/{pool.slots} in use, "
+        f"{pool_stats['stalls']} stalls ({pool_stats['stall_sec']:.1f}s waiting for the encoder)")
+    timing_stats = {**timing.stats(), **encoder_stats}
+    log(f"Frame delivery: {timing_stats['late_frames']} late, "
+        f"~{timing_stats['dropped_frames']} dropped by the camera; encode latency "
+        f"{timing_stats['encode_latency_ms_mean']:.0f} ms mean, "
+        f"{timing_stats['encode_latency_ms_max']:.0f} ms max ({encoder_stats['encoder']})")
+    latency = det.capture_latency()
+    if latency["captures"]:
+        log(f"Capture latency ({latency['mode']}): page at rest -> captured "
+            f"{latency['latency_ms_mean']:.0f} ms mean, "
+            f"{latency['latency_ms_p90']:.0f} ms p90 over {latency['captures']} pages")
 
     np.save(str(paths.data / "motion_signal.npy"), det.motion_signal())
     np.save(str(paths.data / "smoothed_signal.npy"), det.smoothed_signal())
+    np.save(str(paths.data / FEATURES_FILE), det.features())   # for live_replay.py
 
     # Emit the P2/P3 markers too, so `make finish`/`make all` see the front-half
     # dependency chain as satisfied and don't try to regenerate these keyframes.
@@ -421,7 +594,13 @@ def main():
         "frames_processed": total_frames,
         "smoothing_window": args.smoothing_window,
         "capture_source": "live",
+        "buffer_pool": pool_stats,
+        "frame_timing": timing_stats,
+        "keyframe_writes": write_stats,
+        "capture_latency": latency,
     }
+    if archive_meta is not None:
+        metadata["archive"] = archive_meta
     (paths.json / "metadata.json").write_text(json.dumps(metadata, indent=2))
     (paths.json / "keyframes.json").write_text(json.dumps(keyframes, indent=2))
 
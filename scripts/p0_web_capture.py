@@ -10,13 +10,18 @@ and therefore no /dev/video* no matter what the USB-sharing toggles say; the
 browser is the only road to the camera there. Emits the same artifacts as
 p0_live_capture, so `make finish` works unchanged.
 
-The tab streams small grayscale analysis frames (~360p, ~7 MB/s) over one
-WebSocket; the detector picks keyframes by *timestamp*, and only those frames
-cross the wire at full resolution, as JPEGs. The recording never crosses raw:
-MediaRecorder chunks (hardware H.264/VP9) are appended to a raw file, then
-normalized to constant frame rate at --fps when the session ends — P4 scrubs
-the recording by frame index, so a variable-rate file would silently show the
-wrong moment. Normalization uses ffmpeg when available, else OpenCV.
+The tab streams small grayscale analysis frames (~360p) over one WebSocket,
+mostly as delta frames carrying only the blocks that changed. The server steps
+the analysis resolution and rate down when the link falls behind and back up
+when it clears (see analysis_link.py). The detector picks keyframes by
+*timestamp*, and only those frames cross the wire at full resolution, as
+JPEGs. The recording never crosses raw: MediaRecorder chunks (hardware
+H.264/VP9) are appended to a raw file and, with ffmpeg, piped into an encoder
+normalizing them to constant frame rate at --fps as they arrive, so Finish
+only waits for the tail. P4 scrubs the recording by frame index, so a
+variable-rate file would silently show the wrong moment. If the streaming
+encode fails or falls behind, or ffmpeg is missing, the raw file is normalized
+after the session instead (ffmpeg, else OpenCV).
 
 Timeline contract: the detector requires contiguous frame indices at --fps.
 Browser frames are variable-rate, so this server maps each frame's timestamp
@@ -41,6 +46,7 @@ Keys (in the browser tab):
 
 import argparse
 import json
+import queue
 import shutil
 import struct
 import subprocess
@@ -53,16 +59,23 @@ from pathlib import Path
 import cv2
 import numpy as np
 
+from analysis_link import DeltaDecoder, LinkAdapter, link_levels
+from frame_source import FEATURES_FILE
+from keyframe_writer import KeyframeWriter
 from live_state import LiveDetector, keyframe_record
-from miniws import CLOSE, TEXT, WebSocket, accept_key
+from miniws import CLOSE, TEXT, MessageBatcher, WebSocket, accept_key, negotiate_deflate
+from recording_sink import RecordingSink
 from utils import ProjectPaths, log, open_video_writer
 
 # Binary message tags (first byte of every binary WebSocket message).
 MSG_FRAME = 1    # [u8 1][f64 ts_us][u16 w][u16 h][w*h gray]      browser -> server
 MSG_JPEG = 2     # [u8 2][u32 frame_index][jpeg bytes]            browser -> server
 MSG_CHUNK = 3    # [u8 3][u32 seq][MediaRecorder chunk bytes]     browser -> server
+MSG_DELTA = 4    # [u8 4][f64 ts_us][u16 w][u16 h][block mask][blocks]  browser -> server
 
 _FRAME_HDR = struct.Struct("<dHH")
+# What each binary tag is called in the handling telemetry.
+_TAG_NAMES = {MSG_FRAME: "frame", MSG_JPEG: "jpeg", MSG_CHUNK: "chunk", MSG_DELTA: "delta"}
 
 TIMESLICE_MS = 1000       # MediaRecorder chunk interval
 # Extra full-res frames the browser rings beyond settle_frames, covering the
@@ -70,6 +83,11 @@ TIMESLICE_MS = 1000       # MediaRecorder chunk interval
 # arriving there. The ring holds *copies* (~12 MB each at 4K), so this is a
 # memory knob, not a camera-buffer-pool one; localhost RTT is ~1 frame.
 RING_SLACK = 4
+# Outbound messages (a tick per frame, plus saved/link/...) are coalesced
+# over about two frames. Capture requests skip the wait: the frame they name
+# must still be in that ring.
+BATCH_SEC = 0.07
+URGENT = ("capture",)
 
 
 def parse_args(argv=None):
@@ -84,6 +102,12 @@ def parse_args(argv=None):
                    help="Requested camera height (default 2160 = 4K UHD)")
     p.add_argument("--fps", type=float, default=30.0, help="Timeline / recording fps")
     p.add_argument("--analysis-height", type=int, default=360)
+    p.add_argument("--analysis-encoding", choices=("delta", "raw"), default="delta",
+                   help="How the page packs analysis frames: only the changed "
+                        "blocks (delta), or every pixel (raw)")
+    p.add_argument("--fixed-analysis", action="store_true",
+                   help="Keep --analysis-height at the full frame rate for the "
+                        "whole session instead of adapting to the link")
     p.add_argument("--smoothing-window", type=int, default=15)
     p.add_argument("--settle-threshold", type=float, default=2.0,
                    help="Motion below this counts as 'still'")
@@ -91,10 +115,25 @@ def parse_args(argv=None):
                    help="Motion above this counts as a page turn")
     p.add_argument("--settle-time", type=float, default=0.4,
                    help="Seconds of stillness required before capturing")
+    p.add_argument("--early-capture", action="store_true",
+                   help="Capture as soon as the motion decay predicts the page "
+                        "has settled, then upgrade it in place if a sharper "
+                        "frame arrives before the settle time is up")
     p.add_argument("--jpeg-quality", type=int, default=95,
                    help="JPEG quality for captured keyframes")
     p.add_argument("--keep-raw", action="store_true",
                    help="Keep the raw MediaRecorder file next to the normalized one")
+    p.add_argument("--sync-sec", type=float, default=5.0,
+                   help="Seconds between fsyncs of the raw recording: the most "
+                        "a crash can lose of what has reached the server")
+    p.add_argument("--normalize-after", action="store_true",
+                   help="Normalize the recording only after Finish, instead of "
+                        "streaming it into ffmpeg during the session")
+    p.add_argument("--ws-deflate", action="store_true",
+                   help="Accept the browser's permessage-deflate offer. Off by "
+                        "default: Chrome then compresses what it sends too, and "
+                        "the analysis frames and recording it sends are most of "
+                        "the link and barely compress")
     p.add_argument("--verbose", action="store_true",
                    help="Log pipeline diagnostics (the browser's twice-a-second "
                         "stats line, every frame gap). Off by default: the log "
@@ -102,6 +141,27 @@ def parse_args(argv=None):
     return p.parse_args(argv)
 
 
+def _ffmpeg_normalize_cmd(src, out_path, fps):
+    return ["ffmpeg", "-y", "-loglevel", "error", "-progress", "pipe:1",
+            "-nostats", "-i", src,
+            "-vf", f"fps={fps:g}", "-c:v", "libx264", "-preset", "veryfast",
+            "-crf", "18", "-pix_fmt", "yuv420p", "-an", str(out_path)]
+
+
+def _read_progress(lines, progress):
+    """Feed ffmpeg's ``-progress`` output to ``progress`` (seconds written)."""
+    # -progress emits key=value blocks every ~0.5s; out_time_us is the
+    # encode position on the output timeline (older ffmpeg spells it
+    # out_time_ms — also microseconds).
+    for line in lines:
+        key, _, val = line.strip().partition("=")
+        if key in ("out_time_us", "out_time_ms"):
+            try:
+                progress(int(val) / 1e6)
+            except ValueError:
+                pass                      # "N/A" before the first frame
+
+
 def normalize_recording(raw_path, out_path, fps, use_ffmpeg=None, progress=None):
     """Re-encode the variable-rate MediaRecorder file to CFR at ``fps``.
 
@@ -114,10 +174,7 @@ def normalize_recording(raw_path, out_path, fps, use_ffmpeg=None, progress=None)
         use_ffmpeg = shutil.which("ffmpeg") is not None
 
     if use_ffmpeg:
-        cmd = ["ffmpeg", "-y", "-loglevel", "error", "-progress", "pipe:1",
-               "-nostats", "-i", str(raw_path),
-               "-vf", f"fps={fps:g}", "-c:v", "libx264", "-preset", "veryfast",
-               "-crf", "18", "-pix_fmt", "yuv420p", "-an", str(out_path)]
+        cmd = _ffmpeg_normalize_cmd(str(raw_path), out_path, fps)
         try:
             proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
                                     stderr=subprocess.PIPE, text=True)
@@ -129,16 +186,7 @@ def normalize_recording(raw_path, out_path, fps, use_ffmpeg=None, progress=None)
         drain = threading.Thread(target=lambda: err_chunks.append(proc.stderr.read()),
                                  daemon=True)
         drain.start()
-        # -progress emits key=value blocks every ~0.5s; out_time_us is the
-        # encode position on the output timeline (older ffmpeg spells it
-        # out_time_ms — also microseconds).
-        for line in proc.stdout:
-            key, _, val = line.strip().partition("=")
-            if progress is not None and key in ("out_time_us", "out_time_ms"):
-                try:
-                    progress(int(val) / 1e6)
-                except ValueError:
-                    pass                      # "N/A" before the first frame
+        _read_progress(proc.stdout, progress or (lambda done_s: None))
         proc.wait()
         drain.join(timeout=5)
         if proc.returncode != 0:
@@ -186,6 +234,106 @@ def normalize_recording(raw_path, out_path, fps, use_ffmpeg=None, progress=None)
     return f"ok (opencv, {out_n} frames)"
 
 
+class StreamingNormalizer:
+    """The CFR normalize, run while the session records.
+
+    One ffmpeg process reads the MediaRecorder stream on stdin (WebM and
+    Chrome's fragmented MP4 both demux from a pipe) with the same filter and
+    encoder as ``normalize_recording``. ``feed`` queues each chunk for a
+    writer thread, so a slow encode never blocks the socket. When ffmpeg
+    dies, or falls more than MAX_BACKLOG bytes behind (a 4K encode on a slow
+    machine can run below real time), it is abandoned: the raw file is
+    written regardless, and ``finish`` reports the failure so the caller can
+    normalize that file instead.
+    """
+
+    MAX_BACKLOG = 256e6
+
+    def __init__(self, out_path, fps):
+        self.out_path = out_path
+        self.position_s = 0.0         # output video written so far
+        self.error = None
+        self._backlog = 0
+        self._lock = threading.Lock()
+        self._chunks = queue.Queue()
+        self._err = []
+        self.proc = subprocess.Popen(_ffmpeg_normalize_cmd("pipe:0", out_path, fps),
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+        self._threads = [
+            threading.Thread(target=self._write, daemon=True),
+            threading.Thread(target=self._progress, daemon=True),
+            threading.Thread(target=lambda: self._err.append(self.proc.stderr.read()),
+                             daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def feed(self, chunk):
+        """Queue a recorder chunk (copied: it may be a view of a socket buffer)."""
+        if self.error is not None:
+            return
+        with self._lock:
+            self._backlog += len(chunk)
+            behind = self._backlog
+        if behind > self.MAX_BACKLOG:
+            self._fail(f"fell {behind / 1e6:.0f} MB behind the recording")
+            log("  WARNING: the streaming normalize can't keep up with the "
+                "recording; it will be normalized after the session instead")
+            return
+        self._chunks.put(bytes(chunk))
+
+    def finish(self, progress=None):
+        """Close the input and wait for the tail: a status string starting
+        with "ok" on success. ``progress`` is called with seconds of output
+        written, as for ``normalize_recording``."""
+        self._chunks.put(None)
+        while True:
+            try:
+                self.proc.wait(timeout=0.25)
+                break
+            except subprocess.TimeoutExpired:
+                if progress is not None:
+                    progress(self.position_s)
+        for t in self._threads:
+            t.join(timeout=5)
+        if self.error is None and self.proc.returncode != 0:
+            err = (self._err[0] if self._err else b"").decode(errors="replace").strip()
+            self.error = f"ffmpeg: {err[:400] or f'exit {self.proc.returncode}'}"
+        if self.error is not None:
+            return f"failed: {self.error}"
+        return "ok (ffmpeg, streamed)"
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.proc.kill()
+
+    def _write(self):
+        broken = False
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                break
+            with self._lock:
+                self._backlog -= len(chunk)
+            if broken or self.error is not None:
+                continue                  # abandoned or dead: drain and drop
+            try:
+                self.proc.stdin.write(chunk)
+            except OSError:               # ffmpeg exited; finish reports why
+                broken = True
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+
+    def _progress(self):
+        _read_progress(
+            (line.decode(errors="replace") for line in self.proc.stdout),
+            lambda done_s: setattr(self, "position_s", done_s))
+
+
 def _fmt_secs(s):
     s = int(round(s))
     return f"{s // 60}m{s % 60:02d}s" if s >= 60 else f"{s}s"
@@ -196,9 +344,10 @@ class NormalizeProgress:
     (periodic log lines when stdout is not a tty), mirrored to the browser
     tab as throttled "normalizing" messages carrying a fraction and an ETA."""
 
-    def __init__(self, duration_s, send):
+    def __init__(self, duration_s, send, start_s=0.0):
         self.duration_s = duration_s
         self.send = send
+        self.start_s = start_s        # already written when timing started
         self._t0 = time.monotonic()
         self._next_draw = 0.0         # wall clock of the next terminal update
         self._next_send = 0.0         # ... and the next browser update
@@ -209,7 +358,9 @@ class NormalizeProgress:
         now = time.monotonic()
         frac = min(done_s / self.duration_s, 1.0) if self.duration_s > 0 else 0.0
         elapsed = now - self._t0
-        eta = elapsed * (1.0 - frac) / frac if frac > 0.02 else None
+        left = self.duration_s - self.start_s
+        run = min((done_s - self.start_s) / left, 1.0) if left > 0 else 0.0
+        eta = elapsed * (1.0 - run) / run if run > 0.02 else None
         eta_txt = f" · ~{_fmt_secs(eta)} left" if eta is not None else ""
         if now >= self._next_draw:
             self._next_draw = now + (0.25 if self._tty else 10.0)
@@ -250,9 +401,17 @@ class WebSession:
                                 settle_threshold=cfg.settle_threshold,
                                 turn_threshold=cfg.turn_threshold,
                                 settle_time=cfg.settle_time,
-                                smoothing_window=cfg.smoothing_window)
+                                smoothing_window=cfg.smoothing_window,
+                                early_capture=cfg.early_capture)
         self.keyframes = []
         self.pending = {}            # frame_index -> Capture awaiting its JPEG
+        # The browser's JPEG is written by a worker thread, never inline with
+        # the frame stream; "saved" tells the page how many are still going.
+        self.writer = KeyframeWriter(
+            paths.images, on_done=lambda name, ok, left: self.send(
+                {"type": "saved", "filename": name, "ok": ok, "pending": left}))
+        self._send_lock = threading.Lock()
+        self.outbound = None         # the handler's MessageBatcher, for its stats
         self.camera = {}             # actuals from the browser's hello
         self.finished = False
 
@@ -263,17 +422,29 @@ class WebSession:
         self._lag_warned = False
         self._queue_warned = False
         self._gaps = 0               # long frame gaps; only the first is logged
-        self.analysis_w = None
+        self.analysis_w = None       # what the detector sees, whatever the link sends
         self.analysis_h = None
+        self.link = LinkAdapter(link_levels(cfg.analysis_height, cfg.fps),
+                                adaptive=not cfg.fixed_analysis)
+        self._delta = DeltaDecoder()
+        self._last_gray = None       # last frame as the link sent it
+        self.link_bytes = 0          # analysis frames as received ...
+        self.link_raw_bytes = 0      # ... and as raw frames would have been
+        self.delta_dropped = 0
 
         self._t0_us = None           # timestamp anchoring index 0
         self._last_index = -1
         self._ts_by_index = {}       # index -> browser timestamp (for captures)
 
         self.raw_path = None
-        self._raw_file = None
+        self._sink = None            # RecordingSink writing raw_path
+        self.sink_stats = None       # its telemetry, as of the last stats report
         self.raw_bytes = 0
         self._chunks = 0
+        self._stream = None          # StreamingNormalizer, once chunks arrive
+
+        self._handled = {}           # message kind -> count handled
+        self._handle_ms = {}         # message kind -> recent handling times
 
     # ── Logging ──────────────────────────────────────────────
 
@@ -294,7 +465,8 @@ class WebSession:
         """Send if the socket is still there; a dead socket must not stop
         artifact writing (finish() runs on disconnect too)."""
         try:
-            self._send(msg)
+            with self._send_lock:       # the keyframe writer sends from its threads
+                self._send(msg)
         except (OSError, ConnectionError):
             pass
 
@@ -312,13 +484,25 @@ class WebSession:
             "jpeg_quality": cfg.jpeg_quality,
             "ring": self.det.settle_frames + RING_SLACK,
             "timeslice_ms": TIMESLICE_MS,
+            "link": {"encoding": cfg.analysis_encoding, "levels": self.link.levels,
+                     "level": self.link.level},
         })
 
     # ── Inbound ──────────────────────────────────────────────
 
     def handle_text(self, text):
+        t0 = time.perf_counter()
         m = json.loads(text)
         t = m.get("type")
+        if t == "finish":
+            self.finish()               # minutes of normalize: not a message cost
+            return
+        try:
+            self._handle_text(t, m)
+        finally:
+            self._timed("text", t0)
+
+    def _handle_text(self, t, m):
         if t == "hello":
             self.camera = {k: m.get(k) for k in ("width", "height", "frame_rate", "mime")}
             log(f"  Browser camera: {m.get('width')}x{m.get('height')} "
@@ -341,6 +525,13 @@ class WebSession:
             # message sat behind the socket's frame/chunk backlog.
             lag_s = max(0.0, time.time() - m.get("epoch_ms", 0) / 1000.0)
             self.last_stats = m
+            if self._sink is not None:
+                self.sink_stats = self._sink.stats()
+                sink = self.sink_stats
+                self.vlog(f"  [sink] {sink['queued_mb']} MB queued (peak "
+                          f"{sink['queue_peak_mb']}) · write {sink['write_ms_p50']} ms "
+                          f"p50, {sink['write_ms_max']} max · "
+                          f"{sink['unsynced_mb']} MB not yet synced")
             self.vlog(f"  [stats] cam {m.get('cam_fps')} fps · "
                       f"proc {m.get('proc_ms')} ms/frame · "
                       f"frame-ts step {m.get('ts_delta_ms')} ms · "
@@ -364,6 +555,7 @@ class WebSession:
                     "or a VM boundary?) is slower than the capture stream. "
                     "Analysis thins to what the link carries; the recording "
                     "uploads when the link is idle and finishes at Finish (Q).")
+            self._adapt(lag_s, m.get("chunk_q", 0))
         elif t == "capture_missing":
             fi = m.get("frame_index")
             self.pending.pop(fi, None)
@@ -371,22 +563,60 @@ class WebSession:
             self.send({"type": "notice",
                        "text": f"Capture at frame {fi} was lost — "
                                "press C to retake once the page is steady"})
-        elif t == "finish":
-            self.finish()
 
     def handle_binary(self, data):
+        """One binary message. ``data`` may be a view of the socket's receive
+        buffer (see miniws), reused by the next message: everything read out
+        of it is either consumed here or copied."""
+        t0 = time.perf_counter()
         tag = data[0]
-        if tag == MSG_FRAME:
-            ts_us, w, h = _FRAME_HDR.unpack_from(data, 1)
-            if len(data) < 13 + w * h:
-                return
-            gray = np.frombuffer(data, np.uint8, count=w * h, offset=13).reshape(h, w)
-            self._on_frame(ts_us, gray)
-        elif tag == MSG_JPEG:
-            (fi,) = struct.unpack_from("<I", data, 1)
-            self._commit_jpeg(fi, data[5:])
-        elif tag == MSG_CHUNK:
-            self._append_chunk(data[5:])
+        try:
+            if tag == MSG_FRAME:
+                ts_us, w, h = _FRAME_HDR.unpack_from(data, 1)
+                if len(data) < 13 + w * h:
+                    return
+                gray = np.frombuffer(data, np.uint8, count=w * h, offset=13).reshape(h, w)
+                self._delta.reset(gray)
+                self.link_bytes += len(data)
+                self.link_raw_bytes += 13 + w * h
+                # The detector keeps each frame to diff the next one against.
+                self._on_frame(ts_us, gray.copy())
+            elif tag == MSG_DELTA:
+                ts_us, w, h = _FRAME_HDR.unpack_from(data, 1)
+                gray = self._delta.decode(w, h, data[13:])
+                if gray is None:
+                    self.delta_dropped += 1
+                    return
+                self.link_bytes += len(data)
+                self.link_raw_bytes += 13 + w * h
+                self._on_frame(ts_us, gray)
+            elif tag == MSG_JPEG:
+                (fi,) = struct.unpack_from("<I", data, 1)
+                self._commit_jpeg(fi, data[5:])
+            elif tag == MSG_CHUNK:
+                self._append_chunk(data[5:])
+        finally:
+            self._timed(_TAG_NAMES.get(tag, "other"), t0)
+
+    def _timed(self, kind, t0):
+        """Count one handled message of ``kind`` and keep how long it took."""
+        self._handled[kind] = self._handled.get(kind, 0) + 1
+        times = self._handle_ms.setdefault(kind, [])
+        times.append((time.perf_counter() - t0) * 1000)
+        if len(times) > 4096:
+            del times[:2048]
+
+    def handling_stats(self):
+        """Per message kind: how many were handled, and the p50/p99/max of
+        the last few thousand handling times, in ms."""
+        out = {}
+        for kind, times in sorted(self._handle_ms.items()):
+            ms = sorted(times)
+            out[kind] = {"count": self._handled[kind],
+                         "p50_ms": round(ms[len(ms) // 2], 2),
+                         "p99_ms": round(ms[min(len(ms) - 1, len(ms) * 99 // 100)], 2),
+                         "max_ms": round(ms[-1], 2)}
+        return out
 
     # ── The analysis timeline ────────────────────────────────
 
@@ -404,6 +634,8 @@ class WebSession:
                     f"{self.cfg.fps:g} fps")
             return
         if self.analysis_w is None:
+            # The first frame is at the configured level: the size the
+            # thresholds are calibrated on, and the detector's from now on.
             self.analysis_h, self.analysis_w = gray.shape
         # This frame stands for every timeline slot since the last one: the
         # detector credits the whole gap with the difference measured across
@@ -431,7 +663,7 @@ class WebSession:
                 del self._ts_by_index[k]
         self._last_index = index
 
-        tick = self.det.update(index, gray, span=span)
+        tick = self._measure(index, gray, span)
         self.send({"type": "tick", "frame_index": index, "state": tick.state,
                    "motion": round(tick.motion, 2), "smooth": round(tick.smooth, 2),
                    "brightness": round(tick.brightness, 1),
@@ -439,6 +671,46 @@ class WebSession:
         if tick.capture is not None:
             self._request_pixels(tick.capture)
 
+    def _measure(self, index, gray, span):
+        """Run the detector on ``gray`` scaled to the session's analysis size.
+
+        Across a level change the last frame and this one were rendered at
+        different sizes, and their difference would read as motion. That one
+        step is measured with both frames at the smaller of the two sizes,
+        then the detector carries on from this frame at full quality.
+        """
+        base = (self.analysis_w, self.analysis_h)
+
+        def to_base(g):
+            if (g.shape[1], g.shape[0]) == base:
+                return g
+            return cv2.resize(g, base, interpolation=cv2.INTER_LINEAR)
+
+        prev, self._last_gray = self._last_gray, gray
+        if prev is None or prev.shape == gray.shape:
+            return self.det.update(index, to_base(gray), span=span)
+        lo = min(prev.shape, gray.shape)
+        lo_size = (lo[1], lo[0])
+        self.det.rebase(to_base(cv2.resize(prev, lo_size, interpolation=cv2.INTER_AREA)))
+        tick = self.det.update(
+            index, to_base(cv2.resize(gray, lo_size, interpolation=cv2.INTER_AREA)),
+            span=span)
+        self.det.rebase(to_base(gray))
+        return tick
+
+    def _adapt(self, lag_s, chunk_q):
+        """Let the link adapter judge a stats report; tell the page if the
+        analysis level changes."""
+        level = self.link.observe(time.monotonic(), lag_s, chunk_q,
+                                  frame_index=self._last_index)
+        if level is None:
+            return
+        change = self.link.history[-1]
+        self.send({"type": "link", "level": level, **self.link.levels[level]})
+        log(f"  Analysis link: {change['height']}p at {change['fps']:g} fps "
+            f"({change['reason']}: lag {lag_s:.1f}s, "
+            f"{chunk_q / 1e6:.0f} MB queued)")
+
     # ── Captures ─────────────────────────────────────────────
 
     def _request_pixels(self, capture):
@@ -458,14 +730,24 @@ class WebSession:
         capture = self.pending.pop(fi, None)
         if capture is None or not jpeg:
             return
+        if capture.replaces is not None:
+            # Early capture's sharper frame of the same page takes the
+            # provisional keyframe's place, unless that was undone.
+            if not self.keyframes or self.keyframes[-1]["frame_index"] != capture.replaces:
+                return
+            self.writer.discard(self.keyframes.pop()["filename"])
         spread_start = self.keyframes[-1]["frame_index"] if self.keyframes else 0
         filename = f"frame{fi:06d}.jpg"
-        (self.paths.images / filename).write_bytes(jpeg)
+        self.writer.submit(filename, bytes(jpeg))
         self.keyframes.append(
             keyframe_record(capture, self.cfg.fps, spread_start, filename,
                             source="live"))
         self.send({"type": "captured", "count": len(self.keyframes),
                    "frame_index": fi, "reason": capture.reason})
+        if capture.replaces is not None:
+            log(f"  Upgraded #{len(self.keyframes)}: frame {capture.replaces} -> {fi} "
+                f"(sharp={capture.sharpness:.0f})")
+            return
         log(f"  Captured #{len(self.keyframes)}: frame {fi} "
             f"(sharp={capture.sharpness:.0f}, {capture.reason})")
 
@@ -473,21 +755,32 @@ class WebSession:
         if not self.keyframes:
             return
         kf = self.keyframes.pop()
-        (self.paths.images / kf["filename"]).unlink(missing_ok=True)
+        self.writer.discard(kf["filename"])      # safe while its write is in flight
         self.send({"type": "undone", "count": len(self.keyframes)})
         log(f"  Undid capture {kf['filename']}")
 
     # ── The recording ────────────────────────────────────────
 
     def _append_chunk(self, chunk):
-        if self._raw_file is None:
+        """Hand a recorder chunk to the sink (and the streaming normalize);
+        neither writes on this thread, so frames never wait behind the disk."""
+        if self._sink is None:
             mime = self.camera.get("mime") or "video/webm"
             ext = "mp4" if "mp4" in mime else "webm"
             out = Path(self.cfg.video_out)
             out.parent.mkdir(parents=True, exist_ok=True)
             self.raw_path = out.parent / f"{out.stem}.raw.{ext}"
-            self._raw_file = open(self.raw_path, "wb")
-        self._raw_file.write(chunk)
+            self._sink = RecordingSink(self.raw_path, sync_sec=self.cfg.sync_sec)
+            if not self.cfg.normalize_after and shutil.which("ffmpeg"):
+                try:
+                    self._stream = StreamingNormalizer(out, self.cfg.fps)
+                except OSError as e:
+                    log(f"  WARNING: cannot start the streaming normalize ({e}); "
+                        "the recording will be normalized after the session")
+        chunk = bytes(chunk)            # one copy, shared by both queues
+        self._sink.put(chunk)
+        if self._stream is not None:
+            self._stream.feed(chunk)
         self.raw_bytes += len(chunk)
         self._chunks += 1
 
@@ -497,8 +790,9 @@ class WebSession:
         if self.finished:
             return
         self.finished = True
-        if self._raw_file is not None:
-            self._raw_file.close()
+        if self._sink is not None:
+            self.sink_stats = self._sink.close()
+        write_stats = self.writer.close()   # every image on disk before keyframes.json
 
         total_frames = self._last_index + 1
         det, cfg, paths = self.det, self.cfg, self.paths
@@ -510,6 +804,7 @@ class WebSession:
 
         np.save(str(paths.data / "motion_signal.npy"), det.motion_signal())
         np.save(str(paths.data / "smoothed_signal.npy"), det.smoothed_signal())
+        np.save(str(paths.data / FEATURES_FILE), det.features())   # for live_replay.py
         # P2/P3 markers too, so `make finish` sees the front half as satisfied.
         np.save(str(paths.data / "peaks.npy"), det.peaks())
         (paths.json / "spreads.json").write_text(
@@ -539,7 +834,22 @@ class WebSession:
                 "normalize": status,
                 "raw_recording": str(self.raw_path) if self.raw_path else None,
                 "last_stats": self.last_stats,
+                "keyframe_writes": write_stats,
+                "analysis_link": {
+                    "encoding": cfg.analysis_encoding,
+                    "adaptive": self.link.adaptive,
+                    "levels": self.link.levels,
+                    "final_level": self.link.level,
+                    "adaptations": self.link.history,
+                    "received_mb": round(self.link_bytes / 1e6, 1),
+                    "raw_equivalent_mb": round(self.link_raw_bytes / 1e6, 1),
+                    "delta_dropped": self.delta_dropped,
+                },
+                "recording_sink": self.sink_stats,
+                "handling": self.handling_stats(),
+                "outbound": self.outbound.stats() if self.outbound else None,
             },
+            "capture_latency": det.capture_latency(),
         }
         meta_path = paths.json / "metadata.json"
         # Written before the normalize, which can run for minutes on a 4K
@@ -548,12 +858,28 @@ class WebSession:
 
         if self.raw_path is not None:
             self.send({"type": "normalizing"})
-            log(f"  Normalizing recording to CFR {cfg.fps:g} fps -> {cfg.video_out}")
-            reporter = NormalizeProgress(total_frames / cfg.fps, self.send)
-            status = normalize_recording(self.raw_path, cfg.video_out, cfg.fps,
-                                         progress=reporter)
-            reporter.finish_line()
-            log(f"  Normalize: {status}")
+            status = None
+            if self._stream is not None:
+                log(f"  Finishing the streamed CFR {cfg.fps:g} fps encode -> {cfg.video_out}")
+                t0 = time.monotonic()
+                reporter = NormalizeProgress(total_frames / cfg.fps, self.send,
+                                             start_s=self._stream.position_s)
+                status = self._stream.finish(progress=reporter)
+                reporter.finish_line()
+                tail = time.monotonic() - t0
+                log(f"  Normalize: {status}, {tail:.1f}s after Finish")
+                metadata["web"]["streamed_normalize"] = {"status": status,
+                                                         "tail_sec": round(tail, 1)}
+                if not status.startswith("ok"):
+                    log("  Falling back to normalizing the raw recording")
+                    status = None
+            if status is None:
+                log(f"  Normalizing recording to CFR {cfg.fps:g} fps -> {cfg.video_out}")
+                reporter = NormalizeProgress(total_frames / cfg.fps, self.send)
+                status = normalize_recording(self.raw_path, cfg.video_out, cfg.fps,
+                                             progress=reporter)
+                reporter.finish_line()
+                log(f"  Normalize: {status}")
             if status.startswith("ok") and not cfg.keep_raw:
                 self.raw_path.unlink(missing_ok=True)
                 raw_note = "removed after normalize"
@@ -612,11 +938,17 @@ class CaptureHandler(BaseHTTPRequestHandler):
         self.send_header("Upgrade", "websocket")
         self.send_header("Connection", "Upgrade")
         self.send_header("Sec-WebSocket-Accept", accept_key(key))
+        extension, deflate = None, None
+        if self.server.cfg.ws_deflate:
+            extension, deflate = negotiate_deflate(
+                self.headers.get("Sec-WebSocket-Extensions"))
+        if extension:
+            self.send_header("Sec-WebSocket-Extensions", extension)
         self.end_headers()
         self.wfile.flush()
         self.close_connection = True
 
-        ws = WebSocket(self.connection)
+        ws = WebSocket(self.connection, deflate=deflate)
         if not self.server.session_lock.acquire(blocking=False):
             ws.send_text(json.dumps({"type": "error",
                                      "message": "another capture session is already connected"}))
@@ -629,8 +961,9 @@ class CaptureHandler(BaseHTTPRequestHandler):
 
     def _run_session(self, ws):
         srv = self.server
-        session = WebSession(srv.cfg, srv.paths,
-                             send=lambda m: ws.send_text(json.dumps(m)))
+        batcher = MessageBatcher(ws, window=BATCH_SEC, urgent=URGENT)
+        session = WebSession(srv.cfg, srv.paths, send=batcher.send)
+        session.outbound = batcher
         srv.session = session
         log("  Browser connected")
         session.send_config()
@@ -654,8 +987,10 @@ class CaptureHandler(BaseHTTPRequestHandler):
             else:
                 # Nothing happened (a reload before starting); allow a retry.
                 srv.session = None
+                batcher.close()
                 log("  Browser disconnected before capturing; waiting for a new connection")
                 return
+        batcher.close()
         ws.close()
         srv.done.set()
 
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Phases 1-3 in one decode: motion signal, page-turn peaks, keyframes.
+
+Usage:
+  python scripts/p123_single_pass.py recordings/mybook.mp4
+  python scripts/p123_single_pass.py recordings/mybook.mp4 --output-dir output/custom
+
+The split front half decodes the recording twice — P1 reads every frame for
+the motion signal, then P3 seeks back to every keyframe candidate, decoding
+from the preceding keyframe each time. This runs the same three phases over
+a single sequential decode:
+
+  * each frame's analysis-size diff is exactly P1's OpenCV path;
+  * full-resolution frames wait in a short lookahead ring until their
+    smoothed motion value is known (half the smoothing window ahead). A frame
+    that could still be clean in its spread has its P3 sharpness measured
+    there, and the sharpest few per spread stay in memory as keyframe
+    candidates; the rest of the ring is recycled, so memory is bounded by the
+    ring and the candidate budget (--keep per still-open spread, of which
+    there are two or three), not by book length;
+  * once a second, peaks are re-found on the settled prefix of the signal. A
+    spread whose closing peak has enough right context (two peak distances)
+    is closed there and then: its keyframe is chosen exactly as P3 would and
+    written at once.
+
+At the end the whole signal goes through P2 unchanged, and any spread that
+doesn't match one closed early is selected again. A winner that wasn't held
+is read back with one seek — still-page sharpness is nearly flat, so this
+happens — against P3's one seek per candidate. So spreads.json, peaks.npy and keyframes.json
+— and the images — are byte-identical to P1 (--decoder opencv) + P2 + P3;
+the incremental pass only decides how early the work gets done.
+"""
+
+import argparse
+import json
+import sys
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+from scipy.signal import find_peaks
+
+import p1_motion_signal as p1
+import p2_detect_peaks as p2
+import p3_select_keyframes as p3
+from frame_index import FrameReader, ensure_index
+from frame_source import FEATURES_FILE, analysis_size, features_table, probe_video
+from live_state import laplacian_sharpness
+from utils import log, derive_output_dir, ProjectPaths, check_overwrite, check_overwrite_dir
+
+DEFAULT_KEEP = 16
+
+
+class SinglePass:
+    """P1-P3 state for one recording, fed frame by frame through ``push``."""
+
+    def __init__(self, paths, video_path, info, args):
+        self.paths = paths
+        self.video_path = video_path
+        self.fps = info.fps
+        self.args = args
+        self.window = args.smoothing_window
+        self.size = analysis_size(info.width, info.height, args.analysis_height)
+        aw, ah = self.size
+        self._small = np.empty((ah, aw, 3), np.uint8)
+        self._gray = (np.empty((ah, aw), np.uint8), np.empty((ah, aw), np.uint8))
+        self._diff = np.empty((ah, aw), np.uint8)
+        self.diffs = np.empty(max(info.total_frames, 1024), np.float64)
+        self.frames = 0
+        self._sharpness, self._brightness = [], []    # P1's feature table
+
+        # Frame fi's smoothed value needs diffs up to fi + window//2, i.e.
+        # frame fi + window//2 + 1 decoded.
+        self.ring = deque()
+        self.ring_len = self.window // 2 + 2
+        self._spare = []
+        self.keep = args.keep
+        self.kept = {}                  # frame -> (sharpness, frame, segment, s)
+        self.sharpness = {}             # frame -> P3 sharpness, gated frames
+        self._turn_level = min(args.peak_height, args.valley_peak)
+        self._in_turn = False
+        self._run_min = float("inf")
+        self._segment = 0
+
+        self.distance = int(args.min_distance * self.fps)
+        self.guard = 2 * self.distance
+        self.check_every = max(1, int(round(self.fps)))
+        self.closed_to = 0              # end frame of the last closed spread
+        self.closed_peaks = 0           # pass-1 spreads closed so far
+        self.closed = {}                # (start, end) -> keyframe entry or None
+        self._seek_cap = None
+        self.stats = {"from_memory": 0, "seeked": 0, "reselected": 0}
+
+    # ── decode side ──────────────────────────────────────────
+
+    def next_buffer(self):
+        """A recycled full-res buffer for cap.read to fill, or None."""
+        return self._spare.pop() if self._spare else None
+
+    def push(self, frame):
+        cv2.resize(frame, self.size, dst=self._small, interpolation=cv2.INTER_AREA)
+        cur = self._gray[self.frames & 1]
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=cur)
+        self._sharpness.append(laplacian_sharpness(cur))
+        self._brightness.append(float(np.mean(cur)))
+        if self.frames:
+            cv2.absdiff(self._gray[(self.frames - 1) & 1], cur, dst=self._diff)
+            self._append_diff(float(np.mean(self._diff)))
+        self.ring.append((self.frames, frame))
+        self.frames += 1
+        if len(self.ring) > self.ring_len:
+            self._settle(*self.ring.popleft())
+        if self.frames % self.check_every == 0:
+            self._close_stable_spreads()
+
+    def _append_diff(self, value):
+        n = self.frames - 1
+        if n == len(self.diffs):
+            self.diffs = np.concatenate([self.diffs, np.empty_like(self.diffs)])
+        self.diffs[n] = value
+
+    def _approx_smoothed(self, fi, n):
+        """smoothed[fi], up to float rounding, without re-filtering the prefix.
+
+        Only gates which frames get measured — a frame the rounding kept out
+        is caught by the exact selection later, at the cost of one seek.
+        """
+        half = self.window // 2
+        lo = max(0, fi - half)
+        hi = min(n, fi + half + 1)        # n only clamps at the real end
+        return uniform_filter1d(self.diffs[lo:hi], size=self.window)[fi - lo]
+
+    def _settle(self, fi, frame, n=None):
+        """Frame fi leaves the ring: measure it if it could still be clean."""
+        n = self.frames - 1 if n is None else n
+        if fi < n:
+            s = self._approx_smoothed(fi, n)
+            # Provisional segments restart after every stretch of turn-level
+            # motion; a spread's minimum is never above the running minimum
+            # of a segment inside it, so below turn level no clean frame is
+            # turned away (one at turn level costs a seek at selection).
+            if s >= self._turn_level:
+                self._in_turn = True
+            elif self._in_turn:
+                self._in_turn, self._run_min = False, float("inf")
+                self._segment += 1
+            if s < self._run_min:
+                self._run_min = s
+                self._release_unclean()
+            if s < self._run_min + self.args.motion_margin + 1e-6:
+                sharp = p3.frame_sharpness(frame)
+                self.sharpness[fi] = sharp
+                if self._hold(fi, sharp, frame, s):
+                    return
+        self._spare.append(frame)
+
+    def _release_unclean(self):
+        """A new segment minimum: held frames of this segment that are no
+        longer within the margin of it can't be candidates any more."""
+        limit = self._run_min + self.args.motion_margin + 1e-6
+        for fi in [k for k, (_, _, seg, s) in self.kept.items()
+                   if seg == self._segment and s >= limit]:
+            self._spare.append(self.kept.pop(fi)[1])
+
+    def _hold(self, fi, sharp, frame, s):
+        """Hold frame fi if it is among its segment's ``keep`` sharpest."""
+        mine = [k for k, v in self.kept.items() if v[2] == self._segment]
+        if len(mine) >= self.keep:
+            weakest = min(mine, key=lambda k: self.kept[k][0])
+            if self.kept[weakest][0] >= sharp:
+                return False
+            self._spare.append(self.kept.pop(weakest)[1])
+        self.kept[fi] = (sharp, frame, self._segment, s)
+        return True
+
+    # ── incremental P2/P3 ────────────────────────────────────
+
+    def _close_stable_spreads(self):
+        n_exact = self.frames - 1 - self.window // 2
+        if n_exact <= self.closed_to + self.guard:
+            return
+        # Smoothing a prefix gives bit-identical values everywhere the window
+        # doesn't reach past its end, so this is P2's input, truncated.
+        smoothed = uniform_filter1d(self.diffs[:self.frames - 1], size=self.window)[:n_exact]
+        a = self.args
+        peaks, _ = find_peaks(smoothed, height=a.peak_height, distance=self.distance,
+                              prominence=a.prominence)
+        for e in peaks[(peaks > self.closed_to) & (peaks + self.guard <= n_exact)]:
+            s = self.closed_to
+            extra = p2.rescue_spread(smoothed, self.fps, peaks, self.closed_peaks, s, int(e),
+                                     a.long_spread, a.valley_motion, a.valley_min_sec,
+                                     a.valley_peak, verbose=False)
+            bounds = [s] + sorted(int(x) for x in extra) + [int(e)]
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                sp = p2.annotate_spreads([{"spread_index": len(self.closed) + 1,
+                                           "start_frame": lo, "end_frame": hi,
+                                           "frame_count": hi - lo}], self.fps)[0]
+                self.closed[(lo, hi)] = self._keyframe(smoothed, sp)
+            self.closed_peaks += 1
+            self.closed_to = int(e)
+        self._forget_before(self.closed_to)
+
+    def _forget_before(self, frame):
+        for fi in [k for k in self.kept if k < frame]:
+            self._spare.append(self.kept.pop(fi)[1])
+        for fi in [k for k in self.sharpness if k < frame]:
+            del self.sharpness[fi]
+
+    def _keyframe(self, smoothed, sp):
+        """P3 for one spread: select, write the image, return the entry."""
+        a = self.args
+        candidates = p3.keyframe_candidates(smoothed, sp["start_frame"], sp["end_frame"],
+                                            a.sample_rate, a.motion_margin)
+        if candidates is None:
+            log(f"  WARNING: No keyframe for spread {sp['spread_index']}")
+            return None
+        if all(fi in self.sharpness for fi in candidates):
+            result = p3.pick_sharpest(smoothed, candidates, self.sharpness.get)
+        else:
+            result = p3.select_keyframe(self._seeker(), smoothed, sp["start_frame"],
+                                        sp["end_frame"], a.sample_rate, a.motion_margin)
+        frame_idx, motion_val, sharpness = result
+        if frame_idx in self.kept:
+            frame = self.kept[frame_idx][1]
+            self.stats["from_memory"] += 1
+        else:
+            frame = self._seeker().read(frame_idx)
+            if frame is None:
+                return None
+            self.stats["seeked"] += 1
+        entry = p3.keyframe_entry(frame_idx, motion_val, sharpness, sp, self.fps)
+        cv2.imwrite(str(self.paths.images / entry["filename"]), frame,
+                    [cv2.IMWRITE_JPEG_QUALITY, a.jpeg_quality])
+        return entry
+
+    def _seeker(self):
+        if self._seek_cap is None:
+            self._seek_cap = FrameReader(self.video_path,
+                                         ensure_index(self.paths.data, self.video_path))
+        return self._seek_cap
+
+    # ── end of stream ────────────────────────────────────────
+
+    def finish(self):
+        """Settle the ring, run P2 on the whole signal, reconcile P3.
+
+        Returns (diffs, smoothed, peaks, spreads, keyframes, features).
+        """
+        n = self.frames - 1
+        diffs = self.diffs[:n].copy()
+        while self.ring:
+            self._settle(*self.ring.popleft(), n=n)
+        smoothed = uniform_filter1d(diffs, size=self.window)
+        peaks = p2.detect_turns(smoothed, self.fps, self.args)
+        spreads = p2.annotate_spreads(p2.build_spread_list(peaks, len(smoothed)), self.fps)
+
+        early = len(self.closed)
+        keyframes = []
+        for sp in spreads:
+            key = (sp["start_frame"], sp["end_frame"])
+            if key in self.closed:
+                entry = self.closed.pop(key)
+            else:
+                if sp["end_frame"] <= self.closed_to:
+                    self.stats["reselected"] += 1
+                entry = self._keyframe(smoothed, sp)
+            if entry is not None:
+                keyframes.append(entry)
+        # Spreads closed early that P2 drew differently after all.
+        used = {kf["filename"] for kf in keyframes}
+        for entry in self.closed.values():
+            if entry is not None and entry["filename"] not in used:
+                (self.paths.images / entry["filename"]).unlink(missing_ok=True)
+        if self._seek_cap is not None:
+            self._seek_cap.release()
+        st = self.stats
+        log(f"  {early} spreads closed while decoding, {st['reselected']} re-selected "
+            f"at the end; keyframes: {st['from_memory']} from memory, "
+            f"{st['seeked']} seeked")
+        features = features_table(self._sharpness, self._brightness)
+        return diffs, smoothed, peaks, spreads, keyframes, features
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Phases 1-3 in a single decode")
+    parser.add_argument("video", help="Path to input video file")
+    parser.add_argument("--output-dir", type=str, default=None)
+    parser.add_argument("--analysis-height", type=int, default=360)
+    parser.add_argument("--smoothing-window", type=int, default=15)
+    parser.add_argument("--keep", type=int, default=DEFAULT_KEEP,
+                        help="Full-resolution keyframe candidates held per open "
+                             "spread; a winner outside them costs one seek")
+    p2.add_peak_args(parser)
+    p3.add_keyframe_args(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    log("=" * 60)
+    log("PHASES 1-3: Single Pass")
+    log("=" * 60)
+
+    paths = ProjectPaths(derive_output_dir(args.video, args.output_dir))
+    paths.ensure("data", "json", "plots", "images")
+    log(f"Output: {paths.base}")
+
+    signal_path = paths.data / "motion_signal.npy"
+    if signal_path.exists() and not check_overwrite(signal_path):
+        log("Skipped.")
+        return
+    if not check_overwrite_dir(paths.images):
+        log("Skipped.")
+        return
+
+    info = probe_video(args.video)
+    cap = cv2.VideoCapture(args.video)
+    if info is None or not cap.isOpened():
+        log(f"ERROR: Cannot open video: {args.video}")
+        sys.exit(1)
+    total_frames, fps = info.total_frames, info.fps
+    log(f"Video: {info.width}x{info.height} @ {fps:.1f}fps, {total_frames} frames "
+        f"({total_frames/fps:.1f}s)")
+
+    run = SinglePass(paths, args.video, info, args)
+    log(f"Analysis: {run.size[0]}x{run.size[1]} (opencv decode), "
+        f"ring {run.ring_len} + {run.keep} held frames")
+    t0 = time.time()
+    while True:
+        ok, frame = cap.read(run.next_buffer())
+        if not ok:
+            break
+        run.push(frame)
+        if run.frames % 3000 == 0:
+            elapsed = time.time() - t0
+            pct = run.frames / max(total_frames, 1) * 100
+            eta = elapsed / run.frames * max(total_frames - run.frames, 0)
+            log(f"  {run.frames}/{total_frames} ({pct:.0f}%), {len(run.closed)} spreads "
+                f"closed — ETA: {eta:.0f}s")
+    cap.release()
+    elapsed = time.time() - t0
+    log(f"  Decoded {run.frames} frames in {elapsed:.1f}s "
+        f"({run.frames/max(elapsed, 1e-3):.0f} fps)")
+
+    diffs, smoothed, peaks, spreads, keyframes, features = run.finish()
+
+    metadata = {
+        "video_path": str(args.video), "fps": fps, "total_frames": total_frames,
+        "duration_sec": total_frames / fps, "original_width": info.width,
+        "original_height": info.height, "analysis_width": run.size[0],
+        "analysis_height": args.analysis_height, "frames_processed": run.frames,
+        "processing_time_sec": round(time.time() - t0, 1), "decoder": "opencv",
+        "workers": 1, "smoothing_window": args.smoothing_window, "single_pass": True,
+    }
+    np.save(str(signal_path), diffs)
+    np.save(str(paths.data / "smoothed_signal.npy"), smoothed)
+    np.save(str(paths.data / FEATURES_FILE), features)
+    (paths.json / "metadata.json").write_text(json.dumps(metadata, indent=2))
+    np.save(str(paths.data / "peaks.npy"), peaks)
+    (paths.json / "spreads.json").write_text(json.dumps(spreads, indent=2))
+    (paths.json / "peaks_metadata.json").write_text(
+        json.dumps(p2.peaks_metadata(fps, args, peaks, spreads), indent=2))
+    (paths.json / "keyframes.json").write_text(json.dumps(keyframes, indent=2))
+
+    p1.generate_plot(diffs, smoothed, fps, str(paths.plots / "motion_plot.png"))
+    p2.generate_plot(smoothed, peaks, spreads, fps, str(paths.plots / "peaks_plot.png"))
+    p3.generate_plot(smoothed, keyframes, fps, str(paths.plots / "selection_plot.png"))
+    log(f"Segmentation: {len(spreads)} spreads; {len(keyframes)} keyframes")
+    p3.log_summary(keyframes)
+    log("PHASES 1-3 COMPLETE")
+
+
+if __name__ == "__main__":
+    main()
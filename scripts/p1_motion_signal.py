@@ -5,12 +5,31 @@ Phase 1: Compute Motion Signal
 Usage:
   python scripts/p1_motion_signal.py recordings/mybook.mp4
   python scripts/p1_motion_signal.py recordings/mybook.mp4 --output-dir output/custom
+  python scripts/p1_motion_signal.py recordings/mybook.mp4 --decoder opencv
+  python scripts/p1_motion_signal.py recordings/mybook.mp4 --workers 0
+
+Frames are decoded through ffmpeg at analysis size when it is installed (see
+frame_source.py), else through OpenCV; the two agree to within
+frame_source.FFMPEG_TOLERANCE per frame pair.
+
+--workers N splits the recording into N frame ranges decoded by separate
+processes (0 = one per core). Each range starts on the last frame of the one
+before it, so every frame pair is diffed exactly once and the joined signal
+is identical to a single pass; if a shard's boundary frame doesn't match its
+neighbour's (an inexact seek), P1 falls back to the single pass.
+
+Alongside the signal, data/frame_features.npy records each frame's sharpness
+and brightness (see frame_source.FEATURES_DTYPE); P3 --rank table selects
+keyframes from it without decoding candidates.
 """
 
 import argparse
+import hashlib
 import json
+import os
 import time
 import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import cv2
 import numpy as np
@@ -19,24 +38,54 @@ import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+from frame_source import (DECODERS, FEATURES_FILE, GrayFrames, analysis_size,
+                          features_table, ffmpeg_available, probe_video)
+from live_state import laplacian_sharpness
 from utils import log, derive_output_dir, ProjectPaths, check_overwrite
 
 
-def compute_motion_signal(video_path, analysis_height):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
+class DecodeFailed(RuntimeError):
+    """ffmpeg exited non-zero: the frames it gave are a prefix of the
+    recording, not all of it."""
+
+
+def compute_motion_signal(video_path, analysis_height, decoder="auto", workers=1):
+    """Returns (diffs, metadata, features) — see the module docstring."""
+    info = probe_video(video_path)
+    if info is None:
         log(f"ERROR: Cannot open video: {video_path}")
         sys.exit(1)
 
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    orig_w = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    orig_h = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    scale = analysis_height / orig_h
-    aw = int(orig_w * scale)
+    total_frames, fps = info.total_frames, info.fps
+    orig_w, orig_h = info.width, info.height
+    aw, ah = analysis_size(orig_w, orig_h, analysis_height)
 
     log(f"Video: {orig_w}x{orig_h} @ {fps:.1f}fps, {total_frames} frames ({total_frames/fps:.1f}s)")
-    log(f"Analysis: {aw}x{analysis_height}")
+
+    workers = min(workers or os.cpu_count() or 1, max(total_frames - 1, 1))
+    result = None
+    if workers > 1:
+        result = _sharded_pass(video_path, (aw, ah), decoder, total_frames,
+                               fps, workers)
+    if result is None:
+        workers = 1
+        try:
+            result = _motion_pass(video_path, (aw, ah), decoder, total_frames)
+        except DecodeFailed as e:
+            # Without the check, a crash mid-stream reads as EOF and P2/P3
+            # never see the pages after it.
+            if decoder != "auto":
+                log(f"ERROR: {e}")
+                sys.exit(1)
+            log(f"  WARNING: {e} — redoing the pass with OpenCV")
+            result = _motion_pass(video_path, (aw, ah), "opencv", total_frames)
+        if result[1] == 0 and result[2] == "ffmpeg" and decoder == "auto":
+            # An ffmpeg that can't read this container shouldn't cost the
+            # run — the OpenCV path is slower, not different.
+            log("  ffmpeg decoded no frames — retrying with OpenCV")
+            result = _motion_pass(video_path, (aw, ah), "opencv", total_frames)
+        result = result[:4] + result[5:]
+    diffs, frame_idx, backend, t0, features = result
 
     metadata = {
         "video_path": str(video_path), "fps": fps, "total_frames": total_frames,
@@ -45,33 +94,126 @@ def compute_motion_signal(video_path, analysis_height):
         "analysis_height": analysis_height,
     }
 
-    diffs = []
-    prev_gray = None
-    frame_idx = 0
-    t0 = time.time()
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        small = cv2.resize(frame, (aw, analysis_height), interpolation=cv2.INTER_AREA)
-        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
-        if prev_gray is not None:
-            diffs.append(float(np.mean(cv2.absdiff(prev_gray, gray))))
-        prev_gray = gray
-        frame_idx += 1
-        if frame_idx % 3000 == 0:
-            elapsed = time.time() - t0
-            pct = frame_idx / total_frames * 100
-            eta = elapsed / frame_idx * (total_frames - frame_idx)
-            log(f"  {frame_idx}/{total_frames} ({pct:.0f}%) — ETA: {eta:.0f}s")
-
-    cap.release()
     elapsed = time.time() - t0
-    log(f"  Done. {frame_idx} frames in {elapsed:.1f}s ({frame_idx/elapsed:.0f} fps)")
+    log(f"  Done. {frame_idx} frames in {elapsed:.1f}s ({frame_idx/max(elapsed, 1e-3):.0f} fps)")
     metadata["frames_processed"] = frame_idx
     metadata["processing_time_sec"] = round(elapsed, 1)
-    return np.array(diffs), metadata
+    metadata["decoder"] = backend
+    metadata["workers"] = workers
+    return np.array(diffs), metadata, features
+
+
+def _motion_pass(video_path, size, decoder, total_frames, start=0, count=None,
+                 fps=None, progress=True):
+    """One sequential decode.
+
+    Returns (diffs, frames, backend, start time, edges, features). Two
+    preallocated gray buffers alternate as previous/current, so the steady
+    state allocates nothing per frame beyond the floats appended. ``edges``
+    is a digest of the first and last frame decoded — what the sharded pass
+    compares across a boundary; ``features`` the per-frame table. Raises
+    ``DecodeFailed`` when ffmpeg exits non-zero.
+    """
+    aw, ah = size
+    src = GrayFrames(video_path, size, decoder, start=start, count=count, fps=fps)
+    if progress:
+        log(f"Analysis: {aw}x{ah} ({src.backend} decode)")
+    bufs = (np.empty((ah, aw), np.uint8), np.empty((ah, aw), np.uint8))
+    diff = np.empty((ah, aw), np.uint8)
+    diffs, sharpness, brightness = [], [], []
+    frame_idx = 0
+    first = last = None
+    t0 = time.time()
+    try:
+        while src.read_into(bufs[frame_idx & 1]):
+            sharpness.append(laplacian_sharpness(bufs[frame_idx & 1]))
+            brightness.append(float(np.mean(bufs[frame_idx & 1])))
+            if frame_idx:
+                cv2.absdiff(bufs[(frame_idx - 1) & 1], bufs[frame_idx & 1], dst=diff)
+                diffs.append(float(np.mean(diff)))
+            else:
+                first = _digest(bufs[0])
+            frame_idx += 1
+            if progress and frame_idx % 3000 == 0:
+                elapsed = time.time() - t0
+                pct = frame_idx / max(total_frames, 1) * 100
+                eta = elapsed / frame_idx * max(total_frames - frame_idx, 0)
+                log(f"  {frame_idx}/{total_frames} ({pct:.0f}%) — ETA: {eta:.0f}s")
+    finally:
+        status = src.close()
+    if status:
+        raise DecodeFailed(f"ffmpeg exited with status {status} after "
+                           f"{frame_idx} frames of {video_path}")
+    if frame_idx:
+        last = _digest(bufs[(frame_idx - 1) & 1])
+    return (diffs, frame_idx, src.backend, t0, (first, last),
+            features_table(sharpness, brightness))
+
+
+def _digest(gray):
+    return hashlib.blake2b(gray, digest_size=16).digest()
+
+
+def _shard_bounds(total_frames, workers):
+    """Frame ranges [(start, count)] that share their boundary frames.
+
+    Shard k decodes frames bounds[k] .. bounds[k+1] inclusive and so owns
+    the pairs ending at bounds[k]+1 .. bounds[k+1]; the next shard starts on
+    bounds[k+1] again. The last shard reads to EOF (count None), since the
+    container's frame count is only an estimate.
+    """
+    bounds = np.linspace(0, total_frames - 1, workers + 1).astype(int)
+    shards = [(int(a), int(b - a + 1)) for a, b in zip(bounds[:-1], bounds[1:])]
+    shards[-1] = (shards[-1][0], None)
+    return shards
+
+
+def _sharded_pass(video_path, size, decoder, total_frames, fps, workers):
+    """The motion pass split across processes, or None to fall back.
+
+    Returns the same (diffs, frames, backend, start time, features) as a
+    single pass, joined shard by shard. None when a shard's ffmpeg fails, it
+    comes back short, or its first frame isn't the frame its neighbour ended
+    on — the single pass then runs instead, so the output is never a
+    stitched approximation.
+    """
+    # Every shard must run the same decoder, or the seams would differ by
+    # the backend tolerance.
+    backend = decoder
+    if decoder == "auto":
+        backend = "ffmpeg" if ffmpeg_available() else "opencv"
+    shards = _shard_bounds(total_frames, workers)
+    aw, ah = size
+    log(f"Analysis: {aw}x{ah} ({backend} decode, {workers} workers)")
+    t0 = time.time()
+    results = [None] * len(shards)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_motion_pass, video_path, size, backend,
+                            total_frames, start, count, fps, False): k
+            for k, (start, count) in enumerate(shards)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                results[futures[future]] = future.result()
+            except DecodeFailed as e:
+                log(f"  WARNING: {e} — falling back to a single pass")
+                return None
+            log(f"  shard {done}/{len(shards)} done "
+                f"({time.time() - t0:.0f}s)")
+
+    for k, ((start, count), res) in enumerate(zip(shards, results)):
+        frames, edges = res[1], res[4]
+        if (count is not None and frames != count) or frames < 2 or (
+            k and edges[0] != results[k - 1][4][1]
+        ):
+            log(f"  WARNING: shard {k} (frame {start}) did not line up with "
+                "its neighbour — falling back to a single pass")
+            return None
+    diffs = [d for res in results for d in res[0]]
+    # Each shard after the first re-read its neighbour's last frame.
+    features = np.concatenate([results[0][5]] + [res[5][1:] for res in results[1:]])
+    return diffs, len(diffs) + 1, backend, t0, features
 
 
 def generate_plot(diffs, smoothed, fps, output_path):
@@ -113,6 +255,14 @@ def main():
     parser.add_argument("--analysis-height", type=int, default=360)
     parser.add_argument("--smoothing-window", type=int, default=15)
     parser.add_argument("--output-dir", type=str, default=None)
+    parser.add_argument("--decoder", default="auto", choices=DECODERS,
+                        help="Frame source. ffmpeg decodes, scales and drops "
+                             "chroma in-process and pipes only the small gray "
+                             "plane; auto uses it when installed, else OpenCV")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Decode N frame ranges in parallel processes "
+                             "(0 = one per core); output is identical to a "
+                             "single pass")
     args = parser.parse_args()
 
     log("=" * 60)
@@ -129,13 +279,15 @@ def main():
             log("Skipped.")
             return
 
-    diffs, metadata = compute_motion_signal(args.video, args.analysis_height)
+    diffs, metadata, features = compute_motion_signal(
+        args.video, args.analysis_height, args.decoder, args.workers)
 
     smoothed = uniform_filter1d(diffs, size=args.smoothing_window)
     metadata["smoothing_window"] = args.smoothing_window
 
     np.save(str(signal_path), diffs)
     np.save(str(paths.data / "smoothed_signal.npy"), smoothed)
+    np.save(str(paths.data / FEATURES_FILE), features)
     (paths.json / "metadata.json").write_text(json.dumps(metadata, indent=2))
 
     log(f"Signal stats: min={diffs.min():.2f}, max={diffs.max():.2f}, median={np.median(diffs):.2f}")
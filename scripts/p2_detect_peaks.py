@@ -43,32 +43,8 @@ def rescue_missed_turns(smoothed, fps, peaks, long_sec, valley_motion, valley_mi
     spreads = build_spread_list(peaks, len(smoothed))
     additional = []
     for i, sp in enumerate(spreads):
-        s, e = sp["start_frame"], sp["end_frame"]
-        if (e - s) / fps < long_sec:
-            continue
-        region = smoothed[s:e]
-        below = region < valley_motion
-        valleys = []
-        in_v, vs = False, 0
-        for k in range(len(below)):
-            if below[k] and not in_v:
-                vs, in_v = k, True
-            elif not below[k] and in_v:
-                if (k - vs) >= int(valley_min_sec * fps):
-                    valleys.append((vs, k - 1))
-                in_v = False
-        if in_v and (len(below) - vs) >= int(valley_min_sec * fps):
-            valleys.append((vs, len(below) - 1))
-        if len(valleys) >= 2:
-            for v in range(len(valleys) - 1):
-                gs, ge = valleys[v][1], valleys[v + 1][0]
-                if ge > gs:
-                    gm = np.max(region[gs:ge])
-                    if gm >= valley_peak:
-                        sf = s + gs + np.argmax(region[gs:ge])
-                        if min(abs(sf - p) for p in peaks) > int(0.8 * fps):
-                            additional.append(sf)
-                            log(f"  Rescued: spread {i+1} at {sf/fps:.1f}s (peak={gm:.1f})")
+        additional += rescue_spread(smoothed, fps, peaks, i, sp["start_frame"], sp["end_frame"],
+                                    long_sec, valley_motion, valley_min_sec, valley_peak)
     if additional:
         all_peaks = np.sort(np.concatenate([peaks, np.array(additional)]))
         log(f"Pass 2: {len(additional)} rescued → {len(all_peaks)} total peaks")
@@ -77,6 +53,78 @@ def rescue_missed_turns(smoothed, fps, peaks, long_sec, valley_motion, valley_mi
     return peaks
 
 
+def rescue_spread(smoothed, fps, peaks, i, s, e, long_sec, valley_motion, valley_min_sec, valley_peak,
+                  verbose=True):
+    """Missed turns inside spread i (frames s..e): a motion bump between two
+    still valleys that pass 1 didn't split on."""
+    additional = []
+    if (e - s) / fps < long_sec:
+        return additional
+    region = smoothed[s:e]
+    below = region < valley_motion
+    valleys = []
+    in_v, vs = False, 0
+    for k in range(len(below)):
+        if below[k] and not in_v:
+            vs, in_v = k, True
+        elif not below[k] and in_v:
+            if (k - vs) >= int(valley_min_sec * fps):
+                valleys.append((vs, k - 1))
+            in_v = False
+    if in_v and (len(below) - vs) >= int(valley_min_sec * fps):
+        valleys.append((vs, len(below) - 1))
+    if len(valleys) >= 2:
+        for v in range(len(valleys) - 1):
+            gs, ge = valleys[v][1], valleys[v + 1][0]
+            if ge > gs:
+                gm = np.max(region[gs:ge])
+                if gm >= valley_peak:
+                    sf = s + gs + np.argmax(region[gs:ge])
+                    if min(abs(sf - p) for p in peaks) > int(0.8 * fps):
+                        additional.append(sf)
+                        if verbose:
+                            log(f"  Rescued: spread {i+1} at {sf/fps:.1f}s (peak={gm:.1f})")
+    return additional
+
+
+def detect_turns(smoothed, fps, args):
+    """P2 proper: find_peaks (pass 1), then rescue missed turns (pass 2).
+
+    ``args`` carries the CLI parameters (peak_height, min_distance,
+    prominence, long_spread, valley_motion, valley_min_sec, valley_peak).
+    """
+    peaks, _ = find_peaks(smoothed, height=args.peak_height,
+                           distance=int(args.min_distance * fps), prominence=args.prominence)
+    log(f"Pass 1: {len(peaks)} peaks")
+    return rescue_missed_turns(smoothed, fps, peaks, args.long_spread,
+                               args.valley_motion, args.valley_min_sec, args.valley_peak)
+
+
+def annotate_spreads(spreads, fps):
+    for sp in spreads:
+        sp["duration_sec"] = round(sp["frame_count"] / fps, 3)
+        sp["start_time"] = round(sp["start_frame"] / fps, 2)
+        sp["end_time"] = round(sp["end_frame"] / fps, 2)
+    return spreads
+
+
+def peaks_metadata(fps, args, peaks, spreads):
+    return {"fps": fps, "parameters": {
+        "peak_height": args.peak_height, "min_distance_sec": args.min_distance,
+        "prominence": args.prominence, "long_spread_sec": args.long_spread,
+    }, "results": {"total_peaks": int(len(peaks)), "total_spreads": len(spreads)}}
+
+
+def add_peak_args(parser):
+    parser.add_argument("--peak-height", type=float, default=DEFAULT_PEAK_HEIGHT)
+    parser.add_argument("--min-distance", type=float, default=DEFAULT_PEAK_DISTANCE_SEC)
+    parser.add_argument("--prominence", type=float, default=DEFAULT_PEAK_PROMINENCE)
+    parser.add_argument("--long-spread", type=float, default=DEFAULT_LONG_SPREAD_SEC)
+    parser.add_argument("--valley-motion", type=float, default=DEFAULT_VALLEY_MOTION)
+    parser.add_argument("--valley-min-sec", type=float, default=DEFAULT_VALLEY_MIN_SEC)
+    parser.add_argument("--valley-peak", type=float, default=DEFAULT_VALLEY_PEAK_THRESHOLD)
+
+
 def generate_plot(smoothed, peaks, spreads, fps, output_path):
     times = np.arange(len(smoothed)) / fps
     fig, axes = plt.subplots(3, 1, figsize=(22, 14))
@@ -113,13 +161,7 @@ def generate_plot(smoothed, peaks, spreads, fps, output_path):
 def main():
     parser = argparse.ArgumentParser(description="Phase 2: Detect page turn peaks")
     parser.add_argument("output_dir", help="Base output directory (e.g. output/mybook)")
-    parser.add_argument("--peak-height", type=float, default=DEFAULT_PEAK_HEIGHT)
-    parser.add_argument("--min-distance", type=float, default=DEFAULT_PEAK_DISTANCE_SEC)
-    parser.add_argument("--prominence", type=float, default=DEFAULT_PEAK_PROMINENCE)
-    parser.add_argument("--long-spread", type=float, default=DEFAULT_LONG_SPREAD_SEC)
-    parser.add_argument("--valley-motion", type=float, default=DEFAULT_VALLEY_MOTION)
-    parser.add_argument("--valley-min-sec", type=float, default=DEFAULT_VALLEY_MIN_SEC)
-    parser.add_argument("--valley-peak", type=float, default=DEFAULT_VALLEY_PEAK_THRESHOLD)
+    add_peak_args(parser)
     args = parser.parse_args()
 
     log("=" * 60)
@@ -144,27 +186,13 @@ def main():
     fps = metadata["fps"]
     log(f"  {len(smoothed)} values, {fps} fps")
 
-    peaks, _ = find_peaks(smoothed, height=args.peak_height,
-                           distance=int(args.min_distance * fps), prominence=args.prominence)
-    log(f"Pass 1: {len(peaks)} peaks")
-
-    peaks = rescue_missed_turns(smoothed, fps, peaks, args.long_spread,
-                                 args.valley_motion, args.valley_min_sec, args.valley_peak)
-
-    spreads = build_spread_list(peaks, len(smoothed))
-    for sp in spreads:
-        sp["duration_sec"] = round(sp["frame_count"] / fps, 3)
-        sp["start_time"] = round(sp["start_frame"] / fps, 2)
-        sp["end_time"] = round(sp["end_frame"] / fps, 2)
+    peaks = detect_turns(smoothed, fps, args)
+    spreads = annotate_spreads(build_spread_list(peaks, len(smoothed)), fps)
 
     np.save(str(out_peaks), peaks)
     (paths.json / "spreads.json").write_text(json.dumps(spreads, indent=2))
-
-    peaks_meta = {"fps": fps, "parameters": {
-        "peak_height": args.peak_height, "min_distance_sec": args.min_distance,
-        "prominence": args.prominence, "long_spread_sec": args.long_spread,
-    }, "results": {"total_peaks": int(len(peaks)), "total_spreads": len(spreads)}}
-    (paths.json / "peaks_metadata.json").write_text(json.dumps(peaks_meta, indent=2))
+    (paths.json / "peaks_metadata.json").write_text(
+        json.dumps(peaks_metadata(fps, args, peaks, spreads), indent=2))
 
     generate_plot(smoothed, peaks, spreads, fps, str(paths.plots / "peaks_plot.png"))
 
@@ -5,8 +5,24 @@ Phase 3: Select Keyframes
 For each spread, selects the lowest-motion frame (sharpness as tiebreaker).
 Saves full-resolution images to images/ and metadata to json/keyframes.json.
 
+Candidates for every spread are planned up front and read in one forward
+pass: grab() skips the frames in between, retrieve() converts only the
+candidates, and each spread's winner is held until its image is written —
+no seeks, and no frame decoded twice.
+
+--rank table ranks candidates by the sharpness P1 recorded per frame
+(data/frame_features.npy, analysis resolution — the measure live capture
+uses) instead of measuring them, so only each spread's winner is decoded.
+Re-tuning --sample-rate/--motion-margin on a finished book then takes
+seconds. Winners are read through the recording's frame index
+(data/frame_index.npz, built on first use): each one is reached from its
+GOP's keyframe, or by decoding on from the previous winner when that is
+nearer. A recording made with P0 --archive is always ranked from the table,
+and its winners come from the full-resolution stream (see archive.py).
+
 Usage:
   python scripts/p3_select_keyframes.py output/mybook recordings/mybook.mp4
+  python scripts/p3_select_keyframes.py output/mybook recordings/mybook.mp4 --rank table
 """
 
 import argparse
@@ -21,10 +37,13 @@ import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
+from archive import load_archive, open_reader
+from frame_source import FEATURES_FILE, load_features
 from utils import log, ProjectPaths, check_overwrite_dir
 
 
-def select_keyframe(cap, smoothed, start, end, sample_rate, motion_margin):
+def keyframe_candidates(smoothed, start, end, sample_rate, motion_margin):
+    """Frames of a spread worth decoding: every sample_rate-th clean one."""
     if end <= start:
         return None
     region = smoothed[start:min(end, len(smoothed))]
@@ -37,34 +56,161 @@ def select_keyframe(cap, smoothed, start, end, sample_rate, motion_margin):
     if not clean_frames:
         clean_frames = [start + np.argmin(region)]
 
-    candidates = clean_frames[::sample_rate] or [clean_frames[len(clean_frames) // 2]]
+    return clean_frames[::sample_rate] or [clean_frames[len(clean_frames) // 2]]
+
+
+def frame_sharpness(frame):
+    """Laplacian variance of the central 80% — P3's sharpness measure."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    center = gray[int(h*0.1):int(h*0.9), int(w*0.1):int(w*0.9)]
+    return cv2.Laplacian(center, cv2.CV_64F).var()
+
 
+def pick_sharpest(smoothed, candidates, sharpness):
+    """(frame, motion, sharpness) of the sharpest candidate; first wins ties.
+
+    ``sharpness`` maps a candidate to its sharpness, or None for a frame
+    that couldn't be read.
+    """
     best_frame, best_sharpness, best_motion = None, -1, float('inf')
     for fi in candidates:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, fi)
-        ret, frame = cap.read()
-        if not ret:
+        sharp = sharpness(fi)
+        if sharp is None:
             continue
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        h, w = gray.shape
-        center = gray[int(h*0.1):int(h*0.9), int(w*0.1):int(w*0.9)]
-        sharpness = cv2.Laplacian(center, cv2.CV_64F).var()
-        if sharpness > best_sharpness:
-            best_sharpness = sharpness
+        if sharp > best_sharpness:
+            best_sharpness = sharp
             best_frame = fi
             best_motion = smoothed[min(fi, len(smoothed)-1)]
 
     return best_frame, best_motion, best_sharpness
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Phase 3: Select keyframes")
-    parser.add_argument("output_dir", help="Base output directory")
-    parser.add_argument("video", help="Path to video file")
+def select_keyframe(reader, smoothed, start, end, sample_rate, motion_margin):
+    """Select one spread's keyframe, reading candidates through a FrameReader."""
+    candidates = keyframe_candidates(smoothed, start, end, sample_rate, motion_margin)
+    if candidates is None:
+        return None
+
+    def seek_sharpness(fi):
+        frame = reader.read(fi)
+        return frame_sharpness(frame) if frame is not None else None
+
+    return pick_sharpest(smoothed, candidates, seek_sharpness)
+
+
+def sweep_select(cap, smoothed, spreads, sample_rate, motion_margin):
+    """Yield (spread, result, frame) per spread from one forward pass.
+
+    ``cap`` must be positioned at frame 0. ``result`` is what
+    select_keyframe would return for the spread — same candidates, same
+    tie-breaking — and ``frame`` the winner's full-resolution image (None if
+    nothing could be read). A spread is yielded as soon as the pass is past
+    its last candidate, so only its winner is ever held.
+    """
+    pos = 0                         # index of the frame the next grab() reads
+    eof = False
+
+    for sp in spreads:
+        candidates = keyframe_candidates(smoothed, sp["start_frame"], sp["end_frame"],
+                                         sample_rate, motion_margin)
+        if candidates is None:
+            yield sp, None, None
+            continue
+        held = {"sharpness": -1, "frame": None}
+
+        def read_sharpness(fi):
+            nonlocal pos, eof
+            while not eof and pos <= fi:
+                eof = not cap.grab()
+                pos += 1
+            if eof or pos != fi + 1:
+                return None
+            ret, frame = cap.retrieve()
+            if not ret:
+                return None
+            sharp = frame_sharpness(frame)
+            if sharp > held["sharpness"]:
+                held["sharpness"], held["frame"] = sharp, frame
+            return sharp
+
+        result = pick_sharpest(smoothed, candidates, read_sharpness)
+        yield sp, result, held["frame"]
+
+
+def table_select(features, smoothed, spreads, sample_rate, motion_margin):
+    """Yield (spread, result) ranked from the P1 feature table — no decoding."""
+    def table_sharpness(fi):
+        return float(features["sharpness"][fi]) if fi < len(features) else None
+
+    for sp in spreads:
+        candidates = keyframe_candidates(smoothed, sp["start_frame"], sp["end_frame"],
+                                         sample_rate, motion_margin)
+        if candidates is None:
+            yield sp, None
+        else:
+            yield sp, pick_sharpest(smoothed, candidates, table_sharpness)
+
+
+def read_winners(reader, indices):
+    """Yield (index, frame or None) for ascending ``indices``."""
+    for fi in indices:
+        yield fi, reader.read(fi) if fi is not None else None
+
+
+def keyframe_entry(frame_idx, motion_val, sharpness, sp, fps):
+    return {
+        "frame_index": frame_idx,
+        "time_sec": round(frame_idx / fps, 2),
+        "motion_value": round(float(motion_val), 4),
+        "sharpness": round(float(sharpness), 1),
+        "filename": f"frame{frame_idx:06d}.jpg",
+        "spread_start": sp["start_frame"],
+        "spread_end": sp["end_frame"],
+        "spread_duration": sp["duration_sec"],
+        "source": "algorithm",
+    }
+
+
+def add_keyframe_args(parser):
     parser.add_argument("--sample-rate", type=int, default=6)
     parser.add_argument("--motion-margin", type=float, default=0.5)
     parser.add_argument("--jpeg-quality", type=int, default=95,
                         help="JPEG quality for extracted keyframes")
+
+
+def generate_plot(smoothed, keyframe_data, fps, output_path):
+    times = np.arange(len(smoothed)) / fps
+    fig, ax = plt.subplots(1, 1, figsize=(22, 6))
+    ax.plot(times, smoothed, linewidth=0.4, color="steelblue", alpha=0.7)
+    kf_t = [kf["frame_index"] / fps for kf in keyframe_data]
+    kf_m = [kf["motion_value"] for kf in keyframe_data]
+    ax.plot(kf_t, kf_m, "g^", markersize=4, label=f"Keyframes ({len(keyframe_data)})")
+    ax.set_title(f"Keyframe Selection — {len(keyframe_data)} keyframes")
+    ax.set_xlabel("Time (s)")
+    ax.legend()
+    plt.tight_layout()
+    plt.savefig(output_path, dpi=150)
+    plt.close()
+
+
+def log_summary(keyframe_data):
+    motions = [kf["motion_value"] for kf in keyframe_data]
+    high = [kf for kf in keyframe_data if kf["motion_value"] > 3.0]
+    log(f"  Motion: median={np.median(motions):.2f}, max={max(motions):.2f}")
+    if high:
+        log(f"  ⚠ {len(high)} keyframes with motion > 3.0")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phase 3: Select keyframes")
+    parser.add_argument("output_dir", help="Base output directory")
+    parser.add_argument("video", help="Path to video file")
+    add_keyframe_args(parser)
+    parser.add_argument("--rank", choices=("frames", "table"), default="frames",
+                        help="frames: measure each candidate's sharpness at full "
+                             "resolution; table: rank from P1's per-frame feature "
+                             "table and decode only the winners")
     args = parser.parse_args()
 
     log("=" * 60)
@@ -72,7 +218,7 @@ def main():
     log("=" * 60)
 
     paths = ProjectPaths(args.output_dir)
-    paths.ensure("images", "json", "plots")
+    paths.ensure("images", "json", "data", "plots")
 
     spreads = json.loads((paths.json / "spreads.json").read_text())
     smoothed = np.load(str(paths.data / "smoothed_signal.npy"))
@@ -93,34 +239,39 @@ def main():
     t0 = time.time()
     keyframe_data = []
 
-    for i, sp in enumerate(spreads):
-        result = select_keyframe(cap, smoothed, sp["start_frame"], sp["end_frame"],
-                                  args.sample_rate, args.motion_margin)
+    # An archival recording (P0 --archive) is a proxy outside its settle
+    # windows, so a sweep would score scaled-up proxy frames: rank from the
+    # table instead, and read only the winners.
+    if args.rank == "frames" and load_archive(paths.data, args.video) is not None:
+        log("  Archival recording: ranking from the feature table")
+        args.rank = "table"
+    if args.rank == "table":
+        features = load_features(paths.data)
+        if features is None:
+            log(f"ERROR: {paths.data / FEATURES_FILE} not found. Re-run Phase 1, "
+                "or use --rank frames.")
+            sys.exit(1)
+        ranked = list(table_select(features, smoothed, spreads,
+                                   args.sample_rate, args.motion_margin))
+        cap.release()
+        cap = open_reader(paths.data, args.video)
+        winners = read_winners(cap, [r[0] if r else None for _, r in ranked])
+        sweep = ((sp, r, frame) for (sp, r), (_, frame) in zip(ranked, winners))
+    else:
+        sweep = sweep_select(cap, smoothed, spreads, args.sample_rate, args.motion_margin)
+    for i, (sp, result, frame) in enumerate(sweep):
         if result is None:
             log(f"  WARNING: No keyframe for spread {sp['spread_index']}")
             continue
 
         frame_idx, motion_val, sharpness = result
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ret, frame = cap.read()
-        if not ret:
+        if frame is None:
             continue
 
-        filename = f"frame{frame_idx:06d}.jpg"
-        cv2.imwrite(str(paths.images / filename), frame,
+        entry = keyframe_entry(frame_idx, motion_val, sharpness, sp, fps)
+        cv2.imwrite(str(paths.images / entry["filename"]), frame,
                      [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality])
-
-        keyframe_data.append({
-            "frame_index": frame_idx,
-            "time_sec": round(frame_idx / fps, 2),
-            "motion_value": round(float(motion_val), 4),
-            "sharpness": round(float(sharpness), 1),
-            "filename": filename,
-            "spread_start": sp["start_frame"],
-            "spread_end": sp["end_frame"],
-            "spread_duration": sp["duration_sec"],
-            "source": "algorithm",
-        })
+        keyframe_data.append(entry)
 
         if (i + 1) % 25 == 0 or i == len(spreads) - 1:
             log(f"  {i+1}/{len(spreads)} — frame {frame_idx} (motion={motion_val:.2f}, sharp={sharpness:.0f})")
@@ -130,25 +281,8 @@ def main():
 
     (paths.json / "keyframes.json").write_text(json.dumps(keyframe_data, indent=2))
 
-    # Selection plot
-    times = np.arange(len(smoothed)) / fps
-    fig, ax = plt.subplots(1, 1, figsize=(22, 6))
-    ax.plot(times, smoothed, linewidth=0.4, color="steelblue", alpha=0.7)
-    kf_t = [kf["frame_index"] / fps for kf in keyframe_data]
-    kf_m = [kf["motion_value"] for kf in keyframe_data]
-    ax.plot(kf_t, kf_m, "g^", markersize=4, label=f"Keyframes ({len(keyframe_data)})")
-    ax.set_title(f"Keyframe Selection — {len(keyframe_data)} keyframes")
-    ax.set_xlabel("Time (s)")
-    ax.legend()
-    plt.tight_layout()
-    plt.savefig(str(paths.plots / "selection_plot.png"), dpi=150)
-    plt.close()
-
-    motions = [kf["motion_value"] for kf in keyframe_data]
-    high = [kf for kf in keyframe_data if kf["motion_value"] > 3.0]
-    log(f"  Motion: median={np.median(motions):.2f}, max={max(motions):.2f}")
-    if high:
-        log(f"  ⚠ {len(high)} keyframes with motion > 3.0")
+    generate_plot(smoothed, keyframe_data, fps, str(paths.plots / "selection_plot.png"))
+    log_summary(keyframe_data)
 
     log("PHASE 3 COMPLETE")
 
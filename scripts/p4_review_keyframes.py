@@ -76,6 +76,10 @@ import tkinter as tk
 from tkinter import messagebox
 from PIL import Image, ImageTk
 
+from archive import open_reader
+from frame_index import index_in_background
+from image_cache import IMAGE_CACHE_MB, configure as configure_images, shared as shared_images
+from mask_store import MaskStore
 from utils import (
     log,
     ProjectPaths,
@@ -84,10 +88,9 @@ from utils import (
     detect_gutter,
     drift_due,
     shift_due,
-    measure_quad_offsets,
+    measure_work_offsets,
     quad_edge_bases,
     rigid_shift,
-    page_mask_robust,
     resolve_rotation,
     resolve_gutter,
     resolve_crop_quad,
@@ -97,6 +100,7 @@ from utils import (
     mono,
     SAVE_LABEL,
     WATCHDOG_ALERT_FRAC,
+    TRACK_BAND_FRAC,
     TRACK_DEADBAND_FRAC,
 )
 from p5_crop import (
@@ -118,11 +122,15 @@ ACTIONS = {
 
 
 class VideoScrubber:
-    def __init__(self, parent, video_path, start_frame, fps, smoothed, on_grab):
+    def __init__(self, parent, reader, start_frame, fps, smoothed, on_grab):
         self.fps, self.smoothed, self.on_grab = fps, smoothed, on_grab
         self.current_frame = start_frame
-        self.cap = cv2.VideoCapture(video_path)
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Stepping back one frame is a seek to the GOP's keyframe and a short
+        # decode forward; stepping on just decodes the next frame. An archival
+        # recording's reader falls back to the proxy between settle windows.
+        self.reader = reader
+        self.total_frames = len(self.reader)
+        self.frame = None           # (index, BGR) of what's on screen
         self.win = tk.Toplevel(parent)
         self.win.title("Video Scrubber — Find Missing Frame")
         self.win.configure(bg="#0a0a0a")
@@ -203,12 +211,13 @@ class VideoScrubber:
         self._show_frame()
 
     def _show_frame(self):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-        ret, frame = self.cap.read()
-        if not ret:
+        frame = self.reader.read(self.current_frame)
+        if frame is None:
             return
+        self.frame = (self.current_frame, frame)
         self.lbl_info.config(
             text=f"Frame {self.current_frame}  |  {self.current_frame/self.fps:.2f}s"
+            + ("" if self.reader.full_res(self.current_frame) else "  |  proxy")
         )
         motion = self.smoothed[min(self.current_frame, len(self.smoothed) - 1)]
         mc = "#22c55e" if motion < 2.0 else "#f59e0b" if motion < 4.0 else "#ef4444"
@@ -226,15 +235,17 @@ class VideoScrubber:
         self.canvas.create_image(cw // 2, ch // 2, image=self.photo, anchor="center")
 
     def _grab(self):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.current_frame)
-        ret, frame = self.cap.read()
-        if ret:
+        if self.frame is not None and self.frame[0] == self.current_frame:
+            frame = self.frame[1]
+        else:
+            frame = self.reader.read(self.current_frame)
+        if frame is not None:
             self.on_grab(self.current_frame, frame)
-        self.cap.release()
+        self.reader.release()
         self.win.destroy()
 
     def _cancel(self):
-        self.cap.release()
+        self.reader.release()
         self.win.destroy()
 
 
@@ -246,7 +257,12 @@ class ReviewApp:
         self.root.geometry("1200x800")
 
         self.paths = ProjectPaths(output_dir)
+        self.images = shared_images()   # decoded keyframes (image_cache.py)
+        self.masks = MaskStore(self.paths.masks, images=self.images)  # their page masks
         self.video_path = video_path
+        if video_path:
+            # The scrubber's frame-exact reads, built off the main loop.
+            index_in_background(self.paths.data, video_path)
         # 'double' = book spreads with a spine to split; 'single' = loose
         # one-page-per-frame docs. Single hides the gutter overlay; G opens the
         # crop editor instead of the split editor (there is no spine to cut).
@@ -265,6 +281,7 @@ class ReviewApp:
             self._consensus = consensus_geometry(
                 self.paths.images, self.keyframes,
                 cache_path=self.paths.json / "consensus_geometry.json", log_fn=log,
+                images=self.images, mask_store=self.masks,
             )
 
         # State
@@ -916,7 +933,7 @@ class ReviewApp:
         kf = self.keyframes[self.current_idx]
         VideoScrubber(
             self.root,
-            self.video_path,
+            open_reader(self.paths.data, self.video_path, build=False),
             kf["frame_index"],
             self.fps,
             self.smoothed,
@@ -982,7 +999,7 @@ class ReviewApp:
         return self.keyframes[idx].get("crop_margin", DEFAULT_SAFETY_MARGIN)
 
     @staticmethod
-    def _auto_spread_quad(img, margin, rot):
+    def _auto_spread_quad(img, margin, rot, mask=None):
         """The auto crop as a box on the raw frame: 4 px corners + the crop.
 
         Runs p5's ``crop_double_page`` and maps the resulting axis-aligned
@@ -991,7 +1008,7 @@ class ReviewApp:
         ``(quad_px, cropped)`` — the corners as (tl, tr, br, bl) and the
         cropped BGR image for gutter detection."""
         h, w = img.shape[:2]
-        cropped, method, (x0, y0, cw_, ch_) = crop_double_page(img, margin, rot)
+        cropped, method, (x0, y0, cw_, ch_) = crop_double_page(img, margin, rot, mask)
         # crop_double_page only rotates when the angle is meaningful; the
         # fallback path never rotates at all. Mirror that so the box maps back
         # through the rotation that was actually applied.
@@ -1026,9 +1043,10 @@ class ReviewApp:
         box's left and right edges, so both overlays show exactly what p5
         will crop and p6 will cut, tilt included.
 
-        Must use the full-resolution frame: the page mask, tilt, and bounds are
-        resolution-dependent (a downscale can even flip ``crop_double_page``
-        into its whole-frame fallback when the spread doesn't fill the frame).
+        Must use the full-resolution frame and the stored page mask p5 reads
+        (``MaskStore``): the tilt and bounds are resolution-dependent (a
+        downscaled frame can even flip ``crop_double_page`` into its
+        whole-frame fallback when the spread doesn't fill the frame).
         Returns ``{"box": 4 fractional corners, "box_src": "manual" /
         "track" / "inherited" / "consensus" / "auto", "line": 2 fractional
         endpoints}``. Cached per frame; invalidated when an override changes
@@ -1038,7 +1056,7 @@ class ReviewApp:
         kf = self.keyframes[idx]
         geom = None
         try:
-            img = cv2.imread(str(self.paths.images / kf["filename"]))
+            img = self.images.full(self.paths.images / kf["filename"])
             h, w = img.shape[:2]
             quad = resolve_crop_quad(self.keyframes, idx)
             box_src = "manual" if kf.get("crop_quad") else "inherited"
@@ -1062,11 +1080,12 @@ class ReviewApp:
                     )
                     cropped = crop_to_quad(img, quad_px, 0.0)
             else:
+                mask = self.masks.get(self.paths.images / kf["filename"])
                 rot = resolve_rotation(self.keyframes, idx)
                 if rot is None:
-                    rot = _spread_tilt(page_mask_robust(img))
+                    rot = _spread_tilt(mask)
                 quad_px, cropped = self._auto_spread_quad(
-                    img, self._resolve_margin(idx), rot
+                    img, self._resolve_margin(idx), rot, mask
                 )
                 box = [(x / w, y / h) for x, y in quad_px]
                 box_src = "auto"
@@ -1128,7 +1147,7 @@ class ReviewApp:
         as a prior (idx-1, so this frame's own override doesn't seed itself
         after a reset). Returns False if the frame can't be read."""
         kf = self.keyframes[idx]
-        img = cv2.imread(str(self.paths.images / kf["filename"]))
+        img = self.images.full(self.paths.images / kf["filename"])
         if img is None:
             return False
         h, w = img.shape[:2]
@@ -1152,11 +1171,12 @@ class ReviewApp:
                 img, np.array(self._quad_from_rect(), dtype=np.float32), 0.0
             )
         else:
+            mask = self.masks.get(self.paths.images / kf["filename"])
             rot = resolve_rotation(self.keyframes, idx)
             if rot is None:
-                rot = _spread_tilt(page_mask_robust(img))
+                rot = _spread_tilt(mask)
             quad_px, cropped = self._auto_spread_quad(
-                img, self._resolve_margin(idx), rot
+                img, self._resolve_margin(idx), rot, mask
             )
             self._set_rect_from_quad(quad_px)
             self._split_box_src = "auto"
@@ -1316,7 +1336,7 @@ class ReviewApp:
         kf = self.keyframes[idx]
         quad = None
         try:
-            img = cv2.imread(str(self.paths.images / kf["filename"]))
+            img = self.images.full(self.paths.images / kf["filename"])
             h, w = img.shape[:2]
             q = detect_page_quad(img)
             if q is None:
@@ -1338,7 +1358,7 @@ class ReviewApp:
             return
         idx = self.current_idx
         kf = self.keyframes[idx]
-        img = cv2.imread(str(self.paths.images / kf["filename"]))
+        img = self.images.full(self.paths.images / kf["filename"])
         if img is None:
             messagebox.showinfo("Crop", "Could not read this frame.")
             return
@@ -1640,7 +1660,7 @@ class ReviewApp:
         kf = self.keyframes[self.current_idx]
         self._unvalidate(self.current_idx)
         kf.pop("crop_quad", None)
-        img = cv2.imread(str(self.paths.images / kf["filename"]))
+        img = self.images.full(self.paths.images / kf["filename"])
         quad = detect_page_quad(img) if img is not None else None
         if quad is None:
             quad = self._default_quad()
@@ -1839,15 +1859,15 @@ class ReviewApp:
                     anchor = (self._consensus["edge_ref"],
                               self._consensus["edge_rel"])
                 else:
-                    aimg = cv2.imread(
-                        str(self.paths.images / kfs[a_idx]["filename"])
-                    )
-                    if aimg is None:
+                    apath = self.paths.images / kfs[a_idx]["filename"]
+                    asmall, ascale, asize = self.images.work(apath)
+                    if asmall is None:
                         anchor = "unavailable"
                     else:
-                        ah, aw = aimg.shape[:2]
-                        anchor = measure_quad_offsets(
-                            aimg, np.array(quad_frac, float) * [aw, ah]
+                        anchor = measure_work_offsets(
+                            asmall, ascale, np.array(quad_frac, float) * asize,
+                            TRACK_BAND_FRAC * asize[0],
+                            self.masks.get(apath, asmall),
                         )
             if anchor == "unavailable":
                 continue
@@ -1855,16 +1875,18 @@ class ReviewApp:
                 # The operator set this frame's box by hand — trusted.
                 self._watch_q.put((gen, idx, 0.0, True, False, None))
                 continue
-            img = cv2.imread(str(self.paths.images / kf["filename"]))
-            if img is None:
+            path = self.paths.images / kf["filename"]
+            small, scale, size = self.images.work(path)
+            if small is None:
                 continue
-            h, w = img.shape[:2]
+            w, h = size
             if quad0 is None:
                 quad0 = np.array(quad_frac, float) * [w, h]
                 bases0, axes = quad_edge_bases(quad0)
                 anchor_s = [b + o for b, o in zip(bases0, anchor[0])]
             tq = quad0 + shift_uv[0] * axes[0] + shift_uv[1] * axes[1]
-            off, rel = measure_quad_offsets(img, tq)
+            off, rel = measure_work_offsets(small, scale, tq, TRACK_BAND_FRAC * w,
+                                            self.masks.get(path, small))
             bases, _ = quad_edge_bases(tq)
             window.append(([b + o for b, o in zip(bases, off)], rel))
             if len(window) > 3:
@@ -2170,7 +2192,15 @@ def main():
         help="'double' shows the spread split line + G editor; "
         "'single' hides them for loose one-page docs (default: double)",
     )
+    parser.add_argument(
+        "--image-cache-mb",
+        type=int,
+        default=IMAGE_CACHE_MB,
+        help="Memory for decoded keyframes shared by preview, editor and "
+        f"watchdog (default: {IMAGE_CACHE_MB})",
+    )
     args = parser.parse_args()
+    configure_images(args.image_cache_mb)
 
     kf_json = Path(args.output_dir) / "json" / "keyframes.json"
     if not kf_json.exists():
@@ -2182,6 +2212,8 @@ def main():
     bring_to_front(root)
     root.mainloop()
     app.close()   # idempotent: also covers a mainloop exit that skipped the handler
+    log(f"  {app.images.summary()}")
+    log(f"  {app.masks.summary()}")
 
 
 if __name__ == "__main__":
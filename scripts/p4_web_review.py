@@ -11,8 +11,9 @@ clip off small screens) and the Tk scrubber software-decodes 4K per keypress.
 In the browser the scrubber is a native <video> element — hardware decode,
 instant seeks — served with HTTP Range support from the recording, or from
 a small H.264 proxy of it when the recording's codec is one no browser can
-play (OpenCV's "mp4v" default is MPEG-4 Part 2, which none of them do).
-The proxy is a one-time background transcode cached in data/.
+play (OpenCV's "mp4v" is MPEG-4 Part 2, which none of them do). The proxy
+is a one-time background transcode cached in data/; live capture's default
+x264 recordings are H.264 already and never need one.
 
 State written on Save is byte-compatible with the Tk review: keyframes.json
 (actions applied, crop_quad/gutter/rotation overrides, crop_quad_track from
@@ -38,16 +39,23 @@ import subprocess
 import sys
 import threading
 import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
 
 import cv2
 import numpy as np
 
+from archive import open_reader
+from frame_index import index_in_background
+from image_cache import IMAGE_CACHE_MB, configure as configure_images, shared as shared_images
+from mask_store import MaskStore
 from p5_crop import DEFAULT_SAFETY_MARGIN, _spread_tilt, crop_double_page, \
     crop_to_quad, detect_page_quad
+from previews import PreviewCache
 from utils import (
     ProjectPaths,
+    TRACK_BAND_FRAC,
     TRACK_DEADBAND_FRAC,
     WATCHDOG_ALERT_FRAC,
     consensus_geometry,
@@ -55,8 +63,7 @@ from utils import (
     drift_due,
     shift_due,
     log,
-    measure_quad_offsets,
-    page_mask_robust,
+    measure_work_offsets,
     quad_edge_bases,
     resolve_crop_anchor,
     resolve_crop_quad,
@@ -69,6 +76,7 @@ from webui import (
     WebUIServer,
     chromeos_note,
     send_file,
+    send_image,
     serve_forever_in_thread,
 )
 
@@ -86,6 +94,14 @@ BROWSER_FOURCC = {"avc1", "h264", "vp09", "vp80", "av01"}
 PROXY_HEIGHT = 720      # enough to recognize a page mid-turn
 PROXY_CRF = "28"        # ~11 MB per minute of 4K source
 
+# Frame geometry is a 4K imread plus mask, crop and gutter work: hundreds of
+# ms, which stepping onto an uncached frame used to spend on the websocket
+# thread. Workers compute it ahead of the operator instead — --prefetch
+# frames in the direction of travel, half as many behind — into an LRU that
+# holds a long book's worth.
+GEOM_CACHE_SIZE = 512
+PREFETCH_WORKERS = 2
+
 
 def parse_args(argv=None):
     p = argparse.ArgumentParser(description="Phase 4: Review keyframes in the browser")
@@ -95,25 +111,96 @@ def parse_args(argv=None):
     p.add_argument("--mode", default="double", choices=["single", "double"])
     p.add_argument("--host", default="127.0.0.1")
     p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    p.add_argument("--prefetch", type=int, default=4,
+                   help="Frames of geometry to compute ahead of navigation "
+                        "(0 = only on demand)")
+    p.add_argument("--image-cache-mb", type=int, default=IMAGE_CACHE_MB,
+                   help="Memory for decoded keyframes, shared by every session "
+                        "in the process")
     return p.parse_args(argv)
 
 
+class GeometryCache:
+    """Frame geometry by keyframe index: a bounded LRU, thread-safe.
+
+    Every invalidation bumps a stamp (all of them for ``clear``, one index's
+    for ``pop``). A prefetch takes a ``token`` before it starts and ``put``
+    drops its result if the stamp moved meanwhile, so a box computed against
+    the old keyframes never lands after an insert, save or edit cleared it.
+    """
+
+    def __init__(self, size=GEOM_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._gen = 0
+        self._stamps = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, idx):
+        """``(True, geometry)`` if cached, else ``(False, None)``."""
+        with self._lock:
+            if idx not in self._items:
+                return False, None
+            self._items.move_to_end(idx)
+            return True, self._items[idx]
+
+    def get(self, idx):
+        return self.lookup(idx)[1]
+
+    def __contains__(self, idx):
+        with self._lock:
+            return idx in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def token(self, idx):
+        with self._lock:
+            return self._gen, self._stamps.get(idx, 0)
+
+    def put(self, idx, geom, token):
+        """Store unless ``idx`` was invalidated since ``token``; True if stored."""
+        with self._lock:
+            if token != (self._gen, self._stamps.get(idx, 0)):
+                return False
+            self._items[idx] = geom
+            self._items.move_to_end(idx)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+            return True
+
+    def pop(self, idx, default=None):
+        with self._lock:
+            self._stamps[idx] = self._stamps.get(idx, 0) + 1
+            return self._items.pop(idx, default)
+
+    def clear(self):
+        with self._lock:
+            self._gen += 1
+            self._stamps.clear()
+            self._items.clear()
+
+
 class ReviewSession:
     """One browser review session. Socket-free: ``send`` is any callable.
 
     The state model is the Tk app's, minus rendering: ``actions`` and
     ``validated`` keyed by list index, 1-press pins with their undo values,
-    a per-frame geometry cache, and the watchdog worker publishing tracked
-    boxes into ``watch``. The browser holds only view state (current index,
+    a per-frame geometry cache that prefetch workers fill ahead of the
+    operator, and the watchdog worker publishing tracked boxes into
+    ``watch``. The browser holds only view state (current index,
     editor-in-progress); every mutation lands here first and is answered
     with the authoritative result.
     """
 
-    def __init__(self, args, paths, send):
+    def __init__(self, args, paths, send, previews=None):
         self.args = args
         self.paths = paths
         self.mode = args.mode
         self.send = send
+        self.previews = previews     # PreviewCache of images/, for the page's URLs
+        self.images = shared_images()  # decoded keyframes (image_cache.py)
+        self.masks = MaskStore(paths.masks, images=self.images)  # their page masks
 
         self.keyframes = json.loads((paths.json / "keyframes.json").read_text())
         meta_path = paths.json / "metadata.json"
@@ -154,8 +241,19 @@ class ReviewSession:
         self.session_log = []
         self.session_start = datetime.now()
         self.pending_inserts = []
-        self._geom_cache = {}
+        self._geom_cache = GeometryCache()
         self._crop_preview_cache = {}
+        # Prefetch: indices wanted next, nearest first, replaced on every
+        # show (a jump re-orders them; what was queued for the old place is
+        # dropped). _geom_busy marks indices being computed, so the handler
+        # waits for a worker's result instead of computing it twice.
+        self._geom_cond = threading.Condition()
+        self._geom_want = []
+        self._geom_busy = set()
+        self._nav_last = None
+        self._nav_dir = 1
+        self.geom_stats = {"shown": 0, "hits": 0, "waited": 0, "prefetched": 0}
+        self._prefetch_threads = []
         self.finished = False   # set by Finish; ends the server (finish-web)
 
         # Watchdog results, keyed by index; guarded by _lock because the
@@ -201,6 +299,7 @@ class ReviewSession:
                 "source": kf.get("source", "?"),
                 "own_quad": kf.get("crop_quad") is not None,
                 "own_gutter": kf.get("gutter") is not None,
+                "v": self.previews.version(kf["filename"]) if self.previews else None,
             })
         return out
 
@@ -273,6 +372,8 @@ class ReviewSession:
         """
         if self.video_path is None:
             return
+        # Insert's frame-exact reads, ready before the first I.
+        index_in_background(self.paths.data, self.video_path)
         fourcc, frames = self._probe(self.video_path)
         self.video_frames = frames
         if fourcc.lower() in BROWSER_FOURCC:
@@ -401,7 +502,7 @@ class ReviewSession:
             self._consensus = consensus_geometry(
                 self.paths.images, self.keyframes,
                 cache_path=self.paths.json / "consensus_geometry.json",
-                log_fn=log,
+                log_fn=log, images=self.images, mask_store=self.masks,
             )
         finally:
             self._consensus_done = True
@@ -414,6 +515,15 @@ class ReviewSession:
     def close(self):
         self._closed = True
         self._stop_watchdog()
+        with self._geom_cond:
+            self._geom_want = []
+            self._geom_cond.notify_all()
+        st = self.geom_stats
+        if st["shown"]:
+            log(f"  Geometry: {st['hits']}/{st['shown']} frames shown from cache "
+                f"({st['waited']} waited on a prefetch, {st['prefetched']} prefetched)")
+            log(f"  {self.images.summary()}")
+            log(f"  {self.masks.summary()}")
         proc = self._proxy_proc
         if proc is not None and proc.poll() is None:
             # The transcode belongs to this session's browser. A reconnect
@@ -456,7 +566,7 @@ class ReviewSession:
         is_cover = kf.get("is_cover") or self.actions.get(idx) == "cover"
         geom = None
         if self.mode == "double" and not is_cover:
-            geom = self._frame_geometry(idx)
+            geom = self._frame_geometry(idx, shown=True)
         elif self.mode == "single":
             manual = kf.get("crop_quad")
             quad = manual if manual else self._auto_crop_quad(idx)
@@ -480,15 +590,98 @@ class ReviewSession:
             "watch": watch,
             "validated": idx in self.validated,
         })
+        if self.mode == "double":
+            self._prefetch_around(idx)
+
+    # ── Geometry, cached and prefetched ──────────────────────
+
+    def _frame_geometry(self, idx, shown=False):
+        """The frame's geometry from the cache; if a worker is computing it,
+        its result; otherwise computed here and cached."""
+        with self._geom_cond:
+            waited = False
+            while True:
+                found, geom = self._geom_cache.lookup(idx)
+                if found:
+                    if shown:
+                        self.geom_stats["shown"] += 1
+                        self.geom_stats["hits"] += 1
+                        self.geom_stats["waited"] += waited
+                    return geom
+                if idx not in self._geom_busy:
+                    break
+                waited = True
+                self._geom_cond.wait()
+            if shown:
+                self.geom_stats["shown"] += 1
+            self._geom_busy.add(idx)
+            token = self._geom_cache.token(idx)
+        return self._geometry_into_cache(idx, token)
+
+    def _geometry_into_cache(self, idx, token):
+        """Compute a frame the caller marked busy, and cache it unless it
+        was invalidated since ``token``."""
+        geom = None
+        try:
+            geom = self._compute_geometry(idx)
+        finally:
+            with self._geom_cond:
+                self._geom_busy.discard(idx)
+                self._geom_cache.put(idx, geom, token)
+                self._geom_cond.notify_all()
+        return geom
 
-    def _frame_geometry(self, idx):
-        """Port of the Tk preview geometry: what p5 will crop, p6 will cut."""
-        if idx in self._geom_cache:
-            return self._geom_cache[idx]
+    def _prefetch_around(self, idx):
+        """Queue the frames the operator reaches next: ``--prefetch`` ahead
+        in the direction of travel, then half as many behind. Replaces the
+        queue, so after a jump (E, a click on the signal) the old
+        neighbourhood is dropped rather than computed first."""
+        ahead = self.args.prefetch
+        if ahead <= 0:
+            return
+        if self._nav_last is not None and idx != self._nav_last:
+            self._nav_dir = 1 if idx > self._nav_last else -1
+        self._nav_last = idx
+        d = self._nav_dir
+        order = [idx + d * k for k in range(1, ahead + 1)]
+        order += [idx - d * k for k in range(1, max(1, ahead // 2) + 1)]
+        want = [i for i in order if 0 <= i < len(self.keyframes)
+                and not self._skip_geometry(i) and i not in self._geom_cache]
+        with self._geom_cond:
+            self._geom_want = want
+            if want and len(self._prefetch_threads) < PREFETCH_WORKERS:
+                for _ in range(PREFETCH_WORKERS - len(self._prefetch_threads)):
+                    t = threading.Thread(target=self._prefetch_worker,
+                                         name="geom-prefetch", daemon=True)
+                    self._prefetch_threads.append(t)
+                    t.start()
+            self._geom_cond.notify_all()
+
+    def _skip_geometry(self, idx):
         kf = self.keyframes[idx]
+        return bool(kf.get("is_cover")) or self.actions.get(idx) == "cover"
+
+    def _prefetch_worker(self):
+        while True:
+            with self._geom_cond:
+                while not self._closed and not self._geom_want:
+                    self._geom_cond.wait()
+                if self._closed:
+                    return
+                idx = self._geom_want.pop(0)
+                if idx in self._geom_busy or idx in self._geom_cache:
+                    continue
+                self._geom_busy.add(idx)
+                token = self._geom_cache.token(idx)
+                self.geom_stats["prefetched"] += 1
+            self._geometry_into_cache(idx, token)
+
+    def _compute_geometry(self, idx):
+        """Port of the Tk preview geometry: what p5 will crop, p6 will cut."""
         geom = None
         try:
-            img = cv2.imread(str(self.paths.images / kf["filename"]))
+            kf = self.keyframes[idx]
+            img = self.images.full(self.paths.images / kf["filename"])
             h, w = img.shape[:2]
             quad = resolve_crop_quad(self.keyframes, idx)
             box_src = "manual" if kf.get("crop_quad") else "inherited"
@@ -507,7 +700,6 @@ class ReviewSession:
                 # rather than paying the slow per-frame auto crop; the
                 # post-vote state push makes the browser re-request this
                 # frame (and the vote clears this cached None).
-                self._geom_cache[idx] = None
                 return None
             frac = kf.get("gutter")
             cropped = None
@@ -519,11 +711,12 @@ class ReviewSession:
                     )
                     cropped = crop_to_quad(img, quad_px, 0.0)
             else:
+                mask = self.masks.get(self.paths.images / kf["filename"])
                 rot = resolve_rotation(self.keyframes, idx)
                 if rot is None:
-                    rot = _spread_tilt(page_mask_robust(img))
+                    rot = _spread_tilt(mask)
                 quad_px, cropped = self._auto_spread_quad(
-                    img, kf.get("crop_margin", DEFAULT_SAFETY_MARGIN), rot
+                    img, kf.get("crop_margin", DEFAULT_SAFETY_MARGIN), rot, mask
                 )
                 box = [(x / w, y / h) for x, y in quad_px]
                 box_src = "auto"
@@ -546,14 +739,13 @@ class ReviewSession:
             }
         except Exception:
             geom = None
-        self._geom_cache[idx] = geom
         return geom
 
     @staticmethod
-    def _auto_spread_quad(img, margin, rot):
+    def _auto_spread_quad(img, margin, rot, mask=None):
         """The auto crop as a box on the raw frame (Tk _auto_spread_quad)."""
         h, w = img.shape[:2]
-        cropped, method, (x0, y0, cw_, ch_) = crop_double_page(img, margin, rot)
+        cropped, method, (x0, y0, cw_, ch_) = crop_double_page(img, margin, rot, mask)
         corners = np.array(
             [[x0, y0], [x0 + cw_, y0], [x0 + cw_, y0 + ch_], [x0, y0 + ch_]],
             dtype=np.float64,
@@ -573,7 +765,7 @@ class ReviewSession:
         kf = self.keyframes[idx]
         quad = None
         try:
-            img = cv2.imread(str(self.paths.images / kf["filename"]))
+            img = self.images.full(self.paths.images / kf["filename"])
             h, w = img.shape[:2]
             q = detect_page_quad(img)
             if q is None:
@@ -642,8 +834,8 @@ class ReviewSession:
                 kf["crop_quad"] = [
                     [round(x, 5), round(y, 5)] for x, y in geom["box"]
                 ]
-                if self._geom_cache.get(idx):
-                    self._geom_cache[idx]["box_src"] = "manual"
+                if geom is self._geom_cache.get(idx):
+                    geom["box_src"] = "manual"
             if kf.get("gutter") is None:
                 pins["gutter"] = None
                 kf["gutter"] = round(geom["frac"], 4)
@@ -663,7 +855,7 @@ class ReviewSession:
     def _send_seed(self, idx):
         """Editor seed: box, gutter, sources — the Tk _seed_split_editor."""
         kf = self.keyframes[idx]
-        img = cv2.imread(str(self.paths.images / kf["filename"]))
+        img = self.images.full(self.paths.images / kf["filename"])
         if img is None:
             self.send({"type": "notice", "text": "Could not read this frame."})
             return
@@ -712,11 +904,12 @@ class ReviewSession:
             cropped = crop_to_quad(img, quad_px, 0.0)
             box = [[float(x), float(y)] for x, y in quad]
         else:
+            mask = self.masks.get(self.paths.images / kf["filename"])
             rot = resolve_rotation(self.keyframes, idx)
             if rot is None:
-                rot = _spread_tilt(page_mask_robust(img))
+                rot = _spread_tilt(mask)
             quad_px, cropped = self._auto_spread_quad(
-                img, kf.get("crop_margin", DEFAULT_SAFETY_MARGIN), rot
+                img, kf.get("crop_margin", DEFAULT_SAFETY_MARGIN), rot, mask
             )
             box = [[float(x) / w, float(y) / h] for x, y in quad_px]
             src = "auto"
@@ -803,12 +996,15 @@ class ReviewSession:
                        "text": f"Frame {frame_idx} is outside the recording."})
             return
         # The grab always comes from the original recording, never the
-        # downscaled proxy: the proxy is a viewfinder, not a source.
-        cap = cv2.VideoCapture(str(self.video_path))
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ok, frame = cap.read()
-        cap.release()
-        if not ok:
+        # downscaled proxy: the proxy is a viewfinder, not a source. The
+        # frame index makes it a keyframe seek plus a known short decode
+        # (a plain seek while the index is still being built). An archival
+        # recording holds full resolution only near still frames; elsewhere
+        # the grab is its proxy, scaled up.
+        with open_reader(self.paths.data, self.video_path, build=False) as reader:
+            frame = reader.read(frame_idx)
+            proxy_only = not reader.full_res(frame_idx)
+        if frame is None:
             self.send({"type": "notice",
                        "text": f"Could not read frame {frame_idx}."})
             return
@@ -854,6 +1050,10 @@ class ReviewSession:
         self.send(self._state_msg())
         self.send({"type": "inserted", "idx": insert_at,
                    "frame_index": frame_idx, "motion": motion})
+        if proxy_only:
+            self.send({"type": "notice",
+                       "text": f"Frame {frame_idx} is outside the archive's "
+                               "full-resolution windows — inserted from the proxy."})
 
     # ── Save (Tk _save port, minus the matplotlib plot) ──────
 
@@ -1035,31 +1235,33 @@ class ReviewSession:
                     anchor = (self._consensus["edge_ref"],
                               self._consensus["edge_rel"])
                 else:
-                    aimg = cv2.imread(
-                        str(self.paths.images / kfs[a_idx]["filename"])
-                    )
-                    if aimg is None:
+                    apath = self.paths.images / kfs[a_idx]["filename"]
+                    asmall, ascale, asize = self.images.work(apath)
+                    if asmall is None:
                         anchor = "unavailable"
                     else:
-                        ah, aw = aimg.shape[:2]
-                        anchor = measure_quad_offsets(
-                            aimg, np.array(quad_frac, float) * [aw, ah]
+                        anchor = measure_work_offsets(
+                            asmall, ascale, np.array(quad_frac, float) * asize,
+                            TRACK_BAND_FRAC * asize[0],
+                            self.masks.get(apath, asmall),
                         )
             if anchor == "unavailable":
                 continue
             if a_idx == idx:
                 self._publish_watch(gen, idx, 0.0, True, False, None)
                 continue
-            img = cv2.imread(str(self.paths.images / kf["filename"]))
-            if img is None:
+            path = self.paths.images / kf["filename"]
+            small, scale, size = self.images.work(path)
+            if small is None:
                 continue
-            h, w = img.shape[:2]
+            w, h = size
             if quad0 is None:
                 quad0 = np.array(quad_frac, float) * [w, h]
                 bases0, axes = quad_edge_bases(quad0)
                 anchor_s = [b + o for b, o in zip(bases0, anchor[0])]
             tq = quad0 + shift_uv[0] * axes[0] + shift_uv[1] * axes[1]
-            off, rel = measure_quad_offsets(img, tq)
+            off, rel = measure_work_offsets(small, scale, tq, TRACK_BAND_FRAC * w,
+                                            self.masks.get(path, small))
             bases, _ = quad_edge_bases(tq)
             window.append(([b + o for b, o in zip(bases, off)], rel))
             if len(window) > 3:
@@ -1111,26 +1313,30 @@ class ReviewSession:
                    "moved": quad is not None})
 
 
-def build_server(args):
+def build_app(args):
+    """The review app, unbound: ``(html_path, make_session, route)`` for a
+    WebUIServer, or for a station of the multi-station server."""
     paths = ProjectPaths(args.output_dir)
     kf_path = paths.json / "keyframes.json"
     if not kf_path.exists():
         raise FileNotFoundError(f"{kf_path} not found. Run Phase 3 first.")
+    configure_images(args.image_cache_mb)
     html_path = Path(__file__).resolve().parent.parent / "web" / "review.html"
     if not html_path.exists():
         raise FileNotFoundError(f"review page not found: {html_path}")
 
+    previews = PreviewCache(paths.images, paths.previews / "images")
+    previews.warm(kf["filename"] for kf in json.loads(kf_path.read_text()))
     session_box = {}
 
     def make_session(send):
-        s = ReviewSession(args, paths, send)
+        s = ReviewSession(args, paths, send, previews=previews)
         session_box["s"] = s
         return s
 
     def route(handler, path, head_only):
         if path.startswith("/img/"):
-            name = Path(path[5:]).name          # no traversal
-            send_file(handler, paths.images / name, head_only)
+            send_image(handler, previews, path[5:], head_only)
             return True
         if path == "/video":
             s = session_box.get("s")
@@ -1142,7 +1348,11 @@ def build_server(args):
             return True
         return False
 
-    return WebUIServer((args.host, args.port), html_path, make_session, route)
+    return html_path, make_session, route
+
+
+def build_server(args):
+    return WebUIServer((args.host, args.port), *build_app(args))
 
 
 def main():
@@ -31,6 +31,8 @@ from pathlib import Path
 import cv2
 import numpy as np
 
+from image_cache import ImageCache
+from mask_store import MaskStore
 from utils import (
     log,
     ProjectPaths,
@@ -95,7 +97,7 @@ def _mask_bounds(mask, min_frac=0.5):
     return int(xs[0]), int(ys[0]), int(xs[-1] + 1 - xs[0]), int(ys[-1] + 1 - ys[0])
 
 
-def crop_double_page(img, safety_pct, rotation_override=None):
+def crop_double_page(img, safety_pct, rotation_override=None, mask=None):
     """Deskew and isolate a book spread from a tinted table.
 
     Replaces grayscale Otsu (which merges cream pages into light-brown wood)
@@ -110,14 +112,21 @@ def crop_double_page(img, safety_pct, rotation_override=None):
     operator has corrected the deskew in Phase 4. p4's split preview calls this
     with identical arguments, so the cropped result here matches what was shown.
 
+    ``mask`` is the frame's page mask when the caller has it (``MaskStore``,
+    at any scale). The tilt is read off it at that scale, as p4 reads it, and
+    the deskewed frame's mask is that mask rotated along with the frame
+    rather than a second mask of the rotated frame.
+
     Returns ``(cropped, method, (x0, y0, crop_w, crop_h))`` — the crop's origin
     and size in deskewed-frame pixels — so a gutter measured on the crop, or
     the crop box itself, can be mapped back onto the original frame.
     """
     h, w = img.shape[:2]
-    mask = page_mask_robust(img)
+    given = mask is not None
+    if not given:
+        mask = page_mask_robust(img)
 
-    if cv2.countNonZero(mask) < 0.2 * w * h:
+    if cv2.countNonZero(mask) < 0.2 * mask.shape[0] * mask.shape[1]:
         # No page-sized bright region found — leave the frame essentially as-is.
         mx, my = int(w * 0.02), int(h * 0.02)
         return (
@@ -127,12 +136,18 @@ def crop_double_page(img, safety_pct, rotation_override=None):
         )
 
     angle = rotation_override if rotation_override is not None else _spread_tilt(mask)
+    if mask.shape[:2] != (h, w):
+        mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_NEAREST)
     if abs(angle) > 0.2:
         M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
         img = cv2.warpAffine(
             img, M, (w, h), flags=cv2.INTER_LINEAR, borderValue=(255, 255, 255)
         )
-        mask = page_mask_robust(img)
+        mask = (
+            cv2.warpAffine(mask, M, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+            if given
+            else page_mask_robust(img)
+        )
 
     x, y, bw, bh = _mask_bounds(mask)
     mx, my = int(w * safety_pct), int(h * safety_pct)
@@ -349,6 +364,11 @@ def main():
     keyframes = json.loads(kf_path.read_text())
     log(f"Loaded {len(keyframes)} keyframes")
 
+    # Page masks already computed by P4 (or a previous run) are read back, not
+    # recomputed. A missing one is computed from a reduced decode of the file,
+    # as every phase computes it; nothing is kept decoded past that frame.
+    masks = MaskStore(paths.masks, images=ImageCache(budget_mb=0))
+
     # Load crop bounds from review (for double mode side trim)
     global_crop = None
     consensus = None
@@ -370,6 +390,7 @@ def main():
         consensus = consensus_geometry(
             paths.images, keyframes,
             cache_path=paths.json / "consensus_geometry.json", log_fn=log,
+            mask_store=masks,
         )
         if consensus:
             log(f"  Consensus box: {consensus['quad']}")
@@ -438,11 +459,17 @@ def main():
                 # Auto path: crop bounds + page-mask detection
                 # Step 1: Apply side crop bounds
                 crop = kf.get("crop_bounds") or global_crop
+                mask = None
+                if not args.no_otsu and not is_cover:
+                    mask = masks.get(img_path)
                 if crop and not is_cover:
                     h_img, w_img = img.shape[:2]
-                    img = img[
-                        :, int(w_img * crop["left"]) : int(w_img * crop["right"])
-                    ]
+                    cols = slice(int(w_img * crop["left"]), int(w_img * crop["right"]))
+                    img = img[:, cols]
+                    if mask is not None:
+                        mask = cv2.resize(
+                            mask, (w_img, h_img), interpolation=cv2.INTER_NEAREST
+                        )[:, cols]
 
                 # Step 2: Otsu page detection
                 if not args.no_otsu and not is_cover:
@@ -452,7 +479,7 @@ def main():
                     # sessions) is a one-off, so it does NOT propagate.
                     rot = resolve_rotation(keyframes, i)
                     margin = kf.get("crop_margin", args.safety_margin)
-                    cropped, method, _ = crop_double_page(img, margin, rot)
+                    cropped, method, _ = crop_double_page(img, margin, rot, mask)
                 else:
                     cropped = img
                     method = "bounds_only" if crop else "none"
@@ -472,6 +499,11 @@ def main():
     log(f"\nDone. {len(keyframes)} images in {elapsed:.1f}s")
     for method, count in sorted(method_counts.items()):
         log(f"  {method}: {count}")
+    if args.mode == "double":
+        # The uncropped frames' masks stay for a re-extraction; only the
+        # least recently read go, past the store's budget.
+        masks.trim()
+        log(f"  {masks.summary()}")
 
     log("")
     log("PHASE 5 COMPLETE")
@@ -19,6 +19,8 @@ from pathlib import Path
 
 import cv2
 
+from image_cache import ImageCache
+from mask_store import MaskStore
 from utils import (
     log,
     ProjectPaths,
@@ -86,6 +88,9 @@ def main():
         if n_orig:
             log(f"  Cleared {n_orig} stale P7 originals (pages_orig/)")
 
+    # The cropped spreads' masks, kept from an earlier run of this phase.
+    masks = MaskStore(paths.masks, images=ImageCache(budget_mb=0))
+
     t0 = time.time()
     page_list = []
     page_num = 0
@@ -150,7 +155,11 @@ def main():
             if own is not None:
                 mid = int(round(w * own))
             else:
-                mid = detect_gutter(img, prior=resolve_gutter(keyframes, i))
+                mid = detect_gutter(
+                    img,
+                    mask=masks.get(img_path, size=(w, h)),
+                    prior=resolve_gutter(keyframes, i),
+                )
             mid = max(1, min(w - 1, mid))
             left_half = img[:, :mid]
             right_half = img[:, mid:]
@@ -202,6 +211,9 @@ def main():
 
     elapsed = time.time() - t0
     log(f"  Done. {len(page_list)} pages in {elapsed:.1f}s")
+    if args.mode == "double":
+        masks.trim()
+        log(f"  {masks.summary()}")
 
     (paths.json / "pages.json").write_text(json.dumps(page_list, indent=2))
 
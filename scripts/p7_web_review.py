@@ -30,12 +30,13 @@ from pathlib import Path
 
 from PIL import Image
 
+from previews import PreviewCache
 from utils import ProjectPaths, ensure_dir, log, segment_documents, slugify
 from webui import (
     DEFAULT_PORT,
     WebUIServer,
     chromeos_note,
-    send_file,
+    send_image,
     serve_forever_in_thread,
 )
 
@@ -69,9 +70,10 @@ def _transform(img, g):
 class PageSession:
     """One browser page-review session; socket-free (Tk app's state model)."""
 
-    def __init__(self, paths, send):
+    def __init__(self, paths, send, previews=None):
         self.paths = paths
         self.send = send
+        self.previews = previews     # PreviewCache of pages/, for the page's URLs
         self.pages = json.loads((paths.json / "pages.json").read_text())
         self.notes = {}
         self.drops = set()
@@ -101,7 +103,8 @@ class PageSession:
             "type": "state",
             "pages": [
                 {"page_num": pg["page_num"], "filename": pg["filename"],
-                 "kind": pg.get("type", "?")}
+                 "kind": pg.get("type", "?"),
+                 "v": self.previews.version(pg["filename"]) if self.previews else None}
                 for pg in self.pages
             ],
             "notes": {str(k): v for k, v in self.notes.items()},
@@ -234,7 +237,8 @@ class PageSession:
         self.send(self._state_msg())
 
 
-def build_server(args):
+def build_app(args):
+    """The page review app, unbound: ``(html_path, make_session, route)``."""
     paths = ProjectPaths(args.output_dir)
     pages_path = paths.json / "pages.json"
     if not pages_path.exists():
@@ -243,17 +247,20 @@ def build_server(args):
     if not html_path.exists():
         raise FileNotFoundError(f"pages page not found: {html_path}")
 
+    previews = PreviewCache(paths.pages, paths.previews / "pages")
+    previews.warm(pg["filename"] for pg in json.loads(pages_path.read_text()))
+
     def route(handler, path, head_only):
         if path.startswith("/page/"):
-            name = Path(path[6:]).name          # no traversal
-            send_file(handler, paths.pages / name, head_only)
+            send_image(handler, previews, path[6:], head_only)
             return True
         return False
 
-    return WebUIServer(
-        (args.host, args.port), html_path,
-        lambda send: PageSession(paths, send), route,
-    )
+    return html_path, lambda send: PageSession(paths, send, previews=previews), route
+
+
+def build_server(args):
+    return WebUIServer((args.host, args.port), *build_app(args))
 
 
 def main():
@@ -0,0 +1,165 @@
+"""
+Display-sized renditions of the review images, cached on disk.
+
+The browser reviews used to draw every keyframe and page from the file
+itself: a 4K keyframe is several MB, and each arrow-key step fetched one
+(or a page) over what is often a ChromeOS port forward, marked
+``no-store`` so nothing was ever reused. The canvas it is drawn on is
+rarely wider than 2000 device pixels.
+
+``PreviewCache`` keeps a small pyramid of every source image under
+``previews/<source dir>/``: a thumbnail and two display sizes (``LEVELS``,
+by long edge). A rendition is named for its source and the source's
+*version*, a fingerprint of its size and mtime. When crop rewrites a
+keyframe in place, or P7's Save re-renders a page, the version changes, the
+old renditions stop matching and the next build prunes them.
+
+``warm`` builds the whole pyramid on a background thread, one decode per
+source (JPEG draft mode decodes a 4K frame at half size for free), and
+``rendition`` builds any one that is still missing on demand. A request for
+more pixels than the largest level, or than the source has, gets the
+original: a rendition is never upscaled.
+
+The review servers send renditions with an ETag of version and level
+(``webui.send_file``), so a revalidation is a 304. The pages name the
+version in the URL, which lets the browser keep an image until it changes.
+"""
+
+import hashlib
+import os
+import threading
+
+from PIL import Image
+
+from utils import log
+
+LEVELS = (320, 960, 1920)        # long edge, px: thumbnail, two display sizes
+QUALITY = 85
+
+
+class PreviewCache:
+    """Renditions of the images in ``source_dir``, kept in ``cache_dir``."""
+
+    def __init__(self, source_dir, cache_dir):
+        self.source_dir = source_dir
+        self.cache_dir = cache_dir
+        self._sizes = {}             # (name, version) -> (w, h) of the source
+        self._lock = threading.Lock()
+        self.built = 0
+        self._thread = None
+
+    def version(self, name):
+        """Fingerprint of the source as it is now, or None if it is gone."""
+        try:
+            st = (self.source_dir / name).stat()
+        except OSError:
+            return None
+        key = f"{st.st_size}:{st.st_mtime_ns}".encode()
+        return hashlib.blake2b(key, digest_size=6).hexdigest()
+
+    def rendition(self, name, size):
+        """``(path, etag)`` to serve ``name`` at ``size`` px of long edge
+        (None for the original); the path is None if the source is gone."""
+        version = self.version(name)
+        if version is None:
+            return None, None
+        level = None
+        if size:
+            level = next((lv for lv in LEVELS if lv >= size), None)
+        if level is not None and level >= max(self._source_size(name, version)):
+            level = None
+        if level is None:
+            return self.source_dir / name, f'"{version}-orig"'
+        path = self._path(name, version, level)
+        if not path.exists():
+            self._build(name, version)
+        if not path.exists():                  # unreadable source: serve it as is
+            return self.source_dir / name, f'"{version}-orig"'
+        return path, f'"{version}-{level}"'
+
+    def warm(self, names):
+        """Build every missing rendition of ``names`` on a background thread,
+        after pruning renditions of sources that changed or went away."""
+        names = list(names)
+        self._thread = threading.Thread(target=self._warm, args=(names,),
+                                        name="previews", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    # ── Building ─────────────────────────────────────────────
+
+    def _path(self, name, version, level):
+        return self.cache_dir / f"{name}.{version}.{level}.jpg"
+
+    def _source_size(self, name, version):
+        with self._lock:
+            size = self._sizes.get((name, version))
+        if size is None:
+            try:
+                with Image.open(self.source_dir / name) as im:
+                    size = im.size               # the header only
+            except OSError:
+                size = (0, 0)
+            with self._lock:
+                self._sizes[(name, version)] = size
+        return size
+
+    def _build(self, name, version):
+        """Every level of one source from a single decode. Written under a
+        temporary name and renamed, so a reader never sees half a file and
+        two builders of the same rendition don't collide."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with Image.open(self.source_dir / name) as im:
+                w, h = im.size
+                with self._lock:
+                    self._sizes[(name, version)] = (w, h)
+                levels = [lv for lv in LEVELS if lv < max(w, h)]
+                if not levels:
+                    return
+                scale = max(levels) / max(w, h)
+                im.draft("RGB", (int(w * scale), int(h * scale)))
+                img = im.convert("RGB")
+            for level in sorted(levels, reverse=True):
+                path = self._path(name, version, level)
+                if path.exists():
+                    continue
+                scale = level / max(w, h)
+                img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))),
+                                 Image.LANCZOS)
+                tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                img.save(tmp, "JPEG", quality=QUALITY)
+                os.replace(tmp, path)
+                self.built += 1
+        except OSError as e:
+            log(f"  WARNING: no preview of {name}: {e}")
+
+    def _warm(self, names):
+        current = {}
+        for name in names:
+            version = self.version(name)
+            if version is not None:
+                current[name] = version
+        self._prune(current)
+        for name, version in current.items():
+            if any(not self._path(name, version, lv).exists() for lv in LEVELS
+                   if lv < max(self._source_size(name, version))):
+                self._build(name, version)
+
+    def _prune(self, current):
+        """Remove renditions whose source changed since (or is gone)."""
+        try:
+            entries = list(self.cache_dir.iterdir())
+        except OSError:
+            return
+        for path in entries:
+            parts = path.name.rsplit(".", 3)
+            if len(parts) != 4 or parts[3] != "jpg":
+                if path.name.endswith(".tmp"):
+                    path.unlink(missing_ok=True)
+                continue
+            name, version = parts[0], parts[1]
+            if name in current and current[name] != version:
+                path.unlink(missing_ok=True)
+            elif name not in current and not (self.source_dir / name).exists():
+                path.unlink(missing_ok=True)
@@ -0,0 +1,150 @@
+"""
+The browser recording's path to disk, off the socket thread.
+
+``p0_web_capture`` used to append each MediaRecorder chunk to the raw file
+inside its socket handler, the same thread that unpacks analysis frames and
+runs the detector. A chunk is up to a few MB every second, and a slow disk
+(an SD card, a Crostini virtual disk under load) can take longer than that
+to write. The frames queued behind it while it did, and then read as link
+lag, which the analysis link answers by stepping its level down.
+
+``RecordingSink`` takes the chunks instead. ``put`` copies a chunk onto a
+queue and returns. A writer thread takes everything queued at once and
+writes it in one call. The queue is bounded in bytes (``max_queue_bytes``):
+past that, ``put`` waits, because dropping recording is never an option. It
+warns once when that happens, since the disk is then slower than the camera.
+
+Every ``sync_sec`` the writer flushes and fsyncs the file: a durability
+point. A crash or a power cut then loses at most that many seconds of
+recording, plus whatever was still queued. ``stats`` reports the queue
+depth, write latency and the last durability point, for the session's
+telemetry and metadata.json.
+"""
+
+import os
+import threading
+import time
+
+from utils import log
+
+
+class RecordingSink:
+    """Append recorder chunks to ``path`` on a writer thread."""
+
+    def __init__(self, path, max_queue_bytes=64e6, sync_sec=5.0):
+        self.path = path
+        self.max_queue_bytes = max_queue_bytes
+        self.sync_sec = sync_sec
+        self._file = open(path, "wb")
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._queued = 0
+        self._closed = False
+        self.error = None
+        self.bytes_written = 0
+        self.writes = 0
+        self.blocked = 0              # puts that waited for room
+        self.queue_peak = 0
+        self.durable_bytes = 0        # on disk as of the last fsync ...
+        self._durable_at = time.monotonic()   # ... and when that was
+        self._write_ms = []
+        self.sync_ms_max = 0.0
+        self._thread = threading.Thread(target=self._run, name="recording-sink",
+                                        daemon=True)
+        self._thread.start()
+
+    def put(self, chunk):
+        """Queue a chunk (copied: it may be a view of a socket buffer)."""
+        chunk = bytes(chunk)
+        with self._cond:
+            if self._queued + len(chunk) > self.max_queue_bytes and self._queued:
+                self.blocked += 1
+                if self.blocked == 1:
+                    log(f"  WARNING: {self._queued / 1e6:.0f} MB of recording is "
+                        "waiting for the disk, which is slower than the camera; "
+                        "the session slows down until it catches up")
+                while self._queued + len(chunk) > self.max_queue_bytes and self._queued:
+                    self._cond.wait()
+            self._chunks.append(chunk)
+            self._queued += len(chunk)
+            self.queue_peak = max(self.queue_peak, self._queued)
+            self._cond.notify_all()
+
+    def close(self):
+        """Write what is queued, fsync, close; the sink's stats."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        return self.stats()
+
+    def stats(self):
+        with self._cond:
+            ms = sorted(self._write_ms)
+            return {"written_mb": round(self.bytes_written / 1e6, 1),
+                    "queued_mb": round(self._queued / 1e6, 1),
+                    "queue_peak_mb": round(self.queue_peak / 1e6, 1),
+                    "writes": self.writes,
+                    "blocked_puts": self.blocked,
+                    "write_ms_p50": round(ms[len(ms) // 2], 1) if ms else None,
+                    "write_ms_max": round(ms[-1], 1) if ms else None,
+                    "sync_sec": self.sync_sec,
+                    "sync_ms_max": round(self.sync_ms_max, 1),
+                    "durable_mb": round(self.durable_bytes / 1e6, 1),
+                    "unsynced_mb": round((self.bytes_written - self.durable_bytes) / 1e6, 1),
+                    "error": self.error}
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._chunks and not self._closed:
+                    if self.durable_bytes == self.bytes_written:
+                        self._cond.wait()
+                        continue
+                    left = self._durable_at + self.sync_sec - time.monotonic()
+                    if left <= 0:
+                        break
+                    self._cond.wait(left)
+                batch, self._chunks = self._chunks, []
+                done = self._closed and not batch
+            if batch:
+                self._write(batch)
+            if done or time.monotonic() - self._durable_at >= self.sync_sec:
+                self._sync()
+            if done:
+                self._file.close()
+                return
+
+    def _write(self, batch):
+        size = sum(len(c) for c in batch)
+        t0 = time.perf_counter()
+        if self.error is None:
+            try:
+                self._file.writelines(batch)
+            except OSError as e:
+                self.error = str(e)
+                log(f"  WARNING: could not write the recording: {e}")
+        ms = (time.perf_counter() - t0) * 1000
+        with self._cond:
+            self._queued -= size
+            if self.error is None:
+                self.bytes_written += size
+                self.writes += 1
+                self._write_ms.append(ms)
+                if len(self._write_ms) > 4096:
+                    del self._write_ms[:2048]
+            self._cond.notify_all()
+
+    def _sync(self):
+        if self.error is None and self.durable_bytes < self.bytes_written:
+            t0 = time.perf_counter()
+            try:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                self.error = str(e)
+                log(f"  WARNING: could not sync the recording: {e}")
+                return
+            self.sync_ms_max = max(self.sync_ms_max, (time.perf_counter() - t0) * 1000)
+            self.durable_bytes = self.bytes_written
+        self._durable_at = time.monotonic()
@@ -0,0 +1,473 @@
+"""
+One server for several scanning stations: capture and both reviews for any
+number of projects, over one port.
+
+The one-station servers (p0_web_capture, p4_web_review, p7_web_review) each
+take a single browser and refuse a second. With several rigs side by side,
+that means a process and a port per rig, and a ChromeOS port-forwarding rule
+for each. This server puts every station behind one port, each at its own
+path:
+
+  /                        the stations: projects under --root, and what each
+                           is ready for
+  /<NAME>/capture/         P0 capture into output/<NAME>, recording to
+                           recordings/<NAME>.mp4
+  /<NAME>/review/          P4 keyframe review of output/<NAME>
+  /<NAME>/pages/           P7 page review of output/<NAME>
+
+The sessions are the one-station servers' own (WebSession, ReviewSession,
+PageSession), as are the pages, which address everything relative to
+where they are served. Only the plumbing differs. One asyncio event loop
+reads every connection (``WebSocket.arecv``) and does no session work
+itself: each message a session handles, the detector update inside a
+capture frame or the geometry behind a review action, runs on a shared
+thread pool (--workers). A session's messages are handled one at a time and
+in order, so its state needs no more locking than it has under the
+one-station servers. Sessions of different stations run side by side.
+
+One writer per project still holds: a project has at most one session at a
+time, whichever the app, so a review can't save keyframes.json under a
+capture still writing it. A second browser is refused with an error
+message, as the one-station servers refuse theirs. Finishing a session
+frees its station, for the next phase or the next book.
+
+Usage:
+  python scripts/stations.py [--root output] [--port 8412] [capture options]
+
+Options this script doesn't know (--fps, --early-capture, ...) go to every
+capture session, as p0_web_capture would take them.
+"""
+
+import argparse
+import asyncio
+import errno
+import html
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import HeaderParser
+from http import HTTPStatus
+from pathlib import Path
+from urllib.parse import unquote
+
+import p0_web_capture
+import p4_web_review
+import p7_web_review
+from miniws import CLOSE, TEXT, MessageBatcher, WebSocket, accept_key, negotiate_deflate
+from utils import ProjectPaths, log
+from webui import DEFAULT_PORT, chromeos_note
+
+APPS = ("capture", "review", "pages")
+# A station is a directory under --root: no separators, no dot-files.
+NAME_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]{0,63}\Z")
+WEB = Path(__file__).resolve().parent.parent / "web"
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(
+        description="Capture and review for several stations over one port")
+    p.add_argument("--root", default="output",
+                   help="Directory holding the projects (output/<NAME>)")
+    p.add_argument("--recordings", default="recordings",
+                   help="Directory captures record into (<NAME>.mp4)")
+    p.add_argument("--mode", default="double", choices=["single", "double"],
+                   help="P4 review mode")
+    p.add_argument("--workers", type=int, default=0,
+                   help="Threads for session work, shared by every station "
+                        "(0 = one per core, at least 4)")
+    p.add_argument("--image-cache-mb", type=int, default=p4_web_review.IMAGE_CACHE_MB,
+                   help="Memory for decoded keyframes, shared by every review station")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args, capture_argv = p.parse_known_args(argv)
+    # Fail now, not at the first browser, if the capture options are wrong.
+    p0_web_capture.parse_args(["-", "-", *capture_argv])
+    args.capture_argv = capture_argv
+    return args
+
+
+# ── Replies from worker threads ──────────────────────────────
+
+
+class _Conn:
+    """A connection's writing side, usable from any thread.
+
+    Session threads (and the WebSocket's batcher) block in ``sendall`` until
+    the event loop has the bytes and the transport has drained below its
+    high-water mark, which is what a blocking socket does too. On the loop's
+    own thread the write is just queued: blocking there would stall every
+    station.
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self._loop_thread = threading.get_ident()
+
+    def sendall(self, data):
+        data = bytes(data)
+        if threading.get_ident() == self._loop_thread:
+            self.writer.write(data)
+            return
+        asyncio.run_coroutine_threadsafe(self._write(data), self.loop).result()
+
+    def sendfile(self, f, offset, count):
+        """``count`` bytes of ``f`` from ``offset``, copied by the kernel
+        where the transport allows (``loop.sendfile`` reads and writes
+        otherwise). Blocks its thread until they are sent."""
+        if threading.get_ident() == self._loop_thread:
+            f.seek(offset)
+            self.writer.write(f.read(count))
+            return
+        asyncio.run_coroutine_threadsafe(
+            self._sendfile(f, offset, count), self.loop).result()
+
+    async def _write(self, data):
+        if self.writer.is_closing():
+            raise ConnectionResetError("connection closed")
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def _sendfile(self, f, offset, count):
+        if self.writer.is_closing():
+            raise ConnectionResetError("connection closed")
+        await self.writer.drain()
+        await self.loop.sendfile(self.writer.transport, f, offset, count)
+
+
+class _Reply:
+    """The part of BaseHTTPRequestHandler that webui.send_file and the
+    review apps' routes use, writing through a ``_Conn``."""
+
+    def __init__(self, conn, headers):
+        self.headers = headers
+        self.path = "/"
+        self.wfile = self
+        self._conn = conn
+        self._head = []
+
+    def send_response(self, code, message=None):
+        self._head = [f"HTTP/1.1 {code} {message or HTTPStatus(code).phrase}"]
+
+    def send_header(self, key, value):
+        self._head.append(f"{key}: {value}")
+
+    def end_headers(self):
+        self._conn.sendall(("\r\n".join(self._head) + "\r\n\r\n").encode("latin-1"))
+
+    def send_error(self, code, message=None):
+        body = (message or HTTPStatus(code).phrase).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.write(body)
+
+    def write(self, data):
+        self._conn.sendall(data)
+
+    def sendfile(self, f, offset, count):
+        self._conn.sendfile(f, offset, count)
+
+
+# ── The server ───────────────────────────────────────────────
+
+
+class StationServer:
+    """Every station's capture and review sessions, on one event loop."""
+
+    def __init__(self, args):
+        self.args = args
+        self.root = Path(args.root)
+        self.recordings = Path(args.recordings)
+        workers = args.workers or max(4, os.cpu_count() or 1)
+        self.pool = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix="station")
+        self._apps = {}          # (name, app) -> its build, made on first use
+        self._building = {}      # (name, app) -> lock held while it is built
+        self._apps_lock = threading.Lock()
+        self._claims = {}        # name -> the app whose session holds the project
+        self.server = None
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._client, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    def stations(self):
+        """Projects under --root: (name, apps ready, app in session or None)."""
+        out = []
+        if self.root.is_dir():
+            for d in sorted(self.root.iterdir()):
+                if d.is_dir() and NAME_RE.match(d.name):
+                    paths = ProjectPaths(d)
+                    ready = ["capture"]
+                    if (paths.json / "keyframes.json").exists():
+                        ready.append("review")
+                    if (paths.json / "pages.json").exists():
+                        ready.append("pages")
+                    out.append((d.name, ready, self._claims.get(d.name)))
+        return out
+
+    def _run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    # ── HTTP ─────────────────────────────────────────────────
+
+    async def _client(self, reader, writer):
+        conn = _Conn(asyncio.get_running_loop(), writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                request, _, header_text = head.decode("latin-1").partition("\r\n")
+                parts = request.split(" ")
+                headers = HeaderParser().parsestr(header_text)
+                if len(parts) != 3 or parts[0] not in ("GET", "HEAD"):
+                    _Reply(conn, headers).send_error(405)
+                    break
+                target, _, query = parts[1].partition("?")
+                if await self._dispatch(conn, reader, headers, parts[0] == "HEAD",
+                                        unquote(target), query):
+                    break                     # a websocket ran to its end
+                if (headers.get("Connection") or "").lower() == "close":
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, conn, reader, headers, head_only, path, query=""):
+        """Serve one request; True if it was a websocket (the connection is
+        then done)."""
+        reply = _Reply(conn, headers)
+        if path in ("/", "/index.html"):
+            body = self._index_page().encode()
+            reply.send_response(200)
+            reply.send_header("Content-Type", "text/html; charset=utf-8")
+            reply.send_header("Content-Length", str(len(body)))
+            reply.send_header("Cache-Control", "no-store")
+            reply.end_headers()
+            if not head_only:
+                reply.write(body)
+            return False
+        _, name, app, *rest = path.split("/", 3) + [None]
+        rest = rest[0]
+        if not NAME_RE.match(name or "") or app not in APPS:
+            reply.send_error(404)
+            return False
+        if rest is None:                      # relative URLs need the slash
+            reply.send_response(301)
+            reply.send_header("Location", f"/{name}/{app}/")
+            reply.send_header("Content-Length", "0")
+            reply.end_headers()
+            return False
+        try:
+            build = await self._run(self._build, name, app)
+        except (FileNotFoundError, OSError) as e:
+            reply.send_error(404, str(e))
+            return False
+        if rest in ("", "index.html"):
+            body = build["html_path"].read_bytes()
+            reply.send_response(200)
+            reply.send_header("Content-Type", "text/html; charset=utf-8")
+            reply.send_header("Content-Length", str(len(body)))
+            reply.send_header("Cache-Control", "no-store")
+            reply.end_headers()
+            if not head_only:
+                reply.write(body)
+            return False
+        if rest == "ws" and not head_only:
+            await self._websocket(conn, reader, headers, name, app, build)
+            return True
+        route = build.get("route")
+        reply.path = f"/{rest}?{query}" if query else f"/{rest}"    # as the app sees it
+        if route is None or not await self._run(route, reply, "/" + rest, head_only):
+            reply.send_error(404)
+        return False
+
+    def _build(self, name, app):
+        """The app for a station, built on first use (on a worker: building
+        reads the project). Two first requests at once build it once: the
+        second waits for the first's build, since a second ``build_app``
+        would replace the session factory the first page already talks to."""
+        key = (name, app)
+        with self._apps_lock:
+            if key in self._apps:
+                return self._apps[key]
+            lock = self._building.setdefault(key, threading.Lock())
+        with lock:
+            with self._apps_lock:
+                if key in self._apps:
+                    return self._apps[key]
+            project = self.root / name
+            if app == "capture":
+                cfg = p0_web_capture.parse_args(
+                    [str(project), str(self.recordings / f"{name}.mp4"),
+                     *self.args.capture_argv])
+                build = {"html_path": WEB / "capture.html", "cfg": cfg}
+            else:
+                if not project.is_dir():
+                    raise FileNotFoundError(f"no project {project}")
+                if app == "review":
+                    html_path, make_session, route = p4_web_review.build_app(
+                        p4_web_review.parse_args(
+                            [str(project), "--mode", self.args.mode,
+                             "--image-cache-mb", str(self.args.image_cache_mb)]))
+                else:
+                    html_path, make_session, route = p7_web_review.build_app(
+                        p7_web_review.parse_args([str(project)]))
+                build = {"html_path": html_path, "make_session": make_session,
+                         "route": route}
+            with self._apps_lock:
+                self._apps[key] = build
+                self._building.pop(key, None)
+        return build
+
+    def _index_page(self):
+        rows = []
+        for name, ready, busy in self.stations():
+            links = " · ".join(
+                f'<a href="/{html.escape(name)}/{app}/">{app}</a>' for app in ready)
+            state = f"<em>{html.escape(busy)} in session</em>" if busy else ""
+            rows.append(f"<tr><td>{html.escape(name)}</td><td>{links}</td>"
+                        f"<td>{state}</td></tr>")
+        return f"""<!doctype html>
+<html><head><meta charset="utf-8"><title>ScanStudio stations</title>
+<style>
+  body {{ font: 15px system-ui, sans-serif; margin: 2em; background: #111; color: #ddd; }}
+  a {{ color: #8cf; }}  td {{ padding: .3em 1.2em .3em 0; }}  em {{ color: #fa6; }}
+</style></head><body>
+<h2>Stations</h2>
+<table>{''.join(rows) or '<tr><td>No projects yet.</td></tr>'}</table>
+<p><form onsubmit="location.href = '/' + encodeURIComponent(this.n.value) + '/capture/'; return false">
+  New capture: <input name="n" pattern="[A-Za-z0-9][A-Za-z0-9._\\-]*" placeholder="mybook" required>
+  <button>Start</button></form></p>
+</body></html>
+"""
+
+    # ── WebSocket sessions ───────────────────────────────────
+
+    async def _websocket(self, conn, reader, headers, name, app, build):
+        reply = _Reply(conn, headers)
+        key = headers.get("Sec-WebSocket-Key")
+        if key is None or "websocket" not in (headers.get("Upgrade") or "").lower():
+            reply.send_error(400, "WebSocket upgrade expected")
+            return
+        extension, deflate = None, None
+        if app != "capture" or build["cfg"].ws_deflate:
+            extension, deflate = negotiate_deflate(headers.get("Sec-WebSocket-Extensions"))
+        reply.send_response(101, "Switching Protocols")
+        reply.send_header("Upgrade", "websocket")
+        reply.send_header("Connection", "Upgrade")
+        reply.send_header("Sec-WebSocket-Accept", accept_key(key))
+        if extension:
+            reply.send_header("Sec-WebSocket-Extensions", extension)
+        reply.end_headers()
+        ws = WebSocket(conn, deflate=deflate)
+
+        holder = self._claims.get(name)
+        if holder is not None:
+            ws.send_text(json.dumps({
+                "type": "error",
+                "message": f"{name} already has a {holder} session connected"}))
+            ws.close()
+            return
+        self._claims[name] = app
+        log(f"  [{name}] {app}: browser connected")
+        batcher = MessageBatcher(ws, **({"window": p0_web_capture.BATCH_SEC,
+                                         "urgent": p0_web_capture.URGENT}
+                                        if app == "capture" else {}))
+        try:
+            if app == "capture":
+                await self._capture(ws, reader, name, build["cfg"], batcher)
+            else:
+                await self._review(ws, reader, name, build["make_session"], batcher)
+        finally:
+            await self._run(batcher.close)
+            await self._run(ws.close)
+            del self._claims[name]
+            log(f"  [{name}] {app}: session over")
+
+    async def _capture(self, ws, reader, name, cfg, batcher):
+        """CaptureHandler._run_session, with the session's work on the pool."""
+        paths = ProjectPaths(cfg.output_dir)
+        paths.ensure("images", "json", "data", "plots")
+        session = await self._run(p0_web_capture.WebSession, cfg, paths, batcher.send)
+        session.outbound = batcher
+        await self._run(session.send_config)
+        try:
+            while not session.finished:
+                op, payload = await ws.arecv(reader)
+                if op == CLOSE:
+                    break
+                if op == TEXT:
+                    await self._run(session.handle_text, payload.decode())
+                else:
+                    await self._run(session.handle_binary, payload)
+        except (ConnectionError, OSError) as e:
+            log(f"  [{name}] connection lost: {e}")
+        except Exception as e:      # a protocol bug must still salvage the scan
+            log(f"  [{name}] ERROR in session: {e!r}")
+        if not session.finished and (session.frames_seen > 0 or session.raw_bytes > 0):
+            log(f"  [{name}] browser disconnected mid-session — salvaging what arrived.")
+            await self._run(session.finish)
+
+    async def _review(self, ws, reader, name, make_session, batcher):
+        """WebUIHandler._run_session, with the session's work on the pool."""
+        session = await self._run(make_session, batcher.send)
+        try:
+            await self._run(session.hello)
+            while not getattr(session, "finished", False):
+                op, payload = await ws.arecv(reader)
+                if op == CLOSE:
+                    break
+                if op == TEXT:
+                    await self._run(session.handle, json.loads(payload.decode()))
+        except (ConnectionError, OSError) as e:
+            log(f"  [{name}] connection lost: {e}")
+        except Exception as e:      # a protocol bug must not kill the server
+            log(f"  [{name}] ERROR in session: {e!r}")
+        finally:
+            close = getattr(session, "close", None)
+            if close is not None:
+                await self._run(close)
+
+
+async def serve(args):
+    stations = StationServer(args)
+    port = await stations.start(args.host, args.port)
+    log("")
+    chromeos_note(port)
+    log("  Each station is at /<NAME>/capture/, /<NAME>/review/ or /<NAME>/pages/;")
+    log("  the page at / lists them.")
+    log("")
+    log("  Ctrl+C here to stop.")
+    async with stations.server:
+        await stations.server.serve_forever()
+
+
+def main():
+    args = parse_args()
+    log("=" * 60)
+    log("Stations: capture and review over one port")
+    log("=" * 60)
+    try:
+        asyncio.run(serve(args))
+    except OSError as e:
+        log(f"ERROR: {e}")
+        if e.errno == errno.EADDRINUSE:
+            log("  The shared ScanStudio port is taken — another web app "
+                "(capture or a review) is still running. Finish or Ctrl+C "
+                "it, or pass --port.")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        log("\nDone.")
+
+
+if __name__ == "__main__":
+    main()
@@ -96,19 +96,126 @@ def camera_label(idx: int) -> str:
 # fps and avc1 10.2. Live capture at 4K is already encoder-bound, so
 # real-time recording keeps mp4v and pays the one-time proxy instead;
 # offline passes (normalize) prefer H.264, where throughput is free.
-VIDEO_CODECS = {"auto": ("avc1", "mp4v"), "h264": ("avc1",), "mp4v": ("mp4v",)}
+#
+# "x264" sidesteps that trade: raw frames are piped into an ffmpeg libx264
+# process (FfmpegWriter), which encodes on every core at a fast preset where
+# OpenCV's avc1 runs one thread at the default one. The result is real
+# H.264 with a short GOP — browser-playable and cheap to seek the moment
+# recording stops, so the web review needs no proxy. Without ffmpeg, or
+# with an ffmpeg built without libx264, it falls back to mp4v.
+VIDEO_CODECS = {"auto": ("avc1", "mp4v"), "h264": ("avc1",), "mp4v": ("mp4v",),
+                "x264": ("x264", "mp4v")}
+
+# ultrafast keeps 4K30 real-time on a laptop; slower presets shrink the file
+# if the CPU has headroom. One keyframe a second bounds any seek to a
+# second of decoding.
+X264_PRESETS = ("ultrafast", "superfast", "veryfast", "faster", "fast", "medium")
+X264_PRESET = "ultrafast"
+X264_CRF = 18
+X264_GOP_SEC = 1.0
+
 
+_FFMPEG_ENCODERS = {}        # ffmpeg executable -> the encoders it lists
 
-def open_video_writer(path, fps: float, size, codec: str = "auto"):
+
+def ffmpeg_encoders() -> frozenset:
+    """The encoder names the ffmpeg on PATH was built with; empty without one.
+
+    Asked once per executable: a missing encoder only shows once ffmpeg has
+    read its first frame, too late for a writer to fall back.
+    """
+    exe = shutil.which("ffmpeg")
+    if exe is None:
+        return frozenset()
+    if exe not in _FFMPEG_ENCODERS:
+        try:
+            out = subprocess.run([exe, "-hide_banner", "-encoders"],
+                                 capture_output=True, text=True, timeout=10).stdout
+        except (OSError, subprocess.SubprocessError):
+            out = ""
+        # " V....D libx264   libx264 H.264 ..." below a "------" rule
+        _FFMPEG_ENCODERS[exe] = frozenset(
+            line.split()[1] for line in out.split("------", 1)[-1].splitlines()
+            if len(line.split()) > 1)
+    return _FFMPEG_ENCODERS[exe]
+
+
+class FfmpegWriter:
+    """A cv2.VideoWriter stand-in that pipes BGR frames into ffmpeg/libx264.
+
+    ``write`` blocks while ffmpeg is behind (the pipe is full), which is the
+    same backpressure a slow OpenCV writer gives its caller.
+    """
+
+    def __init__(self, path, fps: float, size, preset: str = X264_PRESET,
+                 gop: "int | None" = None, crf: int = X264_CRF):
+        w, h = size
+        gop = gop or max(1, int(round(fps * X264_GOP_SEC)))
+        cmd = ["ffmpeg", "-y", "-loglevel", "error",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}",
+               "-r", f"{fps:g}", "-i", "pipe:0",
+               "-c:v", "libx264", "-preset", preset, "-crf", str(crf),
+               "-g", str(gop), "-threads", "0", "-pix_fmt", "yuv420p",
+               "-an", str(path)]
+        self.error = ""
+        self._err = []
+        try:
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                          stderr=subprocess.PIPE)
+        except OSError as e:
+            self._proc, self.error = None, str(e)
+            return
+        # Drain stderr on the side so a chatty failure can't block the pipe.
+        self._drain = threading.Thread(
+            target=lambda: self._err.append(self._proc.stderr.read()), daemon=True)
+        self._drain.start()
+
+    def isOpened(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def write(self, frame):
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.write(memoryview(np.ascontiguousarray(frame)).cast("B"))
+        except (BrokenPipeError, ValueError):
+            self.release()
+
+    def release(self):
+        """Finish the file; the writer's error text, "" on success."""
+        if self._proc is None:
+            return self.error
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        code = self._proc.wait()
+        self._drain.join()
+        if code != 0:
+            self.error = (b"".join(self._err).decode(errors="replace").strip()
+                          or f"ffmpeg exited {code}")
+        self._proc = None
+        return self.error
+
+
+def open_video_writer(path, fps: float, size, codec: str = "auto",
+                      preset: str = X264_PRESET, gop: "int | None" = None):
     """Open a VideoWriter for ``path``, preferring H.264.
 
     Returns ``(writer, fourcc)``; ``(None, "")`` if no codec opened. The
     fourcc that won is the caller's to report — it decides whether the
-    recording is playable in the browser review.
+    recording is playable in the browser review. "x264" (an FfmpegWriter
+    with ``preset`` and ``gop``) is reported as itself, though the file is
+    avc1 like OpenCV's H.264.
     """
     for tag in VIDEO_CODECS[codec]:
-        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*tag),
-                                 fps, size)
+        if tag == "x264":
+            if "libx264" not in ffmpeg_encoders():
+                continue
+            writer = FfmpegWriter(path, fps, size, preset=preset, gop=gop)
+        else:
+            writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*tag),
+                                     fps, size)
         if writer.isOpened():
             return writer, tag
         writer.release()
@@ -235,6 +342,10 @@ class ProjectPaths:
         self.json = self.base / "json"
         self.reports = self.base / "reports"
         self.pdf = self.base / "pdf"
+        # Display-sized renditions the browser reviews serve (previews.py).
+        self.previews = self.base / "previews"
+        # Page masks of images/, computed once per image (mask_store.py).
+        self.masks = self.data / "masks"
 
     def ensure_all(self):
         """Create all subdirectories."""
@@ -756,11 +867,22 @@ def measure_quad_offsets(img, quad_px, band_px=None):
         if s < 1.0
         else img
     )
-    mask = page_mask_robust(small)
+    return measure_work_offsets(small, s, quad_px, band_px)
+
+
+def measure_work_offsets(small, scale, quad_px, band_px=None, mask=None):
+    """``measure_quad_offsets`` for a frame already at the work size: the
+    full-res frame scaled by ``scale`` (``ImageCache.work``). ``quad_px``,
+    ``band_px`` and the offsets are in full-res px, as there. ``mask`` is
+    ``small``'s page mask when the caller has it (``MaskStore.get``)."""
+    if band_px is None:
+        band_px = TRACK_BAND_FRAC * small.shape[1] / scale
+    if mask is None:
+        mask = page_mask_robust(small)
     off, rel = edge_boundary_offsets(
-        mask, np.asarray(quad_px, dtype=float) * s, band=band_px * s
+        mask, np.asarray(quad_px, dtype=float) * scale, band=band_px * scale
     )
-    return [o / s for o in off], rel
+    return [o / scale for o in off], rel
 
 
 def quad_edge_bases(quad):
@@ -828,7 +950,8 @@ def rigid_shift(anchor_s, anchor_rel, s_window, rel_window):
 
 
 def consensus_geometry(images_dir, keyframes, cache_path=None,
-                       samples=CONSENSUS_SAMPLES, log_fn=None):
+                       samples=CONSENSUS_SAMPLES, log_fn=None, images=None,
+                       mask_store=None):
     """One crop box for the whole session, voted from a sample of frames.
 
     Computes the page mask on ``samples`` keyframes spread across the session,
@@ -843,7 +966,10 @@ def consensus_geometry(images_dir, keyframes, cache_path=None,
     full-res px], "edge_rel": [4 bools], "size": [W, H]}`` or None when there
     aren't enough readable same-sized frames or no page-sized region exists.
     Cached to ``cache_path`` keyed by the sampled files' identity, so the
-    ~2 s vote runs once per project, not once per run."""
+    ~2 s vote runs once per project, not once per run. Frames are read at the
+    work size through ``images`` (an ``ImageCache``; the shared one by
+    default), which the review's watchdog then finds already decoded, and
+    their masks taken from ``mask_store`` (a ``MaskStore``) when given."""
     cands = [kf["filename"] for kf in keyframes if not kf.get("is_cover")]
     if len(cands) < 3:
         return None
@@ -869,25 +995,23 @@ def consensus_geometry(images_dir, keyframes, cache_path=None,
 
     if log_fn:
         log_fn(f"Voting consensus crop box from {len(files)} frames…")
+    if images is None:
+        from image_cache import shared
+        images = shared()
     masks, size, scale = [], None, 1.0
     for p in files:
-        img = cv2.imread(str(p))
-        if img is None:
+        small, s, wh = images.work(p)
+        if small is None:
             continue
-        h, w = img.shape[:2]
         if size is None:
-            size = (w, h)
-            scale = min(1.0, TRACK_WORK_WIDTH / w)
-        elif (w, h) != size:
+            size, scale = wh, s
+        elif wh != size:
             # Mixed sizes mean images/ was already cropped in place (Phase 5
             # ran) — a vote over those is meaningless.
             continue
-        small = (
-            cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
-            if scale < 1.0
-            else img
-        )
-        masks.append(page_mask_robust(small) > 0)
+        mask = (mask_store.get(p, small) if mask_store is not None
+                else page_mask_robust(small))
+        masks.append(mask > 0)
     if len(masks) < 3:
         return None
 
@@ -15,10 +15,13 @@ connection is refused with an error message rather than queued.
 
 import json
 import os
+import socket
 import threading
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
 
-from miniws import CLOSE, TEXT, WebSocket, accept_key
+from miniws import CLOSE, TEXT, MessageBatcher, WebSocket, accept_key, negotiate_deflate
 from utils import log
 
 # One port for every ScanStudio web app (capture and both reviews): the
@@ -30,6 +33,11 @@ from utils import log
 DEFAULT_PORT = 8412
 
 CHUNK = 1 << 20
+# Let the kernel copy file bodies to the socket (os.sendfile) rather than
+# reading them through Python. Off only to compare (tests/bench_send_file.py).
+ZERO_COPY = hasattr(os, "sendfile")
+# For a URL that names its content's version: it never changes under it.
+IMMUTABLE = "private, max-age=31536000, immutable"
 
 CTYPES = {
     ".html": "text/html; charset=utf-8",
@@ -42,20 +50,28 @@ CTYPES = {
 }
 
 
-def send_file(handler, path, head_only=False):
+def send_file(handler, path, head_only=False, etag=None, cache="no-store"):
     """Reply with a file, honoring a single-range Range header (RFC 7233).
 
-    Streams from disk in 1 MB chunks — the scrubber's recording can be
-    gigabytes — and always advertises Accept-Ranges so Chrome knows the
-    <video> is seekable. An unsatisfiable range gets the 416 the spec asks
-    for; a malformed one is ignored (full 200 reply), which is also what the
-    spec asks for.
+    The body goes from the page cache to the socket without passing through
+    Python where the platform allows (``_send_body``) — the scrubber's
+    recording can be gigabytes — and the reply always advertises
+    Accept-Ranges so Chrome knows the <video> is seekable. An unsatisfiable
+    range gets the 416 the spec asks for; a malformed one is ignored (full
+    200 reply), which is also what the spec asks for. With an ``etag``, a
+    request whose If-None-Match names it gets a bodiless 304.
     """
     try:
         size = path.stat().st_size
     except OSError:
         handler.send_error(404)
         return
+    if etag is not None and etag in (handler.headers.get("If-None-Match") or ""):
+        handler.send_response(304)
+        handler.send_header("ETag", etag)
+        handler.send_header("Cache-Control", cache)
+        handler.end_headers()
+        return
     ctype = CTYPES.get(path.suffix.lower(), "application/octet-stream")
     start, end = 0, size - 1
     rng = handler.headers.get("Range")
@@ -86,24 +102,69 @@ def send_file(handler, path, head_only=False):
     handler.send_header("Content-Length", str(end - start + 1))
     if partial:
         handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
-    handler.send_header("Cache-Control", "no-store")
+    if etag is not None:
+        handler.send_header("ETag", etag)
+    handler.send_header("Cache-Control", cache)
     handler.end_headers()
     if head_only:
         return
     try:
         with open(path, "rb") as f:
-            f.seek(start)
-            left = end - start + 1
-            while left > 0:
-                chunk = f.read(min(CHUNK, left))
-                if not chunk:
-                    break
-                handler.wfile.write(chunk)
-                left -= len(chunk)
+            _send_body(handler, f, start, end - start + 1)
     except (BrokenPipeError, ConnectionResetError, OSError):
         pass                       # the browser aborted a seek; routine
 
 
+def _send_body(handler, f, offset, count):
+    """Write ``count`` bytes of ``f`` from ``offset`` after the headers.
+
+    A handler on a real socket uses ``socket.sendfile`` (os.sendfile, falling
+    back to plain sends on its own where there is none); a handler that
+    writes elsewhere may offer a ``sendfile(f, offset, count)`` of its own, as
+    the stations server's replies do. Anything else gets 1 MB reads and
+    writes.
+    """
+    if ZERO_COPY:
+        sendfile = getattr(handler, "sendfile", None)
+        sock = getattr(handler, "connection", None)
+        if sendfile is None and isinstance(sock, socket.socket):
+            handler.wfile.flush()              # the headers go first
+            sendfile = sock.sendfile
+        if sendfile is not None:
+            sendfile(f, offset, count)
+            return
+    f.seek(offset)
+    while count > 0:
+        chunk = f.read(min(CHUNK, count))
+        if not chunk:
+            break
+        handler.wfile.write(chunk)
+        count -= len(chunk)
+
+
+def send_image(handler, previews, name, head_only=False):
+    """Reply with review image ``name`` at the size the page draws it.
+
+    ``?size=N`` asks for N px of long edge, served from ``previews`` (see
+    previews.py); without it, the original. A ``?v=`` naming the image's
+    current version makes the reply cacheable for good, since the page's URL
+    changes when the image does. Otherwise the browser revalidates, and the
+    ETag makes that a 304.
+    """
+    query = parse_qs(urlsplit(handler.path).query)
+    try:
+        size = int(query.get("size", ["0"])[0])
+    except ValueError:
+        size = 0
+    path, etag = previews.rendition(Path(name).name, size)     # no traversal
+    if path is None:
+        handler.send_error(404)
+        return
+    fresh = query.get("v", [""])[0] == etag.strip('"').split("-")[0]
+    send_file(handler, path, head_only, etag=etag,
+              cache=IMMUTABLE if fresh else "no-cache")
+
+
 class WebUIServer(ThreadingHTTPServer):
     """HTTP server hosting one review page, one websocket session at a time.
 
@@ -166,15 +227,18 @@ class WebUIHandler(BaseHTTPRequestHandler):
         if key is None or "websocket" not in self.headers.get("Upgrade", "").lower():
             self.send_error(400, "WebSocket upgrade expected")
             return
+        extension, deflate = negotiate_deflate(self.headers.get("Sec-WebSocket-Extensions"))
         self.send_response(101, "Switching Protocols")
         self.send_header("Upgrade", "websocket")
         self.send_header("Connection", "Upgrade")
         self.send_header("Sec-WebSocket-Accept", accept_key(key))
+        if extension:
+            self.send_header("Sec-WebSocket-Extensions", extension)
         self.end_headers()
         self.wfile.flush()
         self.close_connection = True
 
-        ws = WebSocket(self.connection)
+        ws = WebSocket(self.connection, deflate=deflate)
         if not self.server.session_lock.acquire(blocking=False):
             ws.send_text(json.dumps({
                 "type": "error",
@@ -189,17 +253,10 @@ class WebUIHandler(BaseHTTPRequestHandler):
 
     def _run_session(self, ws):
         # Background threads (the p4 watchdog) push over the same socket the
-        # handler replies on, so every send goes through one lock.
-        send_lock = threading.Lock()
-
-        def send(msg):
-            try:
-                with send_lock:
-                    ws.send_text(json.dumps(msg))
-            except (OSError, ConnectionError):
-                pass
-
-        session = self.server.make_session(send)
+        # handler replies on; the batcher serializes them, and a watch's
+        # stream of frame messages goes out a few at a time.
+        batcher = MessageBatcher(ws)
+        session = self.server.make_session(batcher.send)
         log("  Browser connected")
         try:
             session.hello()
@@ -221,6 +278,7 @@ class WebUIHandler(BaseHTTPRequestHandler):
             close = getattr(session, "close", None)
             if close is not None:
                 close()
+        batcher.close()
         ws.close()
         log("  Browser disconnected")
         if getattr(session, "finished", False):
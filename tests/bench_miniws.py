@@ -0,0 +1,171 @@
+"""
+Benchmark: miniws receive path, in-place recv_into + numpy unmask vs. the
+previous accumulate-copy-and-big-int-XOR path.
+
+A client thread replays pre-built masked frames over a socketpair, the mix
+a web capture session sends: 640x360 analysis frames at 30 fps plus a
+recorder chunk a second, some of it fragmented. The server side receives
+them with each implementation and touches every payload the way
+handle_binary does (np.frombuffer and a sum). It reports messages per
+second, and the peak memory tracemalloc sees over two seconds of traffic,
+in a separate pass so the tracing doesn't skew the timing.
+
+  python tests/bench_miniws.py
+  python tests/bench_miniws.py --seconds 20 --frame 1280x720
+"""
+
+import argparse
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import miniws  # noqa: E402
+from miniws import BINARY, CLOSE, PING, PONG, TEXT, _CONT  # noqa: E402
+
+
+class LegacyWebSocket(miniws.WebSocket):
+    """The receive path as it was: bytearray accumulation, a bytes copy, a
+    repeated mask and a big-int XOR, and a join across fragments."""
+
+    def recv(self):
+        opcode, parts = None, []
+        while True:
+            fin, op, payload = self._read_frame()
+            if op == PING:
+                self._send_frame(PONG, payload)
+                continue
+            if op == PONG:
+                continue
+            if op == CLOSE:
+                return CLOSE, b""
+            if op in (TEXT, BINARY):
+                opcode = op
+            elif op != _CONT:
+                raise ConnectionError(f"unsupported opcode {op:#x}")
+            parts.append(payload)
+            if fin:
+                return opcode, b"".join(parts)
+
+    def _read_frame(self, offset=0):
+        b0, b1 = self._read_exact(2)
+        fin, opcode = bool(b0 & 0x80), b0 & 0x0F
+        masked, length = bool(b1 & 0x80), b1 & 0x7F
+        if length == 126:
+            (length,) = struct.unpack(">H", self._read_exact(2))
+        elif length == 127:
+            (length,) = struct.unpack(">Q", self._read_exact(8))
+        mask = self._read_exact(4) if masked else None
+        payload = self._read_exact(length) if length else b""
+        if mask:
+            payload = _bigint_mask(payload, mask)
+        return fin, opcode, payload
+
+    def _read_exact(self, n):
+        buf = bytearray()
+        while len(buf) < n:
+            chunk = self.sock.recv(min(n - len(buf), 1 << 20))
+            if not chunk:
+                raise ConnectionError("socket closed mid-frame")
+            buf += chunk
+        return bytes(buf)
+
+
+def _bigint_mask(payload, mask):
+    n = len(payload)
+    full = mask * (n // 4) + mask[:n % 4]
+    return (int.from_bytes(payload, "little")
+            ^ int.from_bytes(full, "little")).to_bytes(n, "little")
+
+
+def frame(opcode, payload, fin=True):
+    mask = os.urandom(4)
+    n = len(payload)
+    b0 = (0x80 if fin else 0) | opcode
+    if n < 126:
+        header = bytes([b0, 0x80 | n])
+    elif n < 1 << 16:
+        header = bytes([b0, 0x80 | 126]) + struct.pack(">H", n)
+    else:
+        header = bytes([b0, 0x80 | 127]) + struct.pack(">Q", n)
+    body = bytearray(payload)
+    miniws._xor_mask(body, mask)
+    return header + mask + bytes(body)
+
+
+def session_stream(w, h, fps, messages):
+    """(wire bytes, message count) for ``messages`` messages of a session."""
+    rng = np.random.default_rng(0)
+    analysis = b"\x01" + bytes(12) + rng.integers(0, 255, w * h, np.uint8).tobytes()
+    chunk = b"\x03" + bytes(4) + rng.integers(0, 255, 1 << 20, np.uint8).tobytes()
+    wire, count = bytearray(), 0
+    while count < messages:
+        for i in range(int(fps)):
+            if i == 0:                  # a recorder chunk, in two fragments
+                half = len(chunk) // 2
+                wire += frame(BINARY, chunk[:half], fin=False)
+                wire += frame(_CONT, chunk[half:])
+            else:
+                wire += frame(BINARY, analysis)
+            count += 1
+    return bytes(wire), count
+
+
+def run(cls, wire, count, trace=False):
+    a, b = socket.socketpair()
+    sender = threading.Thread(target=a.sendall, args=(wire,))
+    ws = cls(b)
+    if trace:
+        tracemalloc.start()
+    sender.start()
+    t0 = time.perf_counter()
+    checksum = 0
+    for _ in range(count):
+        _, payload = ws.recv()
+        checksum += int(np.frombuffer(payload, np.uint8, count=64, offset=13).sum())
+    elapsed = time.perf_counter() - t0
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    sender.join()
+    a.close(), b.close()
+    return elapsed, checksum, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=int, default=10,
+                        help="Seconds of session traffic to replay")
+    parser.add_argument("--frame", default="640x360", help="WxH of the analysis frames")
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+    w, h = (int(v) for v in args.frame.split("x"))
+
+    wire, count = session_stream(w, h, args.fps, int(args.seconds * args.fps))
+    print(f"stream: {count} messages, {len(wire) / 1e6:.0f} MB "
+          f"({args.seconds}s of {w}x{h} analysis at {args.fps:g} fps + 1 MB chunks)")
+
+    short, short_count = session_stream(w, h, args.fps, int(2 * args.fps))
+    results = {}
+    for name, cls in (("legacy", LegacyWebSocket), ("in-place", miniws.WebSocket)):
+        elapsed, checksum, _ = run(cls, wire, count)
+        _, _, peak = run(cls, short, short_count, trace=True)
+        results[name] = (elapsed, checksum)
+        print(f"{name:9s} {count / elapsed:7.0f} msg/s  {len(wire) / elapsed / 1e6:6.0f} MB/s"
+              f"   peak traced allocation {peak / 1e6:6.1f} MB")
+    assert results["legacy"][1] == results["in-place"][1], "payloads differ"
+    old, new = results["legacy"][0], results["in-place"][0]
+    print(f"payloads identical: yes   speedup {old / max(new, 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
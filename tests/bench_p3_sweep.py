@@ -0,0 +1,134 @@
+"""
+Benchmark: Phase 3 forward sweep vs. per-candidate seeking.
+
+Writes a synthetic book recording (20k frames by default: still spreads
+separated by sliding page turns), runs P1 (OpenCV) and P2 on it, then
+selects keyframes both ways — select_keyframe plus a winner re-read, as P3
+used to, and one sweep_select pass — checks they agree, and reports seeks
+avoided and the speedup.
+
+With ffmpeg on PATH the clip is H.264 with a long GOP (--gop), the case
+where every seek re-decodes from the previous I-frame; without it, OpenCV's
+mp4v (short GOP), which understates the gain.
+
+  python tests/bench_p3_sweep.py
+  python tests/bench_p3_sweep.py --frames 5000 --gop 60
+"""
+
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import p1_motion_signal as p1  # noqa: E402
+import p2_detect_peaks as p2  # noqa: E402
+import p3_select_keyframes as p3  # noqa: E402
+from frame_index import FrameReader  # noqa: E402
+
+FPS = 30.0
+STILL, TURN = 105, 15
+
+
+def book_frames(n, w, h):
+    rng = np.random.default_rng(3)
+    page, nxt = None, None
+    for i in range(n):
+        k, j = divmod(i, STILL + TURN)
+        if j == 0 or page is None:
+            page = cv2.resize(rng.integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8),
+                              (w, h), interpolation=cv2.INTER_CUBIC)
+            nxt = cv2.resize(rng.integers(0, 255, (h // 8, w // 8, 3), dtype=np.uint8),
+                             (w, h), interpolation=cv2.INTER_CUBIC)
+        if j < STILL:
+            yield page if j % 5 else cv2.GaussianBlur(page, (3, 3), 0)
+        else:
+            yield np.roll(nxt, (j - STILL + 1) * w // TURN, axis=1)
+
+
+def write_clip(path, n, w, h, gop):
+    if shutil.which("ffmpeg"):
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+               "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{w}x{h}", "-r", str(FPS),
+               "-i", "pipe:0", "-c:v", "libx264", "-preset", "ultrafast",
+               "-g", str(gop), "-pix_fmt", "yuv420p", str(path)]
+        proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        for f in book_frames(n, w, h):
+            proc.stdin.write(f.tobytes())
+        proc.stdin.close()
+        if proc.wait() == 0:
+            return f"H.264, GOP {gop}"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), FPS, (w, h))
+    for f in book_frames(n, w, h):
+        writer.write(f)
+    writer.release()
+    return "mp4v (OpenCV default GOP)"
+
+
+def seek_select(video, smoothed, spreads):
+    """P3's old loop: seek per candidate, then seek again for the winner."""
+    reader = FrameReader(video)         # no index: a plain POS_FRAMES seek per read
+    out = []
+    for sp in spreads:
+        result = p3.select_keyframe(reader, smoothed, sp["start_frame"], sp["end_frame"], 6, 0.5)
+        out.append((result, reader.read(result[0])))
+    reader.release()
+    return out, reader.seeks
+
+
+def sweep(video, smoothed, spreads):
+    cap = cv2.VideoCapture(str(video))
+    out = [(result, frame) for _, result, frame
+           in p3.sweep_select(cap, smoothed, spreads, 6, 0.5)]
+    cap.release()
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--size", default="1280x720", help="WxH of the clip")
+    parser.add_argument("--gop", type=int, default=250)
+    args = parser.parse_args()
+    w, h = (int(v) for v in args.size.split("x"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        t = time.time()
+        codec = write_clip(video, args.frames, w, h, args.gop)
+        print(f"clip: {args.frames} frames {w}x{h}, {codec} ({time.time() - t:.0f}s to write)")
+
+        diffs, meta, _ = p1.compute_motion_signal(str(video), 360, decoder="opencv")
+        smoothed = uniform_filter1d(diffs, size=15)
+        p2_args = argparse.Namespace(peak_height=5.0, min_distance=1.5, prominence=3.0,
+                                     long_spread=3.0, valley_motion=2.0,
+                                     valley_min_sec=0.15, valley_peak=4.0)
+        peaks = p2.detect_turns(smoothed, meta["fps"], p2_args)
+        spreads = p2.annotate_spreads(p2.build_spread_list(peaks, len(smoothed)), meta["fps"])
+
+        t = time.time()
+        old, seeks = seek_select(video, smoothed, spreads)
+        t_old = time.time() - t
+        t = time.time()
+        new = sweep(video, smoothed, spreads)
+        t_new = time.time() - t
+
+        assert len(old) == len(new)
+        for (r_old, f_old), (r_new, f_new) in zip(old, new):
+            assert r_old == r_new and np.array_equal(f_old, f_new)
+
+        print(f"spreads: {len(spreads)}   keyframes identical: yes")
+        print(f"seeks:   {seeks} -> 0  ({seeks} avoided)")
+        print(f"time:    {t_old:.1f}s -> {t_new:.1f}s  ({t_old / max(t_new, 1e-3):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Benchmark: webui.send_file with os.sendfile vs. the 1 MB read/write loop,
+on the range requests the P4 scrubber's <video> makes of a recording.
+
+Serves a file of random bytes from a real WebUIServer on localhost and
+plays three patterns against it, each with sendfile and without:
+
+  play    ``bytes=0-``, read a stretch, then hang up (Chrome starting playback)
+  seek    ``bytes=N-`` at random offsets, read 2 MB, hang up (scrubbing)
+  ranged  closed 4 MB ranges on one keep-alive connection
+
+It reports the time from request to first body byte (median and p95), the
+throughput, and the process CPU time per GB served. The client's own
+reading costs the same either way, so the CPU difference is the server's.
+
+  python tests/bench_send_file.py
+  python tests/bench_send_file.py --size-mb 4096 --seeks 200
+"""
+
+import argparse
+import os
+import random
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import webui  # noqa: E402
+
+READ = 1 << 18
+
+
+def request(sock, port, rng):
+    sock.sendall((f"GET /video HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                  f"Range: bytes={rng}\r\n\r\n").encode())
+
+
+def read_head(sock):
+    """Headers of one reply; (first body bytes, Content-Length, time of the
+    first body byte)."""
+    head = b""
+    while b"\r\n\r\n" not in head:
+        chunk = sock.recv(READ)
+        if not chunk:
+            raise ConnectionError("closed before the headers")
+        head += chunk
+    head, _, body = head.partition(b"\r\n\r\n")
+    while not body:
+        body = sock.recv(READ)
+    t = time.perf_counter()
+    length = next(int(line.split(b":")[1]) for line in head.split(b"\r\n")
+                  if line.lower().startswith(b"content-length:"))
+    return body, length, t
+
+
+def read_n(sock, have, n):
+    got = len(have)
+    while got < n:
+        chunk = sock.recv(min(READ, n - got))
+        if not chunk:
+            break
+        got += len(chunk)
+    return got
+
+
+def open_ended(port, offsets, take):
+    """One connection per request, dropped after ``take`` bytes, the way
+    Chrome abandons a range when the playhead moves."""
+    ttfb, sent = [], 0
+    for off in offsets:
+        sock = socket.create_connection(("127.0.0.1", port))
+        t0 = time.perf_counter()
+        request(sock, port, f"{off}-")
+        body, length, t1 = read_head(sock)
+        ttfb.append(t1 - t0)
+        sent += read_n(sock, body, min(take, length))
+        sock.close()
+    return ttfb, sent
+
+
+def closed_ranges(port, offsets, span):
+    ttfb, sent = [], 0
+    sock = socket.create_connection(("127.0.0.1", port))
+    for off in offsets:
+        t0 = time.perf_counter()
+        request(sock, port, f"{off}-{off + span - 1}")
+        body, length, t1 = read_head(sock)
+        ttfb.append(t1 - t0)
+        sent += read_n(sock, body, length)
+    sock.close()
+    return ttfb, sent
+
+
+def run(port, pattern, args, size, zero_copy):
+    webui.ZERO_COPY = zero_copy
+    rnd = random.Random(0)
+    mb = 1 << 20
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    if pattern == "play":
+        ttfb, sent = open_ended(port, [0] * 3, min(size, args.play_mb * mb))
+    elif pattern == "seek":
+        ttfb, sent = open_ended(port, [rnd.randrange(size - 2 * mb) for _ in range(args.seeks)],
+                                2 * mb)
+    else:
+        ttfb, sent = closed_ranges(port, [rnd.randrange(size - 4 * mb)
+                                          for _ in range(args.seeks)], 4 * mb)
+    wall, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    ttfb.sort()
+    return {"ttfb_p50_ms": statistics.median(ttfb) * 1e3,
+            "ttfb_p95_ms": ttfb[int(0.95 * (len(ttfb) - 1))] * 1e3,
+            "mb_s": sent / wall / 1e6, "cpu_s_per_gb": cpu / max(sent / 1e9, 1e-9)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size-mb", type=int, default=1024,
+                        help="Size of the served recording")
+    parser.add_argument("--seeks", type=int, default=100,
+                        help="Requests in the seek and ranged patterns")
+    parser.add_argument("--play-mb", type=int, default=256,
+                        help="MB read by each of the play pattern's requests")
+    args = parser.parse_args()
+    if not hasattr(os, "sendfile"):
+        print("no os.sendfile on this platform: both runs would be the read loop")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        blob = Path(tmp) / "rec.mp4"
+        with open(blob, "wb") as f:
+            block = os.urandom(1 << 20)
+            for _ in range(args.size_mb):
+                f.write(block)
+        size = blob.stat().st_size
+
+        def route(handler, path, head_only):
+            if path != "/video":
+                return False
+            webui.send_file(handler, blob, head_only)
+            return True
+
+        server = webui.WebUIServer(("127.0.0.1", 0), blob, lambda send: None, route)
+        server.handle_error = lambda *a: None    # the hang-ups are the point
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        port = server.server_address[1]
+        print(f"recording: {size / 1e6:.0f} MB (in the page cache)")
+        print(f"{'pattern':8s} {'path':9s} {'ttfb p50':>9s} {'p95':>8s} "
+              f"{'MB/s':>7s} {'CPU s/GB':>9s}")
+        try:
+            for pattern in ("play", "seek", "ranged"):
+                rows = {}
+                for name, zero_copy in (("read/write", False), ("sendfile", True)):
+                    rows[name] = r = run(port, pattern, args, size, zero_copy)
+                    print(f"{pattern:8s} {name:9s} {r['ttfb_p50_ms']:7.2f}ms "
+                          f"{r['ttfb_p95_ms']:6.2f}ms {r['mb_s']:7.0f} {r['cpu_s_per_gb']:9.3f}")
+                old, new = rows["read/write"], rows["sendfile"]
+                print(f"{'':8s} CPU per GB {old['cpu_s_per_gb'] / max(new['cpu_s_per_gb'], 1e-9):.1f}x "
+                      f"lower, throughput {new['mb_s'] / max(old['mb_s'], 1e-9):.1f}x")
+        finally:
+            server.shutdown()
+            webui.ZERO_COPY = hasattr(os, "sendfile")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Tests for the browser capture link's analysis stream (analysis_link.py).
+
+A delta frame must decode to exactly what the page's reference holds after
+encoding it, for frames that don't fill whole blocks too, and carry far
+fewer bytes than a raw frame when the page is still. The adapter must step
+down under lag or a growing recording backlog, hold through its cooldown,
+and step back up only after a long clear stretch.
+
+Run standalone (`python tests/test_analysis_link.py`) or under pytest.
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import analysis_link as al  # noqa: E402
+
+
+def page(seed, h=90, w=150):
+    rng = np.random.default_rng(seed)
+    return rng.integers(60, 200, size=(h, w), dtype=np.uint8)
+
+
+def test_delta_round_trip_is_exact_against_the_reference():
+    base = page(0)
+    dec = al.DeltaDecoder()
+    dec.reset(base)
+    ref = al.reference_frame(base)
+    rng = np.random.default_rng(1)
+    for k in range(6):
+        noisy = np.clip(base.astype(int) + rng.integers(-1, 2, base.shape), 0, 255)
+        frame = noisy.astype(np.uint8)
+        frame[20:50, 30 + k * 10:70 + k * 10] = 255 - frame[20:50, 30 + k * 10:70 + k * 10]
+        payload, ref = al.encode_delta(ref, frame)
+        out = dec.decode(150, 90, payload)
+        assert np.array_equal(out, ref[:90, :150])
+        if k == 0:                                      # the region that moved
+            assert np.array_equal(out[20:50, 30:70], frame[20:50, 30:70])
+        # Held-back blocks differ from the frame by sensor noise alone.
+        assert np.abs(out.astype(int) - frame.astype(int)).max() <= 2
+
+
+def test_still_page_costs_a_fraction_of_a_raw_frame():
+    base = page(0)
+    ref = al.reference_frame(base)
+    payload, _ = al.encode_delta(ref, base.copy())
+    assert len(payload) < base.size / 50
+    dec = al.DeltaDecoder()
+    assert dec.decode(150, 90, payload) is None        # no reference yet
+    dec.reset(base)
+    assert dec.decode(160, 90, payload) is None        # wrong size
+
+
+def test_levels_run_from_the_configured_size_down():
+    levels = al.link_levels(360, 30.0)
+    assert levels[0] == {"height": 360, "fps": 30.0}
+    assert levels[-1] == {"height": 120, "fps": 10.0}
+    assert all(a["height"] * a["fps"] >= b["height"] * b["fps"]
+               for a, b in zip(levels, levels[1:]))
+
+
+def test_adapter_steps_down_under_congestion_and_up_after_a_clear_stretch():
+    ad = al.LinkAdapter(al.link_levels(360, 30.0))
+    assert ad.observe(0.0, 2.0, 0) == 1                 # lag
+    assert ad.observe(2.0, 3.0, 40e6) is None           # cooldown
+    assert ad.observe(5.0, 0.1, 40e6) is None           # backlog, but not growing
+    assert ad.observe(7.0, 0.1, 50e6) == 2              # ... now growing
+    t = 7.0 + al.COOLDOWN_SEC
+    for _ in range(al.CLEAR_REPORTS - 1):
+        assert ad.observe(t, 0.05, 1e6) is None
+        t += 2.0
+    assert ad.observe(t, 0.05, 1e6) == 1
+    assert [h["reason"] for h in ad.history] == ["lag", "queue", "clear"]
+    fixed = al.LinkAdapter(al.link_levels(360, 30.0), adaptive=False)
+    assert fixed.observe(0.0, 9.0, 90e6) is None and fixed.level == 0
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
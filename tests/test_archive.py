@@ -0,0 +1,154 @@
+"""
+Tests for archival recording (P0 --archive) and its reader.
+
+The recorder must send every frame to the proxy and exactly the frames within
+the margin of a still frame, or of a kept one, to the full-resolution
+encoder, giving every pool slot back. Reading an archive must serve those
+frames from the full-resolution stream, frame-exact, and scale the proxy up
+for the rest. An archive whose files changed is ignored, and a recording
+without one reads as a plain FrameReader.
+
+Run standalone (`python tests/test_archive.py`) or under pytest.
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import archive as ar  # noqa: E402
+from frame_index import FrameReader, build_index  # noqa: E402
+from frame_pool import FramePool  # noqa: E402
+from live_encoder import ThreadEncoder  # noqa: E402
+
+W, H = 160, 120
+PW, PH = 80, 60
+
+
+def numbered(i):
+    f = np.full((H, W, 3), (i * 7) % 256, np.uint8)
+    cv2.putText(f, str(i), (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+    return f
+
+
+class FakeEncoder:
+    def __init__(self, pool):
+        self.pool, self.slots = pool, []
+
+    def put(self, slot, t):
+        self.slots.append(int(self.pool.view(slot)[0, 0, 0]))
+        self.pool.release(slot)
+
+
+def record(recorder, pool, n, still=(), keep=()):
+    for i in range(n):
+        slot = pool.acquire()
+        pool.view(slot)[...] = i
+        recorder.put(i, slot, 0.0, np.zeros((PH, PW, 3), np.uint8))
+        if i in keep:
+            recorder.keep(i)
+        recorder.advance(i, i in still)
+        pool.release(slot)                  # the loop's own reference
+    return recorder.finish()
+
+
+def test_recorder_keeps_the_margin_around_still_and_kept_frames():
+    pool = FramePool((4, 4, 3), 0, min_slots=8)
+    proxy_pool = FramePool((PH, PW, 3), 0, min_slots=2)
+    full, proxy = FakeEncoder(pool), FakeEncoder(proxy_pool)
+    recorder = ar.ArchiveRecorder(pool, full, proxy_pool, proxy, margin_frames=3)
+    full_pos = record(recorder, pool, 60, still={20, 21, 22}, keep={45})
+    expected = sorted(set(range(17, 26)) | set(range(42, 49)))
+    assert full.slots == expected
+    assert list(np.flatnonzero(full_pos >= 0)) == expected
+    assert list(full_pos[expected]) == list(range(len(expected)))
+    assert len(proxy.slots) == 60
+    assert pool.in_use() == 0 and proxy_pool.in_use() == 0
+
+
+def test_reader_serves_full_res_in_windows_and_the_proxy_elsewhere():
+    with tempfile.TemporaryDirectory() as tmp:
+        video, data = Path(tmp) / "book.mp4", Path(tmp) / "data"
+        data.mkdir()
+        pool = FramePool((H, W, 3), 0, min_slots=8)
+        proxy_pool = FramePool((PH, PW, 3), 0, min_slots=4)
+        full = ThreadEncoder(pool, str(ar.full_res_path(video)), 30.0, (W, H), "mp4v")
+        proxy = ThreadEncoder(proxy_pool, str(video), 30.0, (PW, PH), "mp4v")
+        recorder = ar.ArchiveRecorder(pool, full, proxy_pool, proxy, margin_frames=4)
+        frames = [numbered(i) for i in range(90)]
+        for i, f in enumerate(frames):
+            slot = pool.acquire()
+            np.copyto(pool.view(slot), f)
+            recorder.put(i, slot, time.monotonic(),
+                         cv2.resize(f, (PW, PH), interpolation=cv2.INTER_AREA))
+            recorder.advance(i, 30 <= i < 40)
+            pool.release(slot)
+        full_pos = recorder.finish()
+        proxy.close()
+        full.close()
+        build_index(data, video)
+        ar.build_archive_index(data, video, full_pos, (W, H))
+
+        held = [int(p) for p in full_pos if p >= 0]
+        assert held == list(range(18)) and full_pos[26] == 0 and full_pos[44] == -1
+        full_frames = []
+        cap = cv2.VideoCapture(str(ar.full_res_path(video)))
+        while True:
+            ok, f = cap.read()
+            if not ok:
+                break
+            full_frames.append(f)
+        cap.release()
+        assert len(full_frames) == 18
+
+        with ar.open_reader(data, video) as reader:
+            assert isinstance(reader, ar.ArchiveReader) and len(reader) == 90
+            for i in (44, 26, 35, 43, 5, 89):
+                frame = reader.read(i)
+                assert frame.shape == (H, W, 3)
+                if 26 <= i < 44:
+                    assert reader.full_res(i)
+                    assert np.array_equal(frame, full_frames[i - 26]), i
+                else:
+                    assert not reader.full_res(i)
+                    diff = np.abs(frame.astype(int) - frames[i].astype(int)).mean()
+                    assert diff < 20, (i, diff)
+            assert reader.read(90) is None
+
+        time.sleep(0.01)
+        ar.full_res_path(video).write_bytes(b"re-recorded")
+        assert ar.load_archive(data, video) is None
+
+
+def test_open_reader_without_an_archive_is_a_frame_reader():
+    with tempfile.TemporaryDirectory() as tmp:
+        video, data = Path(tmp) / "book.mp4", Path(tmp) / "data"
+        data.mkdir()
+        writer = cv2.VideoWriter(str(video), cv2.VideoWriter_fourcc(*"mp4v"), 30.0, (W, H))
+        for i in range(20):
+            writer.write(numbered(i))
+        writer.release()
+        with ar.open_reader(data, video) as reader:
+            assert isinstance(reader, FrameReader)
+            assert reader.full_res(7) and reader.read(7).shape == (H, W, 3)
+        assert (data / "frame_index.npz").exists()
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
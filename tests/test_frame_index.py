@@ -0,0 +1,196 @@
+"""
+Tests for the frame index sidecar and FrameReader.
+
+Every read through the index must return exactly the frame a sequential
+decode reaches at that position — in any order, across GOP boundaries, and
+on B-frame H.264 where packets arrive out of presentation order. The index
+must be rebuilt when the recording changes under it, and a seek that lands
+past its target must cost a few GOPs, not a decode from frame 0.
+
+Run standalone (`python tests/test_frame_index.py`) or under pytest.
+"""
+
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import frame_index as fx  # noqa: E402
+from test_single_pass import write_book  # noqa: E402
+
+
+def decode_all(video):
+    cap = cv2.VideoCapture(str(video))
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def write_bframe_clip(path, n=240, gop=50):
+    """A numbered H.264 clip with B-frames, or False without ffmpeg."""
+    if shutil.which("ffmpeg") is None:
+        return False
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "bgr24",
+           "-s", "160x120", "-r", "30", "-i", "pipe:0", "-c:v", "libx264",
+           "-g", str(gop), "-sc_threshold", "0", "-bf", "2", "-pix_fmt", "yuv420p", str(path)]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+    for i in range(n):
+        f = np.full((120, 160, 3), (i * 7) % 256, np.uint8)
+        cv2.putText(f, str(i), (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+        proc.stdin.write(f.tobytes())
+    proc.stdin.close()
+    return proc.wait() == 0
+
+
+def check_random_reads(video, data_dir):
+    index = fx.build_index(data_dir, video)
+    reference = decode_all(video)
+    assert index is not None and len(index["pts"]) == len(reference)
+    assert index["key"][0] == 1 and index["key"].sum() > 1
+    assert np.all(index["sync"] <= np.arange(len(reference)))
+    assert np.all(index["key"][index["sync"]] == 1)
+    order = list(range(len(reference)))
+    random.Random(7).shuffle(order)
+    with fx.FrameReader(video, index) as reader:
+        for fi in order[:80] + [5, 6, 7, 4, len(reference) - 1]:
+            assert np.array_equal(reader.read(fi), reference[fi]), fi
+        assert reader.read(len(reference)) is None
+    return index
+
+
+def test_reads_match_sequential_decode_mp4v():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        check_random_reads(video, Path(tmp))
+
+
+def test_reads_match_sequential_decode_bframes():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "clip.mp4"
+        if not write_bframe_clip(video):
+            print("  (ffmpeg not installed — skipped)")
+            return
+        index = check_random_reads(video, Path(tmp))
+        assert list(np.flatnonzero(index["key"])) == [0, 50, 100, 150, 200]
+
+
+def test_forward_steps_decode_instead_of_seeking():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        index = fx.build_index(Path(tmp), video)
+        with fx.FrameReader(video, index) as reader:
+            for fi in range(20, 40):
+                reader.read(fi)
+            assert reader.seeks == 1
+            reader.read(30)     # behind: one seek back to 30's keyframe
+            assert reader.seeks == 2
+            assert reader.grabs <= 20 + 30 - int(index["sync"][30])
+
+
+class OvershootingCap:
+    """A capture whose position seeks land ``by`` frames past the target, as
+    a demuxer fooled by its timestamps does."""
+
+    def __init__(self, cap, by):
+        self.cap, self.by = cap, by
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES and value:
+            value += self.by
+        return self.cap.set(prop, value)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+def test_an_overshooting_seek_backs_off_a_gop_at_a_time():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        reference = decode_all(video)
+        index = fx.build_index(Path(tmp), video)
+        gop = int(np.diff(np.flatnonzero(index["key"])).max())
+        with fx.FrameReader(video, index) as reader:
+            reader.cap = OvershootingCap(reader.cap, by=gop + 3)
+            assert np.array_equal(reader.read(400), reference[400])
+            # Two sync points back, then forward: never from frame 0.
+            assert reader.seeks <= 4 and reader.grabs <= 4 * gop, (
+                reader.seeks, reader.grabs)
+
+
+def test_index_is_rebuilt_when_the_recording_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        video = root / "book.mp4"
+        write_book(video)
+        first = fx.ensure_index(root, video)
+        assert fx.load_index(root, video) is not None
+        time.sleep(0.01)
+        writer = cv2.VideoWriter(str(video), cv2.VideoWriter_fourcc(*"mp4v"), 30, (64, 48))
+        for _ in range(10):
+            writer.write(np.zeros((48, 64, 3), np.uint8))
+        writer.release()
+        assert fx.load_index(root, video) is None
+        again = fx.ensure_index(root, video)
+        assert len(again["pts"]) == 10 != len(first["pts"])
+
+
+def test_reviews_build_the_index_in_the_background():
+    from archive import open_reader
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        video = root / "book.mp4"
+        write_book(video)
+        # Not built on the insert path: a plain seek until it exists.
+        with open_reader(root, video, build=False) as reader:
+            assert reader.index is None and reader.read(10) is not None
+        assert not (root / fx.INDEX_FILE).exists()
+        t = fx.index_in_background(root, video)
+        assert fx.index_in_background(root, video) in (t, None)  # one build
+        t.join(30)
+        assert fx.index_in_background(root, video) is None      # current
+        with open_reader(root, video, build=False) as reader:
+            assert reader.index is not None
+        assert not [p for p in root.iterdir() if p.name.endswith(".tmp.npz")]
+
+
+def test_unindexed_reader_falls_back_to_position_seeks():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        reference = decode_all(video)
+        with fx.FrameReader(video) as reader:
+            for fi in (90, 10, 11, 200):
+                assert np.array_equal(reader.read(fi), reference[fi])
+            assert reader.seeks == 3
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
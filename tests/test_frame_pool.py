@@ -0,0 +1,93 @@
+"""
+Tests for live capture's preallocated frame pool.
+
+Slots must come back exactly when their last holder lets go, the pool must
+never hold more than its byte budget allows, and a capture loop that runs
+out of slots must wait for the encoder — counted as a stall — rather than
+allocate.
+
+Run standalone (`python tests/test_frame_pool.py`) or under pytest.
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from frame_pool import FramePool  # noqa: E402
+
+SHAPE = (48, 64, 3)
+FRAME = 48 * 64 * 3
+
+
+def test_budget_sets_slot_count():
+    pool = FramePool(SHAPE, 10 * FRAME + FRAME // 2)
+    assert pool.slots == 10 and pool.nbytes == 10 * FRAME
+    assert FramePool(SHAPE, FRAME, min_slots=4).slots == 4
+
+
+def test_slot_returns_after_last_release():
+    pool = FramePool(SHAPE, 2 * FRAME)
+    a = pool.acquire()
+    pool.retain(a)                  # window + encoder
+    pool.release(a)
+    assert pool.in_use() == 1
+    pool.release(a)
+    assert pool.in_use() == 0
+    b = pool.acquire()
+    pool.view(b)[...] = 7
+    assert np.shares_memory(pool.view(b), pool.slab)
+    assert pool.stats()["peak_in_use"] == 1 and pool.stats()["frames"] == 2
+
+
+def test_full_pool_waits_for_encoder_and_counts_the_stall():
+    pool = FramePool(SHAPE, 2 * FRAME)
+    held = [pool.acquire(), pool.acquire()]
+
+    def encoder():
+        time.sleep(0.05)
+        pool.release(held[0])
+
+    threading.Thread(target=encoder).start()
+    slot = pool.acquire()
+    assert slot == held[0]
+    stats = pool.stats()
+    assert stats["stalls"] == 1 and stats["stall_sec"] >= 0.04
+    assert stats["peak_in_use"] == 2 and stats["slots"] == 2
+
+
+def test_pipeline_never_exceeds_budget():
+    pool = FramePool(SHAPE, 6 * FRAME, min_slots=6)
+    window, queue = [], []
+    for i in range(200):
+        slot = pool.acquire()
+        pool.view(slot)[...] = i % 256
+        pool.retain(slot)
+        queue.append(slot)
+        if len(window) == 3:
+            pool.release(window.pop(0))
+        window.append(slot)
+        if len(queue) == 2:         # an encoder two frames behind
+            pool.release(queue.pop(0))
+    assert pool.stats()["peak_in_use"] <= 6
+    assert pool.stats()["stalls"] == 0
+    assert int(pool.view(window[-1])[0, 0, 0]) == 199 % 256
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
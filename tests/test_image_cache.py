@@ -0,0 +1,113 @@
+"""
+Tests for the shared decoded-image cache (image_cache.py).
+
+A work-size read must come out exactly the size the old full decode plus
+``cv2.resize(fx=s)`` gave, and close to it in content, decoded at reduced
+scale. Entries are shared read-only, counted, evicted least recently used
+past the budget, and a file rewritten in place must be decoded again.
+
+Run standalone (`python tests/test_image_cache.py`) or under pytest.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from image_cache import ImageCache  # noqa: E402
+from utils import TRACK_WORK_WIDTH, measure_quad_offsets, measure_work_offsets  # noqa: E402
+
+
+def spread(w=3840, h=2160):
+    """A bright page on a dark table, with some texture for the JPEG."""
+    img = np.full((h, w, 3), 40, np.uint8)
+    img[h // 8: h * 7 // 8, w // 6: w * 5 // 6] = (232, 238, 244)
+    rng = np.random.default_rng(0)
+    img += rng.integers(0, 8, img.shape, dtype=np.uint8)
+    return img
+
+
+def test_work_size_matches_the_full_decode_path():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "frame000010.jpg"
+        cv2.imwrite(str(path), spread())
+        cache = ImageCache()
+        small, s, size = cache.work(path)
+        full = cv2.imread(str(path))
+        ref = cv2.resize(full, None, fx=s, fy=s, interpolation=cv2.INTER_AREA)
+        assert size == (3840, 2160) and s == TRACK_WORK_WIDTH / 3840
+        assert small.shape == ref.shape
+        assert np.abs(small.astype(int) - ref.astype(int)).mean() < 2
+        assert cache.counts["reduced"] == 1
+
+        # The watchdog's measurement agrees with the full-res path.
+        quad = np.array([[640, 270], [3200, 270], [3200, 1890], [640, 1890]], float)
+        off_full, rel_full = measure_quad_offsets(full, quad)
+        off_work, rel_work = measure_work_offsets(small, s, quad, 0.04 * 3840)
+        assert rel_full == rel_work
+        assert max(abs(a - b) for a, b in zip(off_full, off_work)) < 6
+
+
+def test_hits_read_only_sharing_and_rewrites():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "frame000010.jpg"
+        cv2.imwrite(str(path), spread(1200, 800))
+        cache = ImageCache()
+        a = cache.full(path)
+        assert cache.full(path) is a
+        small, s, _ = cache.work(path)           # no smaller than the work width
+        assert s == 1.0 and small is a
+        assert cache.counts["misses"] == 2 and cache.counts["hits"] == 2
+        try:
+            a[0, 0] = 0
+            raise AssertionError("a shared image must be read-only")
+        except ValueError:
+            pass
+        # Crop rewrites the file in place: the next read decodes it afresh.
+        cv2.imwrite(str(path), spread(600, 400))
+        st = path.stat()
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert cache.full(path).shape == (400, 600, 3)
+        assert cache.full(Path(tmp) / "missing.jpg") is None
+
+
+def test_least_recently_used_go_past_the_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(4):
+            p = Path(tmp) / f"f{i}.jpg"
+            cv2.imwrite(str(p), spread(1000, 1000))     # 3 MB decoded
+            paths.append(p)
+        cache = ImageCache(budget_mb=7)
+        cache.full(paths[0])
+        cache.full(paths[1])
+        cache.full(paths[0])                      # 0 is now the most recent
+        cache.full(paths[2])                      # evicts 1
+        st = cache.stats()
+        assert st["entries"] == 2 and st["evicted"] == 1 and st["mb"] <= 7
+        misses = cache.counts["misses"]
+        cache.full(paths[0])
+        assert cache.counts["misses"] == misses
+        cache.full(paths[1])
+        assert cache.counts["misses"] == misses + 1
+        assert "hit" in cache.summary()
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
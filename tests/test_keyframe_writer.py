@@ -0,0 +1,95 @@
+"""
+Tests for the asynchronous keyframe writer both live front ends commit through.
+
+An array must land on disk as exactly the JPEG cv2.imencode makes, and the
+frame's release callback must run once. Undo must hold at every stage: a
+capture discarded before its write starts, or while it is mid-flight, never
+shows up in images/; one discarded after it landed is deleted.
+
+Run standalone (`python tests/test_keyframe_writer.py`) or under pytest.
+"""
+
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from keyframe_writer import KeyframeWriter  # noqa: E402
+
+
+def frame(v):
+    f = np.full((120, 160, 3), v, np.uint8)
+    cv2.putText(f, str(v), (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+    return f
+
+
+def test_array_is_written_as_imencode_jpeg_and_released_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        done, released = [], []
+        w = KeyframeWriter(Path(tmp), jpeg_quality=90,
+                           on_done=lambda *a: done.append(a))
+        img = frame(40)
+        w.submit("frame000001.jpg", img, release=lambda: released.append(1))
+        w.submit("frame000002.jpg", b"\xff\xd8 raw bytes")
+        stats = w.close()
+        ok, jpg = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        assert (Path(tmp) / "frame000001.jpg").read_bytes() == jpg.tobytes()
+        assert (Path(tmp) / "frame000002.jpg").read_bytes() == b"\xff\xd8 raw bytes"
+        assert released == [1]
+        assert sorted(d[0] for d in done) == ["frame000001.jpg", "frame000002.jpg"]
+        assert stats["written"] == 2 and stats["pending"] == 0
+        assert sorted(p.name for p in Path(tmp).iterdir()) == [
+            "frame000001.jpg", "frame000002.jpg"]       # no temp files left
+
+
+def test_undo_while_in_flight_never_lands():
+    with tempfile.TemporaryDirectory() as tmp:
+        gate, entered = threading.Event(), threading.Event()
+
+        def hold():                     # runs after the encode, before the write
+            entered.set()
+            gate.wait(5)
+
+        w = KeyframeWriter(Path(tmp), workers=1)
+        w.submit("frame000010.jpg", frame(10), release=hold)
+        w.submit("frame000020.jpg", frame(20))          # queued behind it
+        assert entered.wait(5)
+        w.discard("frame000010.jpg")                    # mid-flight
+        w.discard("frame000020.jpg")                    # not started yet
+        assert w.pending() == 2
+        gate.set()
+        w.flush()
+        assert not list(Path(tmp).iterdir())
+        assert w.close()["discarded"] == 2
+
+
+def test_undo_after_write_deletes_and_recapture_wins():
+    with tempfile.TemporaryDirectory() as tmp:
+        w = KeyframeWriter(Path(tmp))
+        w.submit("frame000005.jpg", b"first")
+        w.flush()
+        w.discard("frame000005.jpg")
+        assert not (Path(tmp) / "frame000005.jpg").exists()
+        w.submit("frame000005.jpg", b"second")
+        w.close()
+        assert (Path(tmp) / "frame000005.jpg").read_bytes() == b"second"
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
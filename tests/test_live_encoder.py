@@ -0,0 +1,155 @@
+"""
+Tests for live capture's encoders and frame-delivery accounting.
+
+The process encoder must write exactly what the thread encoder writes,
+reading frames from the shared pool rather than from pickled copies, and
+must hand every slot back once it has written it. The x264 pipe writer
+must produce browser-playable H.264 with the requested GOP, and fall back
+to mp4v without ffmpeg or its libx264. FrameTiming must count late and dropped frames from
+delivery gaps.
+
+Run standalone (`python tests/test_live_encoder.py`) or under pytest.
+"""
+
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import utils  # noqa: E402
+from frame_index import scan_index  # noqa: E402
+from frame_pool import FramePool, SharedFramePool  # noqa: E402
+from live_encoder import FrameTiming, open_encoder  # noqa: E402
+
+W, H, N = 160, 120, 40
+
+
+def record(kind, path, codec="mp4v", **writer_opts):
+    cls = SharedFramePool if kind == "process" else FramePool
+    pool = cls((H, W, 3), 4 * W * H * 3)
+    encoder = open_encoder(kind, pool, path, 30.0, (W, H), codec, **writer_opts)
+    assert encoder.codec == codec
+    for i in range(N):
+        slot = pool.acquire()
+        frame = pool.view(slot)
+        frame[...] = (i * 5) % 256
+        cv2.putText(frame, str(i), (10, 80), cv2.FONT_HERSHEY_SIMPLEX, 1.5,
+                    (255, 255, 255), 3)
+        encoder.put(slot, time.monotonic())     # the loop's ref goes to the encoder
+    stats = encoder.close()
+    assert pool.in_use() == 0
+    assert stats["encoder"] == kind and stats["frames_encoded"] == N
+    assert stats["writer_error"] == ""
+    pool_stats = pool.stats()
+    pool.close()
+    return pool_stats
+
+
+def decode(path):
+    cap = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def test_process_encoder_writes_what_the_thread_encoder_writes():
+    with tempfile.TemporaryDirectory() as tmp:
+        a, b = Path(tmp) / "thread.mp4", Path(tmp) / "process.mp4"
+        record("thread", a)
+        stats = record("process", b)
+        assert stats["slots"] == 4 and stats["frames"] == N
+        fa, fb = decode(a), decode(b)
+        assert len(fa) == len(fb) == N
+        assert all(np.array_equal(x, y) for x, y in zip(fa, fb))
+
+
+def test_x264_pipe_records_browser_playable_short_gop():
+    if shutil.which("ffmpeg") is None:
+        print("  (ffmpeg not installed — skipped)")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "x264.mp4"
+        record("process", path, codec="x264", preset="ultrafast", gop=10)
+        cap = cv2.VideoCapture(str(path))
+        code = int(cap.get(cv2.CAP_PROP_FOURCC))
+        cap.release()
+        assert code.to_bytes(4, "little") in (b"avc1", b"h264")    # as P4 probes it
+        frames = decode(path)
+        assert len(frames) == N
+        assert abs(float(frames[7].mean()) - 35) < 8
+        _, key = scan_index(path)
+        assert list(np.flatnonzero(key)) == list(range(0, N, 10))
+
+
+def test_x264_falls_back_to_mp4v_without_ffmpeg():
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(utils.shutil, "which", return_value=None):
+        writer, codec = utils.open_video_writer(Path(tmp) / "x.mp4", 30.0, (W, H), "x264")
+        assert codec == "mp4v"
+        writer.release()
+
+
+def test_x264_falls_back_to_mp4v_with_an_ffmpeg_without_libx264():
+    listing = " V..... = Video\n ------\n V....D mpeg4    MPEG-4 part 2\n"
+    with tempfile.TemporaryDirectory() as tmp, \
+            mock.patch.object(utils.shutil, "which", return_value="/opt/ffmpeg"), \
+            mock.patch.object(utils.subprocess, "run",
+                              return_value=mock.Mock(stdout=listing)), \
+            mock.patch.dict(utils._FFMPEG_ENCODERS, clear=True):
+        assert utils.ffmpeg_encoders() == {"mpeg4"}
+        writer, codec = utils.open_video_writer(Path(tmp) / "x.mp4", 30.0, (W, H), "x264")
+        assert codec == "mp4v"
+        writer.release()
+
+
+def test_dead_encoder_hands_its_slots_back():
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = SharedFramePool((H, W, 3), 3 * W * H * 3)
+        encoder = open_encoder("process", pool, Path(tmp) / "x.mp4", 30.0, (W, H), "mp4v")
+        encoder._proc.kill()
+        deadline = time.monotonic() + 10
+        for _ in range(10):                     # more frames than slots
+            encoder.put(pool.acquire(), time.monotonic())
+            assert time.monotonic() < deadline
+        encoder._reaper.join(timeout=5)
+        assert encoder.dead and pool.in_use() == 0
+        pool.close()
+
+
+def test_frame_timing_counts_late_and_dropped():
+    timing = FrameTiming(30.0)
+    t = 0.0
+    for gap in [1, 1, 1.4, 3, 1, 2, 1]:       # in frame periods
+        t += gap / 30.0
+        timing.tick(t)
+    stats = timing.stats()
+    assert stats["late_frames"] == 2            # the 3- and 2-period gaps
+    assert stats["dropped_frames"] == 3         # two missing, then one
+    assert abs(stats["max_gap_ms"] - 100.0) < 0.2
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,150 @@
+"""
+Tests for the offline replay of the live detector.
+
+Replay must make exactly the captures and turns LiveDetector makes online,
+for every setting in a grid and across gap-filled spans, from nothing but
+the motion signal and feature table a session saves, in early-capture mode
+as well (with its upgrades applied). Tuning must rank the
+same results whether the grid runs in one process or is spread over several.
+
+Run standalone (`python tests/test_live_replay.py`) or under pytest.
+"""
+
+import json
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from frame_source import FEATURES_FILE  # noqa: E402
+from live_replay import agreement, grid, replay, trailing_mean, tune  # noqa: E402
+from live_state import LiveDetector  # noqa: E402
+
+H, W = 90, 160
+FPS = 30.0
+
+
+def field(seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(80, 170, size=(H, W), dtype=np.uint8)
+
+
+def session_frames(seed=7, pages=6):
+    """Still stretches with soft and sharp frames, separated by page turns
+    of random length; (frame, span) pairs, some spans covering drops."""
+    rng = np.random.default_rng(seed)
+    out, k = [], 0
+    for page in range(pages):
+        base = field(page)
+        speck = base.copy()
+        speck[::4, ::4] += 12               # sharper, barely any motion
+        for _ in range(int(rng.integers(15, 40))):
+            out.append((speck if rng.random() < 0.2 else base, 1))
+        for _ in range(int(rng.integers(3, 12))):
+            k += 1
+            out.append((field(1000 + k), int(rng.choice([1, 1, 1, 3]))))
+    return out
+
+
+def run_live(frames, setting):
+    """Captures as the front ends keep them: an upgrade overwrites its
+    provisional keyframe in place."""
+    det = LiveDetector(fps=FPS, settle_threshold=setting.settle_threshold,
+                       turn_threshold=setting.turn_threshold,
+                       settle_time=setting.settle_time,
+                       smoothing_window=setting.smoothing_window,
+                       early_capture=setting.early_capture)
+    idx, captures = -1, []
+    for frame, span in frames:
+        idx += span
+        capture = det.update(idx, frame, span=span).capture
+        if capture is None:
+            continue
+        if capture.replaces is not None:
+            assert captures[-1] == capture.replaces
+            captures[-1] = capture.frame_index
+        else:
+            captures.append(capture.frame_index)
+    return det, captures
+
+
+def test_replay_matches_the_live_detector_across_a_grid():
+    frames = session_frames()
+    settings = grid([1.0, 2.0], [4.0, 8.0], [0.2, 0.4], [3, 5])
+    for setting in settings:
+        det, live_caps = run_live(frames, setting)
+        assert len(live_caps) >= 2
+        caps, turns, _ = replay(det.motion_signal(), det.features()["sharpness"],
+                             FPS, setting)
+        assert caps == live_caps, setting
+        assert turns == det.turn_frames, setting
+
+
+def test_early_replay_matches_the_live_detector_with_upgrades_applied():
+    frames = session_frames(seed=5)
+    for setting in grid([2.0], [5.0, 8.0], [0.2, 0.4], [3, 5], early=(True,)):
+        det, live_caps = run_live(frames, setting)
+        assert det.provisional >= 2
+        caps, turns, latencies = replay(det.motion_signal(),
+                                        det.features()["sharpness"], FPS, setting)
+        assert caps == live_caps, setting
+        assert turns == det.turn_frames and latencies == det.latencies
+
+
+def test_trailing_mean_is_the_detectors_running_mean_bit_for_bit():
+    frames = session_frames(seed=3)
+    setting = grid([2.0], [5.0], [0.4], [7])[0]
+    det = LiveDetector(fps=FPS, smoothing_window=7)
+    smooth = []
+    for i, (frame, _) in enumerate(frames):
+        smooth.append(det.update(i, frame).smooth)
+    assert np.array_equal(trailing_mean(det.motion_signal(), setting.smoothing_window),
+                          np.array(smooth))
+
+
+def test_agreement_matches_one_to_one_nearest_first():
+    a = agreement([10, 52, 90, 200], [12, 50, 55, 300], tolerance=5)
+    assert (a["matched"], a["missed"], a["extra"]) == (2, 2, 2)
+    assert a["mean_offset_frames"] == 2.0
+
+
+def test_tune_ranks_the_same_in_a_pool_as_in_process():
+    frames = session_frames(seed=11)
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp) / "book"
+        (base / "data").mkdir(parents=True)
+        (base / "json").mkdir()
+        det, caps = run_live(frames, grid([2.0], [5.0], [0.4], [5])[0])
+        np.save(str(base / "data" / "motion_signal.npy"), det.motion_signal())
+        np.save(str(base / "data" / FEATURES_FILE), det.features())
+        (base / "json" / "metadata.json").write_text(json.dumps({"fps": FPS}))
+        (base / "json" / "keyframes.json").write_text(
+            json.dumps([{"frame_index": c} for c in caps]))
+        settings = grid([1.0, 2.0], [5.0, 9.0], [0.2, 0.4], [5])
+        inline = tune([base], settings, workers=1)
+        pooled = tune([base], settings, workers=2)
+        assert inline == pooled
+        assert inline[0]["f1"] == 1.0 and inline[0]["extra"] == 0
+        recorded = next(r for r in inline if r["setting"]["settle_threshold"] == 2.0
+                        and r["setting"]["turn_threshold"] == 5.0
+                        and r["setting"]["settle_time"] == 0.4)
+        assert recorded["sessions"]["book"]["captures"] == caps
+        assert recorded["f1"] == 1.0
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -200,6 +200,41 @@ def test_capture_index_stays_inside_the_resolvable_window():
     assert committed_at - caps[0].frame_index < det.settle_frames
 
 
+# ── Early capture ───────────────────────────────────────────
+
+
+def turn_then_rest():
+    """Settled, a 10-frame turn, then the new page at rest; frame 36 is the
+    sharp one, arriving after the page has already come to rest."""
+    frames = [flat_frame()] * 20 + churn(10) + [flat_frame()] * 20
+    frames[36] = detailed_frame()
+    return frames
+
+
+def test_early_capture_fires_before_the_settle_timer():
+    frames = turn_then_rest()[:36] + [flat_frame()] * 14    # no sharper frame
+    standard, early = LiveDetector(**KW), LiveDetector(**KW, early_capture=True)
+    std_ticks, std_caps = run(standard, frames)
+    ticks, caps = run(early, frames)
+    assert [c.reason for c in std_caps] == ["initial", "settle"]
+    assert [c.reason for c in caps] == ["initial", "early"]
+    fired = [t.frame_index for t in ticks if t.capture is not None]
+    std_fired = [t.frame_index for t in std_ticks if t.capture is not None]
+    assert fired[1] < std_fired[1]
+    assert early.latencies[0] < standard.latencies[0]
+    assert early.state == SETTLED                # confirmed, with no second capture
+    stats = early.capture_latency()
+    assert stats["mode"] == "early" and stats["captures"] == 1 and stats["provisional"] == 1
+
+
+def test_a_sharper_frame_upgrades_the_provisional_capture():
+    det = LiveDetector(**KW, early_capture=True)
+    _, caps = run(det, turn_then_rest())
+    assert [c.reason for c in caps] == ["initial", "early", "upgrade"]
+    assert caps[2].replaces == caps[1].frame_index and caps[2].frame_index == 36
+    assert det.upgrades == 1
+
+
 # ── Operator controls ────────────────────────────────────────
 
 
@@ -0,0 +1,71 @@
+"""
+Tests for the web capture load harness (load_web_capture.py), against the
+real servers.
+
+A short synthetic session, played flat out by two stations, must reach the
+server whole: every frame sent is received, every capture request gets its
+JPEG, and the report carries the server's handling times and its CPU and
+memory. Played in real time against one process per station, frames the
+schedule had passed are skipped, and the server fills them in as a gap.
+
+Run standalone (`python tests/test_load_web_capture.py`) or under pytest.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import load_web_capture as load  # noqa: E402
+
+SESSION = ["--seconds", "4", "--camera", "640x360", "--page-sec", "1.2",
+           "--settle-time", "0.3", "--smoothing-window", "5"]
+
+
+def test_two_stations_flat_out_on_one_server_arrive_whole():
+    with tempfile.TemporaryDirectory() as tmp:
+        r = load.main(["--stations", "2", "--server", "stations", "--speed", "0",
+                       "--out", tmp, "--json", str(Path(tmp) / "load.json"), *SESSION])
+        assert (Path(tmp) / "load.json").exists()
+    assert len(r["per_station"]) == 2 and len(r["processes"]) == 1
+    for st in r["per_station"]:
+        assert st["error"] is None, st["error"]
+        assert st["frames_sent"] == st["frames_received"] == 120
+        assert st["frames_skipped"] == 0 and st["gap_filled"] == 0
+        assert st["captures_requested"] >= 2
+        assert st["jpegs_sent"] == st["captures_requested"]
+        assert st["handling"]["delta"]["count"] == 119
+        assert st["handling"]["chunk"]["count"] == st["chunks_sent"] == 4
+        assert st["tick_rtt_ms"]["p50"] is not None
+    proc = r["processes"][0]
+    assert proc["cpu_s"] > 0 and proc["rss_peak_mb"] > 0
+    assert r["frames_per_cpu_s"] is None or r["frames_per_cpu_s"] > 0
+
+
+def test_real_time_station_skips_what_it_falls_behind_on():
+    with tempfile.TemporaryDirectory() as tmp:
+        r = load.main(["--out", tmp, "--speed", "2", *SESSION])
+    (st,) = r["per_station"]
+    assert st["error"] is None, st["error"]
+    assert r["processes"][0]["exit_code"] == 0       # p0_web_capture ends at Finish
+    assert st["frames_sent"] + st["frames_skipped"] == 120
+    assert st["frames_received"] == st["frames_sent"]
+    # A skipped frame is a hole in the timeline the server fills in, except
+    # at the very end, where no later frame marks it.
+    assert st["gap_filled"] <= st["frames_skipped"]
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,186 @@
+"""
+Tests for the on-disk page-mask store (mask_store.py).
+
+A mask is computed once per image contents and read back by every later
+store on the same directory: the same bits, bit-packed on disk, looked up by
+the image's bytes rather than its name or mtime, and by whether rembg is
+installed. A torn file is recomputed; a cropped frame's old mask outlives the
+crop, and trimming drops the least recently read masks past the budget.
+``crop_double_page`` given the stored mask crops where it crops on its own.
+
+Run standalone (`python tests/test_mask_store.py`) or under pytest.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import utils  # noqa: E402
+from image_cache import ImageCache  # noqa: E402
+from mask_store import MASK_PARAMS, MaskStore  # noqa: E402
+from p5_crop import crop_double_page  # noqa: E402
+
+
+def spread(w=3200, h=1800, tilt=0.0):
+    """A bright, slightly tilted page on a dark table."""
+    img = np.full((h, w, 3), 40, np.uint8)
+    img[h // 8: h * 7 // 8, w // 6: w * 5 // 6] = (232, 238, 244)
+    if tilt:
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), tilt, 1.0)
+        img = cv2.warpAffine(img, M, (w, h), borderValue=(40, 40, 40))
+    rng = np.random.default_rng(0)
+    img += rng.integers(0, 8, img.shape, dtype=np.uint8)
+    return img
+
+
+def test_computed_once_and_read_back_by_a_later_store():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "frame000010.jpg"
+        cv2.imwrite(str(path), spread())
+        images = ImageCache()
+        store = MaskStore(Path(tmp) / "data" / "masks", images=images)
+        mask = store.get(path)
+        small, _, _ = images.work(path)
+        assert np.array_equal(mask, utils.page_mask_robust(small))
+        assert store.counts == {"hits": 0, "computed": 1, "unsettled": 0,
+                                "evicted": 0}
+
+        # Bit-packed: a header and one bit per pixel.
+        (stored,) = store.root.glob("*.mask")
+        h, w = mask.shape
+        assert stored.stat().st_size == 16 + h * ((w + 7) // 8)
+
+        # Reopening the project: a new store reads it, no mask computed.
+        again = MaskStore(store.root, images=ImageCache(budget_mb=0))
+        assert np.array_equal(again.get(path), mask)
+        assert again.counts["hits"] == 1 and again.counts["computed"] == 0
+        full = again.get(path, size=(3200, 1800))
+        assert full.shape == (1800, 3200) and set(np.unique(full)) <= {0, 255}
+        assert "1 stored" in again.summary()
+
+
+def test_keyed_by_contents_and_parameters():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "frame000010.jpg"
+        cv2.imwrite(str(path), spread())
+        root = Path(tmp) / "masks"
+        store = MaskStore(root)
+        store.get(path)
+        # The same bytes under another name (P3 re-extracted it) hit.
+        copy = Path(tmp) / "frame000011.jpg"
+        shutil.copy(path, copy)
+        assert store.key(copy) == store.key(path)
+        store.get(copy)
+        assert store.counts["computed"] == 1
+
+        # Rewritten in place (P5's crop): a new key and a new mask.
+        old = store.key(path)
+        cv2.imwrite(str(path), spread(1600, 1200))
+        assert store.key(path) != old
+        assert store.get(path).shape == (1200, 1600)
+        assert store.counts["computed"] == 2
+
+        # Other mask parameters never see these masks.
+        other = MaskStore(root, params={**MASK_PARAMS, "version": 0})
+        assert other.key(path) != store.key(path)
+
+        # A torn file is recomputed, not trusted.
+        f = root / f"{store.key(path)}.mask"
+        f.write_bytes(f.read_bytes()[:1000])
+        assert store.get(path).shape == (1200, 1600)
+        assert store.counts["computed"] == 3
+        assert store.get(Path(tmp) / "missing.jpg") is None
+
+
+def test_a_cropped_frames_mask_outlives_the_crop():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "frame000010.jpg"
+        cv2.imwrite(str(path), spread(1600, 900))
+        original = path.read_bytes()
+        store = MaskStore(Path(tmp) / "masks")
+        store.get(path)
+        # P5 crops it in place, then P3 re-extracts the same frame.
+        cv2.imwrite(str(path), spread(1400, 800))
+        store.get(path)
+        assert store.trim() == 0
+        path.write_bytes(original)
+        os.utime(path, ns=(1, 1))       # a new stat, as re-extraction gives
+        assert store.get(path).shape == (900, 1600)
+        assert store.counts["hits"] == 1 and store.counts["computed"] == 2
+
+
+def test_trim_drops_the_least_recently_read_past_the_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        frames = [Path(tmp) / f"frame{i:06d}.jpg" for i in (10, 20, 30)]
+        store = MaskStore(Path(tmp) / "masks")
+        for age, (path, w) in enumerate(zip(frames, (1600, 1400, 1200))):
+            cv2.imwrite(str(path), spread(w, 900))
+            store.get(path)
+            t = 1_000_000_000 * (age + 1)
+            os.utime(store.root / f"{store.key(path)}.mask", ns=(t, t))
+        (store.root / "leftover.mask.1.2.tmp").write_bytes(b"")
+        # Reading the oldest makes it the newest.
+        store.get(frames[0])
+        size = sum(p.stat().st_size for p in store.root.glob("*.mask"))
+        assert store.trim(size / 2**20) == 0
+        assert store.trim((size - 1) / 2**20) == 1
+        left = {p.stem for p in store.root.iterdir()}
+        assert left == {store.key(frames[0]), store.key(frames[2])}
+        assert "1 evicted" in store.summary()
+
+
+def test_whether_rembg_is_installed_is_part_of_the_key():
+    with tempfile.TemporaryDirectory() as tmp:
+        # A cropped spread is all page: the HSV mask fails the plausibility
+        # check, which is where U^2-Net would step in.
+        path = Path(tmp) / "cropped.jpg"
+        cv2.imwrite(str(path), np.full((900, 1600, 3), 240, np.uint8))
+        saved = dict(utils._u2net)
+        utils._u2net["state"] = "unavailable"
+        try:
+            without = MaskStore(Path(tmp) / "masks", u2net=False)
+            assert without.get(path) is not None
+            assert without.counts["computed"] == 1
+            # rembg installed but not loadable: not the mask the key promises.
+            broken = MaskStore(without.root, u2net=True)
+            assert broken.key(path) != without.key(path)
+            assert broken.get(path) is not None
+            assert broken.counts["unsettled"] == 1
+            assert len(list(without.root.glob("*.mask"))) == 1
+        finally:
+            utils._u2net.update(saved)
+
+
+def test_crop_with_the_stored_mask_matches_the_full_res_mask():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "frame000010.jpg"
+        img = spread(tilt=2.0)
+        cv2.imwrite(str(path), img)
+        img = cv2.imread(str(path))
+        mask = MaskStore(Path(tmp) / "masks").get(path)
+        _, method, box = crop_double_page(img, 0.02)
+        _, method_s, box_s = crop_double_page(img, 0.02, mask=mask)
+        assert method == method_s == "hsv_deskew"
+        assert max(abs(a - b) for a, b in zip(box, box_s)) <= 0.005 * 3200, (box, box_s)
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -4,21 +4,26 @@ Tests for the minimal WebSocket framing (miniws).
 Everything runs over a socketpair — one end in client mode (masked frames,
 what a browser sends), one end the server. Hand-built byte vectors cover the
 wire format where behavior tests alone could hide a symmetric bug (a codec
-that masks wrongly on both ends still roundtrips).
+that masks wrongly on both ends still roundtrips) — for permessage-deflate,
+the RFC's own example frames, and the wire inflated with zlib directly.
 
 Run standalone (`python tests/test_miniws.py`) or under pytest.
 """
 
 import os
 import socket
+import json
 import struct
 import sys
 import threading
+import time
+import zlib
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
 
-from miniws import BINARY, CLOSE, PING, PONG, TEXT, WebSocket, accept_key  # noqa: E402
+from miniws import (BINARY, CLOSE, PING, PONG, TEXT, MessageBatcher,  # noqa: E402
+                    WebSocket, accept_key, negotiate_deflate)
 
 
 def pair():
@@ -98,6 +103,41 @@ def test_fragmented_message_is_reassembled():
     a.close(), b.close()
 
 
+def test_every_length_unmasks_including_the_unaligned_tail():
+    _, server, a, b = pair()
+    for n in range(0, 11):
+        payload = bytes(range(200, 200 + n))
+        a.sendall(masked_frame(BINARY, payload, mask=b"\x9a\x0b\xfc\x31"))
+        assert server.recv() == (BINARY, payload), n
+    a.close(), b.close()
+
+
+def test_binary_is_a_view_of_a_reused_buffer_and_growth_spares_old_views():
+    a, b = socket.socketpair()
+    server = WebSocket(b, buffer_size=64)
+    a.sendall(masked_frame(BINARY, b"x" * 40))
+    op, first = server.recv()
+    assert isinstance(first, memoryview) and first.obj is server._buf
+    a.sendall(masked_frame(BINARY, b"y" * 40))
+    _, second = server.recv()
+    assert second.obj is first.obj and first == b"y" * 40   # valid until next recv
+    big = os.urandom(300)
+    a.sendall(masked_frame(BINARY, big))
+    _, third = server.recv()
+    assert third == big and third.obj is not first.obj
+    assert first == b"y" * 40           # the grown buffer didn't disturb it
+    a.close(), b.close()
+
+
+def test_fragments_reassemble_in_place_around_a_ping():
+    _, server, a, b = pair()
+    a.sendall(masked_frame(BINARY, b"abc", fin=False))
+    a.sendall(masked_frame(PING, b"p"))
+    a.sendall(masked_frame(0x0, b"defgh", fin=True))
+    assert server.recv() == (BINARY, b"abcdefgh")
+    a.close(), b.close()
+
+
 # ── Control frames ───────────────────────────────────────────
 
 
@@ -106,7 +146,7 @@ def test_ping_is_answered_with_pong_and_skipped():
     client._send_frame(PING, b"x")
     client.send_text("after")
     assert server.recv() == (TEXT, b"after")   # ping handled invisibly
-    fin, op, payload = client._read_frame()
+    fin, _, op, payload = client._read_frame()
     assert (fin, op, payload) == (True, PONG, b"x")
     a.close(), b.close()
 
@@ -115,7 +155,7 @@ def test_close_is_echoed_and_surfaced():
     client, server, a, b = pair()
     client.close(code=1000)
     assert server.recv() == (CLOSE, b"")
-    fin, op, payload = client._read_frame()
+    fin, _, op, payload = client._read_frame()
     assert op == CLOSE and struct.unpack(">H", payload)[0] == 1000
     a.close(), b.close()
 
@@ -132,6 +172,124 @@ def test_torn_socket_raises_connection_error():
     b.close()
 
 
+# ── permessage-deflate ───────────────────────────────────────
+
+
+def deflate_pair(offer="permessage-deflate; client_max_window_bits"):
+    _, settings = negotiate_deflate(offer)
+    a, b = socket.socketpair()
+    return (WebSocket(a, client=True, deflate=settings),
+            WebSocket(b, deflate=settings), a, b)
+
+
+def test_negotiation_accepts_what_it_can_honour():
+    assert negotiate_deflate(None) == (None, None)
+    assert negotiate_deflate("x-webkit-deflate-frame") == (None, None)
+    header, settings = negotiate_deflate(
+        "permessage-deflate; client_max_window_bits")
+    assert header == "permessage-deflate"
+    assert settings["server_max_window_bits"] == 15
+    # A first offer we can't meet falls through to the next.
+    header, settings = negotiate_deflate(
+        "permessage-deflate; server_max_window_bits=8, "
+        "permessage-deflate; server_no_context_takeover; server_max_window_bits=10")
+    assert header == "permessage-deflate; server_no_context_takeover; server_max_window_bits=10"
+    assert settings["server_no_context_takeover"] and settings["server_max_window_bits"] == 10
+    assert negotiate_deflate("permessage-deflate; mystery=1") == (None, None)
+
+
+def test_rfc_7692_hello_vector():
+    # RFC 7692 §7.2.3.1: "Hello" compressed, in one unmasked frame.
+    a, b = socket.socketpair()
+    server = WebSocket(b, deflate=negotiate_deflate("permessage-deflate")[1])
+    a.sendall(bytes([0xC1, 0x07, 0xF2, 0x48, 0xCD, 0xC9, 0xC9, 0x07, 0x00]))
+    assert server.recv() == (TEXT, b"Hello")
+    # ... and the same message fragmented, RSV1 on the first frame only.
+    a.sendall(bytes([0x41, 0x03, 0xF2, 0x48, 0xCD, 0x80, 0x04, 0xC9, 0xC9, 0x07, 0x00]))
+    assert server.recv() == (TEXT, b"Hello")
+    a.close(), b.close()
+
+
+def read_raw(sock, n):
+    data = b""
+    while len(data) < n:
+        data += sock.recv(n - len(data))
+    return data
+
+
+def test_deflated_text_round_trips_and_shares_its_context():
+    client, server, a, b = deflate_pair()
+    tick = json.dumps({"type": "tick", "frame_index": 1234, "state": "STILL",
+                       "motion": 0.41, "smooth": 0.52, "captured": 17})
+    # Inflate the wire independently of the codec under test, one context
+    # across messages as RFC 7692's default context takeover requires.
+    inflater, sizes = zlib.decompressobj(-15), []
+    for _ in range(3):
+        server.send_text(tick)
+        b0, n = read_raw(a, 2)
+        assert b0 == 0x80 | 0x40 | TEXT and n < 126    # FIN, RSV1, unmasked
+        body = read_raw(a, n)
+        assert inflater.decompress(body + b"\x00\x00\xff\xff") == tick.encode()
+        sizes.append(n)
+    assert sizes[1] < sizes[0] / 3              # the repeat rides the shared window
+    assert server.text_bytes == 3 * len(tick) and server.text_wire_bytes == sum(sizes)
+    a.close(), b.close()
+
+    client, server, a, b = deflate_pair()
+    server.send_text(tick)
+    server.send_binary(b"\x00" * 1000)         # binary goes out as it is
+    assert client.recv() == (TEXT, tick.encode())
+    op, payload = client.recv()
+    assert op == BINARY and bytes(payload) == b"\x00" * 1000
+    for _ in range(2):                          # and the other way, masked
+        client.send_text(tick)
+        assert server.recv() == (TEXT, tick.encode())
+    a.close(), b.close()
+
+
+def test_rsv1_without_deflate_is_a_protocol_error():
+    _, server, a, b = pair()
+    frame = bytearray(masked_frame(TEXT, b"abc"))
+    frame[0] |= 0x40
+    a.sendall(bytes(frame))
+    try:
+        server.recv()
+        raise AssertionError("expected ConnectionError")
+    except ConnectionError:
+        pass
+    a.close(), b.close()
+
+
+# ── Batching ─────────────────────────────────────────────────
+
+
+def test_batcher_coalesces_a_burst_and_sends_a_lone_message_as_itself():
+    client, server, a, b = pair()
+    batcher = MessageBatcher(server, window=0.05, urgent=("capture",))
+    for i in range(5):
+        batcher.send({"type": "tick", "frame_index": i})
+    op, payload = client.recv()
+    batch = json.loads(payload)
+    assert batch["type"] == "batch"
+    assert [m["frame_index"] for m in batch["messages"]] == list(range(5))
+    time.sleep(0.1)
+    batcher.send({"type": "saved"})
+    assert json.loads(client.recv()[1]) == {"type": "saved"}
+    # An urgent message doesn't wait out the window, and keeps its order.
+    batcher.window = 5.0
+    t0 = time.monotonic()
+    batcher.send({"type": "tick", "frame_index": 9})
+    batcher.send({"type": "capture", "frame_index": 9})
+    batch = json.loads(client.recv()[1])
+    assert time.monotonic() - t0 < 2.0
+    assert [m["type"] for m in batch["messages"]] == ["tick", "capture"]
+    batcher.send({"type": "finished"})
+    batcher.close()                             # flushes without waiting 5 s
+    assert json.loads(client.recv()[1]) == {"type": "finished"}
+    assert batcher.stats()["messages"] == 9 and batcher.stats()["frames"] == 4
+    a.close(), b.close()
+
+
 if __name__ == "__main__":
     tests = [(n, f) for n, f in sorted(globals().items())
              if n.startswith("test_") and callable(f)]
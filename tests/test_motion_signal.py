@@ -0,0 +1,193 @@
+"""
+Tests for the Phase 1 motion signal and its frame sources.
+
+A short synthetic recording (a textured field that holds still, jumps, and
+holds again) is written with OpenCV, so no camera or real scan is needed.
+The OpenCV path is pinned against the original per-frame loop; the ffmpeg
+path, when ffmpeg is installed, must agree with it within the documented
+tolerance. A sharded (--workers) run must be identical to the single pass,
+and an ffmpeg that dies mid-stream must not pass for the end of the video.
+
+Run standalone (`python tests/test_motion_signal.py`) or under pytest.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import frame_source  # noqa: E402
+import p1_motion_signal as p1  # noqa: E402
+from live_state import laplacian_sharpness  # noqa: E402
+
+W, H, N = 320, 240, 60
+
+
+def write_clip(path, n=N):
+    """Still for a while, a 'page turn' of fresh texture, still again."""
+    rng = np.random.default_rng(0)
+    fields = [cv2.resize(rng.integers(0, 255, (H // 8, W // 8, 3), dtype=np.uint8),
+                         (W, H), interpolation=cv2.INTER_CUBIC) for _ in range(3)]
+    w = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 30.0, (W, H))
+    for i in range(n):
+        if i < n // 3:
+            f = fields[0]
+        elif i < n // 2:
+            f = np.roll(fields[1], 9 * i, axis=1)
+        else:
+            f = fields[2]
+        w.write(f)
+    w.release()
+
+
+def reference_signal(path, analysis_height):
+    """The original P1 loop, verbatim in spirit: decode, resize, gray, diff.
+
+    Also returns each gray frame's laplacian_sharpness, the feature P1 keeps.
+    """
+    cap = cv2.VideoCapture(str(path))
+    aw = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH) * analysis_height
+             / cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    prev, diffs, sharp = None, [], []
+    while True:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        small = cv2.resize(frame, (aw, analysis_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if prev is not None:
+            diffs.append(float(np.mean(cv2.absdiff(prev, gray))))
+        prev = gray
+        sharp.append(laplacian_sharpness(gray))
+    cap.release()
+    return np.array(diffs), np.array(sharp)
+
+
+def test_opencv_path_matches_the_original_loop_exactly():
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = Path(tmp) / "clip.mp4"
+        write_clip(clip)
+        diffs, meta, features = p1.compute_motion_signal(str(clip), 120, decoder="opencv")
+        ref, ref_sharpness = reference_signal(clip, 120)
+        assert meta["decoder"] == "opencv"
+        assert meta["frames_processed"] == N and len(diffs) == N - 1
+        assert np.array_equal(diffs, ref)
+        assert features.dtype == frame_source.FEATURES_DTYPE and len(features) == N
+        assert np.array_equal(features["sharpness"], ref_sharpness)
+        assert 0 < features["brightness"].min() <= features["brightness"].max() < 255
+        assert diffs.max() > 5 * max(diffs[: N // 3 - 1].max(), 0.1)
+
+
+def test_auto_without_ffmpeg_uses_opencv():
+    saved = frame_source.ffmpeg_available
+    frame_source.ffmpeg_available = lambda: False
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            clip = Path(tmp) / "clip.mp4"
+            write_clip(clip, n=12)
+            src = frame_source.GrayFrames(clip, (160, 120))
+            assert src.backend == "opencv"
+            buf = np.empty((120, 160), np.uint8)
+            assert src.read_into(buf) and buf.any()
+            src.close()
+    finally:
+        frame_source.ffmpeg_available = saved
+
+
+def test_ffmpeg_path_agrees_within_tolerance():
+    if not frame_source.ffmpeg_available():
+        print("  (ffmpeg not installed — skipped)")
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = Path(tmp) / "clip.mp4"
+        write_clip(clip)
+        diffs, meta, _ = p1.compute_motion_signal(str(clip), 120, decoder="ffmpeg")
+        ref, _ = reference_signal(clip, 120)
+        assert meta["decoder"] == "ffmpeg"
+        assert len(diffs) == len(ref)
+        assert np.max(np.abs(diffs - ref)) <= frame_source.FFMPEG_TOLERANCE
+
+
+class DyingFfmpeg(frame_source.GrayFrames):
+    """An ffmpeg that dies 20 frames in: the stream just ends, and close()
+    reports exit status 1. Asked for OpenCV, it is OpenCV."""
+
+    def __init__(self, video_path, size, decoder="auto", **kw):
+        super().__init__(video_path, size, "opencv", **kw)
+        if decoder != "opencv":
+            self.backend, self._left = "ffmpeg", 20
+
+    def close(self):
+        super().close()
+        return 1 if self.backend == "ffmpeg" else None
+
+
+def test_ffmpeg_dying_mid_stream_is_not_a_short_signal():
+    saved = p1.GrayFrames, p1.ffmpeg_available
+    p1.GrayFrames, p1.ffmpeg_available = DyingFfmpeg, lambda: True
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            clip = Path(tmp) / "clip.mp4"
+            write_clip(clip)
+            # auto: the pass is redone on OpenCV, the whole recording.
+            diffs, meta, _ = p1.compute_motion_signal(str(clip), 120)
+            assert meta["decoder"] == "opencv"
+            assert meta["frames_processed"] == N and len(diffs) == N - 1
+            # Sharded: the failed shard sends it to the single pass.
+            _, meta, _ = p1.compute_motion_signal(str(clip), 120, workers=2)
+            assert meta["workers"] == 1 and meta["frames_processed"] == N
+            # ffmpeg asked for by name: fail rather than write a short signal.
+            try:
+                p1.compute_motion_signal(str(clip), 120, decoder="ffmpeg")
+                raise AssertionError("a dead ffmpeg must not pass as EOF")
+            except SystemExit:
+                pass
+    finally:
+        p1.GrayFrames, p1.ffmpeg_available = saved
+
+
+def test_sharded_pass_is_identical_to_single_pass():
+    decoders = ["opencv"] + (["ffmpeg"] if frame_source.ffmpeg_available() else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = Path(tmp) / "clip.mp4"
+        write_clip(clip, n=90)
+        for decoder in decoders:
+            single, _, feats = p1.compute_motion_signal(str(clip), 120, decoder=decoder)
+            sharded, meta, sharded_feats = p1.compute_motion_signal(
+                str(clip), 120, decoder=decoder, workers=4)
+            assert meta["workers"] == 4, decoder
+            assert meta["frames_processed"] == 90
+            assert np.array_equal(single, sharded), decoder
+            assert np.array_equal(feats, sharded_feats), decoder
+
+
+def test_shard_bounds_share_boundary_frames():
+    shards = p1._shard_bounds(100, 3)
+    assert shards[0][0] == 0 and shards[-1][1] is None
+    for (a, n), (b, _) in zip(shards, shards[1:]):
+        assert a + n - 1 == b          # next shard starts on our last frame
+
+
+def test_analysis_size_matches_p1_rounding():
+    assert frame_source.analysis_size(3840, 2160, 360) == (640, 360)
+    assert frame_source.analysis_size(1920, 1080, 360) == (640, 360)
+    assert frame_source.analysis_size(1000, 750, 360) == (480, 360)
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,98 @@
+"""
+Tests for the review image renditions (previews.py).
+
+A request is served by the smallest level at least as big as asked, never
+upscaled: past the largest level, or the source's own size, it is the
+original. A source rewritten in place must get a new version, fresh
+renditions, and the old ones pruned.
+
+Run standalone (`python tests/test_previews.py`) or under pytest.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from previews import LEVELS, PreviewCache  # noqa: E402
+
+
+def make_source(tmp, name="frame000010.jpg", size=(2400, 1600), value=200):
+    src = Path(tmp) / "images"
+    src.mkdir(exist_ok=True)
+    arr = np.full((size[1], size[0], 3), value, np.uint8)
+    Image.fromarray(arr).save(src / name, quality=90)
+    return src
+
+
+def test_smallest_level_that_covers_the_request():
+    with tempfile.TemporaryDirectory() as tmp:
+        src = make_source(tmp)
+        cache = PreviewCache(src, Path(tmp) / "previews" / "images")
+        for size, level in ((100, 320), (320, 320), (700, 960), (1500, 1920)):
+            path, etag = cache.rendition("frame000010.jpg", size)
+            assert path.parent == cache.cache_dir, (size, path)
+            assert etag.endswith(f'-{level}"')
+            with Image.open(path) as im:
+                assert max(im.size) == level and im.size[0] > im.size[1]
+        # Past the largest level, or no size at all: the original.
+        for size in (2000, None):
+            path, etag = cache.rendition("frame000010.jpg", size)
+            assert path == src / "frame000010.jpg" and etag.endswith('-orig"')
+        # One decode built the whole pyramid.
+        assert cache.built == len(LEVELS)
+        assert cache.rendition("missing.jpg", 320) == (None, None)
+
+
+def test_never_upscales_a_small_source():
+    with tempfile.TemporaryDirectory() as tmp:
+        src = make_source(tmp, size=(640, 400))
+        cache = PreviewCache(src, Path(tmp) / "previews")
+        path, _ = cache.rendition("frame000010.jpg", 300)
+        with Image.open(path) as im:
+            assert max(im.size) == 320
+        path, etag = cache.rendition("frame000010.jpg", 700)  # 960 > the source
+        assert path == src / "frame000010.jpg" and etag.endswith('-orig"')
+        assert cache.built == 1
+
+
+def test_rewritten_source_gets_a_new_version_and_old_renditions_go():
+    with tempfile.TemporaryDirectory() as tmp:
+        src = make_source(tmp)
+        make_source(tmp, name="gone.jpg")
+        cache = PreviewCache(src, Path(tmp) / "previews")
+        cache.warm(["frame000010.jpg", "gone.jpg"]).join(10)
+        old = cache.version("frame000010.jpg")
+        assert len(list(cache.cache_dir.iterdir())) == 2 * len(LEVELS)
+
+        make_source(tmp, value=90, size=(2000, 1500))           # crop rewrote it
+        st = (src / "frame000010.jpg").stat()
+        os.utime(src / "frame000010.jpg", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        (src / "gone.jpg").unlink()
+        assert cache.version("frame000010.jpg") != old
+        cache.warm(["frame000010.jpg"]).join(10)
+        left = sorted(p.name for p in cache.cache_dir.iterdir())
+        assert len(left) == len(LEVELS) and not any(old in n or "gone" in n for n in left)
+        path, _ = cache.rendition("frame000010.jpg", 1920)
+        with Image.open(path) as im:
+            assert im.size == (1920, 1440) and im.getpixel((5, 5))[0] < 120
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,103 @@
+"""
+Tests for the web capture's recording sink (recording_sink.py).
+
+Chunks must land in order and byte-exact, however the writer batches them,
+and ``put`` must return at once while the disk is stalled, until the queue
+reaches its byte bound. The writer must fsync on its own within
+``sync_sec`` of a write, not only at close.
+
+Run standalone (`python tests/test_recording_sink.py`) or under pytest.
+"""
+
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from recording_sink import RecordingSink  # noqa: E402
+
+
+class StalledFile:
+    """Wraps the sink's file; writes wait until ``gate`` is set."""
+
+    def __init__(self, f, gate):
+        self.f, self.gate, self.calls = f, gate, 0
+
+    def writelines(self, chunks):
+        self.calls += 1
+        self.gate.wait(5)
+        self.f.writelines(chunks)
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+
+def test_chunks_land_in_order_batched_behind_a_slow_write():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "rec.raw.webm"
+        sink = RecordingSink(path, sync_sec=60)
+        gate = threading.Event()
+        sink._file = StalledFile(sink._file, gate)
+        chunks = [bytes([i]) * (1000 + i) for i in range(20)]
+        t0 = time.monotonic()
+        for c in chunks:
+            sink.put(memoryview(c))
+        assert time.monotonic() - t0 < 0.5             # nothing waited on the disk
+        gate.set()
+        stats = sink.close()
+        assert path.read_bytes() == b"".join(chunks)
+        assert stats["writes"] == sink._file.calls <= 3  # the backlog went in one go
+        assert stats["queued_mb"] == 0 and stats["blocked_puts"] == 0
+        assert stats["unsynced_mb"] == 0                # close is a durability point
+
+
+def test_put_waits_only_once_the_queue_is_full():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "rec.raw.webm"
+        sink = RecordingSink(path, max_queue_bytes=13_000, sync_sec=60)
+        gate = threading.Event()
+        sink._file = StalledFile(sink._file, gate)
+        sink.put(b"a" * 4000)                           # in the stalled write
+        time.sleep(0.1)
+        sink.put(b"b" * 4000)
+        sink.put(b"c" * 4000)                           # 12 KB in flight or queued
+        done = threading.Event()
+        late = threading.Thread(target=lambda: (sink.put(b"d" * 4000), done.set()))
+        late.start()
+        assert not done.wait(0.3)                       # held back ...
+        gate.set()
+        assert done.wait(5)                             # ... until the disk caught up
+        late.join()
+        stats = sink.close()
+        assert path.read_bytes() == b"a" * 4000 + b"b" * 4000 + b"c" * 4000 + b"d" * 4000
+        assert stats["blocked_puts"] == 1 and stats["queue_peak_mb"] <= 0.013
+
+
+def test_durability_points_come_without_close():
+    with tempfile.TemporaryDirectory() as tmp:
+        sink = RecordingSink(Path(tmp) / "rec.raw.webm", sync_sec=0.1)
+        sink.put(b"x" * 5000)
+        deadline = time.monotonic() + 3
+        while sink.durable_bytes < 5000 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert sink.durable_bytes == 5000
+        assert sink.stats()["unsynced_mb"] == 0
+        sink.close()
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
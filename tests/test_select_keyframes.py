@@ -0,0 +1,138 @@
+"""
+Tests for Phase 3's single forward sweep.
+
+The sweep must pick exactly what per-candidate seeking picks — same frame,
+same motion, same sharpness — and hand back the very pixels a seek to the
+winner would have read. --rank table must pick from P1's feature table
+alone and still read winners back exactly.
+
+Run standalone (`python tests/test_select_keyframes.py`) or under pytest.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import p1_motion_signal as p1  # noqa: E402
+import p2_detect_peaks as p2  # noqa: E402
+import p3_select_keyframes as p3  # noqa: E402
+from frame_index import INDEX_FILE, FrameReader, build_index  # noqa: E402
+from test_single_pass import SPREADS, write_book  # noqa: E402
+
+
+def book_spreads(video):
+    diffs, meta, _ = p1.compute_motion_signal(str(video), 120, decoder="opencv")
+    smoothed = uniform_filter1d(diffs, size=15)
+    args = argparse.Namespace(peak_height=5.0, min_distance=1.5, prominence=3.0,
+                                 long_spread=3.0, valley_motion=2.0,
+                                 valley_min_sec=0.15, valley_peak=4.0)
+    peaks = p2.detect_turns(smoothed, meta["fps"], args)
+    spreads = p2.annotate_spreads(p2.build_spread_list(peaks, len(smoothed)), meta["fps"])
+    return smoothed, spreads
+
+
+def test_sweep_matches_per_candidate_seeks():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        smoothed, spreads = book_spreads(video)
+        assert len(spreads) == SPREADS
+
+        reader = FrameReader(video)
+        sweep_cap = cv2.VideoCapture(str(video))
+        swept = list(p3.sweep_select(sweep_cap, smoothed, spreads, 6, 0.5))
+        assert [sp for sp, _, _ in swept] == spreads
+        for sp, result, frame in swept:
+            expected = p3.select_keyframe(reader, smoothed, sp["start_frame"],
+                                          sp["end_frame"], 6, 0.5)
+            assert result == expected
+            assert np.array_equal(frame, reader.read(result[0]))
+        reader.release()
+        sweep_cap.release()
+
+
+def test_sweep_past_the_end_reads_nothing():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        smoothed, spreads = book_spreads(video)
+        n = len(smoothed)
+        ghost = {"spread_index": 99, "start_frame": n + 10, "end_frame": n + 40,
+                 "frame_count": 30}
+        padded = np.concatenate([smoothed, np.zeros(60)])
+        cap = cv2.VideoCapture(str(video))
+        out = list(p3.sweep_select(cap, padded, spreads + [ghost], 6, 0.5))
+        cap.release()
+        sp, result, frame = out[-1]
+        assert sp is ghost and result[0] is None and frame is None
+
+
+def test_rank_table_selects_from_p1_features():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        video, out = root / "book.mp4", root / "out"
+        write_book(video)
+        for mod, argv in ((p1, [str(video), "--output-dir", str(out), "--decoder", "opencv"]),
+                          (p2, [str(out)]),
+                          (p3, [str(out), str(video), "--rank", "table"])):
+            with mock.patch.object(sys, "argv", ["prog"] + argv):
+                mod.main()
+        keyframes = json.loads((out / "json/keyframes.json").read_text())
+        features = np.load(out / "data/frame_features.npy", mmap_mode="r")
+        smoothed = np.load(out / "data/smoothed_signal.npy")
+        spreads = json.loads((out / "json/spreads.json").read_text())
+        assert len(keyframes) == len(spreads) == SPREADS
+        assert (out / "data" / INDEX_FILE).exists()
+        cap = cv2.VideoCapture(str(video))
+        for kf, sp in zip(keyframes, spreads):
+            cands = p3.keyframe_candidates(smoothed, sp["start_frame"], sp["end_frame"], 6, 0.5)
+            best = max(cands, key=lambda fi: (features["sharpness"][fi], -fi))
+            assert kf["frame_index"] == best
+            assert kf["sharpness"] == round(float(features["sharpness"][best]), 1)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, best)
+            ok, frame = cap.read()
+            ok, jpg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 95])
+            assert (out / "images" / kf["filename"]).read_bytes() == jpg.tobytes()
+        cap.release()
+
+
+def test_read_winners_skips_missing_spreads():
+    with tempfile.TemporaryDirectory() as tmp:
+        video = Path(tmp) / "book.mp4"
+        write_book(video)
+        wanted = [3, 9, None, 200, 230, 10_000]
+        with FrameReader(video, build_index(Path(tmp), video)) as reader:
+            got = list(p3.read_winners(reader, wanted))
+        assert [fi for fi, _ in got] == wanted
+        assert got[2][1] is None and got[-1][1] is None
+        ref = cv2.VideoCapture(str(video))
+        for fi, frame in got[:2] + got[3:5]:
+            ref.set(cv2.CAP_PROP_POS_FRAMES, fi)
+            ok, expected = ref.read()
+            assert np.array_equal(frame, expected), fi
+        ref.release()
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
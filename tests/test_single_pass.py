@@ -0,0 +1,132 @@
+"""
+Tests for the fused single-pass front half (p123_single_pass).
+
+A synthetic book — still "spreads" of distinct texture separated by sliding
+"page turns" — is run through P1 (OpenCV decode) + P2 + P3 and through the
+single pass; every artifact downstream phases read must come out
+byte-identical, whether keyframes were held in memory or had to be seeked.
+
+Run standalone (`python tests/test_single_pass.py`) or under pytest.
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import p1_motion_signal as p1  # noqa: E402
+import p2_detect_peaks as p2  # noqa: E402
+import p3_select_keyframes as p3  # noqa: E402
+import p123_single_pass as p123  # noqa: E402
+
+W, H, FPS = 320, 240, 30.0
+SPREADS = 6
+STILL, TURN = 75, 15
+
+
+def write_book(path):
+    rng = np.random.default_rng(7)
+    pages = [cv2.resize(rng.integers(0, 255, (H // 8, W // 8, 3), dtype=np.uint8),
+                        (W, H), interpolation=cv2.INTER_CUBIC) for _ in range(SPREADS)]
+    w = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), FPS, (W, H))
+    for k, page in enumerate(pages):
+        for i in range(STILL):
+            # A little camera shake so sharpness has a winner to pick.
+            f = page if i % 5 else cv2.GaussianBlur(page, (3, 3), 0)
+            w.write(f)
+        if k + 1 < len(pages):
+            for i in range(TURN):
+                w.write(np.roll(pages[k + 1], (i + 1) * W // TURN, axis=1))
+    w.release()
+
+
+def run_split(video, out):
+    argv = ["prog", str(video), "--output-dir", str(out), "--decoder", "opencv"]
+    with mock.patch.object(sys, "argv", argv):
+        p1.main()
+    with mock.patch.object(sys, "argv", ["prog", str(out)]):
+        p2.main()
+    with mock.patch.object(sys, "argv", ["prog", str(out), str(video)]):
+        p3.main()
+
+
+def assert_same_outputs(a, b):
+    for rel in ("data/motion_signal.npy", "data/smoothed_signal.npy",
+                "data/frame_features.npy",
+                "data/peaks.npy", "json/spreads.json", "json/keyframes.json"):
+        assert (a / rel).read_bytes() == (b / rel).read_bytes(), rel
+    images_a = sorted(p.name for p in (a / "images").iterdir())
+    images_b = sorted(p.name for p in (b / "images").iterdir())
+    assert images_a == images_b
+    for name in images_a:
+        assert (a / "images" / name).read_bytes() == (b / "images" / name).read_bytes(), name
+
+
+def test_single_pass_matches_p1_p2_p3_byte_for_byte():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        video = root / "book.mp4"
+        write_book(video)
+        run_split(video, root / "split")
+        p123.main([str(video), "--output-dir", str(root / "fused")])
+        assert len(np.load(root / "fused/data/peaks.npy")) == SPREADS - 1
+        assert_same_outputs(root / "split", root / "fused")
+
+
+def test_single_pass_seeks_when_a_winner_was_not_held():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        video = root / "book.mp4"
+        write_book(video)
+        run_split(video, root / "split")
+        p123.main([str(video), "--output-dir", str(root / "fused"), "--keep", "1"])
+        assert_same_outputs(root / "split", root / "fused")
+
+
+def test_spreads_close_while_decoding():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        video = root / "book.mp4"
+        write_book(video)
+        args = p123.parse_args([str(video), "--output-dir", str(root / "out")])
+        paths = p123.ProjectPaths(root / "out")
+        paths.ensure("images")
+        run = p123.SinglePass(paths, str(video), p123.probe_video(video), args)
+        cap = cv2.VideoCapture(str(video))
+        closed_midway, most_held = None, 0
+        while True:
+            ok, frame = cap.read(run.next_buffer())
+            if not ok:
+                break
+            run.push(frame)
+            if run.frames == (STILL + TURN) * 4:
+                closed_midway = len(run.closed)
+            # Bounded: at most `keep` held per segment, few segments open.
+            segments = [v[2] for v in run.kept.values()]
+            assert all(segments.count(g) <= run.keep for g in set(segments))
+            most_held = max(most_held, len(set(segments)))
+        cap.release()
+        assert closed_midway and closed_midway >= 2
+        assert most_held <= 3
+        _, _, peaks, spreads, keyframes, _ = run.finish()
+        assert len(spreads) == SPREADS and len(keyframes) == SPREADS
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
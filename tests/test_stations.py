@@ -0,0 +1,272 @@
+"""
+Tests for the multi-station server (stations.py), over real sockets.
+
+Two capture stations must run at once on one port, each into its own
+project, and a project must never have two sessions: a second browser on a
+station in session is refused, whichever app it asks for, until the first
+finishes. The review apps must be served under their station's path, files
+and Range included, with the websocket session the one-station server
+would run, and an app asked for by several browsers at once built once.
+
+Run standalone (`python tests/test_stations.py`) or under pytest.
+"""
+
+import asyncio
+import json
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import p0_web_capture as web  # noqa: E402
+import stations  # noqa: E402
+from miniws import TEXT, WebSocket, accept_key  # noqa: E402
+
+US_PER_FRAME = 1e6 / 30.0
+KEY = "dGhlIHNhbXBsZSBub25jZQ=="
+
+
+def start(root):
+    args = stations.parse_args(["--root", str(root / "output"),
+                                "--recordings", str(root / "recordings"),
+                                "--port", "0", "--workers", "4",
+                                "--settle-time", "0.2", "--smoothing-window", "5"])
+    srv = stations.StationServer(args)
+    loop = asyncio.new_event_loop()
+    box, ready = {}, threading.Event()
+
+    def run():
+        asyncio.set_event_loop(loop)
+        box["port"] = loop.run_until_complete(srv.start("127.0.0.1", 0))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    assert ready.wait(5)
+    return srv, box["port"], loop
+
+
+def stop(srv, loop):
+    loop.call_soon_threadsafe(srv.server.close)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def ws_connect(port, path):
+    sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+    sock.settimeout(20)
+    sock.sendall((f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+                  "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {KEY}\r\n"
+                  "Sec-WebSocket-Version: 13\r\n\r\n").encode())
+    head = b""
+    while b"\r\n\r\n" not in head:
+        head += sock.recv(1)
+    assert b" 101 " in head.split(b"\r\n", 1)[0], head
+    assert accept_key(KEY).encode() in head
+    return WebSocket(sock, client=True), sock
+
+
+_queued = {}
+
+
+def next_msg(ws):
+    """The next server message, unpacking the batches it coalesces."""
+    queue = _queued.setdefault(ws, [])
+    if not queue:
+        op, payload = ws.recv()
+        assert op == TEXT, f"unexpected opcode {op}"
+        m = json.loads(payload.decode())
+        queue.extend(m["messages"] if m["type"] == "batch" else [m])
+    return queue.pop(0)
+
+
+def read_until(ws, wanted, limit=500):
+    for _ in range(limit):
+        m = next_msg(ws)
+        if m["type"] == wanted:
+            return m
+    raise AssertionError(f"no '{wanted}' message within {limit} messages")
+
+
+def get(port, path, headers=None):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers=headers or {})
+    with urllib.request.urlopen(req, timeout=10) as r:
+        return r.status, r.read(), r.geturl()
+
+
+def frame_msg(ts_us, gray):
+    return (struct.pack("<BdHH", web.MSG_FRAME, ts_us,
+                        gray.shape[1], gray.shape[0]) + gray.tobytes())
+
+
+def test_two_capture_stations_at_once_and_one_session_per_project():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        srv, port, loop = start(root)
+        try:
+            socks = []
+            wss = {}
+            for name in ("left", "right"):
+                ws, sock = ws_connect(port, f"/{name}/capture/ws")
+                socks.append(sock)
+                assert next_msg(ws)["type"] == "config"
+                wss[name] = ws
+            # The station in session refuses a second browser.
+            ws2, sock2 = ws_connect(port, "/left/capture/ws")
+            m = next_msg(ws2)
+            assert m["type"] == "error" and "left" in m["message"], m
+            sock2.close()
+            _, index, _ = get(port, "/")
+            assert b"capture in session" in index
+
+            gray = {name: np.random.default_rng(seed).integers(
+                0, 200, size=(90, 160), dtype=np.int16).astype(np.uint8)
+                for seed, name in enumerate(wss)}
+            for ws in wss.values():
+                ws.send_text(json.dumps({"type": "hello", "width": 640, "height": 360,
+                                         "frame_rate": 30, "mime": "video/webm"}))
+            for i in range(12):                 # interleaved, as two rigs would
+                for name, ws in wss.items():
+                    ws.send_binary(frame_msg(i * US_PER_FRAME, gray[name]))
+            for name, ws in wss.items():
+                req = read_until(ws, "capture")
+                ws.send_binary(struct.pack("<BI", web.MSG_JPEG, req["frame_index"])
+                               + f"jpeg of {name}".encode())
+                assert read_until(ws, "captured")["count"] == 1
+                ws.send_text('{"type": "finish"}')
+                assert read_until(ws, "finished")["keyframes"] == 1
+
+            for name in wss:
+                out = root / "output" / name
+                kfs = json.loads((out / "json" / "keyframes.json").read_text())
+                image = out / "images" / kfs[0]["filename"]
+                assert image.read_bytes() == f"jpeg of {name}".encode()
+                assert len(np.load(out / "data" / "motion_signal.npy")) == 12
+
+            # Finishing frees the station for its next session.
+            for _ in range(50):
+                if not srv._claims:
+                    break
+                threading.Event().wait(0.05)
+            ws, sock = ws_connect(port, "/left/capture/ws")
+            assert next_msg(ws)["type"] == "config"
+            sock.close()
+            for s in socks:
+                s.close()
+        finally:
+            stop(srv, loop)
+
+
+def make_p4_project(out):
+    for d in ("images", "json", "data"):
+        (out / d).mkdir(parents=True)
+    kfs = []
+    for fi in (10, 40, 70):
+        img = np.full((400, 640, 3), 30, np.uint8)
+        img[60:340, 120:520] = (235, 240, 245)
+        name = f"frame{fi:06d}.jpg"
+        cv2.imwrite(str(out / "images" / name), img)
+        kfs.append({"frame_index": fi, "time_sec": fi / 30.0, "motion_value": 1.0,
+                    "sharpness": 100.0, "filename": name, "source": "test"})
+    (out / "json" / "keyframes.json").write_text(json.dumps(kfs))
+    (out / "json" / "metadata.json").write_text(json.dumps({"fps": 30.0}))
+    np.save(str(out / "data" / "smoothed_signal.npy"), np.ones(100))
+
+
+def test_review_station_serves_its_page_files_and_session_under_its_path():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        make_p4_project(root / "output" / "book")
+        srv, port, loop = start(root)
+        try:
+            _, index, _ = get(port, "/")
+            assert b'href="/book/review/"' in index and b"/book/pages/" not in index
+            status, page, url = get(port, "/book/review")     # to the slash
+            assert url.endswith("/book/review/") and b"<html" in page.lower()
+            image = (root / "output" / "book" / "images" / "frame000040.jpg").read_bytes()
+            status, part, _ = get(port, "/book/review/img/frame000040.jpg",
+                                  {"Range": "bytes=10-19"})
+            assert status == 206 and part == image[10:20]
+            status, thumb, _ = get(port, "/book/review/img/frame000040.jpg?size=300")
+            assert status == 200 and 0 < len(thumb) < len(image)     # the query reached it
+            for path in ("/book/pages/", "/../review/", "/book/review/img/nope.jpg"):
+                try:
+                    get(port, path)
+                    raise AssertionError(f"expected a 404 for {path}")
+                except urllib.error.HTTPError as e:
+                    assert e.code == 404, (path, e.code)
+
+            ws, sock = ws_connect(port, "/book/review/ws")
+            state = read_until(ws, "state")
+            assert len(state["keyframes"]) == 3
+            # The vote runs off the connect path and its state is pushed when
+            # it lands; wait for it first, or a loaded machine answers the
+            # show before it and read_until skips the frame.
+            read_until(ws, "state")                # consensus landed
+            ws.send_text(json.dumps({"type": "show", "idx": 0}))
+            assert read_until(ws, "frame")["idx"] == 0
+            # One writer per project, whichever the app.
+            ws2, sock2 = ws_connect(port, "/book/capture/ws")
+            m = next_msg(ws2)
+            assert m["type"] == "error" and "review" in m["message"], m
+            sock2.close()
+            sock.close()
+        finally:
+            stop(srv, loop)
+
+
+def test_an_app_asked_for_at_once_is_built_once():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        (root / "output" / "book").mkdir(parents=True)
+        args = stations.parse_args(["--root", str(root / "output"),
+                                    "--recordings", str(root / "recordings")])
+        srv = stations.StationServer(args)
+        calls, go = [], threading.Event()
+
+        def build_app(cfg):
+            calls.append(cfg)
+            go.wait(5)
+            return root / "index.html", object(), None
+
+        saved = stations.p7_web_review.build_app
+        stations.p7_web_review.build_app = build_app
+        try:
+            builds = []
+            threads = [threading.Thread(
+                target=lambda: builds.append(srv._build("book", "pages")))
+                for _ in range(4)]
+            for t in threads:
+                t.start()
+            go.set()
+            for t in threads:
+                t.join(5)
+        finally:
+            stations.p7_web_review.build_app = saved
+            srv.pool.shutdown()
+        assert len(calls) == 1 and len(builds) == 4
+        assert all(b is builds[0] for b in builds)
+
+
+if __name__ == "__main__":
+    tests = [(n, f) for n, f in sorted(globals().items())
+             if n.startswith("test_") and callable(f)]
+    failed = 0
+    for name, fn in tests:
+        try:
+            fn()
+            print(f"  ok    {name}")
+        except AssertionError as e:
+            failed += 1
+            print(f"  FAIL  {name}: {e}")
+    print(f"\n{len(tests) - failed}/{len(tests)} passed")
+    sys.exit(1 if failed else 0)
@@ -58,10 +58,18 @@ def ws_connect(port):
     return WebSocket(sock, client=True), sock
 
 
+_queued = {}
+
+
 def next_msg(ws):
-    op, payload = ws.recv()
-    assert op == TEXT, f"unexpected opcode {op}"
-    return json.loads(payload.decode())
+    """The next server message, unpacking the batches it coalesces."""
+    queue = _queued.setdefault(ws, [])
+    if not queue:
+        op, payload = ws.recv()
+        assert op == TEXT, f"unexpected opcode {op}"
+        m = json.loads(payload.decode())
+        queue.extend(m["messages"] if m["type"] == "batch" else [m])
+    return queue.pop(0)
 
 
 def read_until(ws, wanted, limit=500):
@@ -122,6 +130,9 @@ def test_full_session_over_a_real_socket():
             assert (out / "json" / "keyframes.json").exists()
             meta = json.loads((out / "json" / "metadata.json").read_text())
             assert meta["capture_source"] == "live-web"
+            outbound = meta["web"]["outbound"]
+            assert 0 < outbound["frames"] < outbound["messages"]   # batched
+            assert not outbound["deflate"]                        # not asked for
             assert server.done.wait(5), "server should signal completion"
             sock.close()
         finally:
@@ -10,6 +10,7 @@ Run standalone (`python tests/test_web_review.py`) or under pytest.
 """
 
 import json
+import os
 import shutil
 import socket
 import sys
@@ -27,7 +28,8 @@ sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
 
 import p4_web_review  # noqa: E402
 import p7_web_review  # noqa: E402
-from miniws import TEXT, WebSocket, accept_key  # noqa: E402
+import webui  # noqa: E402
+from miniws import TEXT, WebSocket, accept_key, negotiate_deflate  # noqa: E402
 
 KEY = "dGhlIHNhbXBsZSBub25jZQ=="
 
@@ -38,19 +40,31 @@ def ws_connect(port):
     sock.sendall((f"GET /ws HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
                   "Upgrade: websocket\r\nConnection: Upgrade\r\n"
                   f"Sec-WebSocket-Key: {KEY}\r\n"
+                  "Sec-WebSocket-Extensions: permessage-deflate; client_max_window_bits\r\n"
                   "Sec-WebSocket-Version: 13\r\n\r\n").encode())
     head = b""
     while b"\r\n\r\n" not in head:
         head += sock.recv(1)
     assert b" 101 " in head.split(b"\r\n", 1)[0], head
     assert accept_key(KEY).encode() in head
-    return WebSocket(sock, client=True), sock
+    # The review servers take Chrome's deflate offer; drive them compressed.
+    assert b"Sec-WebSocket-Extensions: permessage-deflate\r\n" in head
+    _, deflate = negotiate_deflate("permessage-deflate")
+    return WebSocket(sock, client=True, deflate=deflate), sock
+
+
+_queued = {}
 
 
 def next_msg(ws):
-    op, payload = ws.recv()
-    assert op == TEXT, f"unexpected opcode {op}"
-    return json.loads(payload.decode())
+    """The next server message, unpacking the batches it coalesces."""
+    queue = _queued.setdefault(ws, [])
+    if not queue:
+        op, payload = ws.recv()
+        assert op == TEXT, f"unexpected opcode {op}"
+        m = json.loads(payload.decode())
+        queue.extend(m["messages"] if m["type"] == "batch" else [m])
+    return queue.pop(0)
 
 
 def read_until(ws, wanted, limit=800):
@@ -198,6 +212,71 @@ def test_p4_serves_page_and_ranged_images():
         server.shutdown()
 
 
+def test_send_file_ranges_with_and_without_sendfile():
+    with tempfile.TemporaryDirectory() as tmp:
+        blob = Path(tmp) / "rec.mp4"
+        data = np.random.default_rng(0).integers(
+            0, 255, 3 * webui.CHUNK + 123, np.uint8).tobytes()
+        blob.write_bytes(data)
+
+        def route(handler, path, head_only):
+            if path != "/video":
+                return False
+            webui.send_file(handler, blob, head_only)
+            return True
+
+        server = webui.WebUIServer(("127.0.0.1", 0), blob, lambda send: None, route)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}/video"
+        try:
+            for zero_copy in (True, False):
+                webui.ZERO_COPY = zero_copy
+                with urllib.request.urlopen(url) as r:
+                    assert r.status == 200 and r.read() == data
+                n = len(data)
+                for rng, lo, hi in (("100-2097157", 100, 2097158), ("-10", n - 10, n)):
+                    req = urllib.request.Request(url, headers={"Range": f"bytes={rng}"})
+                    with urllib.request.urlopen(req) as r:
+                        assert r.status == 206 and r.read() == data[lo:hi], (zero_copy, rng)
+        finally:
+            webui.ZERO_COPY = hasattr(os, "sendfile")
+            server.shutdown()
+
+
+def test_p4_serves_display_sized_cacheable_renditions():
+    with tempfile.TemporaryDirectory() as tmp:
+        server, port, out = start_p4(tmp)
+        base = f"http://127.0.0.1:{port}"
+        ws, sock = ws_connect(port)
+        kf = read_until(ws, "state")["keyframes"][0]
+        assert kf["v"]
+        full = (out / "images" / kf["filename"]).read_bytes()
+
+        url = f"{base}/img/{kf['filename']}?size=300&v={kf['v']}"
+        with urllib.request.urlopen(url) as r:
+            small = r.read()
+            etag = r.headers["ETag"]
+            assert "immutable" in r.headers["Cache-Control"]
+        assert len(small) < len(full) and etag == f'"{kf["v"]}-320"'
+        assert cv2.imdecode(np.frombuffer(small, np.uint8), 1).shape == (200, 320, 3)
+
+        # Revalidation is a bodiless 304.
+        req = urllib.request.Request(url, headers={"If-None-Match": etag})
+        try:
+            urllib.request.urlopen(req)
+            raise AssertionError("a matching If-None-Match must 304")
+        except urllib.error.HTTPError as e:
+            assert e.code == 304
+
+        # More than the source has is the original; a stale or missing
+        # version is not cached for good.
+        with urllib.request.urlopen(f"{base}/img/{kf['filename']}?size=1920") as r:
+            assert r.read() == full and r.headers["Cache-Control"] == "no-cache"
+        ws.close()
+        sock.close()
+        server.shutdown()
+
+
 # ── P4 scrub source: browser-playable recording, or a proxy ──
 
 def make_recording(path, fourcc, n=24, size=(64, 48)):
@@ -220,6 +299,50 @@ def p4_session(out, video, send=None):
                                        send or (lambda m: None))
 
 
+def test_p4_prefetches_geometry_ahead_of_navigation():
+    with tempfile.TemporaryDirectory() as tmp:
+        out = make_p4_project(Path(tmp))
+        kfs = json.loads((out / "json" / "keyframes.json").read_text())
+        src = out / "images" / kfs[0]["filename"]
+        for fi in range(100, 250, 30):                 # eight frames in all
+            name = f"frame{fi:06d}.jpg"
+            shutil.copy(src, out / "images" / name)
+            kfs.append({**kfs[0], "frame_index": fi, "filename": name})
+        (out / "json" / "keyframes.json").write_text(json.dumps(kfs))
+        args = p4_web_review.parse_args([str(out), "--prefetch", "3"])
+        from utils import ProjectPaths
+        s = p4_web_review.ReviewSession(args, ProjectPaths(str(out)), lambda m: None)
+        s._init_geometry()
+        s._stop_watchdog()              # its tracked boxes would invalidate frames
+
+        def settle():
+            deadline = time.monotonic() + 20
+            while time.monotonic() < deadline and (s._geom_want or s._geom_busy):
+                time.sleep(0.02)
+
+        s.handle({"type": "show", "idx": 0})
+        settle()
+        assert all(i in s._geom_cache for i in (1, 2, 3)) and 5 not in s._geom_cache
+        s.handle({"type": "show", "idx": 1})        # the next frame is a cache hit
+        assert s.geom_stats["hits"] == 1 and s.geom_stats["shown"] == 2
+        settle()
+        assert 4 in s._geom_cache
+
+        # A jump backwards turns the queue round: ahead is now down.
+        s.handle({"type": "show", "idx": 7})
+        s.handle({"type": "show", "idx": 6})
+        assert s._nav_dir == -1 and (not s._geom_want or s._geom_want[0] < 6)
+        settle()
+        assert 5 in s._geom_cache and s._geom_cache.get(5)["box"]
+
+        # A result computed against keyframes that changed meanwhile is dropped.
+        token = s._geom_cache.token(0)
+        s._geom_cache.clear()
+        assert not s._geom_cache.put(0, {"box": "stale"}, token)
+        assert 0 not in s._geom_cache
+        s.close()
+
+
 def test_p4_plays_a_browser_codec_directly():
     with tempfile.TemporaryDirectory() as tmp:
         out = make_p4_project(Path(tmp))
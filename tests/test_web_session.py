@@ -12,9 +12,12 @@ Run standalone (`python tests/test_web_session.py`) or under pytest.
 """
 
 import json
+import shutil
 import struct
+import subprocess
 import sys
 import tempfile
+import time
 from pathlib import Path
 
 import numpy as np
@@ -22,6 +25,7 @@ import numpy as np
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
 
 import p0_web_capture as web  # noqa: E402
+from analysis_link import reference_frame, encode_delta  # noqa: E402
 from utils import ProjectPaths  # noqa: E402
 
 H, W = 90, 160
@@ -56,7 +60,8 @@ class Session:
         argv = [str(root / "out"), str(root / "rec.mp4"),
                 "--settle-time", "0.2", "--smoothing-window", "5"]
         for k, v in overrides.items():
-            argv += [f"--{k.replace('_', '-')}", str(v)]
+            flag = f"--{k.replace('_', '-')}"
+            argv += [flag] if v is True else [flag, str(v)]
         self.cfg = web.parse_args(argv)
         self.paths = ProjectPaths(self.cfg.output_dir)
         self.paths.ensure("images", "json", "data", "plots")
@@ -127,7 +132,10 @@ def test_settle_requests_pixels_then_commits_the_jpeg():
     assert reqs[0]["ts_us"] == fi * US_PER_FRAME
 
     env.s.handle_binary(jpeg_msg(fi))
+    env.s.writer.flush()                # written off the frame path
     assert (env.paths.images / f"frame{fi:06d}.jpg").read_bytes().startswith(b"\xff\xd8")
+    assert env.of_type("saved")[-1] == {"type": "saved", "filename": f"frame{fi:06d}.jpg",
+                                        "ok": True, "pending": 0}
     assert env.of_type("captured")[0]["count"] == 1
     kf = env.s.keyframes[0]
     assert kf["frame_index"] == fi and kf["source"] == "live"
@@ -153,11 +161,31 @@ def test_undo_removes_the_file_and_reports_the_count():
     env.feed([still_frame(1)] * 20)
     fi = env.of_type("capture")[0]["frame_index"]
     env.s.handle_binary(jpeg_msg(fi))
+    env.s.writer.flush()
     env.s.handle_text('{"type": "undo"}')
     assert not (env.paths.images / f"frame{fi:06d}.jpg").exists()
     assert env.of_type("undone")[0]["count"] == 0 and env.s.keyframes == []
 
 
+def test_early_upgrade_replaces_the_provisional_keyframe_in_place():
+    env = Session(early_capture=True)
+    flat = np.tile(np.linspace(60, 200, W), (H, 1)).astype(np.uint8)
+    sharp = flat.copy()
+    sharp[::4, ::4] += 20                   # sharper, barely any motion
+    turn = [still_frame(100 + i) for i in range(10)]
+    env.feed([flat] * 20 + turn + [flat] * 6 + [sharp] + [flat] * 13)
+    reqs = env.of_type("capture")
+    assert [r["reason"] for r in reqs] == ["initial", "early", "upgrade"]
+    for r in reqs:
+        env.s.handle_binary(jpeg_msg(r["frame_index"], b"\xff\xd8 " + bytes([r["frame_index"]])))
+    env.s.writer.flush()
+    assert [k["frame_index"] for k in env.s.keyframes] == [reqs[0]["frame_index"], 36]
+    assert sorted(p.name for p in env.paths.images.iterdir()) == [
+        f"frame{reqs[0]['frame_index']:06d}.jpg", "frame000036.jpg"]
+    assert env.of_type("captured")[-1]["count"] == 2
+    assert env.s.det.capture_latency()["upgrades"] == 1
+
+
 def test_capture_missing_drops_the_pending_capture():
     env = Session()
     env.feed([still_frame(1)] * 20)
@@ -183,6 +211,50 @@ def test_pause_reaches_the_detector():
     assert env.of_type("capture") == []
 
 
+# ── Analysis link ────────────────────────────────────────────
+
+
+def delta_msg(ts_us, ref, gray):
+    payload, _ = encode_delta(ref, gray)
+    return (struct.pack("<BdHH", web.MSG_DELTA, ts_us,
+                        gray.shape[1], gray.shape[0]) + payload)
+
+
+def test_delta_frames_drive_the_detector_like_raw_ones():
+    raw, delta = Session(), Session()
+    frames = [still_frame(1)] * 12 + [still_frame(2)] * 4 + [still_frame(3)] * 14
+    raw.feed(frames)
+    delta.s.handle_binary(frame_msg(0.0, frames[0]))
+    ref = reference_frame(frames[0])
+    for i, g in enumerate(frames[1:], 1):
+        delta.s.handle_binary(delta_msg(i * US_PER_FRAME, ref, g))
+    assert np.array_equal(raw.s.det.motion_signal(), delta.s.det.motion_signal())
+    assert [m["frame_index"] for m in raw.of_type("capture")] == \
+        [m["frame_index"] for m in delta.of_type("capture")]
+    assert delta.s.link_bytes < raw.s.link_bytes / 2
+
+
+def test_link_steps_down_on_lag_without_reading_the_switch_as_motion():
+    import cv2
+    env = Session()
+    page = still_frame(1)
+    env.feed([page] * 6)
+    env.s.handle_text(json.dumps({"type": "stats", "chunk_q": 0,
+                                  "epoch_ms": (time.time() - 3) * 1000}))
+    link = env.of_type("link")
+    assert link and link[0]["level"] == 1 and link[0]["height"] == 270
+    h = link[0]["height"] * H // 360
+    small = cv2.resize(page, (W * h // H, h), interpolation=cv2.INTER_AREA)
+    env.feed([small] * 6, start_index=6)
+    sig = env.s.det.motion_signal()
+    assert len(sig) == 12 and sig[6:].max() < 0.5
+    env.s.finish()
+    meta = json.loads((env.paths.json / "metadata.json").read_text())
+    assert meta["analysis_height"] == H
+    changes = meta["web"]["analysis_link"]["adaptations"]
+    assert [(c["from"], c["to"], c["reason"]) for c in changes] == [(0, 1, "lag")]
+
+
 # ── Recording chunks + finish ────────────────────────────────
 
 
@@ -203,6 +275,11 @@ def test_chunks_append_in_order_and_finish_writes_all_artifacts():
     assert meta["web"]["normalize"].startswith("failed")
     assert meta["capture_source"] == "live-web"
     assert meta["total_frames"] == 20 and meta["original_width"] == 640
+    # Every message is timed by kind; Finish is the session's end, not a message cost.
+    handling = meta["web"]["handling"]
+    assert {k: h["count"] for k, h in handling.items()} == \
+        {"frame": 20, "jpeg": 1, "chunk": 2, "text": 1}
+    assert all(0 <= h["p50_ms"] <= h["p99_ms"] <= h["max_ms"] for h in handling.values())
 
     for rel in ("data/motion_signal.npy", "data/smoothed_signal.npy",
                 "data/peaks.npy", "json/spreads.json", "json/keyframes.json"):
@@ -248,6 +325,69 @@ def test_normalize_missing_file_fails_cleanly():
     assert status.startswith("failed")
 
 
+# ── Streaming normalization (ffmpeg) ─────────────────────────
+
+
+def recorder_webm(path, seconds=2, rate=25):
+    """A VP8 WebM like MediaRecorder's, at a rate off the session's."""
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi", "-i",
+                    f"testsrc=size=160x120:rate={rate}", "-t", str(seconds),
+                    "-c:v", "libvpx", "-b:v", "500k", str(path)], check=True)
+    return path.read_bytes()
+
+
+def record_chunks(env, data, on_half=None):
+    env.s.handle_text(json.dumps({"type": "hello", "width": 160, "height": 120,
+                                  "frame_rate": 25, "mime": "video/webm"}))
+    env.feed([still_frame(1)] * 60)
+    step = len(data) // 8 + 1
+    for seq, at in enumerate(range(0, len(data), step)):
+        env.s.handle_binary(chunk_msg(seq, data[at:at + step]))
+        if seq == 3 and on_half is not None:
+            on_half()
+    env.s.handle_text('{"type": "finish"}')
+    return json.loads((env.paths.json / "metadata.json").read_text())
+
+
+def frame_count(path):
+    import cv2
+    cap = cv2.VideoCapture(str(path))
+    n = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return n
+
+
+def test_chunks_stream_into_ffmpeg_so_finish_only_flushes_the_tail():
+    if shutil.which("ffmpeg") is None:
+        print("  (ffmpeg not installed — skipped)")
+        return
+    env = Session()
+    data = recorder_webm(Path(env.tmp.name) / "src.webm")
+    meta = record_chunks(env, data)
+    assert meta["web"]["streamed_normalize"]["status"] == "ok (ffmpeg, streamed)"
+    assert meta["web"]["normalize"] == "ok (ffmpeg, streamed)"
+    assert 57 <= frame_count(env.cfg.video_out) <= 63     # 2 s at 30 fps
+    assert not env.s.raw_path.exists()
+
+
+def test_a_failed_stream_falls_back_to_the_raw_file():
+    if shutil.which("ffmpeg") is None:
+        print("  (ffmpeg not installed — skipped)")
+        return
+    env = Session()
+    data = recorder_webm(Path(env.tmp.name) / "src.webm")
+    meta = record_chunks(env, data, on_half=lambda: env.s._stream.proc.kill())
+    assert meta["web"]["streamed_normalize"]["status"].startswith("failed")
+    assert meta["web"]["normalize"] == "ok (ffmpeg)"
+    assert 57 <= frame_count(env.cfg.video_out) <= 63
+
+    env = Session(normalize_after=True)
+    data = recorder_webm(Path(env.tmp.name) / "src.webm")
+    meta = record_chunks(env, data)
+    assert "streamed_normalize" not in meta["web"]
+    assert meta["web"]["normalize"] == "ok (ffmpeg)"
+
+
 if __name__ == "__main__":
     tests = [(n, f) for n, f in sorted(globals().items())
              if n.startswith("test_") and callable(f)]